@@ -0,0 +1,121 @@
+import csv
+import datetime
+import heapq
+import io
+import json
+import math
+import os
+import zlib
+
+# Rows formatted before a chunk is handed to the response
+EXPORT_CHUNK_ROWS = int(os.getenv('EXPORT_CHUNK_ROWS', '1000'))
+
+# Export formats and their content types
+FORMATS = {'csv': 'text/csv', 'ndjson': 'application/x-ndjson'}
+
+
+def clean(value):
+    """Dates as YYYY-MM-DD and NaN as empty, the way the exports write them"""
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.strftime('%Y-%m-%d')
+    if isinstance(value, float) and math.isnan(value):
+        return None
+    return value
+
+
+def csv_chunks(rows, fields):
+    """
+    CSV text for an iterable of rows, yielded in chunks of EXPORT_CHUNK_ROWS
+    rows. The header and the first row are yielded on their own, so the
+    response starts before the rest is read.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(fields)
+    yield buffer.getvalue()
+    buffer.seek(0)
+    buffer.truncate()
+
+    for count, row in enumerate(rows, 1):
+        writer.writerow([clean(row.get(field)) for field in fields])
+        if count == 1 or count % EXPORT_CHUNK_ROWS == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def ndjson_chunks(rows, fields):
+    """One JSON object per line, chunked like csv_chunks"""
+    lines = []
+    for count, row in enumerate(rows, 1):
+        lines.append(json.dumps({field: clean(row.get(field)) for field in fields}))
+        if count == 1 or count % EXPORT_CHUNK_ROWS == 0:
+            yield '\n'.join(lines) + '\n'
+            lines = []
+    if lines:
+        yield '\n'.join(lines) + '\n'
+
+
+def gzip_chunks(chunks, level=6):
+    """Compress text chunks into one gzip stream without holding more than one chunk"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    first = True
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode('utf-8'))
+        if first:
+            # Send the gzip header and the first chunk right away instead of waiting for a full block
+            data += compressor.flush(zlib.Z_SYNC_FLUSH)
+            first = False
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def archive_rows(chunks, symbols=None):
+    """Rows from HistoryArchive.stream_stocks column chunks; symbols maps company_id to company_symbol"""
+    for columns in chunks:
+        names = list(columns)
+        values = [columns[name].tolist() for name in names]
+        for row in zip(*values):
+            row = dict(zip(names, row))
+            if symbols is not None:
+                row['company_symbol'] = symbols.get(str(row['company_id']))
+            yield row
+
+
+def archived_quotes(archive, storage, company_ids=None, start=None, end=None, fields=None):
+    """
+    Stock rows within [start, end] from the history archive up to the date it
+    was last updated, followed by the rows stored since then. Companies the
+    archive has no history for are read from the database. Rows come by date
+    then company, or by company then date when company_ids is given.
+    """
+    through = archive.through('stocks')
+    archived_end = min(end, through) if end else through
+    newer_start = max(start, through + datetime.timedelta(days=1)) if start else through + datetime.timedelta(days=1)
+    has_newer = end is None or end > through
+    symbols = archive.manifest['symbols']
+
+    if company_ids is None:
+        yield from archive_rows(archive.stream_stocks(None, start, archived_end), symbols)
+        if has_newer:
+            yield from storage.stream_quotes(None, start=newer_start, end=end, fields=fields)
+        return
+
+    archived = [company_id for company_id in company_ids if archive.company_history(int(company_id)) is not None]
+    missing = [company_id for company_id in company_ids if company_id not in archived]
+    streams = [archive_rows(archive.stream_stocks(archived, start, archived_end), symbols)]
+    if archived and has_newer:
+        streams.append(storage.stream_quotes(archived, start=newer_start, end=end, fields=fields))
+    if missing:
+        streams.append(storage.stream_quotes(missing, start=start, end=end, fields=fields))
+    # Every stream is ordered by company then date; merge keeps a company's archived rows before its newer ones
+    yield from heapq.merge(*streams, key=lambda row: row['company_id'])
+
+
+def export_chunks(rows, fields, format='csv', compress=False):
+    """Response body for rows in the given format, optionally gzip-compressed"""
+    chunks = csv_chunks(rows, fields) if format == 'csv' else ndjson_chunks(rows, fields)
+    return gzip_chunks(chunks) if compress else (chunk.encode('utf-8') for chunk in chunks)
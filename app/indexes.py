@@ -0,0 +1,339 @@
+import datetime
+import os
+import threading
+from pymongo import ASCENDING, DESCENDING
+from app.storage.base import (
+    ACTIVE_FIELDS, BATCH_FIELDS, CHART_FIELDS, COMPANY_LIST_FIELDS, INDEX_CHART_FIELDS, PRICE_FIELDS, SECTOR_CHART_FIELDS,
+    STATS_FIELDS, TURNOVER_ROW_FIELDS
+)
+from app.storage.mongo import DATE_ONLY, projection
+
+STOCKS = os.getenv('NEPSE_STOCKS', 'nepse-stocks')
+INDICES = os.getenv('NEPSE_INDICES', 'nepse-indices')
+COMPANIES = os.getenv('COMPANIES_COLLECTION', 'companies')
+SECTORS = os.getenv('SECTOR_SERIES', 'sector-series')
+STATS = os.getenv('COMPANY_STATS', 'company-stats')
+TURNOVER = os.getenv('TURNOVER_SERIES', 'market-turnover')
+
+# Indexes the read paths depend on, by collection
+REQUIRED_INDEXES = {
+    STOCKS: [
+        # One row per company and day; ingestion relies on it to reject rows written twice
+        [('company_id', ASCENDING), ('published_date', ASCENDING)],
+        # Latest date and day snapshots; traded_amount serves the most-active sort and turnover sum
+        [('published_date', DESCENDING), ('traded_amount', DESCENDING)],
+        # Company history; the price fields make chart queries covered
+        [('company_id', ASCENDING), ('published_date', ASCENDING), ('open', ASCENDING), ('high', ASCENDING),
+         ('low', ASCENDING), ('close', ASCENDING), ('traded_quantity', ASCENDING)],
+    ],
+    INDICES: [
+        [('published_date', DESCENDING)],
+        [('index_id', ASCENDING), ('published_date', DESCENDING)],
+        [('index_name', ASCENDING), ('published_date', ASCENDING), ('open', ASCENDING), ('high', ASCENDING),
+         ('low', ASCENDING), ('current', ASCENDING)],
+    ],
+    COMPANIES: [
+        [('company_id', ASCENDING)],
+        [('symbol', ASCENDING)],
+    ],
+    SECTORS: [
+        [('sector', ASCENDING), ('published_date', ASCENDING)],
+        [('published_date', DESCENDING)],
+    ],
+    STATS: [
+        [('company_id', ASCENDING)],
+    ],
+    TURNOVER: [
+        [('published_date', ASCENDING)],
+    ],
+}
+
+# Required indexes created with unique=True
+UNIQUE_INDEXES = {
+    STOCKS: [[('company_id', ASCENDING), ('published_date', ASCENDING)]],
+}
+
+# Hot queries checked with explain(): name -> (collection, function(collection, sample) -> explain output)
+hot_queries = {}
+
+
+# Register a query whose plan is verified at startup and on the admin indexes page
+def register_hot_query(name, collection, collscan_ok=False):
+    def decorator(explain):
+        hot_queries[name] = (collection, explain, collscan_ok)
+        return explain
+    return decorator
+
+
+@register_hot_query('latest stock date', STOCKS)
+def explain_latest_stock_date(collection, sample):
+    return collection.find({}, DATE_ONLY).sort('published_date', -1).limit(1).explain()
+
+
+@register_hot_query('latest index date', INDICES)
+def explain_latest_index_date(collection, sample):
+    return collection.find({}, DATE_ONLY).sort('published_date', -1).limit(1).explain()
+
+
+@register_hot_query('latest snapshot', STOCKS)
+def explain_latest_snapshot(collection, sample):
+    return collection.find(
+        {'published_date': sample['date'], 'company_id': {'$in': sample['company_ids']}}, projection(PRICE_FIELDS)
+    ).explain()
+
+
+@register_hot_query('most active', STOCKS)
+def explain_most_active(collection, sample):
+    return collection.find({'published_date': sample['date']}, projection(ACTIVE_FIELDS)).sort('traded_amount', -1).limit(8).explain()
+
+
+@register_hot_query('company chart range', STOCKS)
+def explain_company_chart(collection, sample):
+    return collection.find(
+        {'company_id': sample['company_id'], 'published_date': {'$gte': sample['date'] - datetime.timedelta(days=365)}},
+        projection(CHART_FIELDS)
+    ).sort('published_date', 1).explain()
+
+
+@register_hot_query('batch history', STOCKS)
+def explain_batch_history(collection, sample):
+    return collection.find(
+        {'company_id': {'$in': sample['company_ids']}, 'published_date': {'$gte': sample['date'] - datetime.timedelta(days=365)}},
+        projection(BATCH_FIELDS)
+    ).sort([('company_id', 1), ('published_date', 1)]).explain()
+
+
+@register_hot_query('index chart range', INDICES)
+def explain_index_chart(collection, sample):
+    return collection.find(
+        {'index_name': 'NEPSE Index', 'published_date': {'$gte': sample['date'] - datetime.timedelta(days=365)}},
+        projection(INDEX_CHART_FIELDS)
+    ).sort('published_date', 1).explain()
+
+
+@register_hot_query('overlay index histories', INDICES)
+def explain_index_histories(collection, sample):
+    return collection.find(
+        {'index_name': {'$in': ['NEPSE Index', 'Banking Subindex']}}, projection(('index_name',) + INDEX_CHART_FIELDS)
+    ).sort([('index_name', 1), ('published_date', 1)]).explain()
+
+
+@register_hot_query('sector chart range', SECTORS)
+def explain_sector_chart(collection, sample):
+    return collection.find(
+        {'sector': 'Commercial Banks', 'published_date': {'$gte': sample['date'] - datetime.timedelta(days=365)}},
+        projection(SECTOR_CHART_FIELDS)
+    ).sort('published_date', 1).explain()
+
+
+@register_hot_query('company stats', STATS)
+def explain_company_stats(collection, sample):
+    return collection.find({'company_id': sample['company_id']}, projection(STATS_FIELDS)).limit(1).explain()
+
+
+@register_hot_query('turnover range', TURNOVER)
+def explain_turnover_range(collection, sample):
+    return collection.find(
+        {'published_date': {'$gte': sample['date'] - datetime.timedelta(days=365)}}, projection(TURNOVER_ROW_FIELDS)
+    ).sort('published_date', 1).explain()
+
+
+@register_hot_query('company by symbol', COMPANIES)
+def explain_company_by_symbol(collection, sample):
+    return collection.find({'symbol': sample['symbol']}, projection(COMPANY_LIST_FIELDS)).limit(1).explain()
+
+
+# Substring search cannot use an index; companies holds a few hundred documents
+@register_hot_query('company search', COMPANIES, collscan_ok=True)
+def explain_company_search(collection, sample):
+    return collection.find(
+        {'$or': [{'symbol': {'$regex': 'ban', '$options': 'i'}}, {'companyname': {'$regex': 'ban', '$options': 'i'}}]},
+        projection(COMPANY_LIST_FIELDS)
+    ).limit(10).explain()
+
+
+# Find the winning plan in find or aggregate explain output
+def winning_plan(explain):
+    stack = [explain]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, dict):
+            if 'queryPlanner' in node:
+                plan = node['queryPlanner'].get('winningPlan', {})
+                # Slot-based engine plans wrap the classic tree in queryPlan
+                return plan.get('queryPlan', plan)
+            stack.extend(node.values())
+        elif isinstance(node, list):
+            stack.extend(node)
+    return {}
+
+
+def walk_plan(plan):
+    """Yield the nodes of a plan tree, top down"""
+    stack = [plan]
+    while stack:
+        node = stack.pop()
+        if not isinstance(node, dict):
+            continue
+        yield node
+        if 'inputStage' in node:
+            stack.append(node['inputStage'])
+        stack.extend(node.get('inputStages', []))
+
+
+def analyze_plan(explain, collscan_ok=False):
+    """Summarize a plan and list its problems: collection scans and in-memory sorts"""
+    nodes = list(walk_plan(winning_plan(explain)))
+    stages = [node['stage'] for node in nodes if 'stage' in node]
+    issues = []
+    if 'COLLSCAN' in stages and not collscan_ok:
+        issues.append('collection scan')
+    if 'SORT' in stages:
+        issues.append('in-memory sort')
+    return {
+        'stages': stages,
+        'indexes': [node['indexName'] for node in nodes if node.get('indexName')],
+        'covered': 'IXSCAN' in stages and 'FETCH' not in stages and 'COLLSCAN' not in stages,
+        'issues': issues
+    }
+
+
+# Real values for the sample queries, so the planner sees realistic predicates
+def sample_values(db):
+    latest = db[STOCKS].find_one({}, {'published_date': 1, 'company_id': 1, '_id': 0}, sort=[('published_date', -1)]) or {}
+    company = db[COMPANIES].find_one({}, {'symbol': 1, 'company_id': 1, '_id': 0}) or {}
+    return {
+        'date': latest.get('published_date') or datetime.datetime.combine(datetime.date.today(), datetime.time()),
+        'company_id': latest.get('company_id', company.get('company_id', 1)),
+        'company_ids': [latest.get('company_id', 1)],
+        'symbol': company.get('symbol', 'NABIL')
+    }
+
+
+class IndexManager:
+    """
+    Creates REQUIRED_INDEXES and verifies the plans of the registered hot
+    queries. Creation uses MONGODB_URI_ADMIN when it is set, since the web
+    app's connection is read-only. Runs in a background thread at startup
+    and again when an admin asks for it.
+    """
+
+    def __init__(self):
+        self.report = None
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def create_indexes(self, db):
+        """Create any missing required index; returns (created, errors)"""
+        created, errors = [], []
+        for collection_name, indexes in REQUIRED_INDEXES.items():
+            collection = db[collection_name]
+            try:
+                existing = {
+                    tuple((field, int(direction)) for field, direction in info['key'].items())
+                    for info in collection.list_indexes()
+                }
+            except Exception as e:
+                errors.append(f"{collection_name}: {e}")
+                continue
+            for keys in indexes:
+                if tuple(keys) in existing:
+                    continue
+                try:
+                    unique = keys in UNIQUE_INDEXES.get(collection_name, [])
+                    created.append(f"{collection_name}.{collection.create_index(keys, unique=unique)}")
+                except Exception as e:
+                    errors.append(f"{collection_name} {keys}: {e}")
+        return created, errors
+
+    def missing_unique_indexes(self, db):
+        """UNIQUE_INDEXES that do not exist as unique indexes, e.g. because duplicate rows blocked the build"""
+        missing = []
+        for collection_name, indexes in UNIQUE_INDEXES.items():
+            try:
+                existing = {
+                    tuple((field, int(direction)) for field, direction in info['key'].items())
+                    for info in db[collection_name].list_indexes() if info.get('unique')
+                }
+            except Exception as e:
+                missing.extend(f"{collection_name} {keys} (could not list indexes: {e})" for keys in indexes)
+                continue
+            missing.extend(f"{collection_name} {keys}" for keys in indexes if tuple(keys) not in existing)
+        return missing
+
+    def verify(self, db):
+        """Explain every hot query; returns one result per query"""
+        sample = sample_values(db)
+        results = []
+        for name, (collection_name, explain, collscan_ok) in hot_queries.items():
+            result = {'name': name, 'collection': collection_name}
+            try:
+                result.update(analyze_plan(explain(db[collection_name], sample), collscan_ok))
+            except Exception as e:
+                result.update({'stages': [], 'indexes': [], 'covered': False, 'issues': [f"explain failed: {e}"]})
+            results.append(result)
+        return results
+
+    def run(self, db, admin_db=None):
+        started = datetime.datetime.now()
+        created, errors = self.create_indexes(admin_db if admin_db is not None else db)
+        missing_unique = self.missing_unique_indexes(admin_db if admin_db is not None else db)
+        queries = self.verify(db)
+        report = {
+            'checked_at': started,
+            'created': created,
+            'errors': errors,
+            'missing_unique': missing_unique,
+            'ok': not missing_unique,
+            'queries': queries,
+            'flagged': [query['name'] for query in queries if query['issues']]
+        }
+        with self._lock:
+            self.report = report
+
+        for index in created:
+            print(f"Created index {index}")
+        for error in errors:
+            print(f"Warning: could not create index: {error}")
+        for index in missing_unique:
+            print(f"Error: unique index missing: {index}; run app/scripts/normalize_existing_data.py to remove duplicate rows")
+        for query in queries:
+            if query['issues']:
+                print(f"Warning: hot query '{query['name']}' uses {', '.join(query['issues'])} ({' <- '.join(query['stages'])})")
+        print(f"Index check finished: {len(created)} created, {len(report['flagged'])} of {len(queries)} hot queries flagged")
+        return report
+
+    def _run_in_thread(self):
+        from app import get_admin_db, get_mongo_client
+        try:
+            self.run(get_mongo_client()[os.getenv('DATABASE_NAME', 'heisenstocks')], get_admin_db())
+        except Exception as e:
+            print(f"Index check failed: {e}")
+            with self._lock:
+                self.report = {
+                    'checked_at': datetime.datetime.now(), 'created': [], 'errors': [str(e)], 'missing_unique': [], 'ok': False,
+                    'queries': [], 'flagged': []
+                }
+
+    def start(self):
+        """Run create + verify in a background thread unless a run is in progress; returns True if started"""
+        with self._lock:
+            if self.running:
+                return False
+            self._thread = threading.Thread(target=self._run_in_thread, name='index-manager', daemon=True)
+            self._thread.start()
+        return True
+
+
+index_manager = IndexManager()
+
+
+# Check indexes in the background at startup (INDEX_CHECK_ON_STARTUP=0 to skip)
+def init_index_manager(app):
+    if os.getenv('INDEX_CHECK_ON_STARTUP', '1') == '1' and os.getenv('STORAGE_BACKEND', 'mongo').lower() == 'mongo':
+        index_manager.start()
+    return index_manager
@@ -0,0 +1,131 @@
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+# NumPy ports of the chart indicators in app/static/js/indicators/. Every function
+# takes dates x companies arrays (oldest row first) and returns arrays of the same
+# shape, NaN until a full period is available, so one call covers the whole market.
+
+
+def _window_sums(values, period):
+    """Sums over the last period rows and the count of non-NaN values among them"""
+    valid = ~np.isnan(values)
+    filled = np.where(valid, values, 0.0)
+    zeros = np.zeros((1,) + values.shape[1:])
+    total = np.concatenate([zeros, np.cumsum(filled, axis=0)])
+    count = np.concatenate([zeros, np.cumsum(valid, axis=0)])
+    sums = np.full(values.shape, np.nan)
+    counts = np.zeros(values.shape)
+    if period <= len(values):
+        sums[period - 1:] = total[period:] - total[:-period]
+        counts[period - 1:] = count[period:] - count[:-period]
+    return sums, counts
+
+
+def sma(values, period):
+    """Simple moving average (SMAIndicator.sma)"""
+    sums, counts = _window_sums(values, period)
+    return np.where(counts == period, sums / period, np.nan)
+
+
+def standard_deviation(values, period):
+    """Population standard deviation over the period (SqueezeIndicator.standardDeviation)"""
+    mean = sma(values, period)
+    squares = sma(values * values, period)
+    return np.sqrt(np.maximum(squares - mean * mean, 0))
+
+
+def true_range(high, low, close):
+    """Largest of high - low and the gaps from the previous close (SqueezeIndicator.getTrueRange)"""
+    result = high - low
+    previous = close[:-1]
+    result[1:] = np.fmax(result[1:], np.fmax(np.abs(high[1:] - previous), np.abs(low[1:] - previous)))
+    return result
+
+
+def rolling_max(values, period):
+    result = np.full(values.shape, np.nan)
+    if period <= len(values):
+        result[period - 1:] = sliding_window_view(values, period, axis=0).max(axis=-1)
+    return result
+
+
+def rolling_min(values, period):
+    result = np.full(values.shape, np.nan)
+    if period <= len(values):
+        result[period - 1:] = sliding_window_view(values, period, axis=0).min(axis=-1)
+    return result
+
+
+def _weighted_sums(values, period):
+    """
+    For each row i, sum of (t - (i - period + 1)) * values[t] over the window,
+    i.e. the values weighted 0, 1, ..., period - 1 from oldest to newest
+    """
+    positions = np.arange(len(values), dtype=np.float64).reshape((-1,) + (1,) * (values.ndim - 1))
+    sums, counts = _window_sums(values, period)
+    weighted, _ = _window_sums(values * positions, period)
+    start = positions - (period - 1)
+    return weighted - start * sums, sums, counts
+
+
+def linear_regression(values, period):
+    """Least-squares line over the period, evaluated at the newest point (SqueezeIndicator.linearRegression)"""
+    weighted, sums, counts = _weighted_sums(values, period)
+    n = period
+    sum_x = n * (n - 1) / 2
+    sum_xx = (n - 1) * n * (2 * n - 1) / 6
+    slope = (n * weighted - sum_x * sums) / (n * sum_xx - sum_x * sum_x)
+    intercept = (sums - slope * sum_x) / n
+    return np.where(counts == n, slope * (n - 1) + intercept, np.nan)
+
+
+def wma(values, period):
+    """Weighted moving average, newest value weighted period (SSLHybridIndicator.wma)"""
+    weighted, sums, counts = _weighted_sums(values, period)
+    # Weights 1..period instead of 0..period-1 add one more copy of the plain sum
+    return np.where(counts == period, (weighted + sums) / (period * (period + 1) / 2), np.nan)
+
+
+def hma(values, period):
+    """Hull moving average (SSLHybridIndicator.hma)"""
+    return wma(2 * wma(values, period // 2) - wma(values, period), int(np.sqrt(period)))
+
+
+def squeeze(close, high, low, length=20, mult=2.0, length_kc=20, mult_kc=1.5):
+    """
+    Squeeze momentum (SqueezeIndicator.calculate): Bollinger Bands inside
+    Keltner Channels (on), outside them (off), and the momentum value.
+    """
+    basis = sma(close, length)
+    deviation = mult * standard_deviation(close, length)
+    upper_bb, lower_bb = basis + deviation, basis - deviation
+
+    ma = sma(close, length_kc)
+    range_ma = sma(true_range(high, low, close), length_kc)
+    upper_kc, lower_kc = ma + range_ma * mult_kc, ma - range_ma * mult_kc
+
+    average = ((rolling_max(high, length_kc) + rolling_min(low, length_kc)) / 2 + ma) / 2
+    return {
+        'on': (lower_bb > lower_kc) & (upper_bb < upper_kc),
+        'off': (lower_bb < lower_kc) & (upper_bb > upper_kc),
+        'momentum': linear_regression(close - average, length_kc)
+    }
+
+
+def ssl_hybrid(close, high, low, baseline_length=20):
+    """
+    SSL baseline (SSLHybridIndicator.calculate): the trend flips to 1 when
+    the close crosses above the HMA of highs and to -1 below the HMA of lows,
+    and otherwise keeps its previous value.
+    """
+    hma_high = hma(high, baseline_length)
+    hma_low = hma(low, baseline_length)
+    signal = np.where(close > hma_high, 1.0, np.where(close < hma_low, -1.0, np.nan))
+
+    # Carry the last signal forward: the position of the latest non-NaN row, per column
+    rows = np.arange(len(signal)).reshape((-1,) + (1,) * (signal.ndim - 1))
+    latest = np.maximum.accumulate(np.where(np.isnan(signal), -1, rows), axis=0)
+    trend = np.where(latest >= 0, np.take_along_axis(signal, np.maximum(latest, 0), axis=0), 0.0)
+
+    baseline = np.where(trend < 0, hma_high, hma_low)
+    return {'trend': trend, 'baseline': baseline, 'bullish': close > baseline}
@@ -0,0 +1,362 @@
+import collections
+import concurrent.futures
+import datetime
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import traceback
+import uuid
+
+# Job states
+QUEUED = 'queued'
+RUNNING = 'running'
+COMPLETE = 'complete'
+ERROR = 'error'
+CANCELLED = 'cancelled'
+
+FINISHED_STATES = (COMPLETE, ERROR, CANCELLED)
+
+# Number of recent events each job keeps for replay to late subscribers
+EVENT_BUFFER_SIZE = int(os.getenv('JOB_EVENT_BUFFER', '200'))
+
+# Data each ingestion job kind writes; jobs writing the same data share checkpoint journals, so only one runs at a time
+INGEST_WRITES = {
+    'stocks': {'stocks'},
+    'indices': {'indices'},
+    'both': {'stocks', 'indices'},
+    'scheduled': {'stocks', 'indices'},
+}
+
+
+class JobCancelled(Exception):
+    """Raised inside a job when cancellation has been requested"""
+
+
+class Job:
+    """
+    A background ingestion job with progress counters and cooperative cancellation.
+
+    Job functions receive the job as their first argument and report progress
+    through set_total()/advance(), and should check job.cancelled (or call
+    check_cancelled()) between units of work.
+    
+    Progress events published on the job are kept in a ring buffer with
+    sequence numbers, so any number of subscribers can follow one job and a
+    subscriber that joins late is first given the buffered events.
+    """
+
+    def __init__(self, kind, params=None):
+        self.id = uuid.uuid4().hex[:12]
+        self.kind = kind
+        self.params = params or {}
+        self.status = QUEUED
+        self.created_at = datetime.datetime.now()
+        self.started_at = None
+        self.finished_at = None
+        self.message = None
+        self.error = None
+        self.result = None
+        self.progress = {'total': 0, 'done': 0, 'rows': 0, 'errors': 0}
+        self.events = collections.deque(maxlen=EVENT_BUFFER_SIZE)
+        self._sequence = 0
+        self._cancel_event = threading.Event()
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+
+    @property
+    def finished(self):
+        return self.status in FINISHED_STATES
+
+    @property
+    def cancelled(self):
+        return self._cancel_event.is_set()
+
+    def cancel(self):
+        """Request cancellation; the job stops at its next checkpoint"""
+        self._cancel_event.set()
+
+    def wait_for_cancel(self, timeout=None):
+        """Block until cancellation is requested or timeout passes; returns True if cancelled"""
+        return self._cancel_event.wait(timeout)
+
+    def check_cancelled(self):
+        if self.cancelled:
+            raise JobCancelled()
+
+    def set_total(self, total, message=None):
+        with self._lock:
+            self.progress['total'] = total
+            if message:
+                self.message = message
+
+    def advance(self, done=0, rows=0, errors=0, message=None):
+        """Add to the progress counters"""
+        with self._lock:
+            self.progress['done'] += done
+            self.progress['rows'] += rows
+            self.progress['errors'] += errors
+            if message:
+                self.message = message
+
+    def set_progress(self, total, done, rows=0, errors=0):
+        """Replace the progress counters (used when a subprocess reports its own totals)"""
+        with self._lock:
+            self.progress.update({'total': total, 'done': done, 'rows': rows, 'errors': errors})
+
+    def log(self, message):
+        with self._lock:
+            self.message = message
+
+    def publish(self, event):
+        """Append an event to the ring buffer and wake subscribers"""
+        with self._changed:
+            self._sequence += 1
+            self.events.append((self._sequence, event))
+            self._changed.notify_all()
+
+    def set_status(self, status):
+        """Move to a new state; finishing publishes a final 'finished' event"""
+        with self._changed:
+            self.status = status
+            if status == RUNNING:
+                self.started_at = datetime.datetime.now()
+            elif status in FINISHED_STATES:
+                self.finished_at = self.finished_at or datetime.datetime.now()
+        if status in FINISHED_STATES:
+            self.publish({'type': 'finished', 'status': status, 'error': self.error, 'message': self.message})
+
+    def events_after(self, sequence, timeout=None):
+        """
+        Return buffered (sequence, event) pairs newer than sequence, waiting up
+        to timeout seconds for one to arrive. Events that already fell out of
+        the buffer are skipped.
+        """
+        with self._changed:
+            if not self.events or self.events[-1][0] <= sequence:
+                self._changed.wait(timeout)
+            return [(number, event) for number, event in self.events if number > sequence]
+
+    def to_dict(self):
+        with self._lock:
+            progress = dict(self.progress)
+        percent = int(progress['done'] * 100 / progress['total']) if progress['total'] else 0
+        if self.status == COMPLETE:
+            percent = 100
+        return {
+            'id': self.id,
+            'kind': self.kind,
+            'params': self.params,
+            'status': self.status,
+            'progress': progress,
+            'percent': min(percent, 100),
+            'message': self.message,
+            'error': self.error,
+            'result': self.result,
+            'created_at': self.created_at.isoformat(),
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None
+        }
+
+
+class JobRunner:
+    """Runs jobs on a small thread pool and keeps recent jobs for status queries"""
+
+    def __init__(self, max_workers=2, keep_finished=50):
+        self.max_workers = max_workers
+        self.keep_finished = keep_finished
+        self._executor = None
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = concurrent.futures.ThreadPoolExecutor(
+                    max_workers=self.max_workers, thread_name_prefix='job'
+                )
+            return self._executor
+
+    def submit(self, kind, target, **params):
+        """Queue target(job, **params) and return the Job"""
+        job = Job(kind, params)
+        with self._lock:
+            self._jobs[job.id] = job
+            self._prune()
+        self._get_executor().submit(self._run, job, target, params)
+        return job
+
+    def start(self, kind, target, **params):
+        """
+        Return the queued or running job that conflicts with this one, or submit
+        a new one. Returns (job, created).
+
+        Ingestion jobs conflict with any unfinished job writing the same data
+        (INGEST_WRITES), whatever its parameters; other jobs only with a job of
+        the same kind and parameters.
+        """
+        writes = INGEST_WRITES.get(kind)
+        with self._lock:
+            for job in self._jobs.values():
+                if job.finished:
+                    continue
+                if writes and writes & INGEST_WRITES.get(job.kind, set()):
+                    return job, False
+                if job.kind == kind and job.params == params:
+                    return job, False
+            job = Job(kind, params)
+            self._jobs[job.id] = job
+            self._prune()
+        self._get_executor().submit(self._run, job, target, params)
+        return job, True
+
+    def _run(self, job, target, params):
+        if job.cancelled:
+            job.set_status(CANCELLED)
+            return
+        job.set_status(RUNNING)
+        start = time.time()
+        status = COMPLETE
+        try:
+            job.result = target(job, **params)
+            if job.cancelled:
+                status = CANCELLED
+        except JobCancelled:
+            status = CANCELLED
+        except Exception as e:
+            status = ERROR
+            job.error = str(e)
+            print(f"Job {job.id} ({job.kind}) failed: {e}\n{traceback.format_exc()}")
+        finally:
+            job.set_status(status)
+            print(f"Job {job.id} ({job.kind}) finished with status {job.status} in {time.time() - start:.1f} seconds")
+
+    def _prune(self):
+        finished = [job for job in self._jobs.values() if job.finished]
+        if len(finished) > self.keep_finished:
+            finished.sort(key=lambda job: job.finished_at or job.created_at)
+            for job in finished[:len(finished) - self.keep_finished]:
+                del self._jobs[job.id]
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def list(self):
+        with self._lock:
+            jobs = list(self._jobs.values())
+        return sorted(jobs, key=lambda job: job.created_at, reverse=True)
+
+    def cancel(self, job_id):
+        job = self.get(job_id)
+        if job is None:
+            return None
+        job.cancel()
+        return job
+
+
+# Process-wide job runner used by the admin routes
+job_runner = JobRunner(max_workers=int(os.getenv('JOB_WORKERS', '2')))
+
+
+# Run the post-ingest hooks (app/scheduler.py) once an admin ingestion job has stored its rows
+def run_post_ingest(job, trading_date=None):
+    from app.scheduler import NPT, run_post_ingest_hooks
+    job.check_cancelled()
+    trading_date = trading_date or datetime.datetime.now(NPT).date().isoformat()
+    job.log(f"Running post-ingest hooks for {trading_date}")
+    run_post_ingest_hooks(trading_date)
+
+
+def fetch_stocks(job, resume=False, start_date=None, end_date=None):
+    from app.scripts import fetch_new_stock_data
+    return fetch_new_stock_data.main(resume=resume, job=job, start_date=start_date, end_date=end_date)
+
+
+def fetch_indices(job, start_date=None, end_date=None):
+    import asyncio
+    from app.scripts import fetch_new_indices_data
+    return asyncio.run(fetch_new_indices_data.download_new_index_data(job=job, start_date=start_date, end_date=end_date))
+
+
+# Job targets wrapping the ingestion scripts
+def run_stocks_update(job, resume=False, start_date=None, end_date=None):
+    """Fetch new stock prices, or backfill a date range when start_date/end_date are given"""
+    result = fetch_stocks(job, resume=resume, start_date=start_date, end_date=end_date)
+    run_post_ingest(job, end_date)
+    return result
+
+
+def run_indices_update(job, start_date=None, end_date=None):
+    """Fetch new index values, or backfill a date range when start_date/end_date are given"""
+    result = fetch_indices(job, start_date=start_date, end_date=end_date)
+    run_post_ingest(job, end_date)
+    return result
+
+
+def run_script(job, script_name, args=()):
+    """
+    Run an ingestion script in a subprocess with --progress-json and publish
+    its progress events on the job. The script's log output goes to a file.
+    """
+    from app.scripts.progress import read_progress_events
+    
+    script_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'scripts', script_name)
+    log_path = os.path.join(tempfile.gettempdir(), f"{os.path.splitext(script_name)[0]}.log")
+    
+    # Ensure the PYTHONPATH includes the app directory
+    env = os.environ.copy()
+    app_dir = os.path.dirname(os.path.abspath(__file__))
+    python_path = env.get('PYTHONPATH', '')
+    if app_dir not in python_path:
+        env['PYTHONPATH'] = f"{python_path}{os.pathsep}{app_dir}" if python_path else app_dir
+    
+    with open(log_path, 'w') as log_file:
+        process = subprocess.Popen(
+            [sys.executable, script_path, '--progress-json', *args],
+            stdout=subprocess.PIPE,
+            stderr=log_file,
+            text=True,
+            bufsize=1,
+            env=env
+        )
+        job.log(f"Started {script_name} (log file: {log_path})")
+        
+        # Stop the subprocess when the job is cancelled; a stock run can be resumed later
+        def watch_for_cancel():
+            while process.poll() is None:
+                if job.wait_for_cancel(1.0):
+                    process.terminate()
+                    return
+        threading.Thread(target=watch_for_cancel, name=f"job-{job.id}-cancel", daemon=True).start()
+        
+        for event in read_progress_events(process.stdout):
+            if 'total' in event:
+                job.set_progress(event['total'], event.get('done', 0), event.get('rows', 0), event.get('errors', 0))
+            job.publish(event)
+        
+        process.stdout.close()
+        return_code = process.wait()
+    
+    job.check_cancelled()
+    if return_code != 0:
+        raise RuntimeError(f"{script_name} exited with code {return_code}, see {log_path}")
+    return {'returncode': return_code, 'log_file': log_path}
+
+
+def run_ingest_script(job, script_name, args=()):
+    """Run an ingestion script with run_script, then the post-ingest hooks"""
+    result = run_script(job, script_name, args)
+    run_post_ingest(job)
+    return result
+
+
+def run_full_update(job, start_date=None, end_date=None):
+    """Update indices then stocks in one job, then run the post-ingest hooks once"""
+    indices_result = fetch_indices(job, start_date=start_date, end_date=end_date)
+    job.check_cancelled()
+    stocks_result = fetch_stocks(job, start_date=start_date, end_date=end_date)
+    run_post_ingest(job, end_date)
+    return {'indices': indices_result, 'stocks': stocks_result}
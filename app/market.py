@@ -0,0 +1,276 @@
+import datetime
+import os
+import threading
+import time
+import numpy as np
+from app.series import forward_fill
+from app.storage.base import COMPANY_LIST_FIELDS, to_datetime
+
+# Benchmark the betas are measured against
+BENCHMARK = os.getenv('MARKET_BENCHMARK', 'NEPSE Index')
+
+# Windows (trading days) whose correlation and beta are precomputed
+STANDARD_WINDOWS = tuple(int(window) for window in os.getenv('MARKET_WINDOWS', '60,120,250').split(','))
+
+# Trading days of closes kept in the matrix: the longest window plus room for rolling series
+MATRIX_DAYS = int(os.getenv('MATRIX_DAYS', str(max(STANDARD_WINDOWS) * 2 + 1)))
+
+# A company needs returns on this share of a window's days to get a correlation or beta
+MIN_COVERAGE = float(os.getenv('MARKET_MIN_COVERAGE', '0.8'))
+
+# Stock fields kept as dates x companies matrices (the screener uses all of them)
+MATRIX_FIELDS = ('open', 'high', 'low', 'close', 'per_change', 'traded_quantity', 'traded_amount')
+
+# How often requests check the database for a newer trading day
+MATRIX_CHECK_SECONDS = int(os.getenv('MATRIX_CHECK_SECONDS', '60'))
+
+
+def daily_returns(closes):
+    """Percent returns between consecutive rows of a dates x series close matrix; the first row is NaN"""
+    result = np.full(closes.shape, np.nan)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        result[1:] = closes[1:] / closes[:-1] - 1
+    return result
+
+
+def beta_correlation(returns, market):
+    """
+    Beta and correlation of each column of returns (days x companies)
+    against market returns (days), using only days where both exist.
+    Columns below MIN_COVERAGE of the days are NaN.
+    """
+    valid = ~np.isnan(returns) & ~np.isnan(market)[:, None]
+    count = valid.sum(axis=0)
+    x = np.where(valid, market[:, None], 0.0)
+    y = np.where(valid, returns, 0.0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean_x = x.sum(axis=0) / count
+        mean_y = y.sum(axis=0) / count
+        cov = (x * y).sum(axis=0) / count - mean_x * mean_y
+        var_x = (x * x).sum(axis=0) / count - mean_x ** 2
+        var_y = (y * y).sum(axis=0) / count - mean_y ** 2
+        beta = cov / var_x
+        correlation = cov / np.sqrt(var_x * var_y)
+    enough = count >= MIN_COVERAGE * len(market)
+    return np.where(enough, beta, np.nan), np.where(enough, correlation, np.nan)
+
+
+def correlation_matrix(returns):
+    """Pairwise correlation of the columns of returns; columns with any missing day are NaN"""
+    complete = ~np.isnan(returns).any(axis=0)
+    result = np.full((returns.shape[1], returns.shape[1]), np.nan)
+    if complete.sum() > 1:
+        with np.errstate(divide='ignore', invalid='ignore'):
+            result[np.ix_(complete, complete)] = np.corrcoef(returns[:, complete], rowvar=False)
+    return result
+
+
+def rolling_beta_correlation(stock, market, window):
+    """Beta and correlation of one return series against the market over a sliding window"""
+    valid = ~np.isnan(stock) & ~np.isnan(market)
+    x = np.where(valid, market, 0.0)
+    y = np.where(valid, stock, 0.0)
+
+    # Window sums from cumulative sums: sum[i] covers rows i-window+1 .. i
+    def rolling_sum(values):
+        total = np.concatenate([[0.0], np.cumsum(values)])
+        return total[window:] - total[:-window]
+
+    count = rolling_sum(valid.astype(np.float64))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean_x = rolling_sum(x) / count
+        mean_y = rolling_sum(y) / count
+        cov = rolling_sum(x * y) / count - mean_x * mean_y
+        var_x = rolling_sum(x * x) / count - mean_x ** 2
+        var_y = rolling_sum(y * y) / count - mean_y ** 2
+        beta = cov / var_x
+        correlation = cov / np.sqrt(var_x * var_y)
+    enough = count >= MIN_COVERAGE * window
+    return np.where(enough, beta, np.nan), np.where(enough, correlation, np.nan)
+
+
+class MarketMatrix:
+    """
+    Dates x companies matrices of prices and volumes (MATRIX_FIELDS) for
+    the last MATRIX_DAYS trading days, plus the benchmark's closes on the
+    same dates. NaN marks a day a company did not trade. It is loaded
+    once, then refreshed by re-reading its last day (which may have been
+    stored partially) and appending newer ones, and the standard-window
+    correlations and betas are recomputed from it when it changes.
+    """
+
+    def __init__(self):
+        self.dates = np.array([], dtype='datetime64[D]')
+        self.company_ids = np.array([], dtype=np.int64)
+        self.symbols = []
+        self.values = {field: np.empty((0, 0)) for field in MATRIX_FIELDS}
+        self.market = np.array([])
+        self.loaded_at = None
+        self._checked_at = 0
+        self._results = {}
+        self._lock = threading.RLock()
+
+    @property
+    def closes(self):
+        return self.values['close']
+
+    @property
+    def last_date(self):
+        return self.dates[-1].item() if len(self.dates) else None
+
+    # Loading
+    def load(self, storage):
+        """Build the matrix from scratch"""
+        latest = storage.latest_index_date()
+        if latest is None:
+            return self
+        # Enough calendar days to cover MATRIX_DAYS trading days (about 240 trading days a year)
+        since = latest - datetime.timedelta(days=int(MATRIX_DAYS * 1.6) + 30)
+        with self._lock:
+            self.dates = np.array([], dtype='datetime64[D]')
+            self.company_ids = np.array([], dtype=np.int64)
+            self.symbols = []
+            self.values = {field: np.empty((0, 0)) for field in MATRIX_FIELDS}
+            self.market = np.array([])
+            self._append(storage, since)
+        return self
+
+    def refresh(self, storage):
+        """Re-read the last trading day of the matrix and append newer ones; loads it on first use"""
+        with self._lock:
+            if not len(self.dates):
+                return self.load(storage)
+            self._append(storage, to_datetime(self.last_date))
+        return self
+
+    # Replace the days from since onwards with what the database holds now
+    def _append(self, storage, since):
+        # The benchmark's dates are the trading days
+        benchmark = storage.index_history(BENCHMARK, start=since, fields=('published_date', 'current'))
+        if not benchmark:
+            return
+        new_dates = np.array([row['published_date'].date() for row in benchmark], dtype='datetime64[D]')
+        new_market = np.array([np.nan if row.get('current') is None else row['current'] for row in benchmark])
+        kept = int(np.searchsorted(self.dates, np.datetime64(since.date(), 'D')))
+
+        # Companies listed since the last load get a new column, NaN before their first row
+        companies = storage.companies(fields=COMPANY_LIST_FIELDS)
+        known = set(self.company_ids.tolist())
+        added = [company for company in companies if company['company_id'] not in known]
+        if added:
+            self.company_ids = np.concatenate([self.company_ids, [company['company_id'] for company in added]]).astype(np.int64)
+            self.symbols = self.symbols + [company['symbol'] for company in added]
+            for field, matrix in self.values.items():
+                self.values[field] = np.hstack([matrix, np.full((len(self.dates), len(added)), np.nan)])
+
+        blocks = {field: np.full((len(new_dates), len(self.company_ids)), np.nan) for field in MATRIX_FIELDS}
+        columns = {company_id: column for column, company_id in enumerate(self.company_ids.tolist())}
+        rows = storage.quotes_for(self.company_ids.tolist(), start=since, fields=('company_id', 'published_date') + MATRIX_FIELDS)
+        if rows:
+            row_dates = np.array([row['published_date'].date() for row in rows], dtype='datetime64[D]')
+            positions = np.searchsorted(new_dates, row_dates)
+            inside = positions < len(new_dates)
+            inside[inside] = new_dates[positions[inside]] == row_dates[inside]
+            company_columns = np.array([columns[row['company_id']] for row in rows])
+            for field, block in blocks.items():
+                values = np.array([np.nan if row.get(field) is None else row[field] for row in rows])
+                block[positions[inside], company_columns[inside]] = values[inside]
+
+        # Keep the cached results when the re-read days did not change
+        unchanged = (
+            not added
+            and np.array_equal(self.dates[kept:], new_dates)
+            and np.array_equal(self.market[kept:], new_market, equal_nan=True)
+            and all(np.array_equal(self.values[field][kept:], block, equal_nan=True) for field, block in blocks.items())
+        )
+        if unchanged:
+            return
+
+        # Keep only the last MATRIX_DAYS trading days
+        self.dates = np.concatenate([self.dates[:kept], new_dates])[-MATRIX_DAYS:]
+        self.market = np.concatenate([self.market[:kept], new_market])[-MATRIX_DAYS:]
+        for field, block in blocks.items():
+            self.values[field] = np.vstack([self.values[field][:kept], block])[-MATRIX_DAYS:]
+        self.loaded_at = datetime.datetime.now()
+        self._results = {}
+        print(f"Market matrix: {len(self.dates)} days x {len(self.company_ids)} companies through {self.last_date}")
+
+    def current(self, storage):
+        """The matrix, refreshed when a newer trading day may exist (checked at most every MATRIX_CHECK_SECONDS)"""
+        if time.time() - self._checked_at >= MATRIX_CHECK_SECONDS:
+            self._checked_at = time.time()
+            self.refresh(storage)
+        return self
+
+    def snapshot(self):
+        """(dates, company_ids, symbols, values) of one consistent version; appends replace the arrays, never modify them"""
+        with self._lock:
+            return self.dates, self.company_ids, list(self.symbols), dict(self.values)
+
+    # Analytics
+    def returns(self, window):
+        """(dates, stock returns, market returns) for the last window trading days"""
+        with self._lock:
+            closes = forward_fill(self.closes.T).T
+            stock = daily_returns(closes)[-window:]
+            market = daily_returns(self.market[:, None])[-window:, 0]
+            return self.dates[-window:], stock, market
+
+    def window_stats(self, window):
+        """Beta and correlation of every company against the benchmark over the last window days (cached)"""
+        with self._lock:
+            if window not in self._results:
+                dates, stock, market = self.returns(window)
+                beta, correlation = beta_correlation(stock, market)
+                self._results[window] = {'dates': dates, 'beta': beta, 'correlation': correlation, 'returns': stock}
+            return self._results[window]
+
+    def column(self, symbol):
+        try:
+            return self.symbols.index(symbol)
+        except ValueError:
+            return None
+
+    def rolling(self, symbol, window):
+        """Rolling beta and correlation of one company, one value per day once a full window is available"""
+        column = self.column(symbol)
+        if column is None or len(self.dates) <= window:
+            return None
+        with self._lock:
+            closes = forward_fill(self.closes[:, column][None, :])[0]
+            stock = daily_returns(closes[:, None])[:, 0]
+            market = daily_returns(self.market[:, None])[:, 0]
+            beta, correlation = rolling_beta_correlation(stock, market, window)
+            return {'dates': self.dates[window - 1:], 'beta': beta, 'correlation': correlation}
+
+
+market_matrix = MarketMatrix()
+
+
+# Post-ingest hook: re-read the matrix's last day, append the new ones and drop the cached results
+def refresh_market_matrix(app):
+    def refresh(trading_date):
+        from app import get_storage
+        with app.app_context():
+            market_matrix.refresh(get_storage())
+    refresh.__name__ = 'refresh_market_matrix'
+    return refresh
+
+
+# Precompute the standard windows in the background (MARKET_MATRIX_ON_STARTUP=1)
+def init_market_matrix(app):
+    if os.getenv('MARKET_MATRIX_ON_STARTUP', '0') != '1':
+        return market_matrix
+
+    def warm():
+        from app import get_storage
+        try:
+            with app.app_context():
+                market_matrix.current(get_storage())
+                for window in STANDARD_WINDOWS:
+                    market_matrix.window_stats(window)
+        except Exception as e:
+            print(f"Market matrix warm-up failed: {e}")
+
+    threading.Thread(target=warm, name='market-matrix', daemon=True).start()
+    return market_matrix
@@ -0,0 +1,199 @@
+import collections
+import os
+import threading
+import time
+import bson
+from flask import g, has_request_context, request
+from pymongo import monitoring
+from app.scripts.metrics import Histogram, LATENCY_BUCKETS, PAGE_BUCKETS
+
+# Commands above this duration are kept in the slow command log
+SLOW_COMMAND_MS = float(os.getenv('SLOW_COMMAND_MS', '100'))
+
+# The same command on the same collection this many times in one request is reported as N+1
+N_PLUS_ONE_THRESHOLD = int(os.getenv('N_PLUS_ONE_THRESHOLD', '10'))
+
+# Number of slow commands and N+1 warnings kept for the admin metrics page
+PROFILE_LOG_SIZE = int(os.getenv('PROFILE_LOG_SIZE', '100'))
+
+# Upper bounds of the documents-per-request histogram buckets
+DOCUMENT_BUCKETS = (1, 10, 100, 1000, 10000, 100000)
+
+
+# Documents in a command reply: cursor batches for find/aggregate/getMore, n for counts
+def reply_documents(reply):
+    cursor = reply.get('cursor')
+    if isinstance(cursor, dict):
+        return len(cursor.get('firstBatch', cursor.get('nextBatch', [])))
+    if 'values' in reply:
+        return len(reply['values'])
+    return 1 if reply.get('ok') else 0
+
+
+# Mongo commands run while handling one Flask request
+class RequestProfile:
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.commands = []
+        self._pending = {}
+
+    def command_started(self, event):
+        self._pending[event.request_id] = (event.command_name, event.command.get(event.command_name))
+
+    def command_finished(self, event, reply=None, failed=False):
+        command_name, collection = self._pending.pop(event.request_id, (event.command_name, None))
+        self.commands.append({
+            'command': command_name,
+            'collection': collection if isinstance(collection, str) else None,
+            'ms': event.duration_micros / 1000,
+            'documents': reply_documents(reply) if reply else 0,
+            'bytes': len(bson.encode(reply)) if reply else 0,
+            'failed': failed
+        })
+
+    @property
+    def mongo_ms(self):
+        return sum(command['ms'] for command in self.commands)
+
+    def repeated_commands(self):
+        """(command, collection, count) for commands repeated at least N_PLUS_ONE_THRESHOLD times"""
+        counts = collections.Counter((command['command'], command['collection']) for command in self.commands)
+        return [(name, collection, count) for (name, collection), count in counts.items() if count >= N_PLUS_ONE_THRESHOLD]
+
+    def server_timing(self, total_ms):
+        """Server-Timing header value: total Mongo time plus one entry per command name"""
+        by_name = collections.defaultdict(float)
+        for command in self.commands:
+            by_name[command['command']] += command['ms']
+        documents = sum(command['documents'] for command in self.commands)
+        reply_bytes = sum(command['bytes'] for command in self.commands)
+        entries = [
+            f'mongo;dur={self.mongo_ms:.2f};desc="{len(self.commands)} commands, {documents} docs, {reply_bytes} bytes"'
+        ]
+        entries.extend(f"mongo-{name};dur={ms:.2f}" for name, ms in by_name.items())
+        entries.append(f"app;dur={total_ms:.2f}")
+        return ', '.join(entries)
+
+
+# Command listener that attributes Mongo commands to the current Flask request
+class CommandProfiler(monitoring.CommandListener):
+
+    @staticmethod
+    def _profile():
+        if has_request_context():
+            return g.get('mongo_profile')
+        return None
+
+    def started(self, event):
+        profile = self._profile()
+        if profile is not None:
+            profile.command_started(event)
+
+    def succeeded(self, event):
+        profile = self._profile()
+        if profile is not None:
+            profile.command_finished(event, event.reply)
+
+    def failed(self, event):
+        profile = self._profile()
+        if profile is not None:
+            profile.command_finished(event, failed=True)
+
+
+# Per-endpoint request and Mongo statistics
+class EndpointStats:
+
+    def __init__(self):
+        self.requests = 0
+        self.latency = Histogram(LATENCY_BUCKETS)
+        self.mongo_latency = Histogram(LATENCY_BUCKETS)
+        self.commands = Histogram(PAGE_BUCKETS)
+        self.documents = Histogram(DOCUMENT_BUCKETS)
+        self.reply_bytes = 0
+        self.n_plus_one = 0
+
+    def to_dict(self):
+        return {
+            'requests': self.requests,
+            'latency': self.latency.to_dict(),
+            'mongo_latency': self.mongo_latency.to_dict(),
+            'commands': self.commands.to_dict(),
+            'documents': self.documents.to_dict(),
+            'reply_bytes': self.reply_bytes,
+            'n_plus_one': self.n_plus_one
+        }
+
+
+class ProfileStats:
+    """Aggregates request profiles by endpoint and keeps recent slow commands and N+1 warnings"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started_at = time.time()
+        self.endpoints = {}
+        self.slow_commands = collections.deque(maxlen=PROFILE_LOG_SIZE)
+        self.n_plus_one = collections.deque(maxlen=PROFILE_LOG_SIZE)
+
+    def record(self, endpoint, profile, total_ms):
+        repeated = profile.repeated_commands()
+        with self._lock:
+            stats = self.endpoints.setdefault(endpoint, EndpointStats())
+            stats.requests += 1
+            stats.latency.observe(total_ms / 1000)
+            stats.mongo_latency.observe(profile.mongo_ms / 1000)
+            stats.commands.observe(len(profile.commands))
+            stats.documents.observe(sum(command['documents'] for command in profile.commands))
+            stats.reply_bytes += sum(command['bytes'] for command in profile.commands)
+            if repeated:
+                stats.n_plus_one += 1
+            for command in profile.commands:
+                if command['ms'] >= SLOW_COMMAND_MS:
+                    self.slow_commands.appendleft({'at': time.time(), 'endpoint': endpoint, **command})
+            for name, collection, count in repeated:
+                self.n_plus_one.appendleft({'at': time.time(), 'endpoint': endpoint, 'command': name, 'collection': collection, 'count': count})
+
+    def to_dict(self):
+        with self._lock:
+            endpoints = {endpoint: stats.to_dict() for endpoint, stats in self.endpoints.items()}
+            return {
+                'since': self.started_at,
+                'endpoints': dict(sorted(endpoints.items(), key=lambda item: -item[1]['latency']['sum'])),
+                'slow_commands': list(self.slow_commands),
+                'n_plus_one': list(self.n_plus_one)
+            }
+
+    def reset(self):
+        with self._lock:
+            self.started_at = time.time()
+            self.endpoints.clear()
+            self.slow_commands.clear()
+            self.n_plus_one.clear()
+
+
+command_profiler = CommandProfiler()
+profile_stats = ProfileStats()
+
+
+# Profile Mongo commands per request (PROFILE_MONGO=0 to turn off)
+def init_profiling(app):
+    if os.getenv('PROFILE_MONGO', '1') != '1':
+        return
+
+    # Applies to every MongoClient created after this point
+    monitoring.register(command_profiler)
+
+    @app.before_request
+    def start_profile():
+        g.mongo_profile = RequestProfile()
+
+    @app.after_request
+    def finish_profile(response):
+        profile = g.pop('mongo_profile', None)
+        if profile is None:
+            return response
+        total_ms = (time.perf_counter() - profile.started) * 1000
+        response.headers['Server-Timing'] = profile.server_timing(total_ms)
+        if request.endpoint and request.endpoint != 'static':
+            profile_stats.record(request.endpoint, profile, total_ms)
+        return response
@@ -2,7 +2,13 @@ from flask import Blueprint, render_template, redirect, url_for, flash, request,
 from flask_login import login_user, logout_user, login_required, current_user
 from werkzeug.security import check_password_hash
 from app import get_db
+from app.indexes import index_manager
+from app.profiling import profile_stats
+from app.jobs import job_runner, run_full_update as run_full_update_job
+from app.jobs import run_indices_update as run_indices_update_job, run_stocks_update as run_stocks_update_job
+from app.jobs import run_ingest_script, run_script as run_script_job
 from app.models.user import User
+from app.scripts.progress import describe_event
 from flask_wtf import FlaskForm
 from wtforms import StringField, PasswordField, SubmitField, TextAreaField, IntegerField
 from wtforms.validators import DataRequired, Optional
@@ -12,10 +18,9 @@ from dotenv import load_dotenv
 from bson import ObjectId
 from datetime import datetime
 import subprocess
-import threading
-import queue
 import json
 import sys
+import time
 from flask import Response, stream_with_context
 
 auth = Blueprint('auth', __name__)
@@ -243,6 +248,15 @@ def admin_data():
         latest_indices=latest_indices['published_date'] if latest_indices else None
     )
 
+# Parse an optional YYYY-MM-DD form field, returning None when blank or invalid
+def parse_form_date(value):
+    if not value:
+        return None
+    try:
+        return datetime.strptime(value, '%Y-%m-%d')
+    except ValueError:
+        return None
+
 # Update stocks data route
 @auth.route('/admin/update/stocks', methods=['POST'])
 @login_required
@@ -254,10 +268,14 @@ def update_stocks():
     
     # Get the date from the form
     date_str = request.form.get('date')
+    update_date = parse_form_date(date_str)
+    if update_date is None:
+        flash('Please choose a valid date.', 'danger')
+        return redirect(url_for('auth.admin_data'))
     
-    # TODO: Implement actual data fetching from NEPSE API
-    # For now, just show a success message
-    flash(f'Stock data update for {date_str} initiated. This will be processed in the background.', 'info')
+    # Fetch that trading day for every company in a background job
+    job, created = job_runner.start('stocks', run_stocks_update_job, start_date=date_str, end_date=date_str)
+    flash(f'Stock data update for {date_str} {"started as" if created else "is already running as"} job {job.id}.', 'info')
     
     return redirect(url_for('auth.admin_data'))
 
@@ -272,10 +290,13 @@ def update_indices():
     
     # Get the date from the form
     date_str = request.form.get('date')
+    update_date = parse_form_date(date_str)
+    if update_date is None:
+        flash('Please choose a valid date.', 'danger')
+        return redirect(url_for('auth.admin_data'))
     
-    # TODO: Implement actual data fetching from NEPSE API
-    # For now, just show a success message
-    flash(f'Index data update for {date_str} initiated. This will be processed in the background.', 'info')
+    job, created = job_runner.start('indices', run_indices_update_job, start_date=date_str, end_date=date_str)
+    flash(f'Index data update for {date_str} {"started as" if created else "is already running as"} job {job.id}.', 'info')
     
     return redirect(url_for('auth.admin_data'))
 
@@ -293,166 +314,206 @@ def bulk_update():
     end_date = request.form.get('end_date')
     data_type = request.form.get('data_type')
     
-    # TODO: Implement actual bulk data fetching from NEPSE API
-    # For now, just show a success message
-    flash(f'Bulk update initiated for {data_type} from {start_date} to {end_date}. This will be processed in the background.', 'info')
+    start = parse_form_date(start_date)
+    end = parse_form_date(end_date)
+    if start is None or end is None or start > end:
+        flash('Please choose a valid date range.', 'danger')
+        return redirect(url_for('auth.admin_data'))
+    
+    # Backfill the range as a background job
+    targets = {
+        'stocks': run_stocks_update_job,
+        'indices': run_indices_update_job,
+        'both': run_full_update_job
+    }
+    if data_type not in targets:
+        flash('Unknown data type.', 'danger')
+        return redirect(url_for('auth.admin_data'))
+    
+    job, created = job_runner.start(data_type, targets[data_type], start_date=start_date, end_date=end_date)
+    flash(f'Bulk update for {data_type} from {start_date} to {end_date} {"started as" if created else "is already running as"} job {job.id}.', 'info')
     
     return redirect(url_for('auth.admin_data'))
 
-# Helper function to run a script and capture output in real-time
-def run_script_with_live_output(script_path, output_queue):
-    """
-    Runs a Python script and captures its output in real-time,
-    sending it to a queue for streaming to the client.
-    """
-    try:
-        # Log the script path being executed
-        output_queue.put({
-            'progress': 5,
-            'log': f"Attempting to run script: {script_path}"
-        })
+# Background job status routes
+@auth.route('/admin/jobs')
+@login_required
+def list_jobs():
+    """List recent background jobs, newest first"""
+    if not current_user.is_admin:
+        return jsonify({'error': 'Access denied. Admin privileges required.'}), 403
+    
+    from app import scheduler
+    ingest_scheduler = scheduler.scheduler
+    return jsonify({
+        'jobs': [job.to_dict() for job in job_runner.list()],
+        'scheduler': {
+            'enabled': ingest_scheduler is not None,
+            'last_check': ingest_scheduler.last_check if ingest_scheduler else None,
+            'last_ingested': str(ingest_scheduler.last_ingested) if ingest_scheduler and ingest_scheduler.last_ingested else None
+        }
+    })
 
-        # Create a copy of the current environment variables
-        env = os.environ.copy()
-        
-        # Ensure the PYTHONPATH includes the app directory
-        python_path = env.get('PYTHONPATH', '')
-        app_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-        if app_dir not in python_path:
-            if python_path:
-                env['PYTHONPATH'] = f"{python_path}{os.pathsep}{app_dir}"
-            else:
-                env['PYTHONPATH'] = app_dir
-        
-        # Log the environment setup
-        output_queue.put({
-            'log': f"Setting up environment with PYTHONPATH: {env.get('PYTHONPATH')}"
-        })
-        
-        # Start the process with the enhanced environment
-        process = subprocess.Popen(
-            [sys.executable, script_path],
-            stdout=subprocess.PIPE,
-            stderr=subprocess.STDOUT,
-            text=True,
-            bufsize=1,
-            universal_newlines=True,
-            env=env
-        )
-        
-        # Send initial progress
-        output_queue.put({
-            'progress': 10,
-            'log': f"Starting process: {os.path.basename(script_path)}"
-        })
-        
-        # Track completed percentage
-        line_count = 0
-        progress = 10
-        
-        # Read output line by line as it becomes available
-        for line in iter(process.stdout.readline, ''):
-            line_count += 1
-            # Update progress estimation (maxes out at 95%)
-            if line_count % 10 == 0 and progress < 95:
-                progress += 1
-                output_queue.put({'progress': progress})
-            
-            # Forward the output line to the queue
-            output_queue.put({'log': line.rstrip()})
-        
-        # Wait for process to complete
-        process.stdout.close()
-        return_code = process.wait()
-        
-        if return_code == 0:
-            output_queue.put({
-                'status': 'complete',
-                'progress': 100,
-                'log': f"Process completed successfully"
-            })
-        else:
-            output_queue.put({
-                'status': 'error',
-                'progress': 100,
-                'log': f"Process exited with code {return_code}"
-            })
+@auth.route('/admin/jobs/<job_id>')
+@login_required
+def job_status(job_id):
+    """Status and progress of one background job"""
+    if not current_user.is_admin:
+        return jsonify({'error': 'Access denied. Admin privileges required.'}), 403
     
-    except Exception as e:
-        import traceback
-        error_details = traceback.format_exc()
-        output_queue.put({
-            'status': 'error',
-            'progress': 0,
-            'log': f"Error running script: {str(e)}\n{error_details}"
-        })
+    job = job_runner.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job.to_dict())
 
-# Routes for streaming updates using Server-Sent Events (SSE)
-@auth.route('/admin/update-indices')
+@auth.route('/admin/jobs/<job_id>/cancel', methods=['POST'])
 @login_required
-def update_indices_stream():
-    """Stream the indices update process to the client using SSE"""
-    # Check if user is admin
+def cancel_job(job_id):
+    """Ask a background job to stop at its next checkpoint"""
     if not current_user.is_admin:
         return jsonify({'error': 'Access denied. Admin privileges required.'}), 403
     
-    # Get the path to the fetch_new_indices_data.py script
-    script_path = os.path.join(
-        os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 
-        'scripts', 
-        'fetch_new_indices_data.py'
-    )
+    job = job_runner.cancel(job_id)
+    if job is None:
+        return jsonify({'success': False, 'error': 'Job not found'}), 404
+    return jsonify({'success': True, 'job': job.to_dict()})
+
+# Ingestion metrics route
+@auth.route('/admin/ingest-runs')
+@login_required
+def ingest_runs():
+    """Metrics of recent ingestion runs, newest first (?script=stocks to filter, ?limit=N)"""
+    if not current_user.is_admin:
+        return jsonify({'error': 'Access denied. Admin privileges required.'}), 403
     
-    # Debug the script path to make sure it exists
-    print(f"Looking for script at path: {script_path}")
-    if not os.path.isfile(script_path):
-        print(f"WARNING: Script file not found at {script_path}")
-        # Try alternative path relative to current working directory
-        alt_script_path = os.path.join('app', 'scripts', 'fetch_new_indices_data.py')
-        if os.path.isfile(alt_script_path):
-            script_path = alt_script_path
-            print(f"Found script at alternative path: {script_path}")
-        else:
-            print(f"ERROR: Script not found at alternative path either: {alt_script_path}")
-            return jsonify({"error": "Script file not found"}), 404
+    db = get_db()
+    query = {'script': request.args['script']} if request.args.get('script') else {}
+    limit = min(request.args.get('limit', 20, type=int), 200)
+    runs = list(db[os.getenv('INGEST_RUNS', 'ingest_runs')].find(query, {'_id': 0}).sort('started_at', -1).limit(limit))
+    return jsonify({'runs': runs})
+
+# Index management routes
+@auth.route('/admin/indexes')
+@login_required
+def admin_indexes():
+    """Required indexes and the query plans of the hot queries (?format=json for JSON)"""
+    if not current_user.is_admin:
+        flash('Access denied. Admin privileges required.', 'danger')
+        return redirect(url_for('main.index'))
     
-    # Function to generate SSE events
-    def generate():
-        output_queue = queue.Queue()
-        
-        # Start the script in a separate thread
-        thread = threading.Thread(
-            target=run_script_with_live_output,
-            args=(script_path, output_queue)
-        )
-        thread.daemon = True
-        thread.start()
-        
-        # Stream events from the queue to the client
-        try:
-            while True:
-                try:
-                    # Get data from the queue with a timeout
-                    data = output_queue.get(timeout=90)
-                    
-                    # Yield the data as an SSE event
-                    yield f"data: {json.dumps(data)}\n\n"
-                    
-                    # Check if the process is complete or had an error
-                    if data.get('status') in ['complete', 'error']:
-                        break
-                    
-                except queue.Empty:
-                    # If no output for 90 seconds, send a keepalive event
-                    yield f"data: {json.dumps({'log': 'Still processing...'})}\n\n"
-                    
-        except GeneratorExit:
-            # Client disconnected
-            pass
+    if request.args.get('format') == 'json':
+        # A missing unique index is a failure, so monitoring polling this endpoint sees it
+        report = index_manager.report
+        return jsonify({'running': index_manager.running, 'report': report}), 500 if report and not report.get('ok', True) else 200
+    return render_template('auth/indexes.html', report=index_manager.report, running=index_manager.running)
+
+@auth.route('/admin/indexes/check', methods=['POST'])
+@login_required
+def check_indexes():
+    """Create missing indexes and re-run explain() on the hot queries in the background"""
+    if not current_user.is_admin:
+        flash('Access denied. Admin privileges required.', 'danger')
+        return redirect(url_for('main.index'))
+    
+    if index_manager.start():
+        flash('Index check started. Refresh this page in a few seconds.', 'info')
+    else:
+        flash('An index check is already running.', 'warning')
+    return redirect(url_for('auth.admin_indexes'))
+
+# Request profiling routes
+@auth.route('/admin/metrics')
+@login_required
+def admin_metrics():
+    """Per-endpoint request and Mongo command statistics (?format=json for JSON)"""
+    if not current_user.is_admin:
+        flash('Access denied. Admin privileges required.', 'danger')
+        return redirect(url_for('main.index'))
+    
+    stats = profile_stats.to_dict()
+    if request.args.get('format') == 'json':
+        return jsonify(stats)
+    return render_template('auth/metrics.html', stats=stats, since=datetime.fromtimestamp(stats['since']))
+
+@auth.route('/admin/metrics/reset', methods=['POST'])
+@login_required
+def reset_metrics():
+    if not current_user.is_admin:
+        flash('Access denied. Admin privileges required.', 'danger')
+        return redirect(url_for('main.index'))
+    
+    profile_stats.reset()
+    flash('Request metrics reset.', 'info')
+    return redirect(url_for('auth.admin_metrics'))
+
+# Minimum seconds between progress events forwarded to an SSE client
+SSE_PROGRESS_INTERVAL = float(os.getenv('SSE_PROGRESS_INTERVAL', '1.0'))
+
+# Convert a job event into the message format the admin dashboard reads
+def job_event_message(event):
+    if event.get('type') == 'finished':
+        status = event.get('status')
+        if status == 'complete':
+            return {'status': 'complete', 'progress': 100, 'log': "Process completed successfully"}
+        log = 'Job was cancelled' if status == 'cancelled' else f"Job failed: {event.get('error')}"
+        return {'status': 'error', 'progress': 100, 'log': log}
+    return {'progress': event.get('percent', 0), 'log': describe_event(event), 'event': event}
+
+# Stream a job's events as SSE, sending at most one progress event per SSE_PROGRESS_INTERVAL
+def generate_job_events(job):
+    """
+    Follows a job's event buffer, so any number of clients can watch the same
+    job. A client that connects late first gets the buffered events, with
+    their progress events coalesced into the latest one.
+    """
+    sequence = 0
+    pending = None
+    last_sent = 0.0
+    try:
+        yield f"data: {json.dumps({'progress': job.to_dict()['percent'], 'log': f'Following {job.kind} job {job.id}', 'job_id': job.id})}\n\n"
+        while True:
+            events = job.events_after(sequence, timeout=SSE_PROGRESS_INTERVAL if pending else 15)
+            if not events:
+                if pending is not None:
+                    # Send the latest coalesced progress once things go quiet
+                    last_sent = time.monotonic()
+                    yield f"data: {json.dumps(pending, default=str)}\n\n"
+                    pending = None
+                else:
+                    # Comment line keeps proxies from closing an idle connection
+                    yield ": keepalive\n\n"
+                continue
+            
+            for sequence, event in events:
+                data = job_event_message(event)
+                # Start, complete and error events are sent as they arrive; progress is coalesced
+                if event.get('type') == 'progress':
+                    pending = data
+                    continue
+                if pending is not None:
+                    yield f"data: {json.dumps(pending, default=str)}\n\n"
+                    pending = None
+                last_sent = time.monotonic()
+                yield f"data: {json.dumps(data, default=str)}\n\n"
+                if 'status' in data:
+                    return
+            
+            if pending is not None and time.monotonic() - last_sent >= SSE_PROGRESS_INTERVAL:
+                last_sent = time.monotonic()
+                yield f"data: {json.dumps(pending, default=str)}\n\n"
+                pending = None
+    except GeneratorExit:
+        # Client disconnected; the job keeps running for other viewers
+        pass
+
+# Start (or attach to) a script job and return its SSE stream; ingestion scripts run the post-ingest hooks after
+def stream_script_job(kind, script_name, target=run_ingest_script):
+    job, created = job_runner.start(kind, target, script_name=script_name)
+    print(f"{'Started' if created else 'Attached to'} {kind} job {job.id} for an SSE client")
     
     # Return the streaming response
     return Response(
-        stream_with_context(generate()),
+        stream_with_context(generate_job_events(job)),
         mimetype='text/event-stream',
         headers={
             'Cache-Control': 'no-cache',
@@ -460,77 +521,26 @@ def update_indices_stream():
         }
     )
 
+# Routes for streaming updates using Server-Sent Events (SSE)
+@auth.route('/admin/update-indices')
+@login_required
+def update_indices_stream():
+    """Stream the indices update to the client, sharing one job between all viewers"""
+    # Check if user is admin
+    if not current_user.is_admin:
+        return jsonify({'error': 'Access denied. Admin privileges required.'}), 403
+    
+    return stream_script_job('indices', 'fetch_new_indices_data.py')
+
 @auth.route('/admin/update-stocks')
 @login_required
 def update_stocks_stream():
-    """Stream the stocks update process to the client using SSE"""
+    """Stream the stocks update to the client, sharing one job between all viewers"""
     # Check if user is admin
     if not current_user.is_admin:
         return jsonify({'error': 'Access denied. Admin privileges required.'}), 403
     
-    # Get the path to the fetch_new_stock_data.py script
-    script_path = os.path.join(
-        os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 
-        'scripts', 
-        'fetch_new_stock_data.py'
-    )
-    
-    # Debug the script path to make sure it exists
-    print(f"Looking for script at path: {script_path}")
-    if not os.path.isfile(script_path):
-        print(f"WARNING: Script file not found at {script_path}")
-        # Try alternative path relative to current working directory
-        alt_script_path = os.path.join('app', 'scripts', 'fetch_new_stock_data.py')
-        if os.path.isfile(alt_script_path):
-            script_path = alt_script_path
-            print(f"Found script at alternative path: {script_path}")
-        else:
-            print(f"ERROR: Script not found at alternative path either: {alt_script_path}")
-            return jsonify({"error": "Script file not found"}), 404
-    
-    # Function to generate SSE events
-    def generate():
-        output_queue = queue.Queue()
-        
-        # Start the script in a separate thread
-        thread = threading.Thread(
-            target=run_script_with_live_output,
-            args=(script_path, output_queue)
-        )
-        thread.daemon = True
-        thread.start()
-        
-        # Stream events from the queue to the client
-        try:
-            while True:
-                try:
-                    # Get data from the queue with a timeout
-                    data = output_queue.get(timeout=90)
-                    
-                    # Yield the data as an SSE event
-                    yield f"data: {json.dumps(data)}\n\n"
-                    
-                    # Check if the process is complete or had an error
-                    if data.get('status') in ['complete', 'error']:
-                        break
-                    
-                except queue.Empty:
-                    # If no output for 90 seconds, send a keepalive event
-                    yield f"data: {json.dumps({'log': 'Still processing...'})}\n\n"
-                    
-        except GeneratorExit:
-            # Client disconnected
-            pass
-    
-    # Return the streaming response
-    return Response(
-        stream_with_context(generate()),
-        mimetype='text/event-stream',
-        headers={
-            'Cache-Control': 'no-cache',
-            'X-Accel-Buffering': 'no'  # Disable proxy buffering
-        }
-    )
+    return stream_script_job('stocks', 'fetch_new_stock_data.py')
 
 @auth.route('/admin/test-script')
 @login_required
@@ -540,63 +550,25 @@ def test_script_stream():
     if not current_user.is_admin:
         return jsonify({'error': 'Access denied. Admin privileges required.'}), 403
     
-    # Get the path to the test script
-    script_path = os.path.join(
-        os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 
-        'scripts', 
-        'test_script.py'
-    )
-    
-    # Debug the script path to make sure it exists
-    print(f"Looking for test script at path: {script_path}")
+    # Check the test script exists before starting a job for it
+    script_path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'scripts', 'test_script.py')
     if not os.path.isfile(script_path):
-        print(f"WARNING: Test script file not found at {script_path}")
-        # Try alternative path relative to current working directory
-        alt_script_path = os.path.join('app', 'scripts', 'test_script.py')
-        if os.path.isfile(alt_script_path):
-            script_path = alt_script_path
-            print(f"Found test script at alternative path: {script_path}")
-        else:
-            print(f"ERROR: Test script not found at alternative path either: {alt_script_path}")
-            return jsonify({"error": "Test script file not found"}), 404
+        return jsonify({"error": "Test script file not found"}), 404
     
-    # Function to generate SSE events
-    def generate():
-        output_queue = queue.Queue()
-        
-        # Start the script in a separate thread
-        thread = threading.Thread(
-            target=run_script_with_live_output,
-            args=(script_path, output_queue)
-        )
-        thread.daemon = True
-        thread.start()
-        
-        # Stream events from the queue to the client
-        try:
-            while True:
-                try:
-                    # Get data from the queue with a timeout
-                    data = output_queue.get(timeout=90)
-                    
-                    # Yield the data as an SSE event
-                    yield f"data: {json.dumps(data)}\n\n"
-                    
-                    # Check if the process is complete or had an error
-                    if data.get('status') in ['complete', 'error']:
-                        break
-                    
-                except queue.Empty:
-                    # If no output for 90 seconds, send a keepalive event
-                    yield f"data: {json.dumps({'log': 'Still processing...'})}\n\n"
-                    
-        except GeneratorExit:
-            # Client disconnected
-            pass
+    return stream_script_job('test', 'test_script.py', target=run_script_job)
+
+@auth.route('/admin/jobs/<job_id>/events')
+@login_required
+def job_events_stream(job_id):
+    """Follow any background job's events over SSE"""
+    if not current_user.is_admin:
+        return jsonify({'error': 'Access denied. Admin privileges required.'}), 403
     
-    # Return the streaming response
+    job = job_runner.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
     return Response(
-        stream_with_context(generate()),
+        stream_with_context(generate_job_events(job)),
         mimetype='text/event-stream',
         headers={
             'Cache-Control': 'no-cache',
@@ -604,102 +576,28 @@ def test_script_stream():
         }
     )
 
-# Direct script execution routes (non-streaming version)
+# Direct update routes (return a job id immediately; poll /admin/jobs/<job_id> for progress)
 @auth.route('/admin/run-indices-update', methods=['POST'])
 @login_required
 def run_indices_update():
-    """Run the indices update script directly"""
+    """Start the indices update as a background job"""
     # Check if user is admin
     if not current_user.is_admin:
         return jsonify({'error': 'Access denied. Admin privileges required.'}), 403
     
-    # Get the path to the script
-    script_path = os.path.join(
-        os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 
-        'scripts', 
-        'fetch_new_indices_data.py'
-    )
-    
-    # Check if script exists
-    if not os.path.isfile(script_path):
-        alt_script_path = os.path.join('app', 'scripts', 'fetch_new_indices_data.py')
-        if os.path.isfile(alt_script_path):
-            script_path = alt_script_path
-        else:
-            return jsonify({"error": "Script file not found"}), 404
-    
-    try:
-        # Run the script and capture output
-        result = subprocess.run(
-            [sys.executable, script_path],
-            capture_output=True,
-            text=True,
-            check=False
-        )
-        
-        # Return the output as JSON
-        return jsonify({
-            'success': result.returncode == 0,
-            'stdout': result.stdout,
-            'stderr': result.stderr,
-            'returncode': result.returncode
-        })
-    
-    except Exception as e:
-        import traceback
-        return jsonify({
-            'success': False,
-            'error': str(e),
-            'traceback': traceback.format_exc()
-        }), 500
+    job, created = job_runner.start('indices', run_indices_update_job)
+    return jsonify({'success': True, 'job_id': job.id, 'created': created, 'job': job.to_dict()})
 
 @auth.route('/admin/run-stocks-update', methods=['POST'])
 @login_required
 def run_stocks_update():
-    """Run the stocks update script directly"""
+    """Start the stocks update as a background job"""
     # Check if user is admin
     if not current_user.is_admin:
         return jsonify({'error': 'Access denied. Admin privileges required.'}), 403
     
-    # Get the path to the script
-    script_path = os.path.join(
-        os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 
-        'scripts', 
-        'fetch_new_stock_data.py'
-    )
-    
-    # Check if script exists
-    if not os.path.isfile(script_path):
-        alt_script_path = os.path.join('app', 'scripts', 'fetch_new_stock_data.py')
-        if os.path.isfile(alt_script_path):
-            script_path = alt_script_path
-        else:
-            return jsonify({"error": "Script file not found"}), 404
-    
-    try:
-        # Run the script and capture output
-        result = subprocess.run(
-            [sys.executable, script_path],
-            capture_output=True,
-            text=True,
-            check=False
-        )
-        
-        # Return the output as JSON
-        return jsonify({
-            'success': result.returncode == 0,
-            'stdout': result.stdout,
-            'stderr': result.stderr,
-            'returncode': result.returncode
-        })
-    
-    except Exception as e:
-        import traceback
-        return jsonify({
-            'success': False,
-            'error': str(e),
-            'traceback': traceback.format_exc()
-        }), 500
+    job, created = job_runner.start('stocks', run_stocks_update_job, resume=request.args.get('resume') == '1')
+    return jsonify({'success': True, 'job_id': job.id, 'created': created, 'job': job.to_dict()})
 
 @auth.route('/admin/run-test-script', methods=['POST'])
 @login_required
@@ -756,122 +654,14 @@ def run_test_script():
 @auth.route('/admin/run-indices', methods=['POST'])
 @login_required
 def run_indices():
-    """Run the indices update script directly"""
-    # Check if user is admin
-    if not current_user.is_admin:
-        return jsonify({'success': False, 'error': 'Access denied. Admin privileges required.'}), 403
-    
-    try:
-        # Get the path to the script
-        script_path = os.path.join(
-            os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 
-            'scripts', 
-            'fetch_new_indices_data.py'
-        )
-        
-        # Check if script exists
-        if not os.path.isfile(script_path):
-            alt_script_path = os.path.join('app', 'scripts', 'fetch_new_indices_data.py')
-            if os.path.isfile(alt_script_path):
-                script_path = alt_script_path
-            else:
-                return jsonify({"success": False, "error": "Script file not found"}), 404
-        
-        print(f"Running indices update script at: {script_path}")
-        
-        # Create a temporary file to capture output
-        import tempfile
-        with tempfile.NamedTemporaryFile(mode='w+', delete=False) as temp:
-            temp_path = temp.name
-        
-        # Run the script and redirect output to the temporary file
-        command = f"{sys.executable} {script_path} > {temp_path} 2>&1"
-        process = subprocess.run(command, shell=True)
-        
-        # Read the output from the temporary file
-        with open(temp_path, 'r') as f:
-            output = f.read()
-        
-        # Clean up the temporary file
-        os.unlink(temp_path)
-        
-        # Return the output as JSON
-        return jsonify({
-            'success': process.returncode == 0,
-            'stdout': output,
-            'stderr': "",
-            'returncode': process.returncode
-        })
-    
-    except Exception as e:
-        import traceback
-        error_traceback = traceback.format_exc()
-        print(f"Error running indices update script: {str(e)}\n{error_traceback}")
-        return jsonify({
-            'success': False,
-            'error': str(e),
-            'traceback': error_traceback
-        }), 500
+    """Start the indices update as a background job"""
+    return run_indices_update()
 
 @auth.route('/admin/run-stocks', methods=['POST'])
 @login_required
 def run_stocks():
-    """Run the stocks update script directly"""
-    # Check if user is admin
-    if not current_user.is_admin:
-        return jsonify({'success': False, 'error': 'Access denied. Admin privileges required.'}), 403
-    
-    try:
-        # Get the path to the script
-        script_path = os.path.join(
-            os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 
-            'scripts', 
-            'fetch_new_stock_data.py'
-        )
-        
-        # Check if script exists
-        if not os.path.isfile(script_path):
-            alt_script_path = os.path.join('app', 'scripts', 'fetch_new_stock_data.py')
-            if os.path.isfile(alt_script_path):
-                script_path = alt_script_path
-            else:
-                return jsonify({"success": False, "error": "Script file not found"}), 404
-        
-        print(f"Running stocks update script at: {script_path}")
-        
-        # Create a temporary file to capture output
-        import tempfile
-        with tempfile.NamedTemporaryFile(mode='w+', delete=False) as temp:
-            temp_path = temp.name
-        
-        # Run the script and redirect output to the temporary file
-        command = f"{sys.executable} {script_path} > {temp_path} 2>&1"
-        process = subprocess.run(command, shell=True)
-        
-        # Read the output from the temporary file
-        with open(temp_path, 'r') as f:
-            output = f.read()
-        
-        # Clean up the temporary file
-        os.unlink(temp_path)
-        
-        # Return the output as JSON
-        return jsonify({
-            'success': process.returncode == 0,
-            'stdout': output,
-            'stderr': "",
-            'returncode': process.returncode
-        })
-    
-    except Exception as e:
-        import traceback
-        error_traceback = traceback.format_exc()
-        print(f"Error running stocks update script: {str(e)}\n{error_traceback}")
-        return jsonify({
-            'success': False,
-            'error': str(e),
-            'traceback': error_traceback
-        }), 500
+    """Start the stocks update as a background job"""
+    return run_stocks_update()
 
 @auth.route('/admin/run-test', methods=['POST'])
 @login_required
@@ -936,125 +726,11 @@ def run_test():
 @auth.route('/start-indices', methods=['POST'])
 @login_required
 def start_indices():
-    """Start the indices update script in a completely separate process"""
-    # Check if user is admin
-    if not current_user.is_admin:
-        return jsonify({'success': False, 'error': 'Access denied. Admin privileges required.'}), 403
-    
-    try:
-        # Get the path to the script
-        script_path = os.path.join(
-            os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 
-            'scripts', 
-            'fetch_new_indices_data.py'
-        )
-        
-        # Check if script exists
-        if not os.path.isfile(script_path):
-            alt_script_path = os.path.join('app', 'scripts', 'fetch_new_indices_data.py')
-            if os.path.isfile(alt_script_path):
-                script_path = alt_script_path
-            else:
-                return jsonify({"success": False, "error": "Script file not found"}), 404
-        
-        print(f"Starting indices update script in a detached process: {script_path}")
-        
-        # Use a different approach - a completely detached process
-        # This ensures it won't cause timeouts on the web server
-        if os.name == 'nt':  # Windows
-            # Use subprocess.Popen with DETACHED_PROCESS flag
-            import subprocess
-            subprocess.Popen(
-                f'start /B cmd /c "python {script_path} > indices_update.log 2>&1"',
-                shell=True,
-                close_fds=True,
-                stdout=subprocess.DEVNULL,
-                stderr=subprocess.DEVNULL,
-                stdin=subprocess.DEVNULL,
-                creationflags=0x08000000  # DETACHED_PROCESS
-            )
-        else:  # Unix/Linux
-            # Use nohup and redirect output to a log file
-            subprocess.Popen(
-                f'nohup python {script_path} > indices_update.log 2>&1 &',
-                shell=True,
-                stdout=subprocess.DEVNULL,
-                stderr=subprocess.DEVNULL,
-                stdin=subprocess.DEVNULL,
-                preexec_fn=os.setsid
-            )
-        
-        # Return success immediately - the process is now running in the background
-        return jsonify({'success': True})
-        
-    except Exception as e:
-        import traceback
-        error_traceback = traceback.format_exc()
-        print(f"Error starting indices update script: {str(e)}\n{error_traceback}")
-        return jsonify({
-            'success': False,
-            'error': str(e)
-        }), 500
+    """Start the indices update as a background job"""
+    return run_indices_update()
 
 @auth.route('/start-stocks', methods=['POST'])
 @login_required
 def start_stocks():
-    """Start the stocks update script in a completely separate process"""
-    # Check if user is admin
-    if not current_user.is_admin:
-        return jsonify({'success': False, 'error': 'Access denied. Admin privileges required.'}), 403
-    
-    try:
-        # Get the path to the script
-        script_path = os.path.join(
-            os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 
-            'scripts', 
-            'fetch_new_stock_data.py'
-        )
-        
-        # Check if script exists
-        if not os.path.isfile(script_path):
-            alt_script_path = os.path.join('app', 'scripts', 'fetch_new_stock_data.py')
-            if os.path.isfile(alt_script_path):
-                script_path = alt_script_path
-            else:
-                return jsonify({"success": False, "error": "Script file not found"}), 404
-        
-        print(f"Starting stocks update script in a detached process: {script_path}")
-        
-        # Use a different approach - a completely detached process
-        # This ensures it won't cause timeouts on the web server
-        if os.name == 'nt':  # Windows
-            # Use subprocess.Popen with DETACHED_PROCESS flag
-            import subprocess
-            subprocess.Popen(
-                f'start /B cmd /c "python {script_path} > stocks_update.log 2>&1"',
-                shell=True,
-                close_fds=True,
-                stdout=subprocess.DEVNULL,
-                stderr=subprocess.DEVNULL,
-                stdin=subprocess.DEVNULL,
-                creationflags=0x08000000  # DETACHED_PROCESS
-            )
-        else:  # Unix/Linux
-            # Use nohup and redirect output to a log file
-            subprocess.Popen(
-                f'nohup python {script_path} > stocks_update.log 2>&1 &',
-                shell=True,
-                stdout=subprocess.DEVNULL,
-                stderr=subprocess.DEVNULL,
-                stdin=subprocess.DEVNULL,
-                preexec_fn=os.setsid
-            )
-        
-        # Return success immediately - the process is now running in the background
-        return jsonify({'success': True})
-        
-    except Exception as e:
-        import traceback
-        error_traceback = traceback.format_exc()
-        print(f"Error starting stocks update script: {str(e)}\n{error_traceback}")
-        return jsonify({
-            'success': False,
-            'error': str(e)
-        }), 500
\ No newline at end of file
+    """Start the stocks update as a background job"""
+    return run_stocks_update()
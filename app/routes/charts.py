@@ -1,12 +1,25 @@
-from flask import Blueprint, render_template, request, jsonify, redirect, url_for
-from app import get_db
+from flask import Blueprint, Response, render_template, request, jsonify, redirect, url_for, stream_with_context
+from app import get_storage, series
+from app.storage.base import (
+    BATCH_FIELDS, CHART_FIELDS, COMPANY_LIST_FIELDS, INDEX_CHART_FIELDS, INDEX_ROW_FIELDS, QUOTE_FIELDS, SECTOR_CHART_FIELDS, TURNOVER_FIELDS
+)
 from datetime import datetime, timedelta
 from bson import ObjectId
-import re
+import os
 import json
+import time
 
 charts = Blueprint('charts', __name__)
 
+# Most symbols one batch request may ask for
+BATCH_MAX_IDS = int(os.getenv('BATCH_MAX_IDS', '50'))
+
+# Serve batch history from the memory-mapped history archive instead of the database
+ARCHIVE_READS = os.getenv('ARCHIVE_READS', '0') == '1'
+
+# Longest date range one stock export may cover without ids; full history comes from the snapshots
+EXPORT_MAX_DAYS = int(os.getenv('EXPORT_MAX_DAYS', '366'))
+
 @charts.route('/')
 def index():
     """Display the interactive TradingView charts page"""
@@ -23,150 +36,54 @@ def chart_data():
     if not identifier:
         return jsonify({"error": "Missing id parameter"}), 400
     
-    db = get_db()
+    storage = get_storage()
     
     # Parse dates if provided, otherwise use all available data
-    query = {}
-    if from_date:
-        try:
-            from_date = datetime.strptime(from_date, '%Y-%m-%d')
-            query['published_date'] = {'$gte': from_date}
-        except ValueError:
-            query['published_date'] = {'$gte': from_date}
-    
-    if to_date:
-        try:
-            to_date = datetime.strptime(to_date, '%Y-%m-%d')
-            if 'published_date' in query:
-                query['published_date']['$lte'] = to_date
-            else:
-                query['published_date'] = {'$lte': to_date}
-        except ValueError:
-            if 'published_date' in query:
-                query['published_date']['$lte'] = to_date
-            else:
-                query['published_date'] = {'$lte': to_date}
+    try:
+        from_date = datetime.strptime(from_date, '%Y-%m-%d') if from_date else None
+        to_date = datetime.strptime(to_date, '%Y-%m-%d') if to_date else None
+    except ValueError:
+        return jsonify({"error": "Dates must be YYYY-MM-DD"}), 400
     
     if chart_type == 'company':
         try:
             # First try to find by symbol since that's what we're using now
-            company = db.companies.find_one({'symbol': identifier})
-            company_name = None
+            company = storage.get_company(symbol=identifier, fields=COMPANY_LIST_FIELDS)
             
-            if company:
-                # If found by symbol, use company_id since that's how stock data is stored
-                query['company_id'] = company['company_id']
-                company_name = company.get('companyname')
-            else:
-                # Legacy support for company_id and fallback for direct symbol query
-                try:
-                    query['company_id'] = int(identifier)
-                    # Try to get company name from company_id
-                    comp = db.companies.find_one({'company_id': int(identifier)})
-                    if comp:
-                        company_name = comp.get('companyname')
-                except ValueError:
-                    query['company_symbol'] = identifier
-                    # Try to get company name from symbol
-                    comp = db.companies.find_one({'symbol': identifier})
-                    if comp:
-                        company_name = comp.get('companyname')
+            # Legacy support for company_id
+            if not company and identifier.isdigit():
+                company = storage.get_company(company_id=int(identifier), fields=COMPANY_LIST_FIELDS)
         
         except Exception as e:
             return jsonify({"error": f"Invalid company identifier: {str(e)}"}), 400
         
-        data = list(db['nepse-stocks'].find(query).sort('published_date', 1))
+        if not company:
+            return jsonify({"error": "No stock data available for this company"}), 404
+        company_name = company.get('companyname')
+        
+        data = storage.quotes(company['company_id'], start=from_date, end=to_date, fields=CHART_FIELDS)
+        
+        # Fall back to the full history when the range has no data
+        if not data and (from_date or to_date):
+            data = storage.quotes(company['company_id'], fields=CHART_FIELDS)
         
         if not data:
-            if 'published_date' in query:
-                tmp_query = query.copy()
-                del tmp_query['published_date']
-                data = list(db['nepse-stocks'].find(tmp_query).sort('published_date', 1))
-                
-                if not data:
-                    return jsonify({"error": "No stock data available for this company"}), 404
+            return jsonify({"error": "No stock data available for this company"}), 404
         
         result = []
         for item in data:
-            # Add the company name to the first data point
-            if len(result) == 0:
-                item['name'] = company_name
-                
-            date_obj = item.get('published_date')
-            date_str = None
-
-            if isinstance(date_obj, datetime):
-                date_str = date_obj.strftime('%Y-%m-%d')
-            elif isinstance(date_obj, str):
-                # Try parsing known string formats
-                if re.match(r'^\d{4}-\d{1,2}-\d{1,2}$', date_obj):
-                    parts = date_obj.split('-')
-                    date_str = f"{parts[0]}-{int(parts[1]):02d}-{int(parts[2]):02d}"
-                elif re.match(r'^\d{1,2}/\d{1,2}/\d{4}$', date_obj):
-                    parts = date_obj.split('/')
-                    date_str = f"{parts[2]}-{int(parts[0]):02d}-{int(parts[1]):02d}"
-                elif re.match(r'^\d{1,2}-\d{1,2}-\d{4}$', date_obj):
-                    parts = date_obj.split('-')
-                    date_str = f"{parts[2]}-{int(parts[0]):02d}-{int(parts[1]):02d}"
-                else:
-                    # Attempt direct parsing if format is unknown but might be valid
-                    try:
-                        parsed_date = datetime.fromisoformat(date_obj.split('T')[0]) # Handle ISO strings like '2023-10-26T00:00:00Z'
-                        date_str = parsed_date.strftime('%Y-%m-%d')
-                    except ValueError:
-                        print(f"Warning: Could not parse date string: {date_obj}")
-                        continue # Skip this data point if date is unparseable
-            elif isinstance(date_obj, dict) and 'year' in date_obj and 'month' in date_obj and 'day' in date_obj:
-                # Handle the object format {day: d, month: m, year: y}
-                try:
-                    year = int(date_obj['year'])
-                    month = int(date_obj['month'])
-                    day = int(date_obj['day'])
-                    date_str = f"{year:04d}-{month:02d}-{day:02d}"
-                except (ValueError, TypeError):
-                    print(f"Warning: Could not parse date object: {date_obj}")
-                    continue # Skip if object parts are invalid
-            else:
-                print(f"Warning: Unknown date format for item: {item.get('_id', 'N/A')}, date: {date_obj}")
-                continue # Skip if date format is completely unknown
-
-            if not date_str:
-                continue # Skip if date couldn't be determined
-
-            try:
-                open_price = float(item.get('open', 0))
-                high_price = float(item.get('high', 0))
-                low_price = float(item.get('low', 0))
-                close_price = float(item.get('close', 0))
-
-                # Ensure prices are finite numbers
-                if not all(map(lambda x: isinstance(x, (int, float)) and x is not None and x == x, [open_price, high_price, low_price, close_price])):
-                     print(f"Warning: Non-finite price found for date {date_str}, skipping.")
-                     continue
-
-                # Skip if all prices are zero (might indicate bad data)
-                if open_price == 0 and high_price == 0 and low_price == 0 and close_price == 0:
-                    print(f"Warning: All prices are zero for date {date_str}, skipping.")
-                    continue
-
-            except (ValueError, TypeError) as e:
-                print(f"Warning: Error processing prices for date {date_str}: {e}, skipping.")
+            prices = [item.get('open'), item.get('high'), item.get('low'), item['close']]
+            # Candles need all four prices; all-zero rows are placeholders upstream, not trades
+            if None in prices or not any(prices):
                 continue
-
-            volume = 0
-            if 'traded_quantity' in item:
-                try:
-                    volume = float(item['traded_quantity'])
-                except (ValueError, TypeError):
-                    volume = 0
             
             result.append({
-                'time': date_str, # Ensure this is always YYYY-MM-DD string
-                'open': open_price,
-                'high': high_price,
-                'low': low_price,
-                'close': close_price,
-                'volume': int(volume),
+                'time': item['published_date'].strftime('%Y-%m-%d'),
+                'open': prices[0],
+                'high': prices[1],
+                'low': prices[2],
+                'close': prices[3],
+                'volume': int(item.get('traded_quantity') or 0),
                 'symbol': identifier,
                 'name': company_name
             })
@@ -175,145 +92,444 @@ def chart_data():
             return jsonify({"error": "No valid data points found for this company"}), 404
         
     elif chart_type == 'index':
-        query['index_name'] = identifier
+        data = storage.index_history(identifier, start=from_date, end=to_date, fields=INDEX_CHART_FIELDS)
         
-        data = list(db['nepse-indices'].find(query).sort('published_date', 1))
+        if not data and (from_date or to_date):
+            data = storage.index_history(identifier, fields=INDEX_CHART_FIELDS)
+        
+        result = []
+        for item in data:
+            current_value = item['current']
+            result.append({
+                'time': item['published_date'].strftime('%Y-%m-%d'),
+                'value': current_value, # Keep original 'value' if needed by line chart
+                # Use the current value for OHLC fields the index row does not have
+                'open': current_value if item.get('open') is None else item['open'],
+                'high': current_value if item.get('high') is None else item['high'],
+                'low': current_value if item.get('low') is None else item['low'],
+                'close': current_value # Candlestick uses 'close'
+            })
+    
+    elif chart_type == 'sector':
+        # Precomputed from constituent stocks (app/sectors.py); ?weight=equal|turnover picks the return series
+        weight = request.args.get('weight', 'equal')
+        if weight not in ('equal', 'turnover'):
+            return jsonify({"error": "weight must be equal or turnover"}), 400
+        level_field = f"{weight}_weight"
+        
+        data = storage.sector_history(identifier, start=from_date, end=to_date, fields=SECTOR_CHART_FIELDS)
+        
+        if not data and (from_date or to_date):
+            data = storage.sector_history(identifier, fields=SECTOR_CHART_FIELDS)
         
         if not data:
-            if 'published_date' in query:
-                del query['published_date']
-            data = list(db['nepse-indices'].find({'index_name': identifier}).sort('published_date', 1))
+            return jsonify({"error": "No data available for this sector"}), 404
         
         result = []
         for item in data:
-            date_obj = item.get('published_date')
-            date_str = None
-
-            if isinstance(date_obj, datetime):
-                date_str = date_obj.strftime('%Y-%m-%d')
-            elif isinstance(date_obj, str):
-                 # Try parsing known string formats (similar to company logic)
-                if re.match(r'^\d{4}-\d{1,2}-\d{1,2}$', date_obj):
-                    parts = date_obj.split('-')
-                    date_str = f"{parts[0]}-{int(parts[1]):02d}-{int(parts[2]):02d}"
-                elif re.match(r'^\d{1,2}/\d{1,2}/\d{4}$', date_obj):
-                    parts = date_obj.split('/')
-                    date_str = f"{parts[2]}-{int(parts[0]):02d}-{int(parts[1]):02d}"
-                elif re.match(r'^\d{1,2}-\d{1,2}-\d{4}$', date_obj):
-                    parts = date_obj.split('-')
-                    date_str = f"{parts[2]}-{int(parts[0]):02d}-{int(parts[1]):02d}"
-                else:
-                    try:
-                        parsed_date = datetime.fromisoformat(date_obj.split('T')[0])
-                        date_str = parsed_date.strftime('%Y-%m-%d')
-                    except ValueError:
-                        print(f"Warning: Could not parse index date string: {date_obj}")
-                        continue
-            elif isinstance(date_obj, dict) and 'year' in date_obj and 'month' in date_obj and 'day' in date_obj:
-                 # Handle the object format {day: d, month: m, year: y}
-                try:
-                    year = int(date_obj['year'])
-                    month = int(date_obj['month'])
-                    day = int(date_obj['day'])
-                    date_str = f"{year:04d}-{month:02d}-{day:02d}"
-                except (ValueError, TypeError):
-                    print(f"Warning: Could not parse index date object: {date_obj}")
-                    continue
-            else:
-                print(f"Warning: Unknown index date format for item: {item.get('_id', 'N/A')}, date: {date_obj}")
+            level = item.get(level_field)
+            if level is None:
                 continue
+            result.append({
+                'time': item['published_date'].strftime('%Y-%m-%d'),
+                'value': level,
+                'open': level,
+                'high': level,
+                'low': level,
+                'close': level,
+                'turnover': item.get('turnover'),
+                'volume': item.get('volume'),
+                'advances': item.get('advances'),
+                'declines': item.get('declines'),
+                'symbol': identifier,
+                'name': 'Sector'
+            })
+    
+    else:
+        return jsonify({"error": "Invalid chart type"}), 400
+    
+    return jsonify(result)
 
-            if not date_str:
-                continue
+# Per-symbol column arrays for the batch API
+def empty_series(company):
+    return {
+        'company_id': company['company_id'],
+        'name': company.get('companyname'),
+        'time': [], 'open': [], 'high': [], 'low': [], 'close': [], 'volume': []
+    }
+
+# Fill histories from the history archive up to its latest date; returns (company ids it had no data for, that date)
+def archive_series(histories, from_date, to_date):
+    from app.storage.archive import HistoryArchive
+    import numpy as np
+    archive = HistoryArchive()
+    through = archive.through('stocks')
+    if through is None:
+        return [item['company_id'] for item in histories.values()], None
+    
+    missing = []
+    for item in histories.values():
+        columns = archive.company_history(item['company_id'], start=from_date, end=min(to_date, through) if to_date else through)
+        if columns is None:
+            missing.append(item['company_id'])
+            continue
+        item['time'] = np.datetime_as_string(columns['published_date'], unit='D').tolist()
+        for name, column in (('open', 'open'), ('high', 'high'), ('low', 'low'), ('close', 'close'), ('volume', 'traded_quantity')):
+            values = columns[column]
+            # NaN marks a missing value in the archive
+            item[name] = np.where(np.isnan(values), None, values).tolist()
+    return missing, through
+
+@charts.route('/api/batch')
+def batch_data():
+    """
+    History of several companies in one response: ?ids=NABIL,NICA,131&from=YYYY-MM-DD&to=YYYY-MM-DD.
+    Each symbol maps to column arrays (time, open, high, low, close, volume), oldest first.
+    """
+    identifiers = [identifier.strip() for identifier in request.args.get('ids', '').split(',') if identifier.strip()]
+    
+    if not identifiers:
+        return jsonify({"error": "Missing ids parameter"}), 400
+    if len(identifiers) > BATCH_MAX_IDS:
+        return jsonify({"error": f"At most {BATCH_MAX_IDS} ids per request"}), 400
+    
+    try:
+        from_date = series.parse_date(request.args.get('from'))
+        to_date = series.parse_date(request.args.get('to'))
+    except ValueError:
+        return jsonify({"error": "Dates must be YYYY-MM-DD"}), 400
+    
+    storage = get_storage()
+    
+    # Resolve every symbol (and legacy numeric company_id) in one query
+    numeric_ids = [int(identifier) for identifier in identifiers if identifier.isdigit()]
+    companies = storage.resolve_companies(symbols=identifiers, company_ids=numeric_ids, fields=COMPANY_LIST_FIELDS)
+    by_symbol = {company['symbol']: company for company in companies}
+    by_id = {company['company_id']: company for company in companies}
+    
+    histories = {}
+    missing = []
+    for identifier in identifiers:
+        company = by_symbol.get(identifier) or (by_id.get(int(identifier)) if identifier.isdigit() else None)
+        if company:
+            histories[identifier] = empty_series(company)
+        else:
+            missing.append(identifier)
+    
+    pending = [item['company_id'] for item in histories.values()]
+    newer = []
+    newer_from = None
+    if ARCHIVE_READS and pending:
+        requested = pending
+        pending, through = archive_series(histories, from_date, to_date)
+        if through is not None and (to_date is None or to_date > through):
+            # Rows stored since the archive was last updated still come from the database
+            newer = [company_id for company_id in dict.fromkeys(requested) if company_id not in pending]
+            newer_from = max(from_date, through + timedelta(days=1)) if from_date else through + timedelta(days=1)
+    
+    rows = []
+    if pending:
+        # One $in query for every company the archive could not serve
+        rows.extend(storage.quotes_for(pending, start=from_date, end=to_date, fields=BATCH_FIELDS))
+    if newer:
+        rows.extend(storage.quotes_for(newer, start=newer_from, end=to_date, fields=BATCH_FIELDS))
+    
+    if rows:
+        targets = {}
+        for identifier, item in histories.items():
+            targets.setdefault(item['company_id'], []).append(item)
+        for row in rows:
+            for item in targets.get(row['company_id'], []):
+                item['time'].append(row['published_date'].strftime('%Y-%m-%d'))
+                item['open'].append(row.get('open'))
+                item['high'].append(row.get('high'))
+                item['low'].append(row.get('low'))
+                item['close'].append(row.get('close'))
+                item['volume'].append(row.get('traded_quantity'))
+    
+    return jsonify({
+        'from': from_date.strftime('%Y-%m-%d') if from_date else None,
+        'to': to_date.strftime('%Y-%m-%d') if to_date else None,
+        'series': histories,
+        'missing': missing
+    })
 
-            try:
-                current_value = float(item.get('current', 0))
-                # Use current_value as default for OHLC if they are missing/invalid
-                open_value = float(item.get('open', current_value)) if item.get('open') is not None else current_value
-                high_value = float(item.get('high', current_value)) if item.get('high') is not None else current_value
-                low_value = float(item.get('low', current_value)) if item.get('low') is not None else current_value
+@charts.route('/api/overlay')
+def overlay_data():
+    """
+    Several companies and indices on one trading-day index:
+    ?ids=NABIL,NEPSE Index,Banking Subindex&from=&to=&rebase=100&fill=ffill|none&join=outer|inner&mode=level|returns
+    """
+    identifiers = [identifier.strip() for identifier in request.args.get('ids', '').split(',') if identifier.strip()]
+    fill = request.args.get('fill', 'ffill')
+    join = request.args.get('join', 'outer')
+    mode = request.args.get('mode', 'level')
+    
+    if not identifiers:
+        return jsonify({"error": "Missing ids parameter"}), 400
+    if len(identifiers) > series.MAX_SERIES:
+        return jsonify({"error": f"At most {series.MAX_SERIES} ids per request"}), 400
+    if fill not in series.FILL_POLICIES or join not in series.JOIN_POLICIES or mode not in ('level', 'returns'):
+        return jsonify({"error": "fill must be ffill or none, join outer or inner, mode level or returns"}), 400
+    
+    try:
+        from_date = series.parse_date(request.args.get('from'))
+        to_date = series.parse_date(request.args.get('to'))
+        base = float(request.args['rebase']) if request.args.get('rebase') else None
+    except ValueError:
+        return jsonify({"error": "Dates must be YYYY-MM-DD and rebase a number"}), 400
+    
+    storage = get_storage()
+    refs, missing = series.resolve(storage, identifiers)
+    histories = series.load(storage, refs)
+    
+    dates, matrix = series.align(
+        [series.date_slice(histories[(ref['kind'], ref['key'])], from_date, to_date) for ref in refs],
+        join=join, fill=fill
+    )
+    if base is not None and dates.size:
+        matrix = series.rebase(matrix, base)
+    if mode == 'returns' and dates.size:
+        matrix = series.returns(matrix)
+    
+    return jsonify({
+        'dates': series.date_strings(dates),
+        'series': [
+            {'id': ref['id'], 'kind': ref['kind'], 'name': ref['name'], 'values': series.to_list(values)}
+            for ref, values in zip(refs, matrix)
+        ],
+        'missing': missing
+    })
 
-                # Ensure prices are finite numbers
-                if not all(map(lambda x: isinstance(x, (int, float)) and x is not None and x == x, [open_value, high_value, low_value, current_value])):
-                     print(f"Warning: Non-finite index value found for date {date_str}, skipping.")
-                     continue
+# Window parameter for the correlation and beta APIs; None if invalid
+def market_window(default=60):
+    from app.market import MATRIX_DAYS
+    try:
+        window = int(request.args.get('window', default))
+    except ValueError:
+        return None
+    return window if 2 <= window < MATRIX_DAYS else None
 
-            except (ValueError, TypeError) as e:
-                print(f"Warning: Error processing index values for date {date_str}: {e}, skipping.")
-                continue
+@charts.route('/api/correlation')
+def correlation_data():
+    """
+    Beta and correlation of every company against NEPSE Index over the last ?window= trading days
+    (60, 120 and 250 are precomputed). ?matrix=1 adds the company x company correlation matrix.
+    """
+    from app.market import BENCHMARK, correlation_matrix, market_matrix
+    window = market_window()
+    if window is None:
+        return jsonify({"error": "window must be a number of trading days"}), 400
+    
+    matrix = market_matrix.current(get_storage())
+    if not len(matrix.dates):
+        return jsonify({"error": "No market data available"}), 404
+    stats = matrix.window_stats(window)
+    
+    result = {
+        'benchmark': BENCHMARK,
+        'window': window,
+        'from': series.date_strings(stats['dates'][:1])[0],
+        'to': series.date_strings(stats['dates'][-1:])[0],
+        'symbols': matrix.symbols,
+        'beta': series.to_list(stats['beta']),
+        'correlation': series.to_list(stats['correlation'])
+    }
+    if request.args.get('matrix') == '1':
+        result['matrix'] = [series.to_list(row) for row in correlation_matrix(stats['returns'])]
+    return jsonify(result)
 
-            result.append({
-                'time': date_str, # Ensure this is always YYYY-MM-DD string
-                'value': current_value, # Keep original 'value' if needed by line chart
-                'open': open_value,
-                'high': high_value,
-                'low': low_value,
-                'close': current_value # Candlestick uses 'close'
-            })
+@charts.route('/api/beta')
+def beta_data():
+    """Rolling beta and correlation of one company against NEPSE Index: ?symbol=NABIL&window=60"""
+    from app.market import BENCHMARK, market_matrix
+    symbol = request.args.get('symbol')
+    window = market_window()
+    if not symbol:
+        return jsonify({"error": "Missing symbol parameter"}), 400
+    if window is None:
+        return jsonify({"error": "window must be a number of trading days"}), 400
+    
+    rolling = market_matrix.current(get_storage()).rolling(symbol, window)
+    if rolling is None:
+        return jsonify({"error": "No market data available for this symbol and window"}), 404
+    
+    return jsonify({
+        'symbol': symbol,
+        'benchmark': BENCHMARK,
+        'window': window,
+        'dates': series.date_strings(rolling['dates']),
+        'beta': series.to_list(rolling['beta']),
+        'correlation': series.to_list(rolling['correlation'])
+    })
+
+@charts.route('/api/screener')
+def screener_data():
+    """
+    Companies meeting every condition on the latest trading day (or ?date=):
+    ?where=close > sma50,squeeze_fired,volume >= 2*avg_volume20&sort=per_change&order=desc&limit=100
+    """
+    from app.screener import FIELDS, ScreenerError, screener
+    conditions = [condition for condition in request.args.get('where', '').split(',') if condition.strip()]
+    sort = request.args.get('sort') or None
+    order = request.args.get('order', 'desc')
     
+    if not conditions:
+        return jsonify({"error": "Missing where parameter", "fields": FIELDS}), 400
+    if order not in ('asc', 'desc'):
+        return jsonify({"error": "order must be asc or desc"}), 400
+    
+    try:
+        date = series.parse_date(request.args.get('date'))
+        limit = int(request.args.get('limit', 100))
+    except ValueError:
+        return jsonify({"error": "date must be YYYY-MM-DD and limit a number"}), 400
+    
+    start = time.perf_counter()
+    screener.matrix.current(get_storage())
+    try:
+        screened_date, rows, total = screener.screen(
+            conditions, date=date, sort=sort, descending=order == 'desc', limit=limit,
+            include_untraded=request.args.get('include_untraded') == '1'
+        )
+    except ScreenerError as e:
+        return jsonify({"error": str(e), "fields": FIELDS}), 400
+    
+    return jsonify({
+        'date': screened_date.strftime('%Y-%m-%d') if screened_date else None,
+        'conditions': conditions,
+        'total': total,
+        'results': rows,
+        'ms': round((time.perf_counter() - start) * 1000, 1)
+    })
+
+@charts.route('/api/export/<kind>')
+def export_data(kind):
+    """
+    Stream stock quotes or index values as a download:
+    /api/export/stocks?ids=NABIL,NICA&from=YYYY-MM-DD&to=YYYY-MM-DD&format=csv|ndjson&compress=gzip
+    Stock exports without ids need a range of at most EXPORT_MAX_DAYS. Rows go from the database
+    cursor (or the history archive) to the client as they are read, so memory use stays the same
+    for any range.
+    """
+    from app import export
+    export_format = request.args.get('format', 'csv')
+    compress = request.args.get('compress') == 'gzip'
+    identifiers = [identifier.strip() for identifier in request.args.get('ids', '').split(',') if identifier.strip()]
+    
+    if kind not in ('stocks', 'indices'):
+        return jsonify({"error": "Export stocks or indices"}), 404
+    if export_format not in export.FORMATS:
+        return jsonify({"error": "format must be csv or ndjson"}), 400
+    
+    try:
+        from_date = series.parse_date(request.args.get('from'))
+        to_date = series.parse_date(request.args.get('to'))
+    except ValueError:
+        return jsonify({"error": "Dates must be YYYY-MM-DD"}), 400
+    
+    storage = get_storage()
+    
+    # Exports of every company need a bounded range; the whole table is served from the prebuilt snapshot
+    if kind == 'stocks' and not identifiers:
+        if not (from_date or to_date):
+            return redirect(url_for('main.snapshot_file', version='latest', filename='nepse-stocks.csv.gz'))
+        if not (from_date and to_date) or (to_date - from_date).days > EXPORT_MAX_DAYS:
+            return jsonify({
+                "error": f"Give ids, or from and to at most {EXPORT_MAX_DAYS} days apart. Download the full history from /data/snapshots"
+            }), 400
+    
+    if kind == 'stocks':
+        fields = QUOTE_FIELDS
+        company_ids = None
+        if identifiers:
+            refs, missing = series.resolve(storage, identifiers)
+            company_ids = [ref['key'] for ref in refs if ref['kind'] == 'company']
+            if missing or len(company_ids) < len(refs):
+                return jsonify({"error": "Unknown company ids", "missing": missing}), 400
+        
+        archive = None
+        if ARCHIVE_READS:
+            from app.storage.archive import HistoryArchive
+            archive = HistoryArchive()
+        if archive is not None and archive.through('stocks'):
+            rows = export.archived_quotes(archive, storage, company_ids, from_date, to_date, fields)
+        else:
+            rows = storage.stream_quotes(company_ids, start=from_date, end=to_date, fields=fields)
     else:
-        return jsonify({"error": "Invalid chart type"}), 400
+        fields = INDEX_ROW_FIELDS
+        rows = storage.stream_index_rows(identifiers or None, start=from_date, end=to_date, fields=fields)
     
-    return jsonify(result)
+    filename = f"{kind}-{request.args.get('from') or 'start'}-{request.args.get('to') or 'latest'}.{export_format}"
+    if compress:
+        filename += '.gz'
+    return Response(
+        stream_with_context(export.export_chunks(rows, fields, export_format, compress)),
+        mimetype='application/gzip' if compress else export.FORMATS[export_format],
+        headers={
+            'Content-Disposition': f'attachment; filename="{filename}"',
+            'X-Accel-Buffering': 'no'  # Disable proxy buffering
+        }
+    )
 
 @charts.route('/api/turnover')
 def turnover_data():
+    """
+    Market turnover from the per-day series built at ingest (app/turnover.py).
+    ?date=YYYY-MM-DD answers one day; ?from=&to= returns every trading day in the range.
+    """
     date_str = request.args.get('date')
+    from_str = request.args.get('from')
+    to_str = request.args.get('to')
     
-    if not date_str:
-        return jsonify({"error": "Missing date parameter"}), 400
+    if not (date_str or from_str or to_str):
+        return jsonify({"error": "Missing date or from/to parameter"}), 400
     
-    db = get_db()
+    storage = get_storage()
     
     try:
-        query = {}
         try:
-            date = datetime.strptime(date_str, '%Y-%m-%d')
-            query['published_date'] = date
+            date = datetime.strptime(date_str, '%Y-%m-%d') if date_str else None
+            from_date = datetime.strptime(from_str, '%Y-%m-%d') if from_str else None
+            to_date = datetime.strptime(to_str, '%Y-%m-%d') if to_str else None
         except ValueError:
-            query['published_date'] = date_str
+            return jsonify({"error": "Date must be YYYY-MM-DD"}), 400
         
-        index_data = db['nepse-indices'].find_one({
-            'index_name': 'NEPSE Index',
-            'published_date': query['published_date']
-        })
+        if date is None:
+            # One indexed range query over precomputed totals, whatever the length of the range
+            return jsonify([
+                {
+                    'time': day['published_date'].strftime('%Y-%m-%d'),
+                    'turnover': day['turnover'],
+                    'stockTurnover': day['stock_turnover'],
+                    'volume': day['volume'],
+                    'traded': day['traded']
+                }
+                for day in storage.turnover_history(start=from_date, end=to_date)
+            ])
+        
+        stored = storage.turnover_history(start=date, end=date, fields=('turnover',))
+        if stored:
+            return jsonify({
+                'date': date_str,
+                'totalTurnover': stored[0]['turnover']
+            })
         
-        if index_data and 'turnover' in index_data:
-            try:
-                total_turnover = float(index_data['turnover'])
-                return jsonify({
-                    'date': date_str,
-                    'totalTurnover': total_turnover
-                })
-            except (ValueError, TypeError):
-                pass
+        # Days the series does not cover yet: sum the stored rows directly
+        index_data = storage.index_on('NEPSE Index', date, fields=('turnover',))
         
-        stocks = list(db['nepse-stocks'].find(query))
+        if index_data and index_data.get('turnover') is not None:
+            return jsonify({
+                'date': date_str,
+                'totalTurnover': index_data['turnover']
+            })
         
         total_turnover = 0
-        for stock in stocks:
-            if 'traded_amount' in stock:
-                value = stock['traded_amount']
-            elif 'turnover' in stock:
-                value = stock['turnover']
-            elif 'traded_value' in stock:
-                value = stock['traded_value']
+        for stock in storage.quotes_on(date, fields=TURNOVER_FIELDS):
+            if stock.get('traded_amount') is not None:
+                total_turnover += stock['traded_amount']
             else:
-                price = float(stock.get('close', 0))
-                quantity = 0
-                if 'traded_quantity' in stock:
-                    quantity = float(stock['traded_quantity'])
-                elif 'traded_shares' in stock:
-                    quantity = float(stock['traded_shares'])
-                value = price * quantity
-            
-            if isinstance(value, str):
-                try:
-                    value = float(value)
-                except ValueError:
-                    value = 0
-            
-            total_turnover += value
+                total_turnover += stock['close'] * (stock.get('traded_quantity') or 0)
         
         return jsonify({
             'date': date_str,
@@ -326,22 +542,22 @@ def turnover_data():
 @charts.route('/api/companies')
 def companies_list():
     """API endpoint for getting company data for search functionality"""
-    db = get_db()
+    storage = get_storage()
     
     # Get list of companies with their full names
-    companies = list(db.companies.find({}, {'symbol': 1, 'companyname': 1}).sort('symbol', 1))
+    companies = storage.companies(fields=COMPANY_LIST_FIELDS)
     
     # Format for frontend search
     result = []
     for company in companies:
         result.append({
-            'id': str(company['_id']),
+            'id': str(company['company_id']),
             'symbol': company['symbol'],
             'name': company.get('companyname', '') # Include company name
         })
     
     # Also add indices
-    indices = list(db['nepse-indices'].distinct('index_name'))
+    indices = storage.index_names()
     for index in indices:
         result.append({
             'id': index,
@@ -350,4 +566,13 @@ def companies_list():
             'isIndex': True
         })
     
+    # And the sector series
+    for sector in storage.sector_names():
+        result.append({
+            'id': sector,
+            'symbol': sector,
+            'name': 'Sector',
+            'isSector': True
+        })
+    
     return jsonify(result)
\ No newline at end of file
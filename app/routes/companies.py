@@ -1,5 +1,6 @@
 from flask import Blueprint, render_template, request, jsonify, abort
-from app import get_db
+from app import get_storage
+from app.storage.base import CHART_FIELDS, COMPANY_LIST_FIELDS, PRICE_FIELDS, to_datetime
 from app.models.company import Company
 from app.models.stock import Stock
 from bson.objectid import ObjectId
@@ -12,40 +13,32 @@ def index():
     """Display list of all companies with pagination"""
     page = request.args.get('page', 1, type=int)
     per_page = 20
-    db = get_db()
+    storage = get_storage()
     
     # Count total companies for pagination
-    total_companies = db.companies.count_documents({})
+    total_companies = storage.count_companies()
     total_pages = math.ceil(total_companies / per_page)
     
     # Get companies for current page
     skip = (page - 1) * per_page
-    company_list = list(db.companies.find({})
-                        .sort('symbol', 1)
-                        .skip(skip)
-                        .limit(per_page))
+    company_list = storage.companies(skip=skip, limit=per_page, fields=COMPANY_LIST_FIELDS)
     
     # Get latest stock data for these companies
     try:
-        latest_date = db['nepse-stocks'].find_one(
-            {}, sort=[('published_date', -1)]
-        )['published_date']
+        latest_date = storage.latest_stock_date()
+        if latest_date is None:
+            raise KeyError('published_date')
+        
+        # One query for the whole page instead of one per company
+        latest_stocks = {
+            stock['company_id']: stock
+            for stock in storage.quotes_on(latest_date, [company['company_id'] for company in company_list], fields=PRICE_FIELDS)
+        }
         
         for company in company_list:
-            latest_stock = db['nepse-stocks'].find_one({
-                'company_id': company['company_id'],
-                'published_date': latest_date
-            })
+            latest_stock = latest_stocks.get(company['company_id'])
             
             if latest_stock:
-                # Ensure numeric values are converted from strings if needed
-                for key in ['close', 'per_change']:
-                    if key in latest_stock and isinstance(latest_stock[key], str):
-                        try:
-                            latest_stock[key] = float(latest_stock[key])
-                        except (ValueError, TypeError):
-                            latest_stock[key] = 0
-                
                 company['latest_price'] = latest_stock.get('close')
                 company['per_change'] = latest_stock.get('per_change')
             else:
@@ -67,7 +60,7 @@ def index():
 @companies.route('/<company_id>')
 def company_detail(company_id):
     """Display detailed information for a specific company"""
-    db = get_db()
+    storage = get_storage()
     
     # Get company info - convert company_id to integer since it's stored that way in MongoDB
     try:
@@ -75,7 +68,7 @@ def company_detail(company_id):
     except ValueError:
         abort(404)
         
-    company_data = db.companies.find_one({'company_id': company_id_int})
+    company_data = storage.get_company(company_id=company_id_int)
     if not company_data:
         abort(404)
     
@@ -83,32 +76,44 @@ def company_detail(company_id):
     
     # Get historical stock data
     limit = request.args.get('limit', 30, type=int)
-    stock_data = list(db['nepse-stocks'].find(
-        {'company_id': company_id_int}
-    ).sort('published_date', -1).limit(limit))
-    
-    # Ensure numeric values are converted from strings if needed
-    for stock in stock_data:
-        for key in ['open', 'high', 'low', 'close', 'per_change', 'traded_quantity', 'traded_amount']:
-            if key in stock and isinstance(stock[key], str):
-                try:
-                    stock[key] = float(stock[key])
-                except (ValueError, TypeError):
-                    stock[key] = 0
+    stock_data = storage.quotes(company_id_int, limit=limit, newest_first=True)
     
     # Reverse for chronological order (for charts)
     stock_data.reverse()
     
+    # 52-week range, returns, volatility etc. are precomputed at ingest (app/stats.py)
+    stats = storage.company_stats(company_id_int)
+    
     return render_template(
         'companies/detail.html',
         company=company,
-        stock_data=stock_data
+        stock_data=stock_data,
+        stats=stats
     )
 
+@companies.route('/api/<company_id>/stats')
+def company_stats_api(company_id):
+    """Precomputed statistics of one company: 52-week range, returns, volatility, drawdown, average turnover"""
+    storage = get_storage()
+    
+    try:
+        company_id_int = int(company_id)
+    except ValueError:
+        return jsonify({"error": "Invalid company ID"}), 400
+    
+    stats = storage.company_stats(company_id_int)
+    if not stats:
+        return jsonify({"error": "No statistics available for this company"}), 404
+    
+    for key in ('as_of', 'last_traded'):
+        if stats.get(key):
+            stats[key] = stats[key].strftime('%Y-%m-%d')
+    return jsonify(stats)
+
 @companies.route('/api/<company_id>/data')
 def company_data_api(company_id):
     """API endpoint to get company stock data for charts"""
-    db = get_db()
+    storage = get_storage()
     
     # Verify company exists
     try:
@@ -116,7 +121,7 @@ def company_data_api(company_id):
     except ValueError:
         return jsonify({"error": "Invalid company ID"}), 400
         
-    company = db.companies.find_one({'company_id': company_id_int})
+    company = storage.get_company(company_id=company_id_int, fields=('company_id',))
     if not company:
         return jsonify({"error": "Company not found"}), 404
     
@@ -124,38 +129,25 @@ def company_data_api(company_id):
     from_date = request.args.get('from')
     to_date = request.args.get('to')
     
-    # Build query
-    query = {'company_id': company_id_int}
-    if from_date or to_date:
-        query['published_date'] = {}
-        if from_date:
-            query['published_date']['$gte'] = from_date
-        if to_date:
-            query['published_date']['$lte'] = to_date
+    try:
+        from_date = to_datetime(from_date) if from_date else None
+        to_date = to_datetime(to_date) if to_date else None
+    except ValueError:
+        return jsonify({"error": "Dates must be YYYY-MM-DD"}), 400
     
     # Get stock data
-    stock_data = list(db['nepse-stocks'].find(
-        query
-    ).sort('published_date', 1))
+    stock_data = storage.quotes(company_id_int, start=from_date, end=to_date, fields=CHART_FIELDS)
     
     # Format for the chart
     chart_data = []
     for stock in stock_data:
-        # Convert string values to numbers if needed
-        for key in ['open', 'high', 'low', 'close', 'traded_quantity']:
-            if key in stock and isinstance(stock[key], str):
-                try:
-                    stock[key] = float(stock[key]) if key != 'traded_quantity' else int(float(stock[key]))
-                except (ValueError, TypeError):
-                    stock[key] = 0
-                    
         chart_data.append({
             'time': stock['published_date'].strftime('%Y-%m-%d'),
-            'open': float(stock['open']),
-            'high': float(stock['high']),
-            'low': float(stock['low']),
-            'close': float(stock['close']),
-            'volume': int(float(stock['traded_quantity']))
+            'open': stock['open'],
+            'high': stock['high'],
+            'low': stock['low'],
+            'close': stock['close'],
+            'volume': int(stock.get('traded_quantity') or 0)
         })
     
     return jsonify(chart_data)
\ No newline at end of file
@@ -1,7 +1,8 @@
-from flask import Blueprint, render_template, request, jsonify, current_app, redirect, url_for
-from app import get_db
+from flask import Blueprint, render_template, request, jsonify, current_app, redirect, url_for, abort, send_from_directory
+from app import check_readiness, get_storage, snapshots
 from app.models.index import Index
 from datetime import datetime
+import os
 
 main = Blueprint('main', __name__)
 
@@ -10,8 +11,7 @@ def index():
     """Render the homepage with NEPSE index data and summary"""
     # Skip caching for now until we fix the issue
     # If no cached data, fetch from database
-    db = get_db()
-    from datetime import datetime
+    storage = get_storage()
     
     # Define the mapping of all expected indices
     index_mapping = {
@@ -34,61 +34,22 @@ def index():
         "18": "Investment"
     }
     
-    # Use MongoDB aggregation pipeline for more efficient querying
     # Get the latest date first to minimize queries
-    latest_date_doc = db['nepse-indices'].find_one({}, sort=[('published_date', -1)])
-    latest_date = latest_date_doc['published_date'] if latest_date_doc else datetime.now()
+    latest_date = storage.latest_index_date() or datetime.now()
     
-    # Get the latest NEPSE index data
-    latest_index = db['nepse-indices'].find_one(
-        {'index_name': 'NEPSE Index', 'published_date': latest_date}
-    )
-    
-    # Get all indices from the latest date in a single query
-    all_indices = list(db['nepse-indices'].find({'published_date': latest_date}))
+    # Get all indices from the latest date in a single query; the NEPSE Index is among them
+    all_indices = storage.indices_on(latest_date)
+    latest_index = next((idx for idx in all_indices if idx.get('index_name') == 'NEPSE Index'), None)
     
     # Get market turnover directly from NEPSE Index data
-    indices_total_turnover = 0
-    if latest_index and 'turnover' in latest_index:
-        try:
-            # Convert to float if it's a string
-            indices_total_turnover = float(latest_index['turnover']) if isinstance(latest_index['turnover'], str) else latest_index['turnover']
-            print(f"Using NEPSE Index turnover: {indices_total_turnover} for date {latest_date}")
-        except (ValueError, TypeError) as e:
-            print(f"Error parsing NEPSE Index turnover: {e}")
-            indices_total_turnover = 0
+    indices_total_turnover = (latest_index.get('turnover') if latest_index else None) or 0
     
     # Get latest stock date
-    latest_date_stocks = db['nepse-stocks'].find_one(
-        {}, 
-        sort=[('published_date', -1)]
-    )
-    latest_stock_date = latest_date_stocks['published_date'] if latest_date_stocks else None
+    latest_stock_date = storage.latest_stock_date()
     
-    # Calculate total turnover and get most active stocks in a single query
+    # Get most active stocks and total turnover
     if latest_stock_date:
-        # Get most active stocks and total turnover in a single aggregation
-        pipeline = [
-            {'$match': {'published_date': latest_stock_date}},
-            {'$facet': {
-                'most_active': [
-                    {'$sort': {'traded_amount': -1}},
-                    {'$limit': 8}
-                ],
-                'total_turnover': [
-                    {'$group': {'_id': None, 'total': {'$sum': '$traded_amount'}}}
-                ]
-            }}
-        ]
-        
-        agg_result = list(db['nepse-stocks'].aggregate(pipeline))
-        
-        if agg_result and agg_result[0]['total_turnover']:
-            total_turnover = agg_result[0]['total_turnover'][0]['total']
-            stocks = agg_result[0]['most_active']
-        else:
-            total_turnover = 0
-            stocks = []
+        stocks, total_turnover = storage.market_summary(latest_stock_date, top=8)
     else:
         total_turnover = 0
         stocks = []
@@ -132,39 +93,6 @@ def index():
             }
             indices.append(placeholder)
     
-    # Convert string values to proper types
-    for index in indices:
-        # Convert numeric values
-        for key in ['current', 'change_', 'per_change', 'high', 'low', 'open', 'turnover']:
-            if key in index and isinstance(index[key], str):
-                try:
-                    index[key] = float(index[key])
-                except (ValueError, TypeError):
-                    index[key] = 0
-    
-    # Convert published_date string to datetime object if needed
-    if latest_index and 'published_date' in latest_index and isinstance(latest_index['published_date'], str):
-        try:
-            latest_index['published_date'] = datetime.strptime(latest_index['published_date'], '%Y-%m-%d')
-        except (ValueError, TypeError):
-            latest_index['published_date'] = datetime.now()
-    
-    # Convert string values to numeric for stocks
-    for stock in stocks:
-        for key in ['open', 'high', 'low', 'close', 'per_change', 'traded_quantity', 'traded_amount']:
-            if key in stock and isinstance(stock[key], str):
-                try:
-                    stock[key] = float(stock[key])
-                except (ValueError, TypeError):
-                    stock[key] = 0
-    
-        # Convert published_date for stocks if needed
-        if 'published_date' in stock and isinstance(stock['published_date'], str):
-            try:
-                stock['published_date'] = datetime.strptime(stock['published_date'], '%Y-%m-%d')
-            except (ValueError, TypeError):
-                stock['published_date'] = datetime.now()
-    
     # Prepare data for template
     template_data = {
         'nepse': latest_index, 
@@ -189,20 +117,11 @@ def search():
         return jsonify([])
     
     # Skip caching for now
-    db = get_db()
-    
-    # Use text index for more efficient search
-    companies = list(db.companies.find({
-        '$or': [
-            {'symbol': {'$regex': query, '$options': 'i'}},
-            {'companyname': {'$regex': query, '$options': 'i'}} # Changed from company_name to companyname
-        ]
-    }).limit(10))
+    storage = get_storage()
     
-    # Use index for faster index name search
-    indices = list(db['nepse-indices'].find({
-        'index_name': {'$regex': query, '$options': 'i'} # Changed from name to index_name
-    }).distinct('index_name'))
+    # Match symbols and company names, then index names
+    companies = storage.search_companies(query, limit=10)
+    indices = storage.index_names(query)
     
     results = []
     
@@ -232,4 +151,54 @@ def charts_redirect():
     """
     Redirect /charts URL to the charts page
     """
-    return redirect(url_for('charts.index'))
\ No newline at end of file
+    return redirect(url_for('charts.index'))
+
+# How long clients may cache a snapshot file; a version's files never change once built
+SNAPSHOT_MAX_AGE = int(os.getenv('SNAPSHOT_MAX_AGE', str(7 * 24 * 3600)))
+
+@main.route('/data/snapshots')
+def snapshot_index():
+    """
+    Bulk downloads of the full dataset: one gzip CSV per table, built after each ingestion
+    """
+    result = []
+    for version in snapshots.versions():
+        manifest = snapshots.read_manifest(version)
+        for filename, info in manifest['files'].items():
+            info['url'] = url_for('main.snapshot_file', version=version, filename=filename, _external=True)
+        result.append(manifest)
+    return jsonify({
+        'latest': result[0]['version'] if result else None,
+        'snapshots': result
+    })
+
+@main.route('/data/snapshots/<version>/<filename>')
+def snapshot_file(version, filename):
+    """
+    One snapshot file, with Range and conditional request support.
+    /data/snapshots/latest/<filename> redirects to the newest version.
+    """
+    if version == 'latest':
+        available = snapshots.versions()
+        if not available:
+            abort(404)
+        response = redirect(url_for('main.snapshot_file', version=available[0], filename=filename))
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
+    
+    manifest = snapshots.read_manifest(version)
+    if not manifest or (filename not in manifest['files'] and filename != snapshots.MANIFEST):
+        abort(404)
+    return send_from_directory(
+        os.path.join(snapshots.snapshot_dir(), version), filename,
+        as_attachment=filename != snapshots.MANIFEST, max_age=SNAPSHOT_MAX_AGE
+    )
+
+@main.route('/healthz')
+def healthz():
+    """
+    Readiness probe: 200 once the data backend answers, 503 until then
+    """
+    ready, details = check_readiness()
+    details['status'] = 'ok' if ready else 'unavailable'
+    return jsonify(details), 200 if ready else 503
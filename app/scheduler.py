@@ -0,0 +1,344 @@
+import argparse
+import datetime
+import os
+import threading
+import requests
+from dotenv import load_dotenv
+
+# Load environment variables from .env file
+load_dotenv()
+
+# Nepal Standard Time (UTC+05:45)
+NPT = datetime.timezone(datetime.timedelta(hours=5, minutes=45))
+
+# NEPSE trades Sunday to Thursday (Python weekday numbers)
+TRADING_WEEKDAYS = {6, 0, 1, 2, 3}
+
+# Market close in NPT, and how long after it sharesansar usually has the day's data
+MARKET_CLOSE = datetime.time(*map(int, os.getenv('MARKET_CLOSE', '15:00').split(':')))
+SCHEDULER_DELAY_MINUTES = int(os.getenv('SCHEDULER_DELAY_MINUTES', '30'))
+
+# How often to re-check after close while the day's data has not been published yet
+SCHEDULER_RETRY_MINUTES = int(os.getenv('SCHEDULER_RETRY_MINUTES', '15'))
+
+# Give up waiting for a day's data this many hours after close
+SCHEDULER_GIVE_UP_HOURS = int(os.getenv('SCHEDULER_GIVE_UP_HOURS', '6'))
+
+# The NEPSE Index is the watermark: when it has a new day, the rest of the market does too
+WATERMARK_INDEX_ID = 12
+
+# Functions called with the trading date after an ingestion completes
+post_ingest_hooks = []
+
+
+# Register a function to run after each successful ingestion, scheduled or started by an admin
+def register_post_ingest_hook(hook):
+    if hook not in post_ingest_hooks:
+        post_ingest_hooks.append(hook)
+    return hook
+
+
+# Run every post-ingest hook; one failing hook does not stop the others
+def run_post_ingest_hooks(trading_date):
+    for hook in post_ingest_hooks:
+        try:
+            hook(trading_date)
+            print(f"Post-ingest hook {getattr(hook, '__name__', hook)} finished for {trading_date}")
+        except Exception as e:
+            print(f"Post-ingest hook {getattr(hook, '__name__', hook)} failed: {e}")
+
+
+# Post-ingest hook: append the new rows to the columnar history archive
+def update_archive(trading_date):
+    from app import get_mongo_client
+    from app.storage.archive import export_archive
+    counts = export_archive(get_mongo_client()[os.getenv('DATABASE_NAME', 'heisenstocks')])
+    print(f"Archived {counts['stocks']} stock rows and {counts['indices']} index rows")
+
+
+# Post-ingest hook: write the bulk download snapshot for the new trading day (app/snapshots.py)
+def update_snapshot(trading_date):
+    from app import get_mongo_client
+    from app.snapshots import build_snapshot
+    from app.storage.mongo import MongoStore
+    manifest = build_snapshot(MongoStore(get_mongo_client()[os.getenv('DATABASE_NAME', 'heisenstocks')]))
+    if manifest:
+        print(f"Snapshot {manifest['version']}: " + ', '.join(f"{info['rows']} {info['table']} rows" for info in manifest['files'].values()))
+
+
+# Post-ingest hook: aggregate the new trading days into the sector series (needs a writable connection)
+def update_sectors(trading_date):
+    from app import get_admin_db
+    from app.sectors import update_sector_series
+    written = update_sector_series(get_admin_db())
+    print(f"Added {written} sector rows")
+
+
+# Post-ingest hook: sum the new trading days into the market turnover series (needs a writable connection)
+def update_turnover(trading_date):
+    from app import get_admin_db
+    from app.turnover import update_turnover_series
+    written = update_turnover_series(get_admin_db())
+    print(f"Added {written} turnover days")
+
+
+# Post-ingest hook for runs outside the web app: recompute company statistics from the database
+def update_stats(trading_date):
+    from app import get_admin_db
+    from app.stats import update_company_stats
+    written = update_company_stats(get_admin_db())
+    print(f"Updated statistics for {written} companies")
+
+
+# Market holidays from NEPSE_HOLIDAYS (comma separated) and NEPSE_HOLIDAYS_FILE (one date per line)
+def load_holidays():
+    values = [v for v in os.getenv('NEPSE_HOLIDAYS', '').split(',') if v.strip()]
+    holidays_file = os.getenv('NEPSE_HOLIDAYS_FILE')
+    if holidays_file and os.path.isfile(holidays_file):
+        with open(holidays_file, encoding='utf-8') as f:
+            values.extend(line.split('#')[0] for line in f if line.split('#')[0].strip())
+
+    holidays = set()
+    for value in values:
+        try:
+            holidays.add(datetime.date.fromisoformat(value.strip()))
+        except ValueError:
+            print(f"Ignoring invalid holiday date: {value!r}")
+    return holidays
+
+
+def is_trading_day(day, holidays=()):
+    return day.weekday() in TRADING_WEEKDAYS and day not in holidays
+
+
+# Time after which a trading day's data is expected upstream
+def data_ready_time(day):
+    close = datetime.datetime.combine(day, MARKET_CLOSE, tzinfo=NPT)
+    return close + datetime.timedelta(minutes=SCHEDULER_DELAY_MINUTES)
+
+
+# Most recent trading day whose data should already be published
+def expected_trading_day(now, holidays=()):
+    day = now.astimezone(NPT).date()
+    for _ in range(30):
+        if is_trading_day(day, holidays) and data_ready_time(day) <= now:
+            return day
+        day -= datetime.timedelta(days=1)
+    return None
+
+
+# Next time the scheduler should look for a trading day's data
+def next_check_time(now, holidays=()):
+    day = now.astimezone(NPT).date()
+    for _ in range(30):
+        if is_trading_day(day, holidays) and data_ready_time(day) > now:
+            return data_ready_time(day)
+        day += datetime.timedelta(days=1)
+    return now + datetime.timedelta(days=1)
+
+
+# Latest NEPSE Index date stored in the database (read-only connection)
+def latest_stored_date():
+    from app import get_mongo_client
+    collection = get_mongo_client()[os.getenv('DATABASE_NAME', 'heisenstocks')][os.getenv('NEPSE_INDICES', 'nepse-indices')]
+    latest = collection.find_one(
+        {'index_id': WATERMARK_INDEX_ID},
+        {'published_date': 1, '_id': 0},
+        sort=[('published_date', -1)]
+    )
+    if not latest:
+        return None
+    value = latest['published_date']
+    if isinstance(value, str):
+        return datetime.date.fromisoformat(value[:10])
+    return value.date() if isinstance(value, datetime.datetime) else value
+
+
+# One upstream request: does sharesansar have NEPSE Index rows after the stored date?
+def upstream_has_new_data(after_date, through_date):
+    base_url = os.getenv('SHARESANSAR_URL', 'https://www.sharesansar.com').rstrip('/')
+    from_date = (after_date + datetime.timedelta(days=1)) if after_date else through_date
+    response = requests.get(
+        f"{base_url}/index-history-data",
+        params={
+            'draw': '1',
+            'index_id': str(WATERMARK_INDEX_ID),
+            'from': from_date.strftime('%Y-%m-%d'),
+            'to': through_date.strftime('%Y-%m-%d'),
+            'length': '1',
+            'start': '0'
+        },
+        headers={
+            'User-Agent': 'Mozilla/5.0',
+            'X-Requested-With': 'XMLHttpRequest',
+            'Referer': f"{base_url}/index-history"
+        },
+        timeout=15
+    )
+    response.raise_for_status()
+    return int(response.json().get('recordsTotal', 0)) > 0
+
+
+def check_for_new_data(now=None, holidays=None):
+    """
+    Decide whether ingestion should run. Returns a dict with the expected
+    trading day, the stored watermark, 'run' and a human-readable reason. The
+    database watermark is checked first, so an up-to-date database costs no
+    HTTP requests.
+    """
+    now = now or datetime.datetime.now(NPT)
+    holidays = load_holidays() if holidays is None else holidays
+    check = {'expected': expected_trading_day(now, holidays), 'stored': None, 'run': False, 'up_to_date': False}
+
+    if check['expected'] is None:
+        check['reason'] = "no trading day in the last 30 days"
+        return check
+
+    check['stored'] = stored = latest_stored_date()
+    if stored and stored >= check['expected']:
+        check['up_to_date'] = True
+        check['reason'] = f"database already has {stored}"
+    elif not upstream_has_new_data(stored, now.astimezone(NPT).date()):
+        check['reason'] = f"no data after {stored} published upstream yet"
+    else:
+        check['run'] = True
+        check['reason'] = f"new data expected for {check['expected']} (database has {stored})"
+    return check
+
+
+def run_scheduled_update(job, trading_date):
+    """Job target: indices then stocks, then the post-ingest hooks"""
+    from app.jobs import run_script
+    run_script(job, 'fetch_new_indices_data.py')
+    job.check_cancelled()
+    run_script(job, 'fetch_new_stock_data.py')
+    job.check_cancelled()
+    run_post_ingest_hooks(trading_date)
+    return {'trading_date': trading_date}
+
+
+# Background thread that runs ingestion shortly after each NEPSE close
+class IngestScheduler(threading.Thread):
+    """
+    Sleeps until the next trading day's data should be available, checks the
+    watermark, and submits a 'scheduled' job when new data is expected. While
+    the day's data has not appeared it re-checks every SCHEDULER_RETRY_MINUTES
+    until SCHEDULER_GIVE_UP_HOURS after close.
+    """
+
+    def __init__(self):
+        super().__init__(name='ingest-scheduler', daemon=True)
+        self._stop_event = threading.Event()
+        self.last_ingested = None
+        self.last_check = None
+
+    def stop(self):
+        self._stop_event.set()
+
+    def _wait_for_job(self, job):
+        while not job.finished and not self._stop_event.wait(5):
+            pass
+        return job.status
+
+    def check_once(self):
+        """Run one check, and the ingestion job if needed; returns seconds until the next check"""
+        from app.jobs import job_runner, COMPLETE
+        now = datetime.datetime.now(NPT)
+        holidays = load_holidays()
+        retry = datetime.timedelta(minutes=SCHEDULER_RETRY_MINUTES)
+
+        try:
+            check = check_for_new_data(now, holidays)
+        except Exception as e:
+            check = {'expected': expected_trading_day(now, holidays), 'run': False, 'up_to_date': False, 'reason': f"check failed: {e}"}
+        self.last_check = {'at': now.isoformat(), 'reason': check['reason']}
+        print(f"Scheduler: {check['reason']}")
+
+        expected = check['expected']
+        if check['up_to_date']:
+            self.last_ingested = expected
+        elif check['run'] and expected != self.last_ingested:
+            job, created = job_runner.start('scheduled', run_scheduled_update, trading_date=expected.isoformat())
+            print(f"Scheduler: {'started' if created else 'waiting for'} job {job.id}")
+            # Another ingestion job may be running instead; the next check sees whether it stored the day
+            if self._wait_for_job(job) == COMPLETE and job.kind == 'scheduled':
+                self.last_ingested = expected
+
+        # Keep polling while the day's data is due but not yet stored
+        if expected and expected != self.last_ingested:
+            if now < data_ready_time(expected) + datetime.timedelta(hours=SCHEDULER_GIVE_UP_HOURS):
+                return retry.total_seconds()
+        return max((next_check_time(now, holidays) - now).total_seconds(), 60)
+
+    def run(self):
+        print("Ingestion scheduler started")
+        while not self._stop_event.is_set():
+            try:
+                delay = self.check_once()
+            except Exception as e:
+                print(f"Scheduler error: {e}")
+                delay = SCHEDULER_RETRY_MINUTES * 60
+            print(f"Scheduler: next check in {delay / 60:.0f} minutes")
+            self._stop_event.wait(delay)
+
+
+scheduler = None
+web_hooks_registered = False
+
+
+# Register the web app's post-ingest hooks once per process; admin jobs and the scheduler both run them
+def register_web_hooks(app):
+    global web_hooks_registered
+    if web_hooks_registered:
+        return
+    web_hooks_registered = True
+
+    from app import cache
+
+    def clear_cache(trading_date):
+        with app.app_context():
+            cache.clear()
+
+    register_post_ingest_hook(update_sectors)
+    register_post_ingest_hook(update_turnover)
+    register_post_ingest_hook(clear_cache)
+    from app.market import refresh_market_matrix
+    register_post_ingest_hook(refresh_market_matrix(app))
+    from app.stats import refresh_company_stats
+    register_post_ingest_hook(refresh_company_stats(app))
+    if os.getenv('ARCHIVE_ENABLED') == '1':
+        register_post_ingest_hook(update_archive)
+    if os.getenv('SNAPSHOT_ENABLED') == '1':
+        register_post_ingest_hook(update_snapshot)
+
+
+# Register the post-ingest hooks, and start the scheduler when SCHEDULER_ENABLED=1 (enable it in one web process only)
+def init_scheduler(app):
+    global scheduler
+    register_web_hooks(app)
+    if os.getenv('SCHEDULER_ENABLED') != '1' or scheduler is not None:
+        return None
+
+    scheduler = IngestScheduler()
+    scheduler.start()
+    return scheduler
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run NEPSE ingestion after market close when new data is available")
+    parser.add_argument("--check", action="store_true", help="Only report whether new data is expected")
+    args = parser.parse_args()
+
+    check = check_for_new_data()
+    print(check['reason'])
+    if check['run'] and not args.check:
+        from app.jobs import Job
+        register_post_ingest_hook(update_sectors)
+        register_post_ingest_hook(update_turnover)
+        register_post_ingest_hook(update_stats)
+        if os.getenv('ARCHIVE_ENABLED') == '1':
+            register_post_ingest_hook(update_archive)
+        if os.getenv('SNAPSHOT_ENABLED') == '1':
+            register_post_ingest_hook(update_snapshot)
+        run_scheduled_update(Job('scheduled'), check['expected'].isoformat())
+        print(f"Scheduled update for {check['expected']} finished")
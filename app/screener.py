@@ -0,0 +1,246 @@
+import os
+import re
+import threading
+import numpy as np
+from app import indicators
+from app.market import market_matrix
+from app.series import forward_fill
+
+# Trading days in a year, for 52-week highs and lows
+WEEK52_DAYS = int(os.getenv('WEEK52_DAYS', '250'))
+
+# Columns included in every screener result row
+RESULT_FIELDS = ('close', 'per_change', 'volume')
+
+# <expression> <operator> <expression>; expressions are numbers, fields or number*field
+CONDITION = re.compile(r'^\s*(.+?)\s*(>=|<=|!=|>|<|=|\scrosses_above\s|\scrosses_below\s)\s*(.+?)\s*$')
+TERM = re.compile(r'^(?:(-?\d+(?:\.\d+)?)\s*\*\s*)?([a-z_][a-z0-9_]*)$|^(-?\d+(?:\.\d+)?)$')
+
+# Fields computed from the matrix; sma<N> and avg_volume<N> take any period
+FIELDS = {
+    'open': 'Opening price',
+    'high': 'Day high',
+    'low': 'Day low',
+    'close': 'Closing price',
+    'per_change': 'Percent change from the previous close',
+    'volume': 'Traded quantity',
+    'turnover': 'Traded amount',
+    'sma<N>': 'Simple moving average of the close over N days',
+    'avg_volume<N>': 'Average traded quantity over N days',
+    'high52w': '52-week high',
+    'low52w': '52-week low',
+    'pct_from_high52w': 'Percent below the 52-week high',
+    'new_high52w': '1 when the day high reaches the 52-week high',
+    'new_low52w': '1 when the day low reaches the 52-week low',
+    'squeeze_on': '1 while Bollinger Bands are inside the Keltner Channels',
+    'squeeze_off': '1 while Bollinger Bands are outside the Keltner Channels',
+    'squeeze_fired': '1 on the day a squeeze turns off',
+    'squeeze_momentum': 'Squeeze momentum value',
+    'momentum_rising': '1 when squeeze momentum is above the previous day',
+    'ssl_trend': 'SSL trend: 1 up, -1 down',
+    'ssl_bullish': '1 when the close is above the SSL baseline',
+    'ssl_flip_up': '1 on the day the SSL trend turns up',
+    'ssl_flip_down': '1 on the day the SSL trend turns down',
+}
+
+
+class ScreenerError(ValueError):
+    pass
+
+
+def previous(values):
+    """Values shifted one trading day later (row i holds row i - 1)"""
+    result = np.full(values.shape, np.nan)
+    result[1:] = values[:-1]
+    return result
+
+
+def parse_term(text):
+    """(factor, field) for a field term or (number, None) for a constant"""
+    match = TERM.match(text.strip())
+    if not match:
+        raise ScreenerError(f"Cannot read '{text}': use a number, a field or number*field")
+    if match.group(3) is not None:
+        return float(match.group(3)), None
+    return float(match.group(1) or 1), match.group(2)
+
+
+def parse_condition(text):
+    """
+    Parse one condition: 'close > sma50', 'volume >= 2*avg_volume20',
+    'close crosses_above sma200', or a bare flag such as 'squeeze_fired'
+    (which means 'squeeze_fired = 1'); 'not ssl_bullish' means '= 0'.
+    """
+    text = text.strip()
+    match = CONDITION.match(text)
+    if match:
+        left, operator, right = match.groups()
+        return {'text': text, 'left': parse_term(left), 'operator': operator.strip(), 'right': parse_term(right)}
+    negated = text.startswith('not ')
+    field = text[4:].strip() if negated else text
+    return {'text': text, 'left': parse_term(field), 'operator': '=', 'right': (0.0 if negated else 1.0, None)}
+
+
+# Screens every company at once on the market matrix (app/market.py)
+class Screener:
+    """
+    Evaluates conditions on the dates x companies matrices of a
+    MarketMatrix. Each field is computed once for the whole market and
+    cached until the matrix gets a new trading day.
+    """
+
+    def __init__(self, matrix):
+        self.matrix = matrix
+        self._features = {}
+        self._version = None
+        self._lock = threading.Lock()
+
+    def _prices(self, field):
+        # Carry prices over days a company did not trade, as the charts do
+        return forward_fill(self.matrix.values[field].T).T
+
+    def _compute(self, name):
+        if name in ('open', 'high', 'low', 'close'):
+            return self._prices(name)
+        if name == 'per_change':
+            return self.matrix.values['per_change']
+        if name in ('volume', 'turnover'):
+            values = self.matrix.values['traded_quantity' if name == 'volume' else 'traded_amount']
+            return np.where(np.isnan(values), 0.0, values)
+
+        period = re.fullmatch(r'(sma|avg_volume)(\d+)', name)
+        if period:
+            days = int(period.group(2))
+            if not 1 < days <= len(self.matrix.dates):
+                raise ScreenerError(f"{name}: the period must be between 2 and {len(self.matrix.dates)} days")
+            return indicators.sma(self.feature('close' if period.group(1) == 'sma' else 'volume'), days)
+
+        if name == 'high52w':
+            return indicators.rolling_max(self.feature('high'), min(WEEK52_DAYS, len(self.matrix.dates)))
+        if name == 'low52w':
+            return indicators.rolling_min(self.feature('low'), min(WEEK52_DAYS, len(self.matrix.dates)))
+        if name == 'pct_from_high52w':
+            with np.errstate(divide='ignore', invalid='ignore'):
+                return (1 - self.feature('close') / self.feature('high52w')) * 100
+        if name == 'new_high52w':
+            return (self.feature('high') >= self.feature('high52w')).astype(np.float64)
+        if name == 'new_low52w':
+            return (self.feature('low') <= self.feature('low52w')).astype(np.float64)
+
+        if name.startswith('squeeze') or name == 'momentum_rising':
+            result = indicators.squeeze(self.feature('close'), self.feature('high'), self.feature('low'))
+            on, off = result['on'].astype(np.float64), result['off'].astype(np.float64)
+            momentum = result['momentum']
+            # Every squeeze field comes out of one pass
+            return {
+                'squeeze_on': on,
+                'squeeze_off': off,
+                'squeeze_fired': ((off == 1) & (previous(on) == 1)).astype(np.float64),
+                'squeeze_momentum': momentum,
+                'momentum_rising': (momentum > previous(momentum)).astype(np.float64),
+            }
+
+        if name.startswith('ssl_'):
+            result = indicators.ssl_hybrid(self.feature('close'), self.feature('high'), self.feature('low'))
+            trend = result['trend']
+            return {
+                'ssl_trend': trend,
+                'ssl_bullish': result['bullish'].astype(np.float64),
+                'ssl_flip_up': ((trend == 1) & (previous(trend) != 1)).astype(np.float64),
+                'ssl_flip_down': ((trend == -1) & (previous(trend) != -1)).astype(np.float64),
+            }
+        return None
+
+    def feature(self, name):
+        """Dates x companies values of a field, computed once per matrix version"""
+        if name not in self._features:
+            values = self._compute(name)
+            if isinstance(values, dict):
+                self._features.update(values)
+            elif values is not None:
+                self._features[name] = values
+            if name not in self._features:
+                raise ScreenerError(f"Unknown field '{name}'")
+        return self._features[name]
+
+    def _term(self, term, row):
+        factor, field = term
+        if field is None:
+            return factor
+        return factor * self.feature(field)[row]
+
+    def _evaluate(self, condition, row):
+        left = self._term(condition['left'], row)
+        right = self._term(condition['right'], row)
+        operator = condition['operator']
+        if operator in ('crosses_above', 'crosses_below'):
+            if row == 0:
+                raise ScreenerError("Crossings need a previous trading day")
+            before_left = self._term(condition['left'], row - 1)
+            before_right = self._term(condition['right'], row - 1)
+            if operator == 'crosses_above':
+                return (left > right) & (before_left <= before_right)
+            return (left < right) & (before_left >= before_right)
+        with np.errstate(invalid='ignore'):
+            return {
+                '>': np.greater, '>=': np.greater_equal, '<': np.less, '<=': np.less_equal,
+                '=': np.equal, '!=': np.not_equal,
+            }[operator](left, right)
+
+    def screen(self, conditions, date=None, sort=None, descending=True, limit=100, include_untraded=False):
+        """
+        Companies meeting every condition on date (default: the latest day).
+        Returns (date, matched rows, total matches).
+        """
+        parsed = [parse_condition(condition) for condition in conditions]
+        fields = list(RESULT_FIELDS)
+        for condition in parsed:
+            for _, field in (condition['left'], condition['right']):
+                if field and field not in fields:
+                    fields.append(field)
+        if sort and sort not in fields:
+            fields.append(sort)
+
+        with self._lock:
+            if self._version != self.matrix.loaded_at:
+                self._features = {}
+                self._version = self.matrix.loaded_at
+            if not len(self.matrix.dates):
+                return None, [], 0
+
+            row = len(self.matrix.dates) - 1
+            if date is not None:
+                row = int(np.searchsorted(self.matrix.dates, np.datetime64(date.date(), 'D')))
+                if row >= len(self.matrix.dates) or self.matrix.dates[row] != np.datetime64(date.date(), 'D'):
+                    raise ScreenerError(f"{date.date()} is not a trading day in the last {len(self.matrix.dates)} days")
+
+            # Only companies that traded that day, unless asked otherwise
+            mask = np.ones(len(self.matrix.company_ids), dtype=bool)
+            if not include_untraded:
+                mask &= ~np.isnan(self.matrix.values['close'][row])
+            for condition in parsed:
+                mask &= self._evaluate(condition, row)
+
+            values = {field: self.feature(field)[row] for field in fields}
+
+        matched = np.flatnonzero(mask)
+        if sort:
+            order = values[sort][matched]
+            # NaN sorts last in either direction
+            keys = np.where(np.isnan(order), np.inf, -order if descending else order)
+            matched = matched[np.argsort(keys, kind='stable')]
+        total = len(matched)
+        if limit:
+            matched = matched[:limit]
+
+        rows = []
+        for column in matched:
+            result = {'symbol': self.matrix.symbols[column], 'company_id': int(self.matrix.company_ids[column])}
+            for field in fields:
+                value = values[field][column]
+                result[field] = None if np.isnan(value) else round(float(value), 4)
+            rows.append(result)
+        return self.matrix.dates[row].item(), rows, total
+
+
+screener = Screener(market_matrix)
@@ -0,0 +1,180 @@
+import argparse
+import datetime
+import json
+import os
+import subprocess
+import sys
+import time
+import uuid
+from pymongo import MongoClient
+
+# Allow running as a standalone script as well as importing from the app package
+if __package__ in (None, ''):
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from app.scripts.replay_server import ReplayData, ReplayServer
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Collection names used inside the throwaway benchmark database
+STOCKS_COLLECTION = 'nepse-stocks'
+INDICES_COLLECTION = 'nepse-indices'
+
+
+# Seed the throwaway database so the scripts know which companies/indices to update
+def seed_database(db, data, backfill_days):
+    """
+    Insert one existing row per company and index.
+
+    With backfill_days=None the seeded row predates all replay data, so the
+    scripts fetch the full history; otherwise only the newest backfill_days
+    trading days are new.
+    """
+    companies = data.companies
+    db.companies.insert_many([dict(company) for company in companies])
+
+    def cutoff(rows):
+        if backfill_days is None or backfill_days >= len(rows):
+            return "2000-01-01"
+        return rows[backfill_days]["published_date"]
+
+    stock_rows = []
+    for company in companies:
+        rows = data.company_rows.get(company["company_id"], [])
+        stock_rows.append({
+            "company_id": company["company_id"],
+            "company_symbol": company["symbol"],
+            "published_date": cutoff(rows)
+        })
+    if stock_rows:
+        db[STOCKS_COLLECTION].insert_many(stock_rows)
+
+    index_rows = []
+    for index_id, rows in data.index_rows.items():
+        index_rows.append({"index_id": index_id, "published_date": cutoff(rows)})
+    if index_rows:
+        db[INDICES_COLLECTION].insert_many(index_rows)
+
+
+# Run one ingestion script against the replay server and measure it
+def run_script(script_name, env, server, collection, log_file=None, extra_args=None):
+    before_rows = collection.count_documents({})
+    before_stats = server.stats()
+
+    start = time.perf_counter()
+    process = subprocess.run(
+        [sys.executable, os.path.join(SCRIPTS_DIR, script_name)] + (extra_args or []),
+        stdout=log_file or subprocess.DEVNULL,
+        stderr=subprocess.STDOUT,
+        env=env
+    )
+    wall_time = time.perf_counter() - start
+
+    after_stats = server.stats()
+    rows = collection.count_documents({}) - before_rows
+    requests_made = after_stats["requests"] - before_stats["requests"]
+
+    return {
+        "script": script_name,
+        "returncode": process.returncode,
+        "wall_time_s": round(wall_time, 3),
+        "rows": rows,
+        "requests": requests_made,
+        "errors_injected": after_stats["errors"] - before_stats["errors"],
+        "bytes": after_stats["bytes"] - before_stats["bytes"],
+        "rows_per_s": round(rows / wall_time, 1) if wall_time else 0.0,
+        "requests_per_s": round(requests_made / wall_time, 1) if wall_time else 0.0
+    }
+
+
+def print_results(results):
+    print("\n" + "=" * 78)
+    print("INGESTION BENCHMARK")
+    print("=" * 78)
+    print(f"{'script':<28}{'wall s':>9}{'rows':>9}{'rows/s':>10}{'reqs':>8}{'reqs/s':>9}{'rc':>5}")
+    for result in results:
+        print(f"{result['script']:<28}{result['wall_time_s']:>9.2f}{result['rows']:>9}"
+              f"{result['rows_per_s']:>10.1f}{result['requests']:>8}{result['requests_per_s']:>9.1f}"
+              f"{result['returncode']:>5}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the ingestion scripts against a local replay server")
+    parser.add_argument("--mongo-uri", default=os.getenv('BENCHMARK_MONGODB_URI', 'mongodb://localhost:27017/'),
+                        help="MongoDB used for the throwaway benchmark database")
+    parser.add_argument("--fixtures", help="Directory of recorded responses (synthetic data is used if omitted)")
+    parser.add_argument("--companies", type=int, default=50, help="Number of synthetic companies")
+    parser.add_argument("--days", type=int, default=500, help="Trading days of synthetic history")
+    parser.add_argument("--backfill-days", type=int, default=None,
+                        help="Only the newest N trading days are new (default: full history)")
+    parser.add_argument("--latency-ms", type=float, default=0, help="Mean added latency per request")
+    parser.add_argument("--jitter-ms", type=float, default=0, help="Uniform latency jitter per request")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered with HTTP 500")
+    parser.add_argument("--page-size", type=int, default=50, help="Maximum rows returned per DataTables page")
+    parser.add_argument("--scripts", default="indices,stocks", help="Comma-separated scripts to run: indices,stocks")
+    parser.add_argument("--log", help="Write script output to this file instead of discarding it")
+    parser.add_argument("--json", help="Write results as JSON to this file")
+    parser.add_argument("--keep-db", action="store_true", help="Do not drop the benchmark database afterwards")
+    args = parser.parse_args()
+
+    if args.fixtures:
+        data = ReplayData.from_fixtures(args.fixtures)
+    else:
+        data = ReplayData.synthetic(args.companies, args.days)
+
+    server = ReplayServer(
+        data,
+        latency_ms=args.latency_ms, jitter_ms=args.jitter_ms,
+        error_rate=args.error_rate, page_size=args.page_size
+    ).start()
+    print(f"Replay server running on {server.url}")
+
+    database_name = f"bench_ingest_{uuid.uuid4().hex[:8]}"
+    client = MongoClient(args.mongo_uri)
+    db = client[database_name]
+    print(f"Using throwaway database {database_name}")
+
+    env = os.environ.copy()
+    env.update({
+        'MONGODB_URI_ADMIN': args.mongo_uri,
+        'DATABASE_NAME': database_name,
+        'NEPSE_STOCKS': STOCKS_COLLECTION,
+        'NEPSE_INDICES': INDICES_COLLECTION,
+        'SHARESANSAR_URL': server.url
+    })
+
+    scripts = {
+        'indices': ('fetch_new_indices_data.py', db[INDICES_COLLECTION]),
+        'stocks': ('fetch_new_stock_data.py', db[STOCKS_COLLECTION])
+    }
+
+    results = []
+    log_file = open(args.log, 'w') if args.log else None
+    try:
+        seed_database(db, data, args.backfill_days)
+        for name in [s.strip() for s in args.scripts.split(',') if s.strip()]:
+            script_name, collection = scripts[name]
+            print(f"Running {script_name}...")
+            results.append(run_script(script_name, env, server, collection, log_file))
+    finally:
+        if log_file:
+            log_file.close()
+        server.stop()
+        if not args.keep_db:
+            client.drop_database(database_name)
+        client.close()
+
+    print_results(results)
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({
+                "timestamp": datetime.datetime.now().isoformat(),
+                "config": vars(args),
+                "results": results
+            }, f, indent=4)
+        print(f"Saved results to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
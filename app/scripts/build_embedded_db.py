@@ -0,0 +1,128 @@
+import argparse
+import os
+import sys
+import time
+from dotenv import load_dotenv
+
+# Allow running as a standalone script as well as importing from the app package
+if __package__ in (None, ''):
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from app.market import MarketMatrix
+from app.sectors import SOURCE_FIELDS, compute_sector_series
+from app.stats import compute_company_stats
+from app.turnover import TURNOVER_INDEX, compute_turnover_series
+from app.storage.sqlite import SQLiteStore
+from app.scripts.replay_server import ReplayData
+from app.scripts.row_parser import RowValidationError, parse_index_row, parse_stock_row
+
+# Load environment variables from .env file
+load_dotenv()
+
+# Rows written per SQLite transaction
+BATCH_SIZE = 5000
+
+
+# Write documents to the store in batches
+def write_batches(write, documents):
+    total = 0
+    batch = []
+    for document in documents:
+        batch.append(document)
+        if len(batch) >= BATCH_SIZE:
+            total += write(batch)
+            batch = []
+    if batch:
+        total += write(batch)
+    return total
+
+
+# Copy companies, stocks and indices from MongoDB (read-only connection is enough)
+def load_from_mongo(store):
+    from pymongo import MongoClient
+    client = MongoClient(os.getenv('MONGODB_URI_ADMIN') or os.getenv('MONGODB_URI') or 'mongodb://localhost:27017/')
+    db = client[os.getenv('DATABASE_NAME', 'heisenstocks')]
+
+    # Legacy documents may still carry string numbers and dates
+    def clean(documents, kind):
+        for document in documents:
+            try:
+                if kind == 'stock':
+                    yield parse_stock_row(document, document.get('company_id'), document.get('company_symbol'))
+                else:
+                    yield parse_index_row(document, document.get('index_name'))
+            except RowValidationError as e:
+                print(f"Skipping {kind} row {document.get('_id')}: {e}")
+
+    try:
+        companies = store.write_companies(db[os.getenv('COMPANIES_COLLECTION', 'companies')].find({}, {'_id': 0}))
+        stocks = write_batches(store.write_stocks, clean(db[os.getenv('NEPSE_STOCKS', 'nepse-stocks')].find({}, {'_id': 0}), 'stock'))
+        indices = write_batches(store.write_indices, clean(db[os.getenv('NEPSE_INDICES', 'nepse-indices')].find({}, {'_id': 0}), 'index'))
+    finally:
+        client.close()
+    return companies, stocks, indices
+
+
+# Load recorded (fixtures_dir) or generated sharesansar data
+def load_from_replay_data(store, data):
+    from app.scripts.fetch_new_indices_data import index_mapping
+
+    symbols = {company['company_id']: company['symbol'] for company in data.companies}
+    companies = store.write_companies(data.companies)
+    stocks = write_batches(store.write_stocks, (
+        parse_stock_row(row, company_id, symbols.get(company_id))
+        for company_id, rows in data.company_rows.items()
+        for row in rows
+    ))
+    indices = write_batches(store.write_indices, (
+        parse_index_row({**row, 'index_id': index_id}, index_mapping.get(str(index_id), f"Unknown Index ({index_id})"))
+        for index_id, rows in data.index_rows.items()
+        for row in rows
+    ))
+    return companies, stocks, indices
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the embedded SQLite database used with STORAGE_BACKEND=sqlite")
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument("--synthetic", action="store_true", help="Generate synthetic data instead of copying MongoDB")
+    source.add_argument("--fixtures", help="Load recorded sharesansar responses from this directory")
+    parser.add_argument("--output", help="SQLite file to write (default: SQLITE_PATH or app/data/heisenstocks.sqlite3)")
+    parser.add_argument("--companies", type=int, default=50, help="Synthetic companies")
+    parser.add_argument("--days", type=int, default=500, help="Synthetic trading days")
+    parser.add_argument("--seed", type=int, default=42, help="Synthetic data seed")
+    parser.add_argument("--replace", action="store_true", help="Delete the output file first")
+    args = parser.parse_args()
+
+    store = SQLiteStore(args.output, read_only=False)
+    if args.replace and os.path.exists(store.path):
+        os.remove(store.path)
+
+    start = time.time()
+    if args.synthetic:
+        print(f"Generating {args.companies} companies x {args.days} trading days")
+        counts = load_from_replay_data(store, ReplayData.synthetic(args.companies, args.days, args.seed))
+    elif args.fixtures:
+        print(f"Loading fixtures from {args.fixtures}")
+        counts = load_from_replay_data(store, ReplayData.from_fixtures(args.fixtures))
+    else:
+        print("Copying data from MongoDB")
+        counts = load_from_mongo(store)
+
+    # Sector series from the stocks just written
+    sectors = write_batches(store.write_sectors, compute_sector_series(
+        store.companies(fields=('company_id', 'sector')), store.stream_quotes(fields=SOURCE_FIELDS)
+    ))
+    stats = store.write_company_stats(compute_company_stats(MarketMatrix().load(store)))
+    turnover = store.write_turnover(compute_turnover_series(
+        store.stock_day_totals(), store.stream_index_rows([TURNOVER_INDEX], fields=('published_date', 'turnover'))
+    ))
+
+    store.connection().execute('ANALYZE')
+    store.close()
+    print(f"Wrote {counts[0]} companies, {counts[1]} stock rows, {counts[2]} index rows, {sectors} sector rows, "
+          f"{turnover} turnover days and statistics for {stats} companies to {store.path} in {time.time() - start:.1f} seconds")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+import argparse
+import os
+import sys
+import time
+from dotenv import load_dotenv
+
+# Allow running as a standalone script as well as importing from the app package
+if __package__ in (None, ''):
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from app.snapshots import build_snapshot, snapshot_dir
+
+# Load environment variables from .env file
+load_dotenv()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write the bulk download snapshot (companies, nepse-stocks, nepse-indices as gzip CSV)")
+    parser.add_argument("--force", action="store_true", help="Rebuild the snapshot even if this trading day's version exists")
+    parser.add_argument("--sqlite", metavar="PATH", help="Read from an embedded SQLite database instead of MongoDB")
+    parser.add_argument("--output", help="Snapshot directory (default: SNAPSHOT_DIR or app/data/snapshots)")
+    args = parser.parse_args()
+
+    client = None
+    if args.sqlite:
+        from app.storage.sqlite import SQLiteStore
+        storage = SQLiteStore(args.sqlite)
+    else:
+        from pymongo import MongoClient
+        from app.storage.mongo import MongoStore
+        client = MongoClient(os.getenv('MONGODB_URI') or 'mongodb://localhost:27017/')
+        storage = MongoStore(client[os.getenv('DATABASE_NAME', 'heisenstocks')])
+
+    start = time.time()
+    try:
+        manifest = build_snapshot(storage, args.output, force=args.force)
+    finally:
+        if client is not None:
+            client.close()
+
+    if manifest is None:
+        print("No stock data to snapshot")
+        return
+    for filename, info in manifest['files'].items():
+        print(f"{filename}: {info['rows']} rows, {info['bytes'] / 1e6:.1f} MB")
+    print(f"Snapshot {manifest['version']} in {args.output or snapshot_dir()} ({time.time() - start:.1f} seconds)")
+
+
+if __name__ == "__main__":
+    main()
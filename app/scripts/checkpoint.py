@@ -0,0 +1,146 @@
+import datetime
+import threading
+import uuid
+from pymongo import UpdateOne
+
+
+# Checkpoint journal stored in MongoDB so an interrupted ingestion run can be resumed
+class CheckpointJournal:
+    """
+    Records per-company and per-page progress of an ingestion run.
+
+    One run document (``_id`` = job name) holds the run status and the company
+    list discovered at the start of the run, and one document per company holds
+    the paging offset reached and the oldest record already written.
+
+    With deferred=True company updates are buffered and written in one bulk
+    write by flush(), which the ingestion writer calls after each data flush.
+    """
+
+    def __init__(self, collection, job_name, deferred=False):
+        self.collection = collection
+        self.job_name = job_name
+        self.deferred = deferred
+        self.run_id = None
+        self.companies = None
+        self._states = {}
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def _company_key(self, company_id):
+        return f"{self.job_name}:{company_id}"
+
+    def begin(self, resume=False):
+        """Start a new run, or pick up the last unfinished run when resume is True"""
+        now = datetime.datetime.now()
+
+        if resume:
+            run = self.collection.find_one({"_id": self.job_name, "status": "running"})
+            if run:
+                self.run_id = run["run_id"]
+                self.companies = run.get("companies")
+                for state in self.collection.find({"job": self.job_name, "kind": "company", "run_id": self.run_id}):
+                    self._states[state["company_id"]] = state
+                self.collection.update_one({"_id": self.job_name}, {"$set": {"updated_at": now, "resumed_at": now}})
+                print(f"Resuming run {self.run_id}: {len(self._states)} companies have saved progress")
+                return True
+            print("No unfinished run found to resume, starting a new run")
+
+        self.run_id = uuid.uuid4().hex
+        self.companies = None
+        self._states = {}
+        self.collection.delete_many({"job": self.job_name, "kind": "company"})
+        self.collection.replace_one(
+            {"_id": self.job_name},
+            {
+                "_id": self.job_name,
+                "job": self.job_name,
+                "kind": "run",
+                "run_id": self.run_id,
+                "status": "running",
+                "started_at": now,
+                "updated_at": now
+            },
+            upsert=True
+        )
+        return False
+
+    def save_companies(self, companies):
+        """Persist the company list so a resumed run does not need to rediscover it"""
+        self.companies = companies
+        self.collection.update_one(
+            {"_id": self.job_name},
+            {"$set": {"companies": companies, "updated_at": datetime.datetime.now()}}
+        )
+
+    def get_company(self, company_id):
+        """Return the saved state for a company in the current run, or None"""
+        with self._lock:
+            state = self._states.get(company_id)
+            return dict(state) if state else None
+
+    def _save_company(self, company_id, fields):
+        with self._lock:
+            state = self._states.setdefault(company_id, {
+                "job": self.job_name,
+                "kind": "company",
+                "run_id": self.run_id,
+                "company_id": company_id
+            })
+            state.update(fields)
+            state["updated_at"] = datetime.datetime.now()
+            update = {k: v for k, v in state.items() if k != "_id"}
+            if self.deferred:
+                self._pending[company_id] = update
+                return
+        self.collection.update_one({"_id": self._company_key(company_id)}, {"$set": update}, upsert=True)
+
+    def flush(self):
+        """Write buffered company updates in a single bulk write"""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if pending:
+            self.collection.bulk_write([
+                UpdateOne({"_id": self._company_key(company_id)}, {"$set": update}, upsert=True)
+                for company_id, update in pending.items()
+            ], ordered=False)
+
+    def start_company(self, company_id, company_symbol, start_date):
+        """Mark a company as in progress, remembering the cutoff date the run started with"""
+        with self._lock:
+            if company_id in self._states:
+                return
+        self._save_company(company_id, {
+            "symbol": company_symbol,
+            "status": "in_progress",
+            "start_date": start_date,
+            "next_start": 0,
+            "total_records": None,
+            "oldest_date": None,
+            "inserted": 0
+        })
+
+    def record_page(self, company_id, next_start, total_records, oldest_date, inserted):
+        """Record that a page has been written and where the next page starts"""
+        with self._lock:
+            previously_inserted = self._states.get(company_id, {}).get("inserted", 0)
+        fields = {
+            "next_start": next_start,
+            "total_records": total_records,
+            "inserted": previously_inserted + inserted
+        }
+        if oldest_date is not None:
+            fields["oldest_date"] = oldest_date
+        self._save_company(company_id, fields)
+
+    def finish_company(self, company_id, status):
+        """Mark a company as finished ('done' or 'error')"""
+        self._save_company(company_id, {"status": status})
+
+    def finish(self, summary=None):
+        """Mark the whole run as complete"""
+        self.flush()
+        fields = {"status": "complete", "finished_at": datetime.datetime.now()}
+        if summary:
+            fields["summary"] = summary
+        self.collection.update_one({"_id": self.job_name}, {"$set": fields})
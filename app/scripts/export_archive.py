@@ -0,0 +1,38 @@
+import argparse
+import os
+import sys
+import time
+from pymongo import MongoClient
+from dotenv import load_dotenv
+
+# Allow running as a standalone script as well as importing from the app package
+if __package__ in (None, ''):
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from app.storage.archive import HistoryArchive, export_archive
+
+# Load environment variables from .env file
+load_dotenv()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export nepse-stocks and nepse-indices to the columnar history archive")
+    parser.add_argument("--full", action="store_true", help="Rebuild the archive instead of appending rows newer than it")
+    parser.add_argument("--archive-dir", help="Archive directory (default: ARCHIVE_DIR or app/data/archive)")
+    args = parser.parse_args()
+
+    client = MongoClient(os.getenv('MONGODB_URI_ADMIN') or os.getenv('MONGODB_URI') or 'mongodb://localhost:27017/')
+    archive = HistoryArchive(args.archive_dir)
+    start = time.time()
+    try:
+        counts = export_archive(client[os.getenv('DATABASE_NAME', 'heisenstocks')], archive, full=args.full)
+    finally:
+        client.close()
+
+    print(f"Archived {counts['stocks']} stock rows and {counts['indices']} index rows to {archive.path} "
+          f"in {time.time() - start:.1f} seconds")
+    print(f"Stocks through {archive.manifest['stocks_through']}, indices through {archive.manifest['indices_through']}")
+
+
+if __name__ == "__main__":
+    main()
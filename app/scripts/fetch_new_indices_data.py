@@ -1,18 +1,31 @@
+import argparse
 import asyncio
 import aiohttp
 import json
 import os
 import sys
+import time
 import warnings
 import datetime
 from pymongo import MongoClient, UpdateOne
 from dotenv import load_dotenv
 
+# Allow running as a standalone script as well as importing from the app package
+if __package__ in (None, ''):
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from app.scripts.metrics import IngestMetrics, finish_run_metrics
+from app.scripts.progress import ProgressReporter, reserve_stdout_for_progress
+from app.scripts.row_parser import RowValidationError, parse_date, parse_index_row, quarantine_document, quarantine_rows
+
 # Load environment variables from .env file
 load_dotenv()
 
+# Base URL of the upstream site (can point at a local replay server for benchmarks)
+base_url = os.getenv('SHARESANSAR_URL', 'https://www.sharesansar.com').rstrip('/')
+
 # URL for fetching index data
-url = "https://www.sharesansar.com/index-history-data"
+url = f"{base_url}/index-history-data"
 
 # Mapping between index_id and index_name
 index_mapping = {
@@ -39,7 +52,7 @@ headers = {
     "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64)",
     "X-Requested-With": "XMLHttpRequest",
     "Accept": "application/json, text/javascript, */*; q=0.01",
-    "Referer": "https://www.sharesansar.com/index-history"
+    "Referer": f"{base_url}/index-history"
 }
 
 # MongoDB connection setup
@@ -81,10 +94,50 @@ def get_latest_date_for_index(collection, index_id):
     
     return None
 
+# Retries for a page request that fails with a connection error, 429 or 5xx
+max_retries = int(os.getenv('INGEST_MAX_RETRIES', '2'))
+
+# Fetch one page of index history, recording latency, bytes and retries in the run metrics
+async def get_index_page(session, params, metrics=None):
+    for attempt in range(max_retries + 1):
+        last_attempt = attempt == max_retries
+        start = time.perf_counter()
+        try:
+            async with session.get(url, headers=headers, params=params) as response:
+                body = await response.read()
+                status = response.status
+        except aiohttp.ClientError:
+            if last_attempt:
+                raise
+        else:
+            if metrics is not None:
+                metrics.observe_request(url, time.perf_counter() - start, len(body), status)
+            if (status != 429 and status < 500) or last_attempt:
+                return json.loads(body)
+        if metrics is not None:
+            metrics.observe_retry(url)
+        await asyncio.sleep(0.5 * 2 ** attempt)
+
+# Convert raw index rows to typed documents, collecting malformed rows for quarantine
+def parse_index_rows(rows, rejected_rows):
+    documents = []
+    for row in rows:
+        index_name = index_mapping.get(str(row.get("index_id")), f"Unknown Index ({row.get('index_id')})")
+        try:
+            documents.append(parse_index_row(row, index_name))
+        except RowValidationError as e:
+            rejected_rows.append(quarantine_document('index', row, e, index_name=index_name))
+    return documents
+
 # Fetch new index data and directly insert into MongoDB
-async def fetch_and_insert_new_index_data(index_id, collection, latest_date=None):
+async def fetch_and_insert_new_index_data(index_id, collection, latest_date=None, metrics=None):
     # Reset all_data for each index
     all_data = []
+    rejected_rows = []
+    
+    # Compare dates as datetimes even if older documents stored them as strings
+    if latest_date:
+        latest_date = parse_date(latest_date)
     
     # Get today's date and yesterday's date
     today = datetime.datetime.now().strftime("%Y-%m-%d")
@@ -110,43 +163,41 @@ async def fetch_and_insert_new_index_data(index_id, collection, latest_date=None
         
         # Check if there's any new data in the current week
         print("Checking for most recent data...")
-        async with session.get(url, headers=headers, params=recent_params) as response:
-            data = await response.json()
-            total_recent = int(data.get("recordsTotal", 0))
-            print(f"Found {total_recent} recent records for {index_mapping[index_id]}")
-            
-            if total_recent > 0:
-                rows = data.get("data", [])
-                print("Recent data found! Sample of the newest records:")
-                for i, record in enumerate(rows[:5]):
-                    print(f"Record {i+1}: {record['published_date']}")
-                
-                # Check if any records are newer than what we have in DB
-                new_data_found = False
-                new_rows = []
-                
-                for row in rows:
-                    row_date = row["published_date"]
-                    # Compare with latest date in DB
-                    if not latest_date or row_date > latest_date:
-                        print(f"New data found: {row_date} > latest_date: {latest_date if latest_date else 'None'}")
-                        new_data_found = True
-                        row["index_name"] = index_mapping.get(str(row["index_id"]), f"Unknown Index ({row['index_id']})")
-                        new_rows.append(row)
-                
-                if new_data_found:
-                    print(f"Found {len(new_rows)} new records newer than {latest_date}")
-                    all_data.extend(new_rows)
-                else:
-                    print("No new data found that's newer than what's in the database.")
+        data = await get_index_page(session, recent_params, metrics)
+        total_recent = int(data.get("recordsTotal", 0))
+        print(f"Found {total_recent} recent records for {index_mapping[index_id]}")
+        
+        if total_recent > 0:
+            rows = data.get("data", [])
+            print("Recent data found! Sample of the newest records:")
+            for i, record in enumerate(rows[:5]):
+                print(f"Record {i+1}: {record['published_date']}")
+        
+            # Check if any records are newer than what we have in DB
+            new_data_found = False
+            new_rows = []
+        
+            for row in parse_index_rows(rows, rejected_rows):
+                row_date = row["published_date"]
+                # Compare with latest date in DB
+                if not latest_date or row_date > latest_date:
+                    print(f"New data found: {row_date} > latest_date: {latest_date if latest_date else 'None'}")
+                    new_data_found = True
+                    new_rows.append(row)
+        
+            if new_data_found:
+                print(f"Found {len(new_rows)} new records newer than {latest_date}")
+                all_data.extend(new_rows)
             else:
-                print("No recent data found for the last few days.")
+                print("No new data found that's newer than what's in the database.")
+        else:
+            print("No recent data found for the last few days.")
         
         # If we haven't found new data in the current week, try a broader search
         if not all_data and latest_date:
             # Calculate a date range starting from the latest date in the DB
             # We'll look for data between the latest date and today
-            from_date = latest_date
+            from_date = latest_date.strftime("%Y-%m-%d")
             
             # Now fetch any data from the latest date in DB until today
             range_params = {
@@ -159,33 +210,36 @@ async def fetch_and_insert_new_index_data(index_id, collection, latest_date=None
             }
             
             print(f"Checking for any data between {from_date} and {today}...")
-            async with session.get(url, headers=headers, params=range_params) as response:
-                data = await response.json()
-                total_range = int(data.get("recordsTotal", 0))
-                print(f"Found {total_range} records in date range for {index_mapping[index_id]}")
-                
-                if total_range > 0:
-                    rows = data.get("data", [])
-                    print("Sample of records in the range:")
-                    for i, record in enumerate(rows[:5]):
-                        print(f"Record {i+1}: {record['published_date']}")
-                    
-                    # Check for records newer than what we have
-                    for row in rows:
-                        row_date = row["published_date"]
-                        # Skip records with the same date as latest_date (they're already in our DB)
-                        if row_date > latest_date:
-                            print(f"New data found: {row_date} > latest_date: {latest_date}")
-                            row["index_name"] = index_mapping.get(str(row["index_id"]), f"Unknown Index ({row['index_id']})")
-                            all_data.append(row)
-                    
-                    if all_data:
-                        print(f"Found {len(all_data)} new records newer than {latest_date}")
-                    else:
-                        print("No new data found in the date range search.")
+            data = await get_index_page(session, range_params, metrics)
+            total_range = int(data.get("recordsTotal", 0))
+            print(f"Found {total_range} records in date range for {index_mapping[index_id]}")
+            
+            if total_range > 0:
+                rows = data.get("data", [])
+                print("Sample of records in the range:")
+                for i, record in enumerate(rows[:5]):
+                    print(f"Record {i+1}: {record['published_date']}")
+            
+                # Check for records newer than what we have
+                for row in parse_index_rows(rows, rejected_rows):
+                    row_date = row["published_date"]
+                    # Skip records with the same date as latest_date (they're already in our DB)
+                    if row_date > latest_date:
+                        print(f"New data found: {row_date} > latest_date: {latest_date}")
+                        all_data.append(row)
+            
+                if all_data:
+                    print(f"Found {len(all_data)} new records newer than {latest_date}")
                 else:
-                    print("No data found in the specified date range.")
+                    print("No new data found in the date range search.")
+            else:
+                print("No data found in the specified date range.")
 
+    # Keep malformed rows for inspection instead of inserting them
+    if rejected_rows:
+        quarantine_rows(collection.database[os.getenv('INGEST_QUARANTINE', 'ingest_quarantine')], rejected_rows)
+        print(f"Quarantined {len(rejected_rows)} malformed records for {index_mapping[index_id]}")
+    
     # Insert new data into MongoDB
     if all_data:
         # Prepare bulk operations for MongoDB
@@ -211,7 +265,10 @@ async def fetch_and_insert_new_index_data(index_id, collection, latest_date=None
         # Execute the bulk write if there are operations
         if operations:
             try:
+                write_start = time.perf_counter()
                 result = collection.bulk_write(operations)
+                if metrics is not None:
+                    metrics.observe_write(time.perf_counter() - write_start, len(operations))
                 updated = result.modified_count
                 inserted = result.upserted_count
                 print(f"Successfully inserted {inserted} new records and updated {updated} existing records in MongoDB")
@@ -223,15 +280,84 @@ async def fetch_and_insert_new_index_data(index_id, collection, latest_date=None
         print(f"No new data was fetched for {index_mapping[index_id]}.")
         return 0
 
-async def download_new_index_data():
+# Upsert typed index documents keyed on (index_id, published_date)
+def upsert_index_documents(collection, documents, metrics=None):
+    operations = [
+        UpdateOne(
+            {"index_id": document["index_id"], "published_date": document["published_date"]},
+            {"$set": document},
+            upsert=True
+        )
+        for document in documents
+    ]
+    if not operations:
+        return 0
+    start = time.perf_counter()
+    collection.bulk_write(operations, ordered=False)
+    if metrics is not None:
+        metrics.observe_write(time.perf_counter() - start, len(operations))
+    return len(operations)
+
+# Fetch every page of an index's history between two dates and upsert it (used for backfills)
+async def fetch_index_range(index_id, collection, start_date, end_date, page_size=500, metrics=None):
+    rejected_rows = []
+    written = 0
+    pages = 0
+    start = 0
+    total_records = None
+    from_date = parse_date(start_date).strftime("%Y-%m-%d")
+    to_date = parse_date(end_date).strftime("%Y-%m-%d")
+    
+    print(f"Backfilling {index_mapping[index_id]} from {from_date} to {to_date}")
+    async with aiohttp.ClientSession() as session:
+        while total_records is None or start < total_records:
+            params = {
+                "draw": "1",
+                "index_id": index_id,
+                "from": from_date,
+                "to": to_date,
+                "length": str(page_size),
+                "start": str(start)
+            }
+            data = await get_index_page(session, params, metrics)
+            pages += 1
+            
+            if total_records is None:
+                total_records = int(data.get("recordsTotal", 0))
+                print(f"Found {total_records} records in date range for {index_mapping[index_id]}")
+            
+            rows = data.get("data", [])
+            if not rows:
+                break
+            written += upsert_index_documents(collection, parse_index_rows(rows, rejected_rows), metrics)
+            start += len(rows)
+    
+    if rejected_rows:
+        quarantine_rows(collection.database[os.getenv('INGEST_QUARANTINE', 'ingest_quarantine')], rejected_rows)
+        print(f"Quarantined {len(rejected_rows)} malformed records for {index_mapping[index_id]}")
+    
+    if metrics is not None:
+        metrics.observe_pages(pages)
+    print(f"Upserted {written} records for {index_mapping[index_id]}")
+    return written
+
+async def download_new_index_data(job=None, start_date=None, end_date=None, progress_stream=None):
     """
     Download new data for all indices in the index_mapping dictionary.
-    Only fetches data newer than what's already in the database.
-    Now directly inserts new data into MongoDB.
+    Only fetches data newer than what's already in the database, unless
+    start_date/end_date are given, in which case that range is backfilled.
+    Progress events go to the job and/or progress_stream; a job's
+    cancellation is checked between indices.
     """
     print(f"Starting fetch and insert of new data for all {len(index_mapping)} indices...")
     print(f"Today's date: {datetime.datetime.now().strftime('%Y-%m-%d')}")
     
+    # A range given with only one end covers that single day
+    backfill = bool(start_date or end_date)
+    if backfill:
+        start_date = start_date or end_date
+        end_date = end_date or start_date
+    
     # Connect to MongoDB
     collection = connect_to_mongodb()
     print(f"Connected to MongoDB collection: {os.getenv('NEPSE_INDICES')}")
@@ -244,25 +370,35 @@ async def download_new_index_data():
     
     # Process each index sequentially
     total_indices = len(index_mapping)
+    progress = ProgressReporter('indices', stream=progress_stream, job=job)
+    metrics = IngestMetrics('indices-backfill' if backfill else 'indices')
+    progress.start(total_indices, f"Updating {total_indices} indices")
     for i, (index_id, index_name) in enumerate(index_mapping.items()):
+        if job is not None and job.cancelled:
+            print("Cancellation requested, stopping index update")
+            break
+        
         print(f"\n{'='*80}")
         print(f"Processing index {index_id}: {index_name}")
         print(f"{'='*80}")
-        print(f"PROGRESS: {int((i/total_indices)*100)}")
         
         try:
             # Get the latest date we have for this index
-            latest_date = get_latest_date_for_index(collection, index_id)
+            latest_date = None if backfill else get_latest_date_for_index(collection, index_id)
             
-            if latest_date:
+            if backfill:
+                record_count = await fetch_index_range(index_id, collection, start_date, end_date, metrics=metrics)
+            elif latest_date:
                 print(f"Latest data available for index {index_name}: {latest_date}")
                 
                 # Fetch only newer data for this index and insert directly to MongoDB
-                record_count = await fetch_and_insert_new_index_data(index_id, collection, latest_date)
+                record_count = await fetch_and_insert_new_index_data(index_id, collection, latest_date, metrics)
             else:
                 print(f"No existing data found for index {index_name}. Will fetch all data.")
                 # Fetch all data for this index and insert directly to MongoDB
-                record_count = await fetch_and_insert_new_index_data(index_id, collection)
+                record_count = await fetch_and_insert_new_index_data(index_id, collection, metrics=metrics)
+            
+            metrics.add_rows(record_count)
             
             # Update results
             if record_count > 0:
@@ -288,7 +424,19 @@ async def download_new_index_data():
             }
             indices_with_errors += 1
         
-        print(f"PROGRESS: {int(((i+1)/total_indices)*100)}")
+        progress.advance(
+            done=1,
+            rows=results[index_name].get("records", 0),
+            errors=1 if results[index_name]["status"] == "failed" else 0,
+            item=index_name
+        )
+    
+    finish_run_metrics(metrics, collection.database, {
+        "indices_with_new_data": indices_with_new_data,
+        "indices_without_new_data": indices_without_new_data,
+        "indices_with_errors": indices_with_errors
+    })
+    collection.database.client.close()
     
     # Print summary
     print("\n\nFetch and Insert Summary:")
@@ -306,9 +454,24 @@ async def download_new_index_data():
     print(f"Indices with no new data: {indices_without_new_data}")
     print(f"Indices with errors: {indices_with_errors}")
     print(f"Total indices processed: {len(index_mapping)}")
+    
+    summary = {
+        "indices_with_new_data": indices_with_new_data,
+        "indices_without_new_data": indices_without_new_data,
+        "indices_with_errors": indices_with_errors
+    }
+    progress.complete(**summary)
+    return {**summary, "results": results}
 
 # Run the asyncio event loop
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fetch new NEPSE index history into MongoDB")
+    parser.add_argument("--start-date", help="Backfill from this date (YYYY-MM-DD) instead of fetching only new data")
+    parser.add_argument("--end-date", help="Last date of the backfill range (YYYY-MM-DD)")
+    parser.add_argument("--progress-json", action="store_true", help="Write JSON-lines progress events to stdout and log output to stderr")
+    args = parser.parse_args()
+    progress_stream = reserve_stdout_for_progress() if args.progress_json else None
+    
     # Get today's date as a string (for logging)
     today = datetime.datetime.now().strftime("%Y-%m-%d")
     print(f"Starting update for NEPSE indices data on {today}")
@@ -327,7 +490,7 @@ if __name__ == "__main__":
         asyncio.set_event_loop(loop)
         
         # Run the main coroutine to download all indices
-        loop.run_until_complete(download_new_index_data())
+        loop.run_until_complete(download_new_index_data(start_date=args.start_date, end_date=args.end_date, progress_stream=progress_stream))
         
         # Clean up properly
         pending = asyncio.all_tasks(loop)
@@ -341,4 +504,5 @@ if __name__ == "__main__":
         # Close the loop properly
         loop.close()
     except Exception as e:
-        print(f"Error: {e}")
\ No newline at end of file
+        print(f"Error: {e}")
+        sys.exit(1)
\ No newline at end of file
@@ -1,16 +1,34 @@
 import requests
 import json
 import os
+import sys
+import argparse
 import datetime
 import concurrent.futures
 import time
 from urllib.parse import unquote
-from pymongo import MongoClient
+from pymongo import MongoClient, InsertOne, UpdateOne
 from dotenv import load_dotenv
 
+# Allow running as a standalone script as well as importing from the app package
+if __package__ in (None, ''):
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from app.scripts.checkpoint import CheckpointJournal
+from app.scripts.metrics import IngestMetrics, finish_run_metrics
+from app.scripts.pipeline import BulkWriter, Stage
+from app.scripts.progress import ProgressReporter, reserve_stdout_for_progress
+from app.scripts.row_parser import RowValidationError, parse_date, parse_stock_row, quarantine_document, quarantine_rows
+
 # Load environment variables from .env file
 load_dotenv()
 
+# Base URL of the upstream site (can point at a local replay server for benchmarks)
+base_url = os.getenv('SHARESANSAR_URL', 'https://www.sharesansar.com').rstrip('/')
+
+# Retries for a page request that fails with a connection error, 429 or 5xx
+max_retries = int(os.getenv('INGEST_MAX_RETRIES', '2'))
+
 # MongoDB connection setup
 def connect_to_mongodb():
     mongo_uri = os.getenv('MONGODB_URI_ADMIN')
@@ -25,6 +43,18 @@ def connect_to_mongodb():
     
     return collection, client
 
+# Checkpoint journal collection used to resume interrupted runs
+def get_checkpoint_journal(client, job_name='stocks'):
+    database_name = os.getenv('DATABASE_NAME')
+    checkpoints_collection = os.getenv('INGEST_CHECKPOINTS', 'ingest_checkpoints')
+    # Company progress is written in bulk after each data flush by the writer stage
+    return CheckpointJournal(client[database_name][checkpoints_collection], job_name, deferred=True)
+
+# Collection that receives rows rejected by the row parser
+def get_quarantine_collection(client):
+    database_name = os.getenv('DATABASE_NAME')
+    return client[database_name][os.getenv('INGEST_QUARANTINE', 'ingest_quarantine')]
+
 # Function to get the latest date for a company in the database
 def get_latest_date_for_company(collection, company_id):
     try:
@@ -45,17 +75,57 @@ def get_latest_date_for_company(collection, company_id):
     
     return None
 
-# Function to fetch company price history data and insert into MongoDB
-def fetch_new_company_data(company_id, company_symbol, start_date=None, stocks_collection=None):
+# Function to POST with retries and exponential backoff, counting retries in the run metrics
+def post_with_retries(session, url, metrics=None, **kwargs):
+    for attempt in range(max_retries + 1):
+        last_attempt = attempt == max_retries
+        try:
+            response = session.post(url, **kwargs)
+            if (response.status_code != 429 and response.status_code < 500) or last_attempt:
+                return response
+        except requests.RequestException:
+            if last_attempt:
+                raise
+        if metrics is not None:
+            metrics.observe_retry(url)
+        time.sleep(0.5 * 2 ** attempt)
+
+# Function to fetch company price history pages and hand them to the parser stage
+def fetch_company_pages(company_info, journal, emit, job=None, metrics=None):
+    """
+    Fetcher stage: pages through one company's price history and emits each
+    raw page. Only the dates are inspected here, to decide when to stop paging;
+    parsing and writing happen in the parser and writer stages.
+    
+    Records newer than company_info["end_date"] (set for backfills) are skipped.
+    """
+    company_id = company_info["id"]
+    company_symbol = company_info["symbol"]
+    start_date = company_info["latest_date"]
+    end_date = company_info.get("end_date")
+    
+    # Companies still queued when a job is cancelled are left for a resumed run
+    if job is not None and job.cancelled:
+        return
+    
+    print(f"\nProcessing company: {company_symbol}, ID: {company_id}")
+    if start_date:
+        print(f"Latest data available for {company_symbol}: {start_date}")
+    else:
+        print(f"No existing data found for {company_symbol}. Will fetch all data.")
+    
     session = requests.Session()
     session.headers.update({
         'User-Agent': 'Mozilla/5.0',
-        'Referer': f'https://www.sharesansar.com/company/{company_symbol}'
+        'Referer': f'{base_url}/company/{company_symbol}'
     })
+    if metrics is not None:
+        session.hooks['response'].append(metrics.requests_hook)
+    pages = 0
     
     # Step 1: load the company page to get cookies
     try:
-        session.get(f'https://www.sharesansar.com/company/{company_symbol}')
+        session.get(f'{base_url}/company/{company_symbol}')
 
         # Decode XSRF-TOKEN
         xsrf_cookie = session.cookies.get('XSRF-TOKEN')
@@ -84,179 +154,317 @@ def fetch_new_company_data(company_id, company_symbol, start_date=None, stocks_c
             'X-Requested-With': 'XMLHttpRequest'
         }
 
-        # Step 3: fetch all price history data
-        all_data = []
+        # Step 3: fetch all price history data, passing each page on as it arrives
         start = 0
         length = 50
         total_records = None
         
         new_data_found = False
+        
+        # Records at or newer than this date were already written by an interrupted run
+        resume_before = None
+        
+        state = journal.get_company(company_id) if journal is not None else None
+        if state:
+            # Continue from the page and cutoff date saved by the interrupted run
+            start = state.get('next_start', 0)
+            start_date = state.get('start_date')
+            resume_before = state.get('oldest_date')
+            new_data_found = state.get('inserted', 0) > 0
+            print(f"Resuming {company_symbol} at record {start + 1} ({state.get('inserted', 0)} records already written)")
+        elif journal is not None:
+            journal.start_company(company_id, company_symbol, start_date)
 
-        # Today's date for debugging
-        today = datetime.datetime.now().strftime("%Y-%m-%d")
+        # Compare dates as datetimes even if older documents stored them as strings
+        if start_date:
+            start_date = parse_date(start_date)
+        if resume_before:
+            resume_before = parse_date(resume_before)
+        if end_date:
+            end_date = parse_date(end_date)
         
         if start_date:
             print(f"Looking for data newer than: {start_date} for {company_symbol}")
 
         while total_records is None or start < total_records:
+            # Stop between pages when the job is cancelled; the checkpoint keeps the position
+            if job is not None and job.cancelled:
+                print(f"Cancellation requested, stopping {company_symbol} at record {start + 1}")
+                emit({'type': 'end', 'company_id': company_id, 'company_symbol': company_symbol, 'status': 'cancelled'})
+                return
+            
             # Update start position in payload
             payload['start'] = str(start)
             
             # Make the request
-            response = session.post('https://www.sharesansar.com/company-price-history', params=payload, headers=headers)
+            response = post_with_retries(session, f'{base_url}/company-price-history', metrics, params=payload, headers=headers)
             page_data = response.json()
+            pages += 1
             
             # Get total records count (first time only)
             if total_records is None:
                 total_records = page_data['recordsTotal']
                 print(f"Company {company_symbol} (ID: {company_id}): Total records available: {total_records}")
             
-            # Process the data and check if it's newer than what we already have
-            current_page_data = []
+            # Check which records are newer than what we already have
+            new_count = 0
             filtered_count = 0
+            resumed_count = 0
             
             for record in page_data['data']:
+                try:
+                    record_date = parse_date(record.get('published_date'))
+                except RowValidationError:
+                    # Left for the parser stage to quarantine
+                    continue
+                
+                # Backfills page past records newer than the requested range
+                if end_date and record_date > end_date:
+                    continue
+                
                 # If we have a start date and this record is older or equal, skip it
-                if start_date and record['published_date'] <= start_date:
+                if start_date and record_date <= start_date:
                     filtered_count += 1
                     continue
                 
                 new_data_found = True
-                record['company_id'] = company_id
-                record['company_symbol'] = company_symbol
-                current_page_data.append(record)
+                
+                # Skip records the interrupted run already wrote
+                if resume_before and record_date >= resume_before:
+                    resumed_count += 1
+                    continue
+                
+                new_count += 1
             
             # Report filtering
             if filtered_count > 0:
                 print(f"Filtered out {filtered_count} records that are not newer than {start_date} for {company_symbol}")
             
-            # Add new data to our collection
-            all_data.extend(current_page_data)
-            
             # Move to next page
             start += length
             print(f"Company {company_symbol}: Processed records {start-length+1} to {min(start, total_records)} of {total_records}")
             
+            emit({
+                'type': 'page',
+                'company_id': company_id,
+                'company_symbol': company_symbol,
+                'records': page_data['data'],
+                'start_date': start_date,
+                'resume_before': resume_before,
+                'end_date': end_date,
+                'next_start': start,
+                'total_records': total_records
+            })
+            
             # If we got less new data than requested and filtered some out, we might have reached existing data
-            if len(current_page_data) < length and filtered_count > 0:
+            if new_count < length and filtered_count > 0:
                 print(f"Found fewer new records than expected for {company_symbol}, likely reached existing data.")
                 break
             
             # If we found no new data in this batch, and we've already found some new data before,
             # we can stop as we've likely reached older data than what we're interested in
-            if len(current_page_data) == 0 and new_data_found:
+            if new_count == 0 and new_data_found and resumed_count == 0:
                 print(f"No new data in this batch for {company_symbol}, stopping as we've reached existing data.")
                 break
 
-        print(f"Company {company_symbol}: Total new records fetched: {len(all_data)}")
-
-        # Insert new data into MongoDB
-        if all_data and stocks_collection is not None:  # Fixed condition check
-            try:
-                # Insert many records at once for better performance
-                result = stocks_collection.insert_many(all_data, ordered=False)
-                print(f"Successfully inserted {len(result.inserted_ids)} records for {company_symbol} into database")
-                return len(result.inserted_ids), True
-            except Exception as e:
-                print(f"Error inserting data for {company_symbol}: {e}")
-                return 0, False
-        elif not all_data:
-            print(f"No new data to insert for {company_symbol}")
-            return 0, True  # No data, but technically successful (no error)
-        else:
-            print(f"Cannot insert data: MongoDB collection not provided for {company_symbol}")
-            return 0, False
+        emit({'type': 'end', 'company_id': company_id, 'company_symbol': company_symbol, 'status': 'done'})
             
     except Exception as e:
         print(f"Error processing company {company_symbol}: {e}")
-        return 0, False
+        emit({'type': 'end', 'company_id': company_id, 'company_symbol': company_symbol, 'status': 'error'})
+    
+    finally:
+        if metrics is not None:
+            metrics.observe_pages(pages)
 
-# Function to process a batch of companies with one worker
-def process_company_batch(company_batch, stocks_collection):
-    result = {
-        "companies_updated": 0,
-        "companies_no_updates": 0,
-        "companies_with_errors": 0,
-        "total_records_processed": 0
-    }
+# Parser stage and writer callbacks shared by one ingestion run
+class StockIngestRun:
+    """
+    Parses raw pages into typed documents, queues them on the bulk writer and
+    keeps per-company results. Checkpoints only advance once a page's
+    documents have been written, and once a page of a company fails its
+    later pages are not written either.
     
-    for company_info in company_batch:
-        company_id = company_info["id"]
-        company_symbol = company_info["symbol"]
-        latest_date = company_info["latest_date"]
-        
-        print(f"\nProcessing company: {company_symbol}, ID: {company_id}")
+    With upsert=True documents are upserted on (company_id, published_date) so
+    backfilling a range that overlaps existing data does not duplicate rows.
+    """
+
+    def __init__(self, writer, journal=None, quarantine_collection=None, upsert=False, progress=None, metrics=None):
+        self.writer = writer
+        self.journal = journal
+        self.quarantine_collection = quarantine_collection
+        self.upsert = upsert
+        self.progress = progress
+        self.metrics = metrics
+        self.inserted = {}
+        self.failed = set()
+        self.result = {
+            "companies_updated": 0,
+            "companies_no_updates": 0,
+            "companies_with_errors": 0,
+            "total_records_processed": 0
+        }
+
+    def handle(self, item):
+        """Parser stage handler for items emitted by fetch_company_pages"""
+        company_id = item['company_id']
+        if item['type'] == 'end':
+            self.writer.submit([], lambda written, error: self._company_finished(item, error))
+            return
         
-        try:
-            if latest_date:
-                print(f"Latest data available for {company_symbol}: {latest_date}")
-                # Fetch only newer price history data and insert into MongoDB
-                records_processed, success = fetch_new_company_data(company_id, company_symbol, latest_date, stocks_collection)
-            else:
-                print(f"No existing data found for {company_symbol}. Will fetch all data.")
-                # Fetch all price history data and insert into MongoDB
-                records_processed, success = fetch_new_company_data(company_id, company_symbol, None, stocks_collection)
-            
-            # Update results
-            if success:
-                if records_processed > 0:
-                    result["companies_updated"] += 1
-                    result["total_records_processed"] += records_processed
-                else:
-                    result["companies_no_updates"] += 1
-            else:
-                result["companies_with_errors"] += 1
-                
-        except Exception as e:
-            print(f"Error processing company {company_symbol}: {str(e)}")
-            result["companies_with_errors"] += 1
-            
-    return result
+        # The checkpoint stays at a company's failed page, so --resume fetches its later pages again
+        if company_id in self.failed:
+            return
+
+        documents = []
+        rejected_rows = []
+        start_date = item['start_date']
+        resume_before = item['resume_before']
+        end_date = item['end_date']
+        for record in item['records']:
+            # Convert to typed fields; malformed rows go to quarantine instead of the database
+            try:
+                document = parse_stock_row(record, company_id, item['company_symbol'])
+            except RowValidationError as e:
+                rejected_rows.append(quarantine_document('stock', record, e, company_id=company_id, company_symbol=item['company_symbol']))
+                continue
+            if start_date and document['published_date'] <= start_date:
+                continue
+            if resume_before and document['published_date'] >= resume_before:
+                continue
+            if end_date and document['published_date'] > end_date:
+                continue
+            documents.append(document)
+
+        if rejected_rows:
+            quarantine_rows(self.quarantine_collection, rejected_rows)
+            print(f"Quarantined {len(rejected_rows)} malformed records for {item['company_symbol']}")
+
+        oldest_date = min(d['published_date'] for d in documents) if documents else None
+        if self.upsert:
+            operations = [
+                UpdateOne(
+                    {'company_id': company_id, 'published_date': document['published_date']},
+                    {'$set': document},
+                    upsert=True
+                )
+                for document in documents
+            ]
+        else:
+            operations = [InsertOne(document) for document in documents]
+        self.writer.submit(
+            operations,
+            lambda written, error: self._page_written(item, oldest_date, written, error)
+        )
+
+    def _page_written(self, item, oldest_date, written, error):
+        company_id = item['company_id']
+        self.inserted[company_id] = self.inserted.get(company_id, 0) + written
+        if self.metrics is not None:
+            self.metrics.add_rows(written)
+        if error:
+            print(f"Error inserting data for {item['company_symbol']}: {error}")
+            self.failed.add(company_id)
+        # Never move the checkpoint past a page that was not fully written
+        if self.journal is not None and company_id not in self.failed:
+            self.journal.record_page(company_id, item['next_start'], item['total_records'], oldest_date, written)
 
-def main():
+    def _company_finished(self, item, error):
+        company_id = item['company_id']
+        inserted = self.inserted.pop(company_id, 0)
+        if item['status'] == 'cancelled':
+            # Leave the company in progress so a resumed run continues it
+            return
+        status = 'error' if item['status'] == 'error' or company_id in self.failed else 'done'
+        if self.progress is not None:
+            self.progress.advance(done=1, rows=inserted, errors=1 if status == 'error' else 0, item=item['company_symbol'])
+        if self.journal is not None:
+            self.journal.finish_company(company_id, status)
+
+        if status == 'error':
+            self.result["companies_with_errors"] += 1
+        elif inserted > 0:
+            self.result["companies_updated"] += 1
+            self.result["total_records_processed"] += inserted
+            print(f"Successfully inserted {inserted} records for {item['company_symbol']} into database")
+        else:
+            self.result["companies_no_updates"] += 1
+            print(f"No new data to insert for {item['company_symbol']}")
+
+def main(resume=False, num_fetchers=8, write_batch_size=5000, queue_size=64, job=None, start_date=None, end_date=None,
+         progress_stream=None):
+    """
+    Fetch new price history for every company, or backfill start_date..end_date
+    when a range is given. Progress events go to the job and/or progress_stream;
+    a cancelled job leaves its checkpoint open for --resume.
+    """
     # Get today's date as a string (for logging)
     today = datetime.datetime.now().strftime("%Y-%m-%d")
     print(f"Starting update for NEPSE company data on {today}")
     
-    # Number of worker threads to use (adjust based on your system)
-    num_workers = 8
-    print(f"Using {num_workers} worker threads to process companies")
+    # A range given with only one end covers that single day
+    backfill = bool(start_date or end_date)
+    if backfill:
+        start_date = parse_date(start_date or end_date)
+        end_date = parse_date(end_date or start_date)
+        print(f"Backfilling company data from {start_date:%Y-%m-%d} to {end_date:%Y-%m-%d}")
+    
+    # Number of fetcher threads downloading pages concurrently
+    print(f"Using {num_fetchers} fetcher threads, a parser stage and a single writer (batch size {write_batch_size})")
     
     # Connect to MongoDB
     stocks_collection, mongo_client = connect_to_mongodb()
     print(f"Connected to MongoDB collection: {os.getenv('NEPSE_STOCKS')}")
     
+    # Start a checkpointed run, or continue the last unfinished one
+    journal = get_checkpoint_journal(mongo_client, 'stocks-backfill' if backfill else 'stocks')
+    resumed = journal.begin(resume=resume)
+    quarantine_collection = get_quarantine_collection(mongo_client)
+    progress = ProgressReporter('stocks', stream=progress_stream, job=job)
+    metrics = IngestMetrics('stocks-backfill' if backfill else 'stocks')
+    
     try:
-        # Get a unique list of companies from the stocks collection
-        unique_companies = stocks_collection.distinct("company_id", {})
-        print(f"Found {len(unique_companies)} unique company IDs in the database")
-        
         # Get company details and latest dates for all companies
         company_info_list = []
         skipped_companies = []
         
-        print("Building company list and checking latest dates...")
-        for company_id in unique_companies:
-            # Find symbol for this company_id
-            company_data = stocks_collection.find_one({"company_id": company_id}, {"company_symbol": 1})
+        if resumed and journal.companies is not None:
+            # Reuse the company list discovered by the interrupted run
+            company_info_list = journal.companies
+            unique_companies = [company["id"] for company in company_info_list]
+            print(f"Loaded {len(company_info_list)} companies from the saved checkpoint")
+        else:
+            # Get a unique list of companies from the stocks collection
+            unique_companies = stocks_collection.distinct("company_id", {})
+            print(f"Found {len(unique_companies)} unique company IDs in the database")
+            print("Building company list and checking latest dates...")
             
-            if company_data and "company_symbol" in company_data:
-                company_symbol = company_data["company_symbol"]
-                
-                # Get the latest date for this company
-                latest_date = get_latest_date_for_company(stocks_collection, company_id)
-                
-                company_info_list.append({
-                    "id": company_id,
-                    "symbol": company_symbol,
-                    "latest_date": latest_date
-                })
-            else:
-                skipped_companies.append({
-                    "id": company_id,
-                    "reason": "Missing company_symbol in database"
-                })
-                print(f"Skipping company ID {company_id}: Missing company_symbol in database")
+            for company_id in unique_companies:
+                # Find symbol for this company_id
+                company_data = stocks_collection.find_one({"company_id": company_id}, {"company_symbol": 1})
+            
+                if company_data and "company_symbol" in company_data:
+                    company_symbol = company_data["company_symbol"]
+            
+                    company_info = {"id": company_id, "symbol": company_symbol}
+                    if backfill:
+                        # Keep records from start_date up to and including end_date
+                        company_info["latest_date"] = start_date - datetime.timedelta(days=1)
+                        company_info["end_date"] = end_date
+                    else:
+                        # Get the latest date for this company
+                        company_info["latest_date"] = get_latest_date_for_company(stocks_collection, company_id)
+            
+                    company_info_list.append(company_info)
+                else:
+                    skipped_companies.append({
+                        "id": company_id,
+                        "reason": "Missing company_symbol in database"
+                    })
+                    print(f"Skipping company ID {company_id}: Missing company_symbol in database")
+            
+            # Remember the company list so a resumed run can skip discovery
+            journal.save_companies(company_info_list)
         
         print(f"Found {len(company_info_list)} companies with valid symbols")
         print(f"Skipped {len(skipped_companies)} companies due to missing information")
@@ -274,50 +482,49 @@ def main():
             
             print(f"Saved information about skipped companies to {skipped_file}")
         
-        # Divide companies among workers
-        companies_per_worker = len(company_info_list) // num_workers
-        if len(company_info_list) % num_workers > 0:
-            companies_per_worker += 1
+        # Companies a resumed run already finished only count towards the summary
+        pending_companies = []
+        resumed_result = {"companies_updated": 0, "companies_no_updates": 0, "total_records_processed": 0}
+        for company_info in company_info_list:
+            state = journal.get_company(company_info["id"])
+            if state and state.get("status") == "done":
+                if state.get("inserted", 0) > 0:
+                    resumed_result["companies_updated"] += 1
+                    resumed_result["total_records_processed"] += state["inserted"]
+                else:
+                    resumed_result["companies_no_updates"] += 1
+            else:
+                pending_companies.append(company_info)
         
-        company_batches = []
-        for i in range(0, len(company_info_list), companies_per_worker):
-            batch = company_info_list[i:i + companies_per_worker]
-            company_batches.append(batch)
+        if len(pending_companies) < len(company_info_list):
+            print(f"Skipping {len(company_info_list) - len(pending_companies)} companies already completed by the resumed run")
         
-        print(f"Divided companies into {len(company_batches)} batches")
+        progress.start(len(company_info_list), f"Updating {len(pending_companies)} companies")
+        progress.advance(done=len(company_info_list) - len(pending_companies), rows=resumed_result["total_records_processed"])
         
-        # Process batches in parallel using ThreadPoolExecutor
-        with concurrent.futures.ThreadPoolExecutor(max_workers=num_workers) as executor:
-            # Submit tasks
-            future_to_batch = {
-                executor.submit(process_company_batch, batch, stocks_collection): i 
-                for i, batch in enumerate(company_batches)
-            }
-            
-            # Track overall results
-            total_companies_updated = 0
-            total_companies_no_updates = 0
-            total_companies_with_errors = 0
-            total_records_processed = 0
-            
-            # Process results as they complete
-            for future in concurrent.futures.as_completed(future_to_batch):
-                batch_index = future_to_batch[future]
-                try:
-                    result = future.result()
-                    
-                    # Aggregate results
-                    total_companies_updated += result["companies_updated"]
-                    total_companies_no_updates += result["companies_no_updates"]
-                    total_companies_with_errors += result["companies_with_errors"]
-                    total_records_processed += result["total_records_processed"]
-                    
-                    print(f"Batch {batch_index+1} completed: {result['companies_updated']} updated, " 
-                          f"{result['companies_no_updates']} no updates, {result['companies_with_errors']} errors, "
-                          f"{result['total_records_processed']} records processed")
-                          
-                except Exception as e:
-                    print(f"Batch {batch_index+1} generated an exception: {e}")
+        # Fetchers -> parser -> writer, connected by bounded queues for backpressure
+        writer = BulkWriter(stocks_collection, batch_size=write_batch_size, max_queue=queue_size, after_flush=journal.flush, metrics=metrics)
+        run = StockIngestRun(writer, journal, quarantine_collection, upsert=backfill, progress=progress, metrics=metrics)
+        parser = Stage('parser', run.handle, max_queue=queue_size)
+        writer.start()
+        parser.start()
+        
+        try:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=num_fetchers) as executor:
+                futures = [executor.submit(fetch_company_pages, company_info, journal, parser.put, job, metrics) for company_info in pending_companies]
+                for future in concurrent.futures.as_completed(futures):
+                    future.result()
+        finally:
+            parser.close()
+            writer_stats = writer.close()
+        
+        print(f"Writer: {writer_stats['operations']} rows in {writer_stats['flushes']} bulk writes "
+              f"({writer_stats['write_time']:.2f}s writing, {writer_stats['errors']} errors, {writer_stats['duplicates']} already stored)")
+        
+        total_companies_updated = run.result["companies_updated"] + resumed_result["companies_updated"]
+        total_companies_no_updates = run.result["companies_no_updates"] + resumed_result["companies_no_updates"]
+        total_companies_with_errors = run.result["companies_with_errors"]
+        total_records_processed = run.result["total_records_processed"] + resumed_result["total_records_processed"]
         
         # Print final summary
         print("\n" + "="*50)
@@ -331,10 +538,43 @@ def main():
         print(f"Total companies processed: {total_companies_updated + total_companies_no_updates + total_companies_with_errors}")
         print(f"Total companies in database: {len(unique_companies)}")
         
+        summary = {
+            "companies_updated": total_companies_updated,
+            "companies_no_updates": total_companies_no_updates,
+            "companies_with_errors": total_companies_with_errors,
+            "total_records_processed": total_records_processed
+        }
+        if job is not None and job.cancelled:
+            # Keep the run open so it can be resumed
+            journal.flush()
+            print("Run cancelled; use --resume to continue from the saved checkpoint")
+            summary["cancelled"] = True
+        else:
+            journal.finish(summary)
+        finish_run_metrics(metrics, stocks_collection.database, summary)
+        progress.complete(**summary)
+        return summary
+    
+    except Exception as e:
+        progress.error(str(e))
+        raise
+        
     finally:
         # Close MongoDB connection when done
         mongo_client.close()
         print("MongoDB connection closed")
     
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Fetch new NEPSE company price history into MongoDB")
+    parser.add_argument("--resume", action="store_true", help="Continue the last interrupted run from its saved checkpoint")
+    parser.add_argument("--fetchers", type=int, default=8, help="Number of concurrent fetcher threads")
+    parser.add_argument("--write-batch-size", type=int, default=5000, help="Rows coalesced into each bulk write")
+    parser.add_argument("--queue-size", type=int, default=64, help="Bounded queue size between stages")
+    parser.add_argument("--start-date", help="Backfill from this date (YYYY-MM-DD) instead of fetching only new data")
+    parser.add_argument("--end-date", help="Last date of the backfill range (YYYY-MM-DD)")
+    parser.add_argument("--progress-json", action="store_true", help="Write JSON-lines progress events to stdout and log output to stderr")
+    args = parser.parse_args()
+    
+    progress_stream = reserve_stdout_for_progress() if args.progress_json else None
+    main(resume=args.resume, num_fetchers=args.fetchers, write_batch_size=args.write_batch_size, queue_size=args.queue_size,
+         start_date=args.start_date, end_date=args.end_date, progress_stream=progress_stream)
\ No newline at end of file
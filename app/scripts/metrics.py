@@ -0,0 +1,188 @@
+import bisect
+import datetime
+import json
+import os
+import threading
+import time
+from urllib.parse import urlsplit
+
+# Upper bounds (seconds) of the latency histogram buckets
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Upper bounds of the pages-per-company histogram buckets
+PAGE_BUCKETS = (1, 2, 5, 10, 20, 50, 100)
+
+
+class Histogram:
+    """Fixed-bucket histogram with count, sum, min, max and approximate percentiles"""
+
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.min = None
+        self.max = None
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def percentile(self, q):
+        """Upper bound of the bucket holding the q-th percentile, capped at the observed max"""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for i, bucket_count in enumerate(self.counts):
+            seen += bucket_count
+            if seen >= rank:
+                return min(self.buckets[i], self.max) if i < len(self.buckets) else self.max
+        return self.max
+
+    def to_dict(self):
+        return {
+            'count': self.count,
+            'sum': round(self.sum, 4),
+            'mean': round(self.sum / self.count, 4) if self.count else None,
+            'min': self.min,
+            'max': self.max,
+            'p50': self.percentile(0.5),
+            'p95': self.percentile(0.95),
+            'p99': self.percentile(0.99),
+            # Stored as [upper bound, count] pairs: bounds like 0.05 cannot be Mongo field names
+            'buckets': [[bound, count] for bound, count in zip(self.buckets + ('+Inf',), self.counts)]
+        }
+
+
+# Metrics collected during one ingestion run
+class IngestMetrics:
+    """
+    Thread-safe counters and histograms for one run of an ingestion script:
+    per-host request latency, bytes downloaded, retries, pages per company,
+    Mongo bulk write latency and rows written.
+
+    At the end of a run save() stores the run in the ingest_runs collection
+    and write_file() writes the same document as JSON.
+    """
+
+    def __init__(self, script):
+        self.script = script
+        self.started_at = datetime.datetime.now()
+        self._start = time.monotonic()
+        self._lock = threading.Lock()
+        self.request_latency = {}
+        self.requests = {}
+        self.bytes_downloaded = 0
+        self.retries = {}
+        self.http_errors = {}
+        self.pages_per_company = Histogram(PAGE_BUCKETS)
+        self.write_latency = Histogram(LATENCY_BUCKETS)
+        self.write_operations = 0
+        self.rows_written = 0
+
+    def observe_request(self, url, seconds, nbytes=0, status=200):
+        host = urlsplit(url).netloc or url
+        with self._lock:
+            self.request_latency.setdefault(host, Histogram(LATENCY_BUCKETS)).observe(seconds)
+            self.requests[host] = self.requests.get(host, 0) + 1
+            self.bytes_downloaded += nbytes
+            if status >= 400:
+                self.http_errors[host] = self.http_errors.get(host, 0) + 1
+
+    def observe_retry(self, url):
+        host = urlsplit(url).netloc or url
+        with self._lock:
+            self.retries[host] = self.retries.get(host, 0) + 1
+
+    def observe_pages(self, pages):
+        with self._lock:
+            self.pages_per_company.observe(pages)
+
+    def observe_write(self, seconds, operations):
+        with self._lock:
+            self.write_latency.observe(seconds)
+            self.write_operations += operations
+
+    def add_rows(self, rows):
+        with self._lock:
+            self.rows_written += rows
+
+    # Hook for requests.Session.hooks['response'] that times every response
+    def requests_hook(self, response, *args, **kwargs):
+        self.observe_request(response.url, response.elapsed.total_seconds(), len(response.content), response.status_code)
+
+    def to_dict(self, summary=None):
+        with self._lock:
+            elapsed = time.monotonic() - self._start
+            return {
+                'script': self.script,
+                'started_at': self.started_at,
+                'finished_at': datetime.datetime.now(),
+                'elapsed_s': round(elapsed, 2),
+                # Per-host figures are lists since host names contain dots
+                'hosts': [
+                    {
+                        'host': host,
+                        'requests': self.requests.get(host, 0),
+                        'retries': self.retries.get(host, 0),
+                        'http_errors': self.http_errors.get(host, 0),
+                        'latency': histogram.to_dict()
+                    }
+                    for host, histogram in self.request_latency.items()
+                ],
+                'requests': sum(self.requests.values()),
+                'bytes_downloaded': self.bytes_downloaded,
+                'retries': sum(self.retries.values()),
+                'http_errors': sum(self.http_errors.values()),
+                'pages_per_company': self.pages_per_company.to_dict(),
+                'write_latency': self.write_latency.to_dict(),
+                'write_operations': self.write_operations,
+                'rows_written': self.rows_written,
+                'rows_per_s': round(self.rows_written / elapsed, 1) if elapsed > 0 else 0.0,
+                'summary': summary or {}
+            }
+
+    def save(self, collection, summary=None):
+        """Store this run in the ingest_runs collection; failures are only logged"""
+        document = self.to_dict(summary)
+        try:
+            collection.insert_one(document)
+        except Exception as e:
+            print(f"Error saving ingestion metrics: {e}")
+        return document
+
+    def write_file(self, document, path=None):
+        """Write the run document as JSON (INGEST_METRICS_FILE or data/ingest_metrics_<script>.json)"""
+        if path is None:
+            path = os.getenv('INGEST_METRICS_FILE') or os.path.join(
+                os.path.dirname(os.path.abspath(__file__)), 'data', f"ingest_metrics_{self.script}.json"
+            )
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump({k: v for k, v in document.items() if k != '_id'}, f, indent=2, default=str)
+        except OSError as e:
+            print(f"Error writing ingestion metrics file: {e}")
+        return path
+
+    def print_summary(self, document):
+        print(f"Metrics: {document['requests']} requests, {document['bytes_downloaded'] / 1e6:.1f} MB, "
+              f"{document['retries']} retries, {document['rows_written']} rows ({document['rows_per_s']}/s)")
+        for host in document['hosts']:
+            latency = host['latency']
+            print(f"  {host['host']}: p50 {latency['p50']}s, p95 {latency['p95']}s, max {latency['max']}s")
+        if document['write_latency']['count']:
+            print(f"  mongo writes: {document['write_latency']['count']} bulk writes, p95 {document['write_latency']['p95']}s")
+
+
+# Store and export a finished run's metrics
+def finish_run_metrics(metrics, db, summary=None):
+    collection = db[os.getenv('INGEST_RUNS', 'ingest_runs')]
+    document = metrics.save(collection, summary)
+    metrics.write_file(document)
+    metrics.print_summary(document)
+    return document
@@ -0,0 +1,118 @@
+import argparse
+import os
+import sys
+import time
+from pymongo import MongoClient, UpdateOne
+from dotenv import load_dotenv
+
+# Allow running as a standalone script as well as importing from the app package
+if __package__ in (None, ''):
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from app.scripts.row_parser import (
+    INDEX_NUMERIC_FIELDS, STOCK_NUMERIC_FIELDS, RowValidationError,
+    parse_index_row, parse_stock_row, quarantine_document, quarantine_rows
+)
+
+# Load environment variables from .env file
+load_dotenv()
+
+
+# Query matching documents that still carry string numbers or string dates
+def untyped_query(numeric_fields):
+    clauses = [{'published_date': {'$type': 'string'}}, {'DT_Row_Index': {'$exists': True}}]
+    clauses.extend({field: {'$type': 'string'}} for field in numeric_fields)
+    return {'$or': clauses}
+
+
+# Convert documents written before ingest-time parsing to typed fields in place; documents that cannot
+# be parsed are moved to the quarantine collection, since the read paths expect typed fields
+def normalize_collection(collection, kind, quarantine_collection, batch_size=1000):
+    numeric_fields = STOCK_NUMERIC_FIELDS if kind == 'stock' else INDEX_NUMERIC_FIELDS
+    operations = []
+    rejected_rows = []
+    converted = 0
+    start = time.time()
+
+    for document in collection.find(untyped_query(numeric_fields)).batch_size(batch_size):
+        try:
+            if kind == 'stock':
+                typed = parse_stock_row(document, document.get('company_id'), document.get('company_symbol'))
+            else:
+                typed = parse_index_row(document, document.get('index_name'))
+        except RowValidationError as e:
+            # The same context the scrapers record, so quarantine keys stay distinct per company or index
+            if kind == 'stock':
+                context = {'company_id': document.get('company_id'), 'company_symbol': document.get('company_symbol')}
+            else:
+                context = {'index_name': document.get('index_name')}
+            rejected_rows.append(quarantine_document(kind, document, e, source_document_id=document['_id'], **context))
+            continue
+
+        operations.append(UpdateOne(
+            {'_id': document['_id']},
+            {'$set': typed, '$unset': {'DT_Row_Index': ''}}
+        ))
+        if len(operations) >= batch_size:
+            collection.bulk_write(operations, ordered=False)
+            converted += len(operations)
+            operations = []
+            print(f"{collection.name}: converted {converted} documents ({converted / (time.time() - start):.0f}/s)")
+
+    if operations:
+        collection.bulk_write(operations, ordered=False)
+        converted += len(operations)
+
+    # Only remove the rejected documents once their copies are in quarantine
+    if rejected_rows and quarantine_rows(quarantine_collection, rejected_rows) == len(rejected_rows):
+        ids = [document['source_document_id'] for document in rejected_rows]
+        for offset in range(0, len(ids), batch_size):
+            collection.delete_many({'_id': {'$in': ids[offset:offset + batch_size]}})
+    elif rejected_rows:
+        print(f"{collection.name}: {len(rejected_rows)} rejected documents could not be quarantined and were left in place")
+    print(f"{collection.name}: converted {converted} documents, quarantined {len(rejected_rows)}")
+    return converted, len(rejected_rows)
+
+
+# Keep only the last written row per company and day, so the unique (company_id, published_date) index
+# in app/indexes.py can be built; run after normalizing, when equal dates share one type
+def remove_duplicate_days(collection, batch_size=1000):
+    pipeline = [
+        {'$group': {'_id': {'company_id': '$company_id', 'published_date': '$published_date'},
+                    'ids': {'$push': '$_id'}, 'count': {'$sum': 1}}},
+        {'$match': {'count': {'$gt': 1}}}
+    ]
+    duplicate_ids = []
+    for day in collection.aggregate(pipeline, allowDiskUse=True):
+        # ObjectIds grow with insertion time; the newest row is the one later ingestions would have written
+        newest = max(day['ids'])
+        duplicate_ids.extend(document_id for document_id in day['ids'] if document_id != newest)
+
+    for offset in range(0, len(duplicate_ids), batch_size):
+        collection.delete_many({'_id': {'$in': duplicate_ids[offset:offset + batch_size]}})
+    print(f"{collection.name}: removed {len(duplicate_ids)} duplicate company days")
+    return len(duplicate_ids)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert existing string-typed stock and index documents to typed fields and remove duplicate stock days")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--only", choices=['stocks', 'indices'], help="Normalize only one collection")
+    args = parser.parse_args()
+
+    client = MongoClient(os.getenv('MONGODB_URI_ADMIN'))
+    db = client[os.getenv('DATABASE_NAME')]
+    quarantine_collection = db[os.getenv('INGEST_QUARANTINE', 'ingest_quarantine')]
+
+    try:
+        if args.only in (None, 'stocks'):
+            normalize_collection(db[os.getenv('NEPSE_STOCKS', 'nepse-stocks')], 'stock', quarantine_collection, args.batch_size)
+            remove_duplicate_days(db[os.getenv('NEPSE_STOCKS', 'nepse-stocks')], args.batch_size)
+        if args.only in (None, 'indices'):
+            normalize_collection(db[os.getenv('NEPSE_INDICES', 'nepse-indices')], 'index', quarantine_collection, args.batch_size)
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    main()
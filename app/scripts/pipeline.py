@@ -0,0 +1,153 @@
+import queue
+import threading
+import time
+from pymongo.errors import BulkWriteError
+
+# Marks the end of a stage's input
+_STOP = object()
+
+# Write error code of a duplicate key: the row is already stored
+DUPLICATE_KEY = 11000
+
+
+# Single writer that coalesces operations from many producers into large unordered bulk writes
+class BulkWriter(threading.Thread):
+    """
+    Consumes (operations, callback) items from a bounded queue and writes them
+    with collection.bulk_write(ordered=False).
+
+    Items are coalesced until batch_size operations are buffered or
+    flush_interval seconds pass without reaching it. submit() blocks while the
+    queue is full, which pushes back on the producing stages. After every flush
+    each item's callback is called with (written, error), then after_flush().
+    Duplicate key errors are not failures: the row is already stored, so it
+    only does not count as written.
+    Write latencies are recorded on ``metrics`` (an IngestMetrics) if given.
+    """
+
+    def __init__(self, collection, batch_size=5000, flush_interval=1.0, max_queue=64, after_flush=None, metrics=None):
+        super().__init__(name='bulk-writer', daemon=True)
+        self.collection = collection
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.after_flush = after_flush
+        self.metrics = metrics
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.stats = {"flushes": 0, "operations": 0, "errors": 0, "duplicates": 0, "write_time": 0.0}
+
+    def submit(self, operations, callback=None):
+        """Queue operations for writing; blocks when the writer is behind"""
+        self.queue.put((operations, callback))
+
+    def close(self):
+        """Flush everything still queued and wait for the writer to finish"""
+        self.queue.put(_STOP)
+        self.join()
+        return self.stats
+
+    def _flush(self, items):
+        operations = [operation for ops, _ in items for operation in ops]
+        failed = {}
+        duplicates = set()
+        fatal_error = None
+        if operations:
+            start = time.perf_counter()
+            try:
+                self.collection.bulk_write(operations, ordered=False)
+            except BulkWriteError as e:
+                # Unordered writes keep going past failures; remember which operations failed
+                for write_error in e.details.get('writeErrors', []):
+                    if write_error.get('code') == DUPLICATE_KEY:
+                        duplicates.add(write_error['index'])
+                    else:
+                        failed[write_error['index']] = write_error.get('errmsg', 'write error')
+            except Exception as e:
+                fatal_error = str(e)
+            elapsed = time.perf_counter() - start
+            self.stats["write_time"] += elapsed
+            if self.metrics is not None:
+                self.metrics.observe_write(elapsed, len(operations))
+            self.stats["flushes"] += 1
+            if fatal_error or failed:
+                self.stats["errors"] += len(operations) if fatal_error else len(failed)
+                print(f"Bulk write of {len(operations)} operations had errors: {fatal_error or next(iter(failed.values()))}")
+            self.stats["duplicates"] += len(duplicates)
+            self.stats["operations"] += 0 if fatal_error else len(operations) - len(failed) - len(duplicates)
+
+        offset = 0
+        for ops, callback in items:
+            count = len(ops)
+            item_errors = [failed[i] for i in range(offset, offset + count) if i in failed]
+            item_duplicates = sum(1 for i in range(offset, offset + count) if i in duplicates)
+            offset += count
+            if callback is None:
+                continue
+            try:
+                if fatal_error:
+                    callback(0, fatal_error)
+                else:
+                    callback(count - len(item_errors) - item_duplicates, item_errors[0] if item_errors else None)
+            except Exception as e:
+                print(f"Error in writer callback: {e}")
+
+        if self.after_flush is not None:
+            try:
+                self.after_flush()
+            except Exception as e:
+                print(f"Error after writer flush: {e}")
+
+    def run(self):
+        items = []
+        buffered = 0
+        deadline = time.monotonic() + self.flush_interval
+        while True:
+            try:
+                item = self.queue.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                item = None
+
+            if item is _STOP:
+                self._flush(items)
+                return
+
+            if item is not None:
+                items.append(item)
+                buffered += len(item[0])
+
+            # Flush on a full batch, or once the oldest buffered item has waited flush_interval
+            if buffered >= self.batch_size or (items and time.monotonic() >= deadline):
+                self._flush(items)
+                items = []
+                buffered = 0
+            if not items:
+                deadline = time.monotonic() + self.flush_interval
+
+
+# Intermediate stage: one thread applying a function to every item of a bounded input queue
+class Stage(threading.Thread):
+    """Runs handler(item) for each queued item until close() is called"""
+
+    def __init__(self, name, handler, max_queue=64):
+        super().__init__(name=name, daemon=True)
+        self.handler = handler
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.processed = 0
+
+    def put(self, item):
+        """Queue an item; blocks when the stage is behind"""
+        self.queue.put(item)
+
+    def close(self):
+        self.queue.put(_STOP)
+        self.join()
+
+    def run(self):
+        while True:
+            item = self.queue.get()
+            if item is _STOP:
+                return
+            try:
+                self.handler(item)
+            except Exception as e:
+                print(f"Error in {self.name} stage: {e}")
+            self.processed += 1
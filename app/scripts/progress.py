@@ -0,0 +1,128 @@
+import json
+import sys
+import threading
+import time
+
+
+# Structured progress reporting for the ingestion scripts
+class ProgressReporter:
+    """
+    Tracks units done/total, rows written and errors for one ingestion stage
+    and publishes them as JSON-lines events.
+
+    Events go to ``stream`` (for example stdout reserved by
+    reserve_stdout_for_progress()) and/or are published on the background
+    ``job`` running the stage. Progress events are coalesced to at most one
+    per ``min_interval`` seconds; start, complete and error events are
+    always written.
+    """
+
+    def __init__(self, stage, stream=None, job=None, min_interval=0.5):
+        self.stage = stage
+        self.stream = stream
+        self.job = job
+        self.min_interval = min_interval
+        self.total = 0
+        self.done = 0
+        self.rows = 0
+        self.errors = 0
+        self.started = time.monotonic()
+        self._last_emit = 0.0
+        self._lock = threading.Lock()
+
+    def snapshot(self):
+        """Current counters with elapsed time, rate and estimated time remaining"""
+        elapsed = time.monotonic() - self.started
+        rate = self.done / elapsed if elapsed > 0 else 0.0
+        remaining = max(self.total - self.done, 0)
+        return {
+            'stage': self.stage,
+            'done': self.done,
+            'total': self.total,
+            'rows': self.rows,
+            'errors': self.errors,
+            'percent': int(self.done * 100 / self.total) if self.total else 0,
+            'elapsed_s': round(elapsed, 1),
+            'rate': round(rate, 2),
+            'eta_s': round(remaining / rate, 1) if rate > 0 else None
+        }
+
+    def _write(self, event):
+        if self.job is not None:
+            self.job.publish(event)
+        if self.stream is None:
+            return
+        try:
+            self.stream.write(json.dumps(event, default=str) + '\n')
+            self.stream.flush()
+        except (OSError, ValueError):
+            # The reader went away; keep ingesting without progress output
+            self.stream = None
+
+    def event(self, kind, **fields):
+        """Write an event immediately"""
+        with self._lock:
+            event = {'type': kind, **self.snapshot(), **fields}
+            self._write(event)
+        if self.job is not None and fields.get('message'):
+            self.job.log(fields['message'])
+        return event
+
+    def start(self, total, message=None):
+        with self._lock:
+            self.total = total
+        if self.job is not None:
+            self.job.set_total(self.job.progress['total'] + total, message)
+        self.event('start', message=message)
+
+    def advance(self, done=0, rows=0, errors=0, item=None):
+        """Add to the counters and emit a progress event if min_interval has passed"""
+        with self._lock:
+            self.done += done
+            self.rows += rows
+            self.errors += errors
+            now = time.monotonic()
+            due = now - self._last_emit >= self.min_interval or self.done >= self.total
+            if due:
+                self._last_emit = now
+                self._write({'type': 'progress', **self.snapshot(), 'item': item})
+        if self.job is not None:
+            self.job.advance(done=done, rows=rows, errors=errors, message=f"{self.stage}: {item}" if item else None)
+
+    def complete(self, **summary):
+        return self.event('complete', summary=summary)
+
+    def error(self, message):
+        return self.event('error', message=message)
+
+
+# Send print() output to stderr so stdout carries only JSON-lines progress events
+def reserve_stdout_for_progress():
+    stream = sys.stdout
+    sys.stdout = sys.stderr
+    return stream
+
+
+# Read JSON-lines progress events from a stream, skipping anything that is not an event
+def read_progress_events(stream):
+    for line in stream:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            event = json.loads(line)
+        except ValueError:
+            continue
+        if isinstance(event, dict) and 'type' in event:
+            yield event
+
+
+# Turn a progress event into a short human-readable line
+def describe_event(event):
+    if event.get('message'):
+        return f"{event.get('stage')}: {event['message']}"
+    text = f"{event.get('stage')}: {event.get('done', 0)}/{event.get('total', 0)} done, {event.get('rows', 0)} rows, {event.get('errors', 0)} errors"
+    if event.get('eta_s') is not None and event.get('type') == 'progress':
+        minutes, seconds = divmod(int(event['eta_s']), 60)
+        text += f", ETA {minutes}m {seconds:02d}s"
+    return text
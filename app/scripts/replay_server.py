@@ -0,0 +1,274 @@
+import argparse
+import json
+import os
+import random
+import secrets
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, quote, unquote, urlparse
+
+# Allow running as a standalone script as well as importing from the app package
+if __package__ in (None, ''):
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from app.scripts.synthetic import generate_companies, generate_index_history, generate_price_history, trading_days
+
+# Index ids served by sharesansar (same as the indices ingestion script)
+INDEX_IDS = [1, 2, 3, 4, 5, 6, 8, 9, 10, 11, 12, 13, 14, 15, 16, 17, 18]
+
+
+# Recorded or generated upstream data served by the replay server
+class ReplayData:
+    """
+    Price and index history keyed by company_id / index_id, newest row first.
+
+    Recorded responses are loaded from a fixtures directory laid out as::
+
+        companies.json                          [{"company_id": 1, "symbol": "ABC"}, ...]
+        company-price-history/<company_id>.json rows, or a saved DataTables response
+        index-history-data/<index_id>.json      rows, or a saved DataTables response
+    """
+
+    def __init__(self):
+        self.companies = []
+        self.company_rows = {}
+        self.index_rows = {}
+
+    @classmethod
+    def synthetic(cls, companies=50, days=500, seed=42):
+        data = cls()
+        dates = trading_days(days)
+        data.companies = generate_companies(companies, seed=seed)
+        for company in data.companies:
+            data.company_rows[company["company_id"]] = generate_price_history(company["company_id"], dates, seed=seed)
+        for index_id in INDEX_IDS:
+            data.index_rows[index_id] = generate_index_history(index_id, dates, seed=seed)
+        return data
+
+    @classmethod
+    def from_fixtures(cls, fixtures_dir):
+        data = cls()
+
+        def load_rows(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                content = json.load(f)
+            rows = content.get("data", []) if isinstance(content, dict) else content
+            return sorted(rows, key=lambda row: row["published_date"], reverse=True)
+
+        companies_file = os.path.join(fixtures_dir, 'companies.json')
+        if os.path.isfile(companies_file):
+            with open(companies_file, 'r', encoding='utf-8') as f:
+                data.companies = json.load(f)
+
+        for folder, target in (('company-price-history', data.company_rows), ('index-history-data', data.index_rows)):
+            folder_path = os.path.join(fixtures_dir, folder)
+            if not os.path.isdir(folder_path):
+                continue
+            for name in os.listdir(folder_path):
+                if name.endswith('.json'):
+                    target[int(name[:-5])] = load_rows(os.path.join(folder_path, name))
+
+        # Fall back to generated symbols for recorded companies without a companies.json entry
+        known = {company["company_id"] for company in data.companies}
+        for company_id in sorted(data.company_rows):
+            if company_id not in known:
+                data.companies.append({"company_id": company_id, "symbol": f"C{company_id}"})
+        return data
+
+
+# Request handler emulating the sharesansar endpoints used by the ingestion scripts
+class ReplayRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        # Keep benchmark output clean
+        pass
+
+    def _params(self):
+        parsed = urlparse(self.path)
+        params = {k: v[-1] for k, v in parse_qs(parsed.query).items()}
+        length = int(self.headers.get('Content-Length') or 0)
+        if length:
+            body = self.rfile.read(length).decode('utf-8')
+            params.update({k: v[-1] for k, v in parse_qs(body).items()})
+        return parsed.path, params
+
+    def _send(self, status, body, content_type='application/json', extra_headers=None, count=True):
+        payload = body.encode('utf-8') if isinstance(body, str) else body
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(payload)))
+        for name, value in (extra_headers or []):
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+        if count:
+            self.server.record(len(payload))
+
+    def _simulate_network(self):
+        """Apply configured latency and random failures; returns False if the request should fail"""
+        server = self.server
+        if server.latency_ms or server.jitter_ms:
+            delay = server.latency_ms + random.uniform(-server.jitter_ms, server.jitter_ms)
+            time.sleep(max(0.0, delay) / 1000.0)
+        if server.error_rate and random.random() < server.error_rate:
+            server.record_error()
+            self._send(500, json.dumps({"message": "Server Error"}))
+            return False
+        return True
+
+    def _datatables(self, rows, params):
+        start = int(params.get('start', 0))
+        length = min(int(params.get('length', 50)), self.server.page_size)
+        body = {
+            "draw": int(params.get('draw', 1)),
+            "recordsTotal": len(rows),
+            "recordsFiltered": len(rows),
+            "data": rows[start:start + length]
+        }
+        self._send(200, json.dumps(body))
+
+    def do_GET(self):
+        path, params = self._params()
+
+        if path == '/__stats':
+            self._send(200, json.dumps(self.server.stats()), count=False)
+            return
+
+        if not self._simulate_network():
+            return
+
+        if path.startswith('/company/'):
+            # Company page: issue the XSRF cookie the price history endpoint checks
+            token = secrets.token_hex(20)
+            self.server.add_token(token)
+            self._send(200, '<html><body>company</body></html>', content_type='text/html', extra_headers=[
+                ('Set-Cookie', f'XSRF-TOKEN={quote(token)}; Path=/'),
+                ('Set-Cookie', f'sharesansar_session={secrets.token_hex(16)}; Path=/; HttpOnly')
+            ])
+        elif path == '/index-history-data':
+            rows = self.server.data.index_rows.get(int(params.get('index_id', 0)), [])
+            from_date = params.get('from')
+            to_date = params.get('to')
+            if from_date or to_date:
+                rows = [
+                    row for row in rows
+                    if (not from_date or row["published_date"] >= from_date)
+                    and (not to_date or row["published_date"] <= to_date)
+                ]
+            self._datatables(rows, params)
+        else:
+            self._send(404, json.dumps({"message": "Not Found"}))
+
+    def do_POST(self):
+        path, params = self._params()
+
+        if not self._simulate_network():
+            return
+
+        if path == '/company-price-history':
+            token = self.headers.get('X-XSRF-TOKEN')
+            if not token or not self.server.has_token(unquote(token)):
+                # Laravel answers a missing/invalid CSRF token with 419
+                self._send(419, json.dumps({"message": "CSRF token mismatch."}))
+                return
+            rows = self.server.data.company_rows.get(int(params.get('company', 0)), [])
+            self._datatables(rows, params)
+        else:
+            self._send(404, json.dumps({"message": "Not Found"}))
+
+
+# Threaded HTTP server with request counters
+class ReplayServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, data, host='127.0.0.1', port=0, latency_ms=0, jitter_ms=0, error_rate=0.0, page_size=50):
+        super().__init__((host, port), ReplayRequestHandler)
+        self.data = data
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.page_size = page_size
+        self._lock = threading.Lock()
+        self._tokens = set()
+        self._requests = 0
+        self._errors = 0
+        self._bytes = 0
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def add_token(self, token):
+        with self._lock:
+            self._tokens.add(token)
+
+    def has_token(self, token):
+        with self._lock:
+            return token in self._tokens
+
+    def record(self, size):
+        with self._lock:
+            self._requests += 1
+            self._bytes += size
+
+    def record_error(self):
+        with self._lock:
+            self._errors += 1
+
+    def stats(self):
+        with self._lock:
+            return {"requests": self._requests, "errors": self._errors, "bytes": self._bytes}
+
+    def start(self):
+        """Serve requests from a background thread"""
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve recorded or synthetic sharesansar responses locally")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--fixtures", help="Directory of recorded responses (synthetic data is used if omitted)")
+    parser.add_argument("--companies", type=int, default=50, help="Number of synthetic companies")
+    parser.add_argument("--days", type=int, default=500, help="Trading days of synthetic history")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--latency-ms", type=float, default=0, help="Mean added latency per request")
+    parser.add_argument("--jitter-ms", type=float, default=0, help="Uniform latency jitter per request")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered with HTTP 500")
+    parser.add_argument("--page-size", type=int, default=50, help="Maximum rows returned per DataTables page")
+    args = parser.parse_args()
+
+    if args.fixtures:
+        data = ReplayData.from_fixtures(args.fixtures)
+    else:
+        data = ReplayData.synthetic(args.companies, args.days, args.seed)
+
+    server = ReplayServer(
+        data, args.host, args.port,
+        latency_ms=args.latency_ms, jitter_ms=args.jitter_ms,
+        error_rate=args.error_rate, page_size=args.page_size
+    )
+    print(f"Replay server listening on {server.url} "
+          f"({len(data.company_rows)} companies, {len(data.index_rows)} indices)")
+    print(f"Point the ingestion scripts at it with SHARESANSAR_URL={server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
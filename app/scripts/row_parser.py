@@ -0,0 +1,143 @@
+import datetime
+import math
+from pymongo import UpdateOne
+
+# Numeric fields of a company-price-history row
+STOCK_NUMERIC_FIELDS = ('open', 'high', 'low', 'close', 'per_change', 'traded_quantity', 'traded_amount')
+
+# Numeric fields of an index-history-data row
+INDEX_NUMERIC_FIELDS = ('open', 'high', 'low', 'current', 'change_', 'per_change', 'turnover')
+
+# Date formats seen in legacy data, tried after the YYYY-MM-DD fast path (ISO timestamps are cut at the 'T')
+_FALLBACK_DATE_FORMATS = ('%Y-%m-%d', '%Y/%m/%d', '%m/%d/%Y', '%d-%m-%Y', '%Y-%m-%d %H:%M:%S')
+
+
+class RowValidationError(ValueError):
+    """Raised when an upstream row cannot be converted into a valid document"""
+
+    def __init__(self, field, value, message):
+        super().__init__(f"{field}: {message} ({value!r})")
+        self.field = field
+        self.value = value
+
+
+def parse_number(value, field='value'):
+    """Convert sharesansar numbers such as "1,234.50" to float; blanks become None"""
+    if value is None:
+        return None
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        number = float(value)
+    else:
+        text = str(value).strip()
+        if not text or text == '-':
+            return None
+        if ',' in text:
+            text = text.replace(',', '')
+        try:
+            number = float(text)
+        except ValueError:
+            raise RowValidationError(field, value, "not a number")
+    if not math.isfinite(number):
+        raise RowValidationError(field, value, "not a finite number")
+    return number
+
+
+def parse_date(value, field='published_date'):
+    """Convert a published date (string, date or datetime) to a datetime at midnight"""
+    if isinstance(value, datetime.datetime):
+        return value
+    if isinstance(value, datetime.date):
+        return datetime.datetime(value.year, value.month, value.day)
+    if not isinstance(value, str) or not value.strip():
+        raise RowValidationError(field, value, "missing date")
+
+    text = value.strip()
+    # Fast path for the YYYY-MM-DD strings sharesansar returns
+    if len(text) == 10 and text[4] == '-' and text[7] == '-':
+        try:
+            return datetime.datetime(int(text[0:4]), int(text[5:7]), int(text[8:10]))
+        except ValueError:
+            raise RowValidationError(field, value, "invalid date")
+
+    text = text.split('T')[0]
+    for date_format in _FALLBACK_DATE_FORMATS:
+        try:
+            return datetime.datetime.strptime(text, date_format)
+        except ValueError:
+            continue
+    raise RowValidationError(field, value, "unrecognised date format")
+
+
+def parse_stock_row(record, company_id, company_symbol):
+    """Build a typed nepse-stocks document from a company-price-history row"""
+    document = {
+        'published_date': parse_date(record.get('published_date')),
+        'company_id': company_id,
+        'company_symbol': company_symbol
+    }
+    for field in STOCK_NUMERIC_FIELDS:
+        document[field] = parse_number(record.get(field), field)
+
+    if document['close'] is None:
+        raise RowValidationError('close', record.get('close'), "missing close price")
+    for field in ('open', 'high', 'low', 'close', 'traded_quantity', 'traded_amount'):
+        if document[field] is not None and document[field] < 0:
+            raise RowValidationError(field, record.get(field), "negative value")
+
+    if 'status' in record:
+        document['status'] = record['status']
+    return document
+
+
+def parse_index_row(record, index_name=None):
+    """Build a typed nepse-indices document from an index-history-data row"""
+    try:
+        index_id = int(record.get('index_id'))
+    except (TypeError, ValueError):
+        raise RowValidationError('index_id', record.get('index_id'), "not an integer")
+
+    document = {
+        'index_id': index_id,
+        'published_date': parse_date(record.get('published_date'))
+    }
+    for field in INDEX_NUMERIC_FIELDS:
+        if field in record:
+            document[field] = parse_number(record[field], field)
+
+    if document.get('current') is None:
+        raise RowValidationError('current', record.get('current'), "missing index value")
+    if index_name:
+        document['index_name'] = index_name
+    return document
+
+
+def quarantine_document(kind, record, error, **context):
+    """Describe a rejected row for the quarantine collection"""
+    return {
+        'kind': kind,
+        'raw': {k: v for k, v in record.items() if k != '_id'},
+        'field': getattr(error, 'field', None),
+        'error': str(error),
+        'received_at': datetime.datetime.now(),
+        **context
+    }
+
+
+def quarantine_rows(collection, documents):
+    """Upsert rejected rows so re-fetching the same bad row does not duplicate it; returns the rows written"""
+    if not documents or collection is None:
+        return 0
+    operations = []
+    for document in documents:
+        key = {
+            'kind': document['kind'],
+            'source_id': document.get('company_id', document['raw'].get('index_id')),
+            'source_date': str(document['raw'].get('published_date'))
+        }
+        operations.append(UpdateOne(key, {'$set': document, '$inc': {'times_seen': 1}}, upsert=True))
+    try:
+        collection.bulk_write(operations, ordered=False)
+    except Exception as e:
+        print(f"Error writing {len(documents)} rows to quarantine: {e}")
+        return 0
+    return len(documents)
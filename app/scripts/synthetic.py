@@ -0,0 +1,111 @@
+import datetime
+import math
+import random
+
+# NEPSE trades Sunday to Thursday (Python weekday numbers)
+TRADING_WEEKDAYS = {6, 0, 1, 2, 3}
+
+# Sectors used for generated companies
+SECTORS = [
+    "Commercial Banks",
+    "Development Banks",
+    "Finance",
+    "Hotels And Tourism",
+    "Hydro Power",
+    "Life Insurance",
+    "Manufacturing And Processing",
+    "Microfinance",
+    "Non Life Insurance",
+    "Others",
+    "Trading",
+    "Investment"
+]
+
+
+def format_amount(value):
+    """Format a number the way sharesansar renders it ("1,234.50")"""
+    return f"{value:,.2f}"
+
+
+def trading_days(days, end_date=None):
+    """Return the last `days` trading dates up to end_date, newest first"""
+    current = end_date or datetime.date.today()
+    result = []
+    while len(result) < days:
+        if current.weekday() in TRADING_WEEKDAYS:
+            result.append(current)
+        current -= datetime.timedelta(days=1)
+    return result
+
+
+def generate_companies(count, seed=42):
+    """Generate a deterministic list of company documents"""
+    rng = random.Random(seed)
+    companies = []
+    for company_id in range(1, count + 1):
+        companies.append({
+            "company_id": company_id,
+            "symbol": f"SYN{company_id:03d}",
+            "companyname": f"Synthetic Company {company_id} Limited",
+            "sector": SECTORS[rng.randrange(len(SECTORS))]
+        })
+    return companies
+
+
+def generate_price_history(company_id, dates, seed=42):
+    """
+    Generate sharesansar-style price history rows for one company.
+
+    Rows follow `dates` (newest first) and carry string numbers exactly like
+    the company-price-history DataTables endpoint.
+    """
+    rng = random.Random(seed * 100003 + company_id)
+    price = rng.uniform(100, 2000)
+    rows = []
+    # Walk forward in time so the series is a continuous random walk
+    for date in reversed(dates):
+        previous = price
+        price = max(10.0, price * math.exp(rng.gauss(0, 0.02)))
+        high = max(price, previous) * (1 + abs(rng.gauss(0, 0.01)))
+        low = min(price, previous) * (1 - abs(rng.gauss(0, 0.01)))
+        quantity = rng.randint(100, 200000)
+        rows.append({
+            "published_date": date.strftime("%Y-%m-%d"),
+            "open": format_amount(previous),
+            "high": format_amount(high),
+            "low": format_amount(low),
+            "close": format_amount(price),
+            "per_change": f"{(price - previous) / previous * 100:.2f}",
+            "traded_quantity": format_amount(quantity),
+            "traded_amount": format_amount(quantity * price),
+            "status": "0"
+        })
+    rows.reverse()
+    for i, row in enumerate(rows):
+        row["DT_Row_Index"] = i + 1
+    return rows
+
+
+def generate_index_history(index_id, dates, seed=42):
+    """Generate sharesansar-style index history rows for one index (newest first)"""
+    rng = random.Random(seed * 7919 + index_id)
+    value = rng.uniform(500, 3000)
+    rows = []
+    for date in reversed(dates):
+        previous = value
+        value = value * math.exp(rng.gauss(0, 0.01))
+        rows.append({
+            "index_id": index_id,
+            "published_date": date.strftime("%Y-%m-%d"),
+            "open": format_amount(previous),
+            "high": format_amount(max(value, previous) * (1 + abs(rng.gauss(0, 0.003)))),
+            "low": format_amount(min(value, previous) * (1 - abs(rng.gauss(0, 0.003)))),
+            "current": format_amount(value),
+            "change_": format_amount(value - previous),
+            "per_change": f"{(value - previous) / previous * 100:.2f}",
+            "turnover": format_amount(rng.uniform(1e9, 1e10))
+        })
+    rows.reverse()
+    for i, row in enumerate(rows):
+        row["DT_Row_Index"] = i + 1
+    return rows
@@ -0,0 +1,32 @@
+import argparse
+import os
+import sys
+import time
+from pymongo import MongoClient
+from dotenv import load_dotenv
+
+# Allow running as a standalone script as well as importing from the app package
+if __package__ in (None, ''):
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from app.stats import COMPANY_STATS, update_company_stats
+
+# Load environment variables from .env file
+load_dotenv()
+
+
+def main():
+    argparse.ArgumentParser(description="Recompute the company-stats documents from the last MATRIX_DAYS trading days").parse_args()
+
+    client = MongoClient(os.getenv('MONGODB_URI_ADMIN') or os.getenv('MONGODB_URI') or 'mongodb://localhost:27017/')
+    start = time.time()
+    try:
+        written = update_company_stats(client[os.getenv('DATABASE_NAME', 'heisenstocks')])
+    finally:
+        client.close()
+
+    print(f"Wrote {written} documents to {COMPANY_STATS} in {time.time() - start:.1f} seconds")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,34 @@
+import argparse
+import os
+import sys
+import time
+from pymongo import MongoClient
+from dotenv import load_dotenv
+
+# Allow running as a standalone script as well as importing from the app package
+if __package__ in (None, ''):
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from app.turnover import TURNOVER_SERIES, update_turnover_series
+
+# Load environment variables from .env file
+load_dotenv()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sum nepse-stocks per trading day into the market-turnover collection")
+    parser.add_argument("--full", action="store_true", help="Rebuild the whole series instead of appending new trading days")
+    args = parser.parse_args()
+
+    client = MongoClient(os.getenv('MONGODB_URI_ADMIN') or os.getenv('MONGODB_URI') or 'mongodb://localhost:27017/')
+    start = time.time()
+    try:
+        written = update_turnover_series(client[os.getenv('DATABASE_NAME', 'heisenstocks')], full=args.full)
+    finally:
+        client.close()
+
+    print(f"Wrote {written} rows to {TURNOVER_SERIES} in {time.time() - start:.1f} seconds")
+
+
+if __name__ == "__main__":
+    main()
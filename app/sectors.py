@@ -0,0 +1,140 @@
+import itertools
+import os
+import numpy as np
+from pymongo import UpdateOne
+from app.storage.base import SECTOR_COUNT_FIELDS, SECTOR_FIELDS, to_datetime
+
+# Collection (and SQLite table) holding the precomputed sector series
+SECTOR_SERIES = os.getenv('SECTOR_SERIES', 'sector-series')
+
+# Value of every sector series on its first day
+SECTOR_BASE = float(os.getenv('SECTOR_BASE', '1000'))
+
+# Daily moves larger than this (percent) are left out of the returns: NEPSE's circuit
+# limit is 10%, so bigger moves are unadjusted bonus or right shares, or bad rows
+SECTOR_MAX_MOVE = float(os.getenv('SECTOR_MAX_MOVE', '12'))
+
+# Chained levels are stored unrounded, so continuing the series from them gives the same values as a full build
+LEVEL_FIELDS = ('equal_weight', 'turnover_weight')
+
+# Stock fields the aggregation reads
+SOURCE_FIELDS = ('company_id', 'published_date', 'per_change', 'traded_quantity', 'traded_amount')
+
+# Documents written per bulk write
+WRITE_BATCH = 5000
+
+
+def to_array(rows, field):
+    return np.array([np.nan if row.get(field) is None else row[field] for row in rows], dtype=np.float64)
+
+
+def day_aggregates(codes, count, per_change, quantity, amount):
+    """
+    Per-sector totals for one trading day. codes holds each row's sector
+    number (0 .. count - 1); returns a dict of arrays of length count.
+    """
+    def total(mask, weights=None):
+        return np.bincount(codes[mask], None if weights is None else weights[mask], minlength=count)
+
+    traded = np.ones(len(codes), dtype=bool)
+    amount = np.where(np.isnan(amount), 0.0, amount)
+    quantity = np.where(np.isnan(quantity), 0.0, quantity)
+    valid = ~np.isnan(per_change) & (np.abs(np.where(np.isnan(per_change), 0.0, per_change)) <= SECTOR_MAX_MOVE)
+
+    movers = total(valid)
+    weight = total(valid, amount)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        equal = total(valid, per_change) / movers
+        weighted = total(valid, per_change * amount) / weight
+    return {
+        'equal_weight_change': equal,
+        # Days where nothing with a valid move traded any amount fall back to equal weights
+        'turnover_weight_change': np.where(weight > 0, weighted, equal),
+        'turnover': total(traded, amount),
+        'volume': total(traded, quantity),
+        'advances': total(valid & (per_change > 0)),
+        'declines': total(valid & (per_change < 0)),
+        'unchanged': total(valid & (per_change == 0)),
+        'constituents': total(traded),
+    }
+
+
+def compute_sector_series(companies, stock_rows, levels=None):
+    """
+    Yield one document per sector and trading day from stock rows sorted by
+    published_date. Returns are built from each stock's per_change, so no
+    previous close is needed; levels maps a sector to its last stored
+    (equal_weight, turnover_weight) so an incremental run continues it.
+    """
+    sector_of = {company['company_id']: company['sector'].strip() for company in companies if (company.get('sector') or '').strip()}
+    names = sorted(set(sector_of.values()) | set(levels or {}))
+    number = {name: position for position, name in enumerate(names)}
+    code_of = {company_id: number[name] for company_id, name in sector_of.items()}
+
+    equal_level = np.full(len(names), SECTOR_BASE)
+    weighted_level = np.full(len(names), SECTOR_BASE)
+    for name, (equal, weighted) in (levels or {}).items():
+        equal_level[number[name]], weighted_level[number[name]] = equal, weighted
+
+    for date, rows in itertools.groupby(stock_rows, key=lambda row: row['published_date']):
+        rows = [row for row in rows if row['company_id'] in code_of]
+        if not rows:
+            continue
+        codes = np.array([code_of[row['company_id']] for row in rows])
+        day = day_aggregates(codes, len(names), to_array(rows, 'per_change'), to_array(rows, 'traded_quantity'), to_array(rows, 'traded_amount'))
+
+        # Chain the levels; a sector with no valid move keeps its level
+        equal_level *= 1 + np.where(np.isnan(day['equal_weight_change']), 0.0, day['equal_weight_change']) / 100
+        weighted_level *= 1 + np.where(np.isnan(day['turnover_weight_change']), 0.0, day['turnover_weight_change']) / 100
+
+        values = dict(day, equal_weight=equal_level, turnover_weight=weighted_level)
+        for position in np.flatnonzero(day['constituents']):
+            document = {'sector': names[position], 'published_date': to_datetime(date)}
+            for field in SECTOR_FIELDS:
+                value = float(values[field][position])
+                if field in SECTOR_COUNT_FIELDS:
+                    document[field] = int(value)
+                else:
+                    document[field] = None if np.isnan(value) else value if field in LEVEL_FIELDS else round(value, 4)
+            yield document
+
+
+# Last stored levels of every sector before a date, to continue the series
+def stored_levels(collection, before):
+    levels = {}
+    for sector in collection.distinct('sector'):
+        latest = collection.find_one(
+            {'sector': sector, 'published_date': {'$lt': before}},
+            {'equal_weight': 1, 'turnover_weight': 1, '_id': 0}, sort=[('published_date', -1)]
+        )
+        if latest:
+            levels[sector] = (latest['equal_weight'], latest['turnover_weight'])
+    return levels
+
+
+# Recompute sector rows from the latest stored day onwards (everything when full=True); rows are
+# upserted, so a day stored while its stock rows were still arriving is corrected
+def update_sector_series(db, full=False):
+    from app.storage.mongo import projection
+
+    collection = db[SECTOR_SERIES]
+    if full:
+        collection.delete_many({})
+    latest = collection.find_one({}, {'published_date': 1, '_id': 0}, sort=[('published_date', -1)])
+    query = {'published_date': {'$gte': latest['published_date']}} if latest else {}
+
+    companies = list(db[os.getenv('COMPANIES_COLLECTION', 'companies')].find({}, projection(('company_id', 'sector'))))
+    rows = db[os.getenv('NEPSE_STOCKS', 'nepse-stocks')].find(query, projection(SOURCE_FIELDS)).sort('published_date', 1).batch_size(10000)
+
+    written = 0
+    documents = compute_sector_series(companies, rows, stored_levels(collection, latest['published_date']) if latest else None)
+    while True:
+        batch = list(itertools.islice(documents, WRITE_BATCH))
+        if not batch:
+            break
+        collection.bulk_write([
+            UpdateOne({'sector': document['sector'], 'published_date': document['published_date']}, {'$set': document}, upsert=True)
+            for document in batch
+        ], ordered=False)
+        written += len(batch)
+    return written
@@ -0,0 +1,175 @@
+import datetime
+import os
+import numpy as np
+from app import cache
+from app.storage.base import BATCH_FIELDS, COMPANY_LIST_FIELDS, INDEX_CHART_FIELDS
+
+# Seconds a loaded history stays in the cache (the scheduler clears the cache after each ingestion)
+SERIES_CACHE_TIMEOUT = int(os.getenv('SERIES_CACHE_TIMEOUT', '300'))
+
+# Most series one analytics request may ask for
+MAX_SERIES = int(os.getenv('MAX_SERIES', '20'))
+
+# Fill policies for dates a series has no value on
+FILL_POLICIES = ('ffill', 'none')
+
+# Date sets the aligned series are joined on: every date (outer) or dates all series have (inner)
+JOIN_POLICIES = ('outer', 'inner')
+
+# Columns of a loaded series; indices have no volume, so theirs is NaN
+COLUMNS = ('open', 'high', 'low', 'close', 'volume')
+
+
+def parse_date(value):
+    """YYYY-MM-DD query parameter to datetime (None stays None); raises ValueError"""
+    return datetime.datetime.strptime(value, '%Y-%m-%d') if value else None
+
+
+def to_float(value):
+    return np.nan if value is None else value
+
+
+# Rows of one series (oldest first) to numpy columns
+def rows_to_columns(rows, close_field):
+    columns = {'published_date': np.array([row['published_date'].date() for row in rows], dtype='datetime64[D]')}
+    for name, field in (('open', 'open'), ('high', 'high'), ('low', 'low'), ('close', close_field), ('volume', 'traded_quantity')):
+        columns[name] = np.array([to_float(row.get(field)) for row in rows], dtype=np.float64)
+    return columns
+
+
+# Split rows sorted by key then date into one list per key
+def group_rows(rows, key):
+    grouped = {}
+    for row in rows:
+        grouped.setdefault(row[key], []).append(row)
+    return grouped
+
+
+def resolve(storage, identifiers):
+    """
+    Look up company symbols (or numeric company ids) and index names.
+    Returns ([{'id', 'kind', 'key', 'name'}], missing identifiers).
+    """
+    index_names = set(storage.index_names())
+    company_identifiers = [identifier for identifier in identifiers if identifier not in index_names]
+    companies = storage.resolve_companies(
+        symbols=company_identifiers,
+        company_ids=[int(identifier) for identifier in company_identifiers if identifier.isdigit()],
+        fields=COMPANY_LIST_FIELDS
+    ) if company_identifiers else []
+    by_symbol = {company['symbol']: company for company in companies}
+    by_id = {company['company_id']: company for company in companies}
+
+    refs, missing = [], []
+    for identifier in identifiers:
+        if identifier in index_names:
+            refs.append({'id': identifier, 'kind': 'index', 'key': identifier, 'name': identifier})
+            continue
+        company = by_symbol.get(identifier) or (by_id.get(int(identifier)) if identifier.isdigit() else None)
+        if company:
+            refs.append({'id': identifier, 'kind': 'company', 'key': company['company_id'],
+                         'symbol': company['symbol'], 'name': company.get('companyname') or company['symbol']})
+        else:
+            missing.append(identifier)
+    return refs, missing
+
+
+def load(storage, refs):
+    """
+    Full history of each resolved series as numpy columns, keyed by (kind, key).
+    Cached histories are reused; the rest are fetched with one query per kind.
+    """
+    loaded, pending = {}, {'company': [], 'index': []}
+    for ref in refs:
+        cache_key = f"series:{ref['kind']}:{ref['key']}"
+        columns = cache.get(cache_key)
+        if columns is None:
+            pending[ref['kind']].append(ref['key'])
+        else:
+            loaded[(ref['kind'], ref['key'])] = columns
+
+    fetched = {}
+    if pending['company']:
+        rows = group_rows(storage.quotes_for(set(pending['company']), fields=BATCH_FIELDS), 'company_id')
+        for company_id in pending['company']:
+            fetched[('company', company_id)] = rows_to_columns(rows.get(company_id, []), 'close')
+    if pending['index']:
+        rows = group_rows(storage.index_histories(set(pending['index']), fields=('index_name',) + INDEX_CHART_FIELDS), 'index_name')
+        for index_name in pending['index']:
+            fetched[('index', index_name)] = rows_to_columns(rows.get(index_name, []), 'current')
+
+    for (kind, key), columns in fetched.items():
+        cache.set(f"series:{kind}:{key}", columns, timeout=SERIES_CACHE_TIMEOUT)
+    loaded.update(fetched)
+    return loaded
+
+
+def date_slice(columns, start=None, end=None):
+    """Rows of a series within [start, end]; dates are sorted, so this is two binary searches"""
+    dates = columns['published_date']
+    lo = np.searchsorted(dates, np.datetime64(start.date(), 'D'), 'left') if start else 0
+    hi = np.searchsorted(dates, np.datetime64(end.date(), 'D'), 'right') if end else len(dates)
+    return {name: values[lo:hi] for name, values in columns.items()}
+
+
+def forward_fill(matrix):
+    """Replace NaN with the last earlier value in the same row (leading NaN stay)"""
+    valid = ~np.isnan(matrix)
+    positions = np.where(valid, np.arange(matrix.shape[1]), 0)
+    np.maximum.accumulate(positions, axis=1, out=positions)
+    filled = matrix[np.arange(matrix.shape[0])[:, None], positions]
+    # Rows that start with NaN would otherwise take the value at position 0
+    filled[~np.maximum.accumulate(valid, axis=1)] = np.nan
+    return filled
+
+
+def align(series, field='close', join='outer', fill='ffill'):
+    """
+    Join series on a common trading-day index.
+    Returns (dates, matrix) with one matrix row per series, NaN where a series has no value.
+    """
+    if not series:
+        return np.array([], dtype='datetime64[D]'), np.empty((0, 0))
+    all_dates = [columns['published_date'] for columns in series]
+    dates = np.unique(np.concatenate(all_dates))
+    if join == 'inner':
+        for series_dates in all_dates:
+            dates = dates[np.isin(dates, series_dates, assume_unique=True)]
+
+    matrix = np.full((len(series), len(dates)), np.nan)
+    for row, columns in enumerate(series):
+        # Place each series' values at the positions of its dates in the common index
+        positions = np.searchsorted(dates, columns['published_date'])
+        inside = positions < len(dates)
+        inside[inside] = dates[positions[inside]] == columns['published_date'][inside]
+        matrix[row, positions[inside]] = columns[field][inside]
+
+    if fill == 'ffill':
+        matrix = forward_fill(matrix)
+    return dates, matrix
+
+
+def rebase(matrix, base=100.0):
+    """Scale each row so its first value is base"""
+    first = np.argmax(~np.isnan(matrix), axis=1)
+    start = matrix[np.arange(matrix.shape[0]), first]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return matrix / start[:, None] * base
+
+
+def returns(matrix):
+    """Day-over-day percent change of each row; the first column is NaN"""
+    result = np.full(matrix.shape, np.nan)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        result[:, 1:] = (matrix[:, 1:] / matrix[:, :-1] - 1) * 100
+    return result
+
+
+# JSON-safe list: NaN and infinities become null
+def to_list(values, digits=4):
+    values = np.round(values.astype(np.float64), digits)
+    return np.where(np.isfinite(values), values, None).tolist()
+
+
+def date_strings(dates):
+    return np.datetime_as_string(dates, unit='D').tolist()
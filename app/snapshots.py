@@ -0,0 +1,134 @@
+import datetime
+import gzip
+import hashlib
+import json
+import os
+import shutil
+from app.export import csv_chunks
+from app.storage.base import COMPANY_FIELDS, INDEX_ROW_FIELDS, QUOTE_FIELDS
+
+# Default location of the bulk snapshot downloads
+DEFAULT_SNAPSHOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'snapshots')
+
+# Snapshot versions kept on disk; older ones are deleted after a build
+SNAPSHOT_KEEP = int(os.getenv('SNAPSHOT_KEEP', '7'))
+
+# Files of a snapshot and the columns written to each
+TABLES = {
+    'companies': COMPANY_FIELDS,
+    'nepse-stocks': QUOTE_FIELDS,
+    'nepse-indices': INDEX_ROW_FIELDS,
+}
+
+MANIFEST = 'manifest.json'
+
+
+def snapshot_dir():
+    return os.getenv('SNAPSHOT_DIR') or DEFAULT_SNAPSHOT_DIR
+
+
+def table_rows(storage, table):
+    if table == 'companies':
+        return storage.companies(fields=TABLES[table])
+    if table == 'nepse-stocks':
+        return storage.stream_quotes(fields=TABLES[table])
+    return storage.stream_index_rows(fields=TABLES[table])
+
+
+# Write rows as gzip CSV without holding more than one chunk; returns the row count
+def write_table(path, rows, fields):
+    count = 0
+
+    def counted():
+        nonlocal count
+        for row in rows:
+            count += 1
+            yield row
+
+    # mtime=0 keeps the file identical when the data is, so checksums only change with the data
+    with open(path, 'wb') as raw, gzip.GzipFile(fileobj=raw, mode='wb', mtime=0) as compressed:
+        for chunk in csv_chunks(counted(), fields):
+            compressed.write(chunk.encode('utf-8'))
+    return count
+
+
+def sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def is_version(name):
+    """Versions are trading dates (YYYY-MM-DD); anything else in the directory is a build in progress"""
+    try:
+        return datetime.date.fromisoformat(name).isoformat() == name
+    except ValueError:
+        return False
+
+
+def versions(path=None):
+    """Complete snapshot versions on disk, newest first"""
+    path = path or snapshot_dir()
+    if not os.path.isdir(path):
+        return []
+    return sorted(
+        (name for name in os.listdir(path) if is_version(name) and os.path.isfile(os.path.join(path, name, MANIFEST))),
+        reverse=True
+    )
+
+
+def read_manifest(version, path=None):
+    if not is_version(version):
+        return None
+    manifest_path = os.path.join(path or snapshot_dir(), version, MANIFEST)
+    if not os.path.isfile(manifest_path):
+        return None
+    with open(manifest_path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def build_snapshot(storage, path=None, force=False):
+    """
+    Dump companies, nepse-stocks and nepse-indices to <version>/<table>.csv.gz,
+    where the version is the latest trading date. The files are written to a
+    temporary directory and swapped in, so a download never sees a partial
+    snapshot. Returns the manifest (None when there is no data).
+    """
+    path = path or snapshot_dir()
+    latest = storage.latest_stock_date()
+    if latest is None:
+        return None
+    version = latest.strftime('%Y-%m-%d')
+    if not force and read_manifest(version, path):
+        return read_manifest(version, path)
+
+    target = os.path.join(path, version)
+    temporary = f"{target}.tmp"
+    shutil.rmtree(temporary, ignore_errors=True)
+    os.makedirs(temporary)
+
+    manifest = {'version': version, 'created_at': datetime.datetime.now().isoformat(timespec='seconds'), 'files': {}}
+    for table, fields in TABLES.items():
+        filename = f"{table}.csv.gz"
+        file_path = os.path.join(temporary, filename)
+        rows = write_table(file_path, table_rows(storage, table), fields)
+        manifest['files'][filename] = {
+            'table': table, 'rows': rows, 'columns': list(fields),
+            'bytes': os.path.getsize(file_path), 'sha256': sha256(file_path)
+        }
+    with open(os.path.join(temporary, MANIFEST), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+
+    old = f"{target}.old"
+    shutil.rmtree(old, ignore_errors=True)
+    if os.path.isdir(target):
+        os.replace(target, old)
+    os.replace(temporary, target)
+    shutil.rmtree(old, ignore_errors=True)
+
+    for expired in versions(path)[SNAPSHOT_KEEP:]:
+        shutil.rmtree(os.path.join(path, expired), ignore_errors=True)
+    return manifest
+
@@ -48,7 +48,7 @@ document.addEventListener('DOMContentLoaded', function() {
 
     async function loadSymbolData(type, id) {
         try {
-            const response = await fetch(`/charts/api/data?type=${type}&id=${id}`);
+            const response = await fetch(`/charts/api/data?type=${type}&id=${encodeURIComponent(id)}`);
             const data = await response.json();
             
             if (data && data.length > 0) {
@@ -290,7 +290,7 @@ document.addEventListener('DOMContentLoaded', function() {
         suggestionsContainer.innerHTML = items.map((item, index) => `
             <div class="suggestion-item ${index === 0 ? 'selected' : ''}" data-index="${index}">
                 <span class="suggestion-symbol">${item.symbol}</span>
-                <span class="suggestion-name">${item.isIndex ? 'Index' : item.name}</span>
+                <span class="suggestion-name">${item.isIndex ? 'Index' : item.isSector ? 'Sector' : item.name}</span>
             </div>
         `).join('');
         
@@ -302,7 +302,7 @@ document.addEventListener('DOMContentLoaded', function() {
         
         hideSearch();  // Hide search immediately when selection is made
         // For both companies and indices, use the symbol
-        loadSymbolData(item.isIndex ? 'index' : 'company', item.symbol);
+        loadSymbolData(item.isIndex ? 'index' : item.isSector ? 'sector' : 'company', item.symbol);
     }
 
     let debounceTimeout;
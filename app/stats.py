@@ -0,0 +1,121 @@
+import os
+import numpy as np
+from pymongo import UpdateOne
+from app.market import daily_returns
+from app.series import forward_fill
+from app.storage.base import to_datetime
+
+# Collection (and SQLite table) holding one statistics document per company
+COMPANY_STATS = os.getenv('COMPANY_STATS', 'company-stats')
+
+# Return periods in trading days (NEPSE trades five days a week)
+RETURN_PERIODS = {'1w': 5, '1m': 21, '3m': 63, '1y': 250}
+
+# Trading days behind the 52-week range, volatility and drawdown, and the turnover average
+YEAR_DAYS = 250
+AVERAGE_DAYS = 63
+
+# Fewest daily returns in the year for a volatility figure
+MIN_VOLATILITY_DAYS = 20
+
+
+def value_or_none(value):
+    value = float(value)
+    return None if np.isnan(value) or np.isinf(value) else round(value, 4)
+
+
+def compute_company_stats(matrix):
+    """
+    One statistics document per company that traded in the matrix window,
+    computed for every company at once from the dates x companies matrices
+    of a MarketMatrix (app/market.py).
+    """
+    dates, company_ids, symbols, values = matrix.snapshot()
+    if not len(dates) or not len(company_ids):
+        return []
+
+    raw_closes = values['close']
+    closes = forward_fill(raw_closes.T).T
+    last_close = closes[-1]
+    traded = ~np.isnan(raw_closes)
+
+    # fmax/fmin reductions skip NaN and give NaN for companies with no rows, without warnings
+    year = slice(-YEAR_DAYS, None)
+    high = np.fmax.reduce(values['high'][year], axis=0)
+    low = np.fmin.reduce(values['low'][year], axis=0)
+
+    stats = {
+        'last_close': last_close,
+        'high_52w': high,
+        'low_52w': low,
+    }
+    with np.errstate(divide='ignore', invalid='ignore'):
+        stats['pct_from_high_52w'] = (1 - last_close / high) * 100
+
+        for name, days in RETURN_PERIODS.items():
+            base = closes[-1 - days] if len(dates) > days else np.full(len(company_ids), np.nan)
+            stats[f"return_{name}"] = (last_close / base - 1) * 100
+
+        # Annualized standard deviation of daily returns, in percent
+        returns = daily_returns(closes)[year]
+        valid = ~np.isnan(returns)
+        count = valid.sum(axis=0)
+        filled = np.where(valid, returns, 0.0)
+        mean = filled.sum(axis=0) / count
+        variance = (np.where(valid, returns - mean, 0.0) ** 2).sum(axis=0) / (count - 1)
+        stats['volatility_1y'] = np.where(count >= MIN_VOLATILITY_DAYS, np.sqrt(variance * YEAR_DAYS) * 100, np.nan)
+
+        # Largest fall from a running peak within the year, in percent (negative)
+        window = closes[year]
+        drawdown = (window / np.fmax.accumulate(window, axis=0) - 1) * 100
+        stats['max_drawdown_1y'] = np.fmin.reduce(drawdown, axis=0)
+
+    # Days without trades count as zero turnover
+    for name, field in (('avg_turnover_3m', 'traded_amount'), ('avg_volume_3m', 'traded_quantity')):
+        recent = values[field][-AVERAGE_DAYS:]
+        stats[name] = np.where(np.isnan(recent), 0.0, recent).mean(axis=0)
+
+    # Row of each company's most recent trade
+    last_traded = len(dates) - 1 - np.argmax(traded[::-1], axis=0)
+    as_of = to_datetime(dates[-1].item())
+
+    documents = []
+    for column in np.flatnonzero(traded.any(axis=0)):
+        document = {
+            'company_id': int(company_ids[column]),
+            'symbol': symbols[column],
+            'as_of': as_of,
+            'last_traded': to_datetime(dates[last_traded[column]].item()),
+        }
+        for name, column_values in stats.items():
+            document[name] = value_or_none(column_values[column])
+        documents.append(document)
+    return documents
+
+
+# Replace every company's statistics document; matrix defaults to a fresh load of the database
+def update_company_stats(db, matrix=None):
+    from app.market import MarketMatrix
+    from app.storage.mongo import MongoStore
+
+    if matrix is None:
+        matrix = MarketMatrix().load(MongoStore(db))
+    documents = compute_company_stats(matrix)
+    if documents:
+        db[COMPANY_STATS].bulk_write([
+            UpdateOne({'company_id': document['company_id']}, {'$set': document}, upsert=True) for document in documents
+        ], ordered=False)
+    return len(documents)
+
+
+# Post-ingest hook: recompute the statistics from the refreshed market matrix (needs a writable connection)
+def refresh_company_stats(app):
+    def refresh(trading_date):
+        from app import get_admin_db, get_storage
+        from app.market import market_matrix
+        with app.app_context():
+            market_matrix.refresh(get_storage())
+        written = update_company_stats(get_admin_db(), market_matrix)
+        print(f"Updated statistics for {written} companies")
+    refresh.__name__ = 'refresh_company_stats'
+    return refresh
@@ -0,0 +1,278 @@
+import datetime
+import json
+import os
+import shutil
+import numpy as np
+from app.storage.base import INDEX_FIELDS, STOCK_FIELDS
+
+# Default location of the columnar history archive
+DEFAULT_ARCHIVE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'archive')
+
+# Column dtypes; missing numbers are stored as NaN
+STOCK_DTYPES = {'company_id': np.int32, 'published_date': 'datetime64[D]', **dict.fromkeys(STOCK_FIELDS, np.float64)}
+INDEX_DTYPES = {'index_id': np.int32, 'published_date': 'datetime64[D]', **dict.fromkeys(INDEX_FIELDS, np.float64)}
+
+MANIFEST = 'manifest.json'
+
+
+def archive_dir():
+    return os.getenv('ARCHIVE_DIR') or DEFAULT_ARCHIVE_DIR
+
+
+# Turn documents into typed column arrays
+def to_columns(documents, dtypes):
+    columns = {}
+    for name, dtype in dtypes.items():
+        if name == 'published_date':
+            values = [np.datetime64(document[name].date() if isinstance(document[name], datetime.datetime) else document[name], 'D')
+                      for document in documents]
+        elif dtype is np.float64:
+            values = [np.nan if document.get(name) is None else document[name] for document in documents]
+        else:
+            values = [document[name] for document in documents]
+        columns[name] = np.asarray(values, dtype=dtype)
+    return columns
+
+
+def read_partition(path, mmap=True):
+    """Load every column of a partition; with mmap the arrays are read-only views of the files"""
+    if not os.path.isdir(path):
+        return None
+    return {
+        name[:-4]: np.load(os.path.join(path, name), mmap_mode='r' if mmap else None)
+        for name in os.listdir(path) if name.endswith('.npy')
+    }
+
+
+def write_partition(path, columns):
+    """Write a partition to a temporary directory and swap it in, so readers never see half a partition"""
+    temporary = f"{path}.tmp"
+    shutil.rmtree(temporary, ignore_errors=True)
+    os.makedirs(temporary)
+    for name, values in columns.items():
+        np.save(os.path.join(temporary, f"{name}.npy"), values)
+    if os.path.isdir(path):
+        # Open memory maps keep the old files alive until they are closed
+        old = f"{path}.old"
+        shutil.rmtree(old, ignore_errors=True)
+        os.replace(path, old)
+        os.replace(temporary, path)
+        shutil.rmtree(old, ignore_errors=True)
+    else:
+        os.replace(temporary, path)
+
+
+def merge_partition(path, columns, keys):
+    """
+    Append rows to a partition. Rows whose keys already exist are replaced
+    by the new ones, and the result is sorted by keys (last key first in
+    priority order, as in numpy.lexsort).
+    """
+    existing = read_partition(path, mmap=False)
+    if existing:
+        columns = {name: np.concatenate([existing[name], columns[name]]) for name in columns}
+    order = np.lexsort([columns[key] for key in reversed(keys)])
+    columns = {name: values[order] for name, values in columns.items()}
+
+    # After a stable sort the newest copy of a duplicated key is the last of its run
+    count = len(columns[keys[0]])
+    keep = np.ones(count, dtype=bool)
+    if count > 1:
+        same = np.ones(count - 1, dtype=bool)
+        for key in keys:
+            same &= columns[key][1:] == columns[key][:-1]
+        keep[:-1] = ~same
+    write_partition(path, {name: values[keep] for name, values in columns.items()})
+    return int(keep.sum())
+
+
+# Columnar copy of nepse-stocks and nepse-indices for fast local reads
+class HistoryArchive:
+    """
+    Daily history stored as one .npy file per column, in three partition sets:
+
+        stocks/company/<company_id>/   one company's history, by date
+        stocks/year/<year>/            every company for one year, by date then company
+        indices/<index_id>/            one index's history, by date
+
+    Readers memory-map the files, so loading a company's history or a
+    day's cross-section does not parse or copy the data. manifest.json
+    records symbols and the latest archived dates for incremental appends.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or archive_dir()
+        self._manifest = None
+
+    # Manifest
+    @property
+    def manifest(self):
+        if self._manifest is None:
+            manifest_path = os.path.join(self.path, MANIFEST)
+            if os.path.isfile(manifest_path):
+                with open(manifest_path, encoding='utf-8') as f:
+                    self._manifest = json.load(f)
+            else:
+                self._manifest = {'symbols': {}, 'index_names': {}, 'stocks_through': None, 'indices_through': None}
+        return self._manifest
+
+    def save_manifest(self):
+        os.makedirs(self.path, exist_ok=True)
+        temporary = os.path.join(self.path, f"{MANIFEST}.tmp")
+        with open(temporary, 'w', encoding='utf-8') as f:
+            json.dump(self.manifest, f, indent=2)
+        os.replace(temporary, os.path.join(self.path, MANIFEST))
+
+    def through(self, kind):
+        """Latest archived date for 'stocks' or 'indices'"""
+        value = self.manifest.get(f"{kind}_through")
+        return datetime.datetime.fromisoformat(value) if value else None
+
+    # Writing
+    def append_stocks(self, documents):
+        """Merge stock documents into the company and year partitions; returns rows appended"""
+        if not documents:
+            return 0
+        columns = to_columns(documents, STOCK_DTYPES)
+        for document in documents:
+            if document.get('company_symbol'):
+                self.manifest['symbols'][str(document['company_id'])] = document['company_symbol']
+
+        for company_id in np.unique(columns['company_id']):
+            mask = columns['company_id'] == company_id
+            merge_partition(
+                os.path.join(self.path, 'stocks', 'company', str(company_id)),
+                {name: values[mask] for name, values in columns.items()},
+                ['published_date']
+            )
+        years = columns['published_date'].astype('datetime64[Y]').astype(int) + 1970
+        for year in np.unique(years):
+            mask = years == year
+            merge_partition(
+                os.path.join(self.path, 'stocks', 'year', str(year)),
+                {name: values[mask] for name, values in columns.items()},
+                ['published_date', 'company_id']
+            )
+
+        latest = columns['published_date'].max().item()
+        current = self.through('stocks')
+        if current is None or latest > current.date():
+            self.manifest['stocks_through'] = latest.isoformat()
+        return len(documents)
+
+    def append_indices(self, documents):
+        """Merge index documents into the per-index partitions; returns rows appended"""
+        if not documents:
+            return 0
+        columns = to_columns(documents, INDEX_DTYPES)
+        for document in documents:
+            if document.get('index_name'):
+                self.manifest['index_names'][str(document['index_id'])] = document['index_name']
+
+        for index_id in np.unique(columns['index_id']):
+            mask = columns['index_id'] == index_id
+            merge_partition(
+                os.path.join(self.path, 'indices', str(index_id)),
+                {name: values[mask] for name, values in columns.items()},
+                ['published_date']
+            )
+
+        latest = columns['published_date'].max().item()
+        current = self.through('indices')
+        if current is None or latest > current.date():
+            self.manifest['indices_through'] = latest.isoformat()
+        return len(documents)
+
+    # Reading
+    def company_id(self, symbol):
+        for company_id, known in self.manifest['symbols'].items():
+            if known == symbol:
+                return int(company_id)
+        return None
+
+    def company_history(self, company, start=None, end=None):
+        """Columns of one company's history (company_id or symbol), optionally within [start, end]"""
+        company_id = company if isinstance(company, int) else self.company_id(company)
+        columns = read_partition(os.path.join(self.path, 'stocks', 'company', str(company_id)))
+        return self._date_slice(columns, start, end)
+
+    def index_history(self, index, start=None, end=None):
+        """Columns of one index's history (index_id or index_name)"""
+        index_id = index
+        if not isinstance(index, int):
+            index_id = next((int(key) for key, name in self.manifest['index_names'].items() if name == index), None)
+        columns = read_partition(os.path.join(self.path, 'indices', str(index_id)))
+        return self._date_slice(columns, start, end)
+
+    def year(self, year):
+        """Every company's rows for one year, sorted by date then company"""
+        return read_partition(os.path.join(self.path, 'stocks', 'year', str(year)))
+
+    def cross_section(self, date):
+        """Every company's row on one date"""
+        day = np.datetime64(date.date() if isinstance(date, datetime.datetime) else date, 'D')
+        columns = self.year(day.astype('datetime64[Y]').astype(int) + 1970)
+        if columns is None:
+            return None
+        dates = columns['published_date']
+        lo, hi = np.searchsorted(dates, day, 'left'), np.searchsorted(dates, day, 'right')
+        return {name: values[lo:hi] for name, values in columns.items()}
+
+    def stream_stocks(self, company_ids=None, start=None, end=None, chunk_size=5000):
+        """
+        Stock rows within [start, end] as column chunks of at most chunk_size
+        rows: by date then company from the year partitions, or by company
+        then date when company_ids is given. Only one chunk is copied out of
+        the memory maps at a time.
+        """
+        if company_ids is not None:
+            partitions = (self.company_history(int(company_id), start, end) for company_id in sorted(company_ids))
+        else:
+            years_path = os.path.join(self.path, 'stocks', 'year')
+            years = sorted(int(name) for name in os.listdir(years_path) if name.isdigit()) if os.path.isdir(years_path) else []
+            years = [year for year in years if (not start or year >= start.year) and (not end or year <= end.year)]
+            partitions = (self._date_slice(self.year(year), start, end) for year in years)
+        for columns in partitions:
+            if not columns:
+                continue
+            for offset in range(0, len(columns['published_date']), chunk_size):
+                yield {name: np.array(values[offset:offset + chunk_size]) for name, values in columns.items()}
+
+    @staticmethod
+    def _date_slice(columns, start, end):
+        if columns is None or (start is None and end is None):
+            return columns
+        dates = columns['published_date']
+        lo = np.searchsorted(dates, np.datetime64(start, 'D'), 'left') if start else 0
+        hi = np.searchsorted(dates, np.datetime64(end, 'D'), 'right') if end else len(dates)
+        return {name: values[lo:hi] for name, values in columns.items()}
+
+
+# Copy new rows from MongoDB into the archive (everything when full=True); the latest archived day is
+# copied again, so rows stored late for it replace the archived ones
+def export_archive(db, archive=None, full=False, batch_size=200000):
+    from app.storage.base import INDEX_ROW_FIELDS, QUOTE_FIELDS
+    from app.storage.mongo import projection
+
+    archive = archive or HistoryArchive()
+    if full:
+        shutil.rmtree(archive.path, ignore_errors=True)
+        archive._manifest = None
+
+    counts = {}
+    for kind, collection, fields, append in (
+        ('stocks', db[os.getenv('NEPSE_STOCKS', 'nepse-stocks')], QUOTE_FIELDS, archive.append_stocks),
+        ('indices', db[os.getenv('NEPSE_INDICES', 'nepse-indices')], INDEX_ROW_FIELDS, archive.append_indices),
+    ):
+        since = archive.through(kind)
+        query = {'published_date': {'$gte': since}} if since else {}
+        counts[kind] = 0
+        batch = []
+        for document in collection.find(query, projection(fields)).batch_size(10000):
+            batch.append(document)
+            if len(batch) >= batch_size:
+                counts[kind] += append(batch)
+                batch = []
+        counts[kind] += append(batch)
+    archive.save_manifest()
+    return counts
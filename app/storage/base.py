@@ -0,0 +1,154 @@
+import datetime
+
+# Numeric fields of a nepse-stocks row
+STOCK_FIELDS = ('open', 'high', 'low', 'close', 'per_change', 'traded_quantity', 'traded_amount')
+
+# Numeric fields of a nepse-indices row
+INDEX_FIELDS = ('open', 'high', 'low', 'current', 'change_', 'per_change', 'turnover')
+
+# Numeric fields of a sector-series row (app/sectors.py)
+SECTOR_FIELDS = (
+    'equal_weight', 'turnover_weight', 'equal_weight_change', 'turnover_weight_change',
+    'turnover', 'volume', 'advances', 'declines', 'unchanged', 'constituents'
+)
+SECTOR_COUNT_FIELDS = ('advances', 'declines', 'unchanged', 'constituents')
+
+# Numeric fields of a company-stats document (app/stats.py)
+COMPANY_STATS_FIELDS = (
+    'last_close', 'high_52w', 'low_52w', 'pct_from_high_52w', 'return_1w', 'return_1m', 'return_3m', 'return_1y',
+    'volatility_1y', 'max_drawdown_1y', 'avg_turnover_3m', 'avg_volume_3m'
+)
+
+# Numeric fields of a market-turnover row (app/turnover.py)
+TURNOVER_SERIES_FIELDS = ('turnover', 'stock_turnover', 'volume', 'traded')
+
+# Projections: the fields each access pattern reads, so backends fetch nothing else
+COMPANY_FIELDS = ('company_id', 'symbol', 'companyname', 'sector')
+COMPANY_LIST_FIELDS = ('company_id', 'symbol', 'companyname')
+QUOTE_FIELDS = ('company_id', 'company_symbol', 'published_date') + STOCK_FIELDS
+CHART_FIELDS = ('published_date', 'open', 'high', 'low', 'close', 'traded_quantity')
+BATCH_FIELDS = ('company_id',) + CHART_FIELDS
+PRICE_FIELDS = ('company_id', 'close', 'per_change')
+TURNOVER_FIELDS = ('close', 'traded_quantity', 'traded_amount')
+ACTIVE_FIELDS = ('company_id', 'company_symbol', 'published_date', 'close', 'per_change', 'traded_quantity', 'traded_amount')
+INDEX_ROW_FIELDS = ('index_id', 'index_name', 'published_date') + INDEX_FIELDS
+INDEX_CHART_FIELDS = ('published_date', 'open', 'high', 'low', 'current')
+SECTOR_ROW_FIELDS = ('sector', 'published_date') + SECTOR_FIELDS
+SECTOR_CHART_FIELDS = ('published_date', 'equal_weight', 'turnover_weight', 'turnover', 'volume', 'advances', 'declines')
+STATS_FIELDS = ('company_id', 'symbol', 'as_of', 'last_traded') + COMPANY_STATS_FIELDS
+TURNOVER_ROW_FIELDS = ('published_date',) + TURNOVER_SERIES_FIELDS
+
+
+def to_datetime(value):
+    """Convert a date, datetime or YYYY-MM-DD string to a datetime at midnight (None stays None)"""
+    if value is None or isinstance(value, datetime.datetime):
+        return value
+    if isinstance(value, datetime.date):
+        return datetime.datetime(value.year, value.month, value.day)
+    return datetime.datetime.strptime(str(value).strip()[:10], '%Y-%m-%d')
+
+
+# Data-access interface used by the read-only web routes
+class DataStore:
+    """
+    Read access to companies, daily stock quotes, index values and the
+    precomputed sector series.
+
+    Rows are returned as dicts shaped like the MongoDB documents, with
+    published_date as a datetime. Each query takes the fields it needs
+    (one of the projections above) and only those fields are returned.
+
+    Backends: MongoStore (the live database) and SQLiteStore (an embedded
+    file for local and offline use), selected with STORAGE_BACKEND.
+    """
+
+    name = None
+
+    # Companies
+    def count_companies(self):
+        raise NotImplementedError
+
+    def companies(self, skip=0, limit=0, fields=COMPANY_FIELDS):
+        """Companies sorted by symbol"""
+        raise NotImplementedError
+
+    def get_company(self, company_id=None, symbol=None, fields=COMPANY_FIELDS):
+        raise NotImplementedError
+
+    def search_companies(self, text, limit=10, fields=COMPANY_LIST_FIELDS):
+        """Companies whose symbol or name contains text (case-insensitive)"""
+        raise NotImplementedError
+
+    def resolve_companies(self, symbols=(), company_ids=(), fields=COMPANY_FIELDS):
+        """Companies matching any of the symbols or company_ids, in one query"""
+        raise NotImplementedError
+
+    def company_stats(self, company_id, fields=STATS_FIELDS):
+        """Precomputed statistics of one company (app/stats.py), or None"""
+        raise NotImplementedError
+
+    # Stock quotes
+    def latest_stock_date(self):
+        raise NotImplementedError
+
+    def quotes(self, company_id, start=None, end=None, limit=0, newest_first=False, fields=QUOTE_FIELDS):
+        """Daily quotes of one company within [start, end]"""
+        raise NotImplementedError
+
+    def quotes_for(self, company_ids, start=None, end=None, fields=BATCH_FIELDS):
+        """Daily quotes of several companies within [start, end], by company then date, in one query"""
+        raise NotImplementedError
+
+    def stream_quotes(self, company_ids=None, start=None, end=None, fields=QUOTE_FIELDS):
+        """
+        Iterator over quotes within [start, end], read in batches rather than
+        loaded at once: every company by date, or company_ids by company then date
+        """
+        raise NotImplementedError
+
+    def quotes_on(self, date, company_ids=None, fields=QUOTE_FIELDS):
+        """Quotes of every company (or only company_ids) on one date"""
+        raise NotImplementedError
+
+    def market_summary(self, date, top=8, fields=ACTIVE_FIELDS):
+        """Most active stocks by traded amount and total turnover on one date"""
+        raise NotImplementedError
+
+    # Indices
+    def latest_index_date(self):
+        raise NotImplementedError
+
+    def index_names(self, text=None):
+        """Distinct index names, optionally only those containing text"""
+        raise NotImplementedError
+
+    def indices_on(self, date, fields=INDEX_ROW_FIELDS):
+        raise NotImplementedError
+
+    def index_on(self, index_name, date, fields=INDEX_ROW_FIELDS):
+        raise NotImplementedError
+
+    def index_history(self, index_name, start=None, end=None, fields=INDEX_ROW_FIELDS):
+        """Values of one index within [start, end], oldest first"""
+        raise NotImplementedError
+
+    def index_histories(self, index_names, start=None, end=None, fields=INDEX_ROW_FIELDS):
+        """Values of several indices within [start, end], by index name then date, in one query"""
+        raise NotImplementedError
+
+    def stream_index_rows(self, index_names=None, start=None, end=None, fields=INDEX_ROW_FIELDS):
+        """Iterator over index values within [start, end]: every index by date, or index_names by name then date"""
+        raise NotImplementedError
+
+    # Sector series (precomputed from constituent stocks by app/sectors.py)
+    def sector_names(self):
+        raise NotImplementedError
+
+    def sector_history(self, sector, start=None, end=None, fields=SECTOR_ROW_FIELDS):
+        """Aggregates of one sector within [start, end], oldest first"""
+        raise NotImplementedError
+
+    # Market turnover series (precomputed per trading day by app/turnover.py)
+    def turnover_history(self, start=None, end=None, fields=TURNOVER_ROW_FIELDS):
+        """Market turnover of each trading day within [start, end], oldest first"""
+        raise NotImplementedError
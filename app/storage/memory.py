@@ -0,0 +1,575 @@
+import collections
+import copy
+import datetime
+import heapq
+import os
+import re
+import threading
+from bson import ObjectId
+from pymongo.operations import InsertOne, UpdateOne
+from pymongo.results import BulkWriteResult, DeleteResult, InsertManyResult, InsertOneResult, UpdateResult
+
+
+# Value of a dotted field path, or None when it is missing
+def get_field(document, path):
+    value = document
+    for part in path.split('.'):
+        if not isinstance(value, dict) or part not in value:
+            return None
+        value = value[part]
+    return value
+
+
+def _compare_key(value):
+    """Sort key that orders None first and never compares unlike types"""
+    if value is None:
+        return (0, 0)
+    if isinstance(value, bool):
+        return (1, value)
+    if isinstance(value, (int, float)):
+        return (2, value)
+    if isinstance(value, str):
+        return (3, value)
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return (4, value)
+    return (5, str(value))
+
+
+# Marks a field removed by $unset
+_UNSET = object()
+
+# BSON type aliases accepted by $type
+_TYPES = {'string': str, 'date': datetime.datetime, 'double': float, 'int': int, 'bool': bool}
+
+
+def _match_operator(value, operator, operand):
+    if operator == '$eq':
+        return value == operand
+    if operator == '$ne':
+        return value != operand
+    if operator == '$in':
+        return value in operand
+    if operator == '$nin':
+        return value not in operand
+    if operator == '$exists':
+        return (value is not None) == bool(operand)
+    if operator == '$regex':
+        return isinstance(value, str) and re.search(operand, value) is not None
+    if operator == '$type':
+        return isinstance(value, _TYPES[operand])
+    if operator in ('$gt', '$gte', '$lt', '$lte'):
+        if value is None or _compare_key(value)[0] != _compare_key(operand)[0]:
+            return False
+        return {'$gt': value > operand, '$gte': value >= operand, '$lt': value < operand, '$lte': value <= operand}[operator]
+    raise NotImplementedError(f"Query operator {operator} is not supported by the in-memory database")
+
+
+def matches(document, query):
+    """True if a document satisfies a Mongo filter (the subset of operators the app uses)"""
+    for key, condition in (query or {}).items():
+        if key == '$or':
+            if not any(matches(document, clause) for clause in condition):
+                return False
+        elif key == '$and':
+            if not all(matches(document, clause) for clause in condition):
+                return False
+        elif isinstance(condition, dict) and any(name.startswith('$') for name in condition):
+            value = get_field(document, key)
+            if '$regex' in condition:
+                flags = re.IGNORECASE if 'i' in condition.get('$options', '') else 0
+                condition = {**condition, '$regex': re.compile(condition['$regex'], flags)}
+            for operator, operand in condition.items():
+                if operator != '$options' and not _match_operator(value, operator, operand):
+                    return False
+        elif get_field(document, key) != condition:
+            return False
+    return True
+
+
+def prepare(query):
+    """Copy of a filter with $in / $nin lists turned into sets, so each membership test is one lookup"""
+    prepared = {}
+    for key, condition in query.items():
+        if key in ('$or', '$and'):
+            condition = [prepare(clause) for clause in condition]
+        elif isinstance(condition, dict):
+            condition = dict(condition)
+            for operator in ('$in', '$nin'):
+                if operator in condition:
+                    try:
+                        condition[operator] = frozenset(condition[operator])
+                    except TypeError:
+                        pass
+        prepared[key] = condition
+    return prepared
+
+
+def _copy(value):
+    # Scalars (numbers, strings, datetimes, ObjectIds) are immutable; only containers need copying
+    return copy.deepcopy(value) if isinstance(value, (dict, list)) else value
+
+
+def project(document, projection):
+    """Copy of a document with a Mongo inclusion or exclusion projection applied"""
+    if not projection:
+        return {field: _copy(value) for field, value in document.items()}
+    if isinstance(projection, (list, tuple)):
+        projection = dict.fromkeys(projection, 1)
+    included = [field for field, flag in projection.items() if flag and field != '_id']
+    if included:
+        result = {field: _copy(document[field]) for field in included if field in document}
+        if projection.get('_id', 1) and '_id' in document:
+            result['_id'] = document['_id']
+        return result
+    return {field: _copy(value) for field, value in document.items() if projection.get(field, 1)}
+
+
+# Normalize the sort arguments pymongo accepts to [(field, direction), ...]
+def sort_keys(key_or_list, direction=None):
+    if isinstance(key_or_list, str):
+        return [(key_or_list, direction or 1)]
+    if isinstance(key_or_list, dict):
+        return list(key_or_list.items())
+    return list(key_or_list)
+
+
+def sort_documents(documents, keys):
+    # Stable sorts applied from the last key to the first
+    for field, direction in reversed(keys):
+        documents.sort(key=lambda document: _compare_key(get_field(document, field)), reverse=direction < 0)
+    return documents
+
+
+# Expression value for $group ids and accumulators: '$field', a literal, $ifNull, $multiply, or a dict of expressions
+def evaluate(document, expression):
+    if isinstance(expression, str) and expression.startswith('$'):
+        return get_field(document, expression[1:])
+    if isinstance(expression, dict):
+        if '$ifNull' in expression:
+            for argument in expression['$ifNull']:
+                value = evaluate(document, argument)
+                if value is not None:
+                    return value
+            return None
+        if '$multiply' in expression:
+            values = [evaluate(document, argument) for argument in expression['$multiply']]
+            if any(value is None for value in values):
+                return None
+            product = 1
+            for value in values:
+                product *= value
+            return product
+        return {key: evaluate(document, value) for key, value in expression.items()}
+    return expression
+
+
+def group(documents, spec):
+    groups = collections.OrderedDict()
+    for document in documents:
+        key = evaluate(document, spec['_id'])
+        groups.setdefault(repr(key), (key, []))[1].append(document)
+
+    results = []
+    for key, members in groups.values():
+        result = {'_id': key}
+        for name, accumulator in spec.items():
+            if name == '_id':
+                continue
+            (operator, expression), = accumulator.items()
+            values = [evaluate(document, expression) for document in members]
+            numbers = [value for value in values if isinstance(value, (int, float)) and not isinstance(value, bool)]
+            present = [value for value in values if value is not None]
+            if operator == '$sum':
+                result[name] = sum(numbers)
+            elif operator == '$avg':
+                result[name] = sum(numbers) / len(numbers) if numbers else None
+            elif operator == '$min':
+                result[name] = min(present, key=_compare_key) if present else None
+            elif operator == '$max':
+                result[name] = max(present, key=_compare_key) if present else None
+            elif operator == '$first':
+                result[name] = values[0] if values else None
+            elif operator == '$last':
+                result[name] = values[-1] if values else None
+            elif operator == '$push':
+                result[name] = values
+            elif operator == '$addToSet':
+                result[name] = list(dict.fromkeys(present))
+            else:
+                raise NotImplementedError(f"Accumulator {operator} is not supported by the in-memory database")
+        results.append(result)
+    return results
+
+
+# Cursor over a query; the query runs when the cursor is first iterated
+class MemoryCursor:
+
+    def __init__(self, collection, query=None, projection=None):
+        self.collection = collection
+        self.query = query or {}
+        self.projection = projection
+        self._sort = []
+        self._skip = 0
+        self._limit = 0
+        self._results = None
+
+    def sort(self, key_or_list, direction=None):
+        self._sort = sort_keys(key_or_list, direction)
+        return self
+
+    def skip(self, count):
+        self._skip = count
+        return self
+
+    def limit(self, count):
+        self._limit = count
+        return self
+
+    def batch_size(self, size):
+        return self
+
+    def distinct(self, key):
+        return self.collection.distinct(key, self.query)
+
+    def _execute(self):
+        documents = self.collection.select(self.query)
+        if self._limit and len(self._sort) == 1:
+            # Top-k selection instead of sorting the whole collection (latest date, most active)
+            (field, direction), = self._sort
+            pick = heapq.nlargest if direction < 0 else heapq.nsmallest
+            documents = pick(self._skip + self._limit, documents, key=lambda document: _compare_key(get_field(document, field)))
+        else:
+            documents = sort_documents(documents, self._sort)
+        documents = documents[self._skip:]
+        if self._limit:
+            documents = documents[:self._limit]
+        return [project(document, self.projection) for document in documents]
+
+    def __iter__(self):
+        if self._results is None:
+            self._results = self._execute()
+        return iter(self._results)
+
+
+class MemoryCollection:
+    """
+    A list of documents with the pymongo Collection calls the app makes.
+    Fields passed to create_index get a hash index, so equality and $in
+    filters on company_id, published_date, symbol and index_name do not
+    scan the whole collection.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.documents = []
+        self._indexes = {}
+        self._lock = threading.RLock()
+
+    # Indexes
+    def create_index(self, keys, **kwargs):
+        field = sort_keys(keys)[0][0]
+        with self._lock:
+            if field not in self._indexes:
+                index = collections.defaultdict(list)
+                for document in self.documents:
+                    index[get_field(document, field)].append(document)
+                self._indexes[field] = index
+        return f"{field}_hash"
+
+    def list_indexes(self):
+        return [{'name': f"{field}_hash", 'key': {field: 1}} for field in self._indexes]
+
+    def select(self, query):
+        """Documents matching query, using a hash index on the first indexed equality or $in field"""
+        with self._lock:
+            candidates = self.documents
+            for field, condition in (query or {}).items():
+                if field not in self._indexes:
+                    continue
+                if isinstance(condition, dict) and set(condition) == {'$in'}:
+                    found = {id(document): document for value in condition['$in'] for document in self._indexes[field].get(value, [])}
+                    candidates = list(found.values())
+                    break
+                if not isinstance(condition, dict):
+                    candidates = self._indexes[field].get(condition, [])
+                    break
+            if not query:
+                return list(candidates)
+            query = prepare(query)
+            return [document for document in candidates if matches(document, query)]
+
+    # Reads
+    def find(self, filter=None, projection=None, sort=None, skip=0, limit=0):
+        cursor = MemoryCursor(self, filter, projection).skip(skip).limit(limit)
+        return cursor.sort(sort) if sort else cursor
+
+    def find_one(self, filter=None, projection=None, sort=None):
+        return next(iter(self.find(filter, projection, sort=sort, limit=1)), None)
+
+    def count_documents(self, filter):
+        return len(self.select(filter))
+
+    def estimated_document_count(self):
+        return len(self.documents)
+
+    def distinct(self, key, filter=None):
+        values = [get_field(document, key) for document in self.select(filter)]
+        return list(dict.fromkeys(value for value in values if value is not None))
+
+    def aggregate(self, pipeline, **kwargs):
+        documents = None
+        for stage in pipeline:
+            (operator, spec), = stage.items()
+            if operator == '$match':
+                documents = self.select(spec) if documents is None else [document for document in documents if matches(document, spec)]
+                continue
+            if documents is None:
+                documents = self.select({})
+            if operator == '$sort':
+                documents = sort_documents(list(documents), sort_keys(spec))
+            elif operator == '$skip':
+                documents = documents[spec:]
+            elif operator == '$limit':
+                documents = documents[:spec]
+            elif operator == '$project':
+                documents = [project(document, spec) for document in documents]
+            elif operator == '$group':
+                documents = group(documents, spec)
+            elif operator == '$count':
+                documents = [{spec: len(documents)}]
+            else:
+                raise NotImplementedError(f"Pipeline stage {operator} is not supported by the in-memory database")
+        documents = self.select({}) if documents is None else documents
+        return iter([project(document, None) for document in documents])
+
+    # Writes
+    def insert_many(self, documents):
+        ids = []
+        with self._lock:
+            for document in documents:
+                document = dict(document)
+                document.setdefault('_id', ObjectId())
+                self.documents.append(document)
+                for field, index in self._indexes.items():
+                    index[get_field(document, field)].append(document)
+                ids.append(document['_id'])
+        return InsertManyResult(ids, True)
+
+    def insert_one(self, document):
+        return InsertOneResult(self.insert_many([document]).inserted_ids[0], True)
+
+    def update_one(self, filter, update, upsert=False):
+        """$set, $unset and $inc of top-level fields"""
+        with self._lock:
+            found = self.select(filter)
+            if not found:
+                if upsert:
+                    document = {k: v for k, v in filter.items() if not k.startswith('$') and not isinstance(v, dict)}
+                    document.update(update.get('$set', {}))
+                    document.update(update.get('$inc', {}))
+                    inserted = self.insert_one(document)
+                    return UpdateResult({'n': 1, 'nModified': 0, 'upserted': inserted.inserted_id}, True)
+                return UpdateResult({'n': 0, 'nModified': 0}, True)
+            document = found[0]
+            changes = dict(update.get('$set', {}))
+            for field, amount in update.get('$inc', {}).items():
+                changes[field] = (document.get(field) or 0) + amount
+            for field in update.get('$unset', {}):
+                changes[field] = _UNSET
+            for field, value in changes.items():
+                if field in self._indexes:
+                    self._indexes[field][get_field(document, field)].remove(document)
+                    self._indexes[field][None if value is _UNSET else value].append(document)
+                if value is _UNSET:
+                    document.pop(field, None)
+                else:
+                    document[field] = value
+            return UpdateResult({'n': 1, 'nModified': 1}, True)
+
+    def replace_one(self, filter, replacement, upsert=False):
+        with self._lock:
+            found = self.select(filter)
+            if not found:
+                if upsert:
+                    inserted = self.insert_one(replacement)
+                    return UpdateResult({'n': 1, 'nModified': 0, 'upserted': inserted.inserted_id}, True)
+                return UpdateResult({'n': 0, 'nModified': 0}, True)
+            document = found[0]
+            for field, index in self._indexes.items():
+                index[get_field(document, field)].remove(document)
+            document_id = document['_id']
+            document.clear()
+            document.update(replacement, _id=document_id)
+            for field, index in self._indexes.items():
+                index[get_field(document, field)].append(document)
+            return UpdateResult({'n': 1, 'nModified': 1}, True)
+
+    def bulk_write(self, requests, ordered=True):
+        """InsertOne and UpdateOne requests, applied in order"""
+        counts = {'nInserted': 0, 'nUpserted': 0, 'nMatched': 0, 'nModified': 0, 'nRemoved': 0, 'upserted': []}
+        with self._lock:
+            for position, request in enumerate(requests):
+                if isinstance(request, InsertOne):
+                    self.insert_one(request._doc)
+                    counts['nInserted'] += 1
+                elif isinstance(request, UpdateOne):
+                    result = self.update_one(request._filter, request._doc, upsert=bool(request._upsert))
+                    if result.upserted_id is not None:
+                        counts['nUpserted'] += 1
+                        counts['upserted'].append({'index': position, '_id': result.upserted_id})
+                    else:
+                        counts['nMatched'] += result.matched_count
+                        counts['nModified'] += result.modified_count
+                else:
+                    raise NotImplementedError(f"{type(request).__name__} is not supported by the in-memory database")
+        return BulkWriteResult(counts, True)
+
+    def delete_one(self, filter):
+        with self._lock:
+            found = self.select(filter)
+            if not found:
+                return DeleteResult({'n': 0}, True)
+            document = found[0]
+            self.documents.remove(document)
+            for field, index in self._indexes.items():
+                index[get_field(document, field)].remove(document)
+            return DeleteResult({'n': 1}, True)
+
+    def delete_many(self, filter):
+        with self._lock:
+            found = {id(document) for document in self.select(filter)}
+            self.documents = [document for document in self.documents if id(document) not in found]
+            for field, index in self._indexes.items():
+                for value in list(index):
+                    index[value] = [document for document in index[value] if id(document) not in found]
+            return DeleteResult({'n': len(found)}, True)
+
+
+# Stand-in for a pymongo Database held entirely in memory
+class MemoryDatabase:
+    """
+    Deterministic offline database for development, load tests and
+    profiling without MongoDB. Collections are created on first access,
+    like pymongo's, and hold plain documents.
+    """
+
+    def __init__(self, name='heisenstocks'):
+        self.name = name
+        self._collections = {}
+        self._lock = threading.Lock()
+
+    def __getitem__(self, name):
+        with self._lock:
+            if name not in self._collections:
+                self._collections[name] = MemoryCollection(name)
+            return self._collections[name]
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return self[name]
+
+    def list_collection_names(self):
+        return list(self._collections)
+
+    def command(self, name, *args, **kwargs):
+        if name == 'ping':
+            return {'ok': 1.0}
+        raise NotImplementedError(f"Command {name} is not supported by the in-memory database")
+
+    def create_required_indexes(self):
+        from app.indexes import REQUIRED_INDEXES
+        for collection_name, indexes in REQUIRED_INDEXES.items():
+            for keys in indexes:
+                self[collection_name].create_index(keys)
+        self[os.getenv('NEPSE_STOCKS', 'nepse-stocks')].create_index([('company_id', 1)])
+
+
+# Fill a memory database with generated (ReplayData.synthetic) or recorded (from_fixtures) data
+def seed_replay_data(db, data):
+    from app.scripts.fetch_new_indices_data import index_mapping
+    from app.scripts.row_parser import parse_index_row, parse_stock_row
+
+    symbols = {company['company_id']: company['symbol'] for company in data.companies}
+    db[os.getenv('COMPANIES_COLLECTION', 'companies')].insert_many(data.companies)
+    db[os.getenv('NEPSE_STOCKS', 'nepse-stocks')].insert_many(
+        parse_stock_row(row, company_id, symbols.get(company_id))
+        for company_id, rows in sorted(data.company_rows.items())
+        for row in reversed(rows)
+    )
+    db[os.getenv('NEPSE_INDICES', 'nepse-indices')].insert_many(
+        parse_index_row({**row, 'index_id': index_id}, index_mapping.get(str(index_id), f"Unknown Index ({index_id})"))
+        for index_id, rows in sorted(data.index_rows.items())
+        for row in reversed(rows)
+    )
+
+
+# Fill a memory database from a history archive snapshot (see app/storage/archive.py)
+def seed_archive(db, archive):
+    import numpy as np
+
+    def documents(columns, extra):
+        names = list(columns)
+        for row in zip(*(columns[name].tolist() for name in names)):
+            document = dict(zip(names, row))
+            document['published_date'] = datetime.datetime.combine(document['published_date'], datetime.time())
+            for name, value in document.items():
+                if isinstance(value, float) and np.isnan(value):
+                    document[name] = None
+            document.update(extra(document))
+            yield document
+
+    symbols = archive.manifest['symbols']
+    index_names = archive.manifest['index_names']
+    db[os.getenv('COMPANIES_COLLECTION', 'companies')].insert_many(
+        {'company_id': int(company_id), 'symbol': symbol} for company_id, symbol in sorted(symbols.items(), key=lambda item: int(item[0]))
+    )
+    for company_id in sorted(symbols, key=int):
+        columns = archive.company_history(int(company_id))
+        if columns is not None:
+            db[os.getenv('NEPSE_STOCKS', 'nepse-stocks')].insert_many(
+                documents(columns, lambda document: {'company_symbol': symbols[str(document['company_id'])]})
+            )
+    for index_id in sorted(index_names, key=int):
+        columns = archive.index_history(int(index_id))
+        if columns is not None:
+            db[os.getenv('NEPSE_INDICES', 'nepse-indices')].insert_many(
+                documents(columns, lambda document: {'index_name': index_names[str(document['index_id'])]})
+            )
+
+
+def create_memory_database():
+    """
+    Build the offline database. MEMORY_SNAPSHOT names a history archive
+    directory to load; otherwise MEMORY_COMPANIES x MEMORY_DAYS of synthetic
+    data are generated from MEMORY_SEED, so every run sees the same data.
+    MEMORY_ADMIN_PASSWORD adds an admin user for the admin pages.
+    """
+    db = MemoryDatabase(os.getenv('DATABASE_NAME', 'heisenstocks'))
+    db.create_required_indexes()
+
+    snapshot = os.getenv('MEMORY_SNAPSHOT')
+    if snapshot:
+        from app.storage.archive import HistoryArchive
+        seed_archive(db, HistoryArchive(snapshot))
+    else:
+        from app.scripts.replay_server import ReplayData
+        seed_replay_data(db, ReplayData.synthetic(
+            int(os.getenv('MEMORY_COMPANIES', '50')), int(os.getenv('MEMORY_DAYS', '500')), int(os.getenv('MEMORY_SEED', '42'))
+        ))
+
+    from app.sectors import update_sector_series
+    from app.stats import update_company_stats
+    from app.turnover import update_turnover_series
+    update_sector_series(db)
+    update_company_stats(db)
+    update_turnover_series(db)
+
+    if os.getenv('MEMORY_ADMIN_PASSWORD'):
+        from werkzeug.security import generate_password_hash
+        db[os.getenv('USERS_COLLECTION', 'users')].insert_one({
+            'username': os.getenv('MEMORY_ADMIN_USERNAME', 'admin'),
+            'password': generate_password_hash(os.getenv('MEMORY_ADMIN_PASSWORD')),
+            'is_admin': True
+        })
+    return db
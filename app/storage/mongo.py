@@ -0,0 +1,166 @@
+import os
+import re
+from app.storage.base import (
+    ACTIVE_FIELDS, BATCH_FIELDS, COMPANY_FIELDS, COMPANY_LIST_FIELDS, DataStore, INDEX_ROW_FIELDS, QUOTE_FIELDS, SECTOR_ROW_FIELDS,
+    STATS_FIELDS, TURNOVER_ROW_FIELDS, to_datetime
+)
+
+# Projection returning only published_date: answered from the published_date index alone
+DATE_ONLY = {'published_date': 1, '_id': 0}
+
+
+# Documents per cursor batch when streaming; the driver holds one batch at a time
+STREAM_BATCH_SIZE = int(os.getenv('STREAM_BATCH_SIZE', '2000'))
+
+
+# Mongo projection for a tuple of fields, without _id
+def projection(fields):
+    return {**dict.fromkeys(fields, 1), '_id': 0}
+
+
+# MongoDB implementation of the data-access interface
+class MongoStore(DataStore):
+    """Reads the nepse-stocks, nepse-indices and companies collections of a pymongo database, and the precomputed sector-series, company-stats and market-turnover"""
+
+    name = 'mongo'
+
+    def __init__(self, db):
+        self.db = db
+        self.stocks = db[os.getenv('NEPSE_STOCKS', 'nepse-stocks')]
+        self.indices = db[os.getenv('NEPSE_INDICES', 'nepse-indices')]
+        self.company_collection = db[os.getenv('COMPANIES_COLLECTION', 'companies')]
+        self.sector_series = db[os.getenv('SECTOR_SERIES', 'sector-series')]
+        self.stats = db[os.getenv('COMPANY_STATS', 'company-stats')]
+        self.turnover = db[os.getenv('TURNOVER_SERIES', 'market-turnover')]
+
+    @staticmethod
+    def _date_range(start, end):
+        date_query = {}
+        if start:
+            date_query['$gte'] = to_datetime(start)
+        if end:
+            date_query['$lte'] = to_datetime(end)
+        return date_query
+
+    def count_companies(self):
+        return self.company_collection.count_documents({})
+
+    def companies(self, skip=0, limit=0, fields=COMPANY_FIELDS):
+        return list(self.company_collection.find({}, projection(fields)).sort('symbol', 1).skip(skip).limit(limit))
+
+    def get_company(self, company_id=None, symbol=None, fields=COMPANY_FIELDS):
+        query = {'company_id': company_id} if company_id is not None else {'symbol': symbol}
+        return self.company_collection.find_one(query, projection(fields))
+
+    def search_companies(self, text, limit=10, fields=COMPANY_LIST_FIELDS):
+        pattern = re.escape(text)
+        return list(self.company_collection.find({
+            '$or': [
+                {'symbol': {'$regex': pattern, '$options': 'i'}},
+                {'companyname': {'$regex': pattern, '$options': 'i'}}
+            ]
+        }, projection(fields)).limit(limit))
+
+    def resolve_companies(self, symbols=(), company_ids=(), fields=COMPANY_FIELDS):
+        return list(self.company_collection.find({
+            '$or': [{'symbol': {'$in': list(symbols)}}, {'company_id': {'$in': list(company_ids)}}]
+        }, projection(fields)))
+
+    def company_stats(self, company_id, fields=STATS_FIELDS):
+        return self.stats.find_one({'company_id': company_id}, projection(fields))
+
+    def latest_stock_date(self):
+        latest = self.stocks.find_one({}, DATE_ONLY, sort=[('published_date', -1)])
+        return latest['published_date'] if latest else None
+
+    def quotes(self, company_id, start=None, end=None, limit=0, newest_first=False, fields=QUOTE_FIELDS):
+        query = {'company_id': company_id}
+        date_query = self._date_range(start, end)
+        if date_query:
+            query['published_date'] = date_query
+        cursor = self.stocks.find(query, projection(fields)).sort('published_date', -1 if newest_first else 1)
+        return list(cursor.limit(limit))
+
+    def quotes_for(self, company_ids, start=None, end=None, fields=BATCH_FIELDS):
+        # The $in bounds on the (company_id, published_date, ...) index return rows already in this order
+        query = {'company_id': {'$in': list(company_ids)}}
+        date_query = self._date_range(start, end)
+        if date_query:
+            query['published_date'] = date_query
+        return list(self.stocks.find(query, projection(fields)).sort([('company_id', 1), ('published_date', 1)]))
+
+    def stream_quotes(self, company_ids=None, start=None, end=None, fields=QUOTE_FIELDS):
+        query = {'company_id': {'$in': list(company_ids)}} if company_ids is not None else {}
+        date_query = self._date_range(start, end)
+        if date_query:
+            query['published_date'] = date_query
+        order = [('company_id', 1), ('published_date', 1)] if company_ids is not None else [('published_date', 1)]
+        return self.stocks.find(query, projection(fields)).sort(order).batch_size(STREAM_BATCH_SIZE)
+
+    def quotes_on(self, date, company_ids=None, fields=QUOTE_FIELDS):
+        query = {'published_date': to_datetime(date)}
+        if company_ids is not None:
+            query['company_id'] = {'$in': list(company_ids)}
+        return list(self.stocks.find(query, projection(fields)))
+
+    def market_summary(self, date, top=8, fields=ACTIVE_FIELDS):
+        # Two index-backed queries: the top rows come straight off (published_date, traded_amount),
+        # which a $sort inside $facet cannot use
+        day = to_datetime(date)
+        most_active = list(self.stocks.find({'published_date': day}, projection(fields)).sort('traded_amount', -1).limit(top))
+        result = list(self.stocks.aggregate([
+            {'$match': {'published_date': day}},
+            {'$group': {'_id': None, 'total': {'$sum': '$traded_amount'}}}
+        ]))
+        return most_active, result[0]['total'] if result else 0
+
+    def latest_index_date(self):
+        latest = self.indices.find_one({}, DATE_ONLY, sort=[('published_date', -1)])
+        return latest['published_date'] if latest else None
+
+    def index_names(self, text=None):
+        query = {'index_name': {'$regex': re.escape(text), '$options': 'i'}} if text else {}
+        return sorted(self.indices.distinct('index_name', query))
+
+    def indices_on(self, date, fields=INDEX_ROW_FIELDS):
+        return list(self.indices.find({'published_date': to_datetime(date)}, projection(fields)))
+
+    def index_on(self, index_name, date, fields=INDEX_ROW_FIELDS):
+        return self.indices.find_one({'index_name': index_name, 'published_date': to_datetime(date)}, projection(fields))
+
+    def index_history(self, index_name, start=None, end=None, fields=INDEX_ROW_FIELDS):
+        query = {'index_name': index_name}
+        date_query = self._date_range(start, end)
+        if date_query:
+            query['published_date'] = date_query
+        return list(self.indices.find(query, projection(fields)).sort('published_date', 1))
+
+    def index_histories(self, index_names, start=None, end=None, fields=INDEX_ROW_FIELDS):
+        query = {'index_name': {'$in': list(index_names)}}
+        date_query = self._date_range(start, end)
+        if date_query:
+            query['published_date'] = date_query
+        return list(self.indices.find(query, projection(fields)).sort([('index_name', 1), ('published_date', 1)]))
+
+    def stream_index_rows(self, index_names=None, start=None, end=None, fields=INDEX_ROW_FIELDS):
+        query = {'index_name': {'$in': list(index_names)}} if index_names is not None else {}
+        date_query = self._date_range(start, end)
+        if date_query:
+            query['published_date'] = date_query
+        order = [('index_name', 1), ('published_date', 1)] if index_names is not None else [('published_date', 1)]
+        return self.indices.find(query, projection(fields)).sort(order).batch_size(STREAM_BATCH_SIZE)
+
+    def sector_names(self):
+        return sorted(self.sector_series.distinct('sector'))
+
+    def sector_history(self, sector, start=None, end=None, fields=SECTOR_ROW_FIELDS):
+        query = {'sector': sector}
+        date_query = self._date_range(start, end)
+        if date_query:
+            query['published_date'] = date_query
+        return list(self.sector_series.find(query, projection(fields)).sort('published_date', 1))
+
+    def turnover_history(self, start=None, end=None, fields=TURNOVER_ROW_FIELDS):
+        date_query = self._date_range(start, end)
+        query = {'published_date': date_query} if date_query else {}
+        return list(self.turnover.find(query, projection(fields)).sort('published_date', 1))
@@ -0,0 +1,384 @@
+import datetime
+import os
+import pathlib
+import sqlite3
+import threading
+from app.storage.base import (
+    ACTIVE_FIELDS, BATCH_FIELDS, COMPANY_FIELDS, COMPANY_LIST_FIELDS, COMPANY_STATS_FIELDS, DataStore, INDEX_FIELDS, INDEX_ROW_FIELDS,
+    QUOTE_FIELDS, SECTOR_COUNT_FIELDS, SECTOR_FIELDS, SECTOR_ROW_FIELDS, STATS_FIELDS, STOCK_FIELDS,
+    TURNOVER_ROW_FIELDS, TURNOVER_SERIES_FIELDS, to_datetime
+)
+
+# Default location of the embedded database file
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'heisenstocks.sqlite3')
+
+# Tables are clustered on (id, published_date) so a company's or index's history is one range scan
+SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS companies (
+    company_id INTEGER PRIMARY KEY,
+    symbol TEXT NOT NULL,
+    companyname TEXT,
+    sector TEXT
+);
+CREATE INDEX IF NOT EXISTS companies_symbol ON companies (symbol);
+
+CREATE TABLE IF NOT EXISTS stocks (
+    company_id INTEGER NOT NULL,
+    company_symbol TEXT,
+    published_date TEXT NOT NULL,
+    {', '.join(f'{field} REAL' for field in STOCK_FIELDS)},
+    PRIMARY KEY (company_id, published_date)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS stocks_date ON stocks (published_date, traded_amount);
+
+CREATE TABLE IF NOT EXISTS indices (
+    index_id INTEGER NOT NULL,
+    index_name TEXT,
+    published_date TEXT NOT NULL,
+    {', '.join(f'{field} REAL' for field in INDEX_FIELDS)},
+    PRIMARY KEY (index_id, published_date)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS indices_name_date ON indices (index_name, published_date);
+CREATE INDEX IF NOT EXISTS indices_date ON indices (published_date);
+
+CREATE TABLE IF NOT EXISTS sectors (
+    sector TEXT NOT NULL,
+    published_date TEXT NOT NULL,
+    {', '.join(f"{field} {'INTEGER' if field in SECTOR_COUNT_FIELDS else 'REAL'}" for field in SECTOR_FIELDS)},
+    PRIMARY KEY (sector, published_date)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS company_stats (
+    company_id INTEGER PRIMARY KEY,
+    symbol TEXT,
+    as_of TEXT,
+    last_traded TEXT,
+    {', '.join(f'{field} REAL' for field in COMPANY_STATS_FIELDS)}
+);
+
+CREATE TABLE IF NOT EXISTS turnover (
+    published_date TEXT PRIMARY KEY,
+    {', '.join(f"{field} {'INTEGER' if field == 'traded' else 'REAL'}" for field in TURNOVER_SERIES_FIELDS)}
+);
+"""
+
+STOCK_COLUMNS = ('company_id', 'company_symbol', 'published_date') + STOCK_FIELDS
+INDEX_COLUMNS = ('index_id', 'index_name', 'published_date') + INDEX_FIELDS
+COMPANY_COLUMNS = ('company_id', 'symbol', 'companyname', 'sector')
+SECTOR_COLUMNS = ('sector', 'published_date') + SECTOR_FIELDS
+STATS_COLUMNS = STATS_FIELDS
+TURNOVER_COLUMNS = TURNOVER_ROW_FIELDS
+
+
+def to_date_text(value):
+    """Dates are stored as YYYY-MM-DD text, which sorts chronologically"""
+    if value is None:
+        return None
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.strftime('%Y-%m-%d')
+    return to_datetime(value).strftime('%Y-%m-%d')
+
+
+# SELECT list for a projection; field names are checked against the table's columns
+def select_list(fields, columns):
+    unknown = set(fields) - set(columns)
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(sorted(unknown))}")
+    return ', '.join(fields)
+
+
+# LIKE pattern matching text anywhere, with wildcards in text escaped
+def like_pattern(text):
+    return '%' + text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+
+
+def row_to_dict(row):
+    document = dict(row)
+    for field in ('published_date', 'as_of', 'last_traded'):
+        if document.get(field) is not None:
+            document[field] = to_datetime(document[field])
+    return document
+
+
+# Embedded SQLite implementation of the data-access interface
+class SQLiteStore(DataStore):
+    """
+    Reads market data from a single SQLite file built with
+    app/scripts/build_embedded_db.py. Each thread gets its own connection;
+    the web app opens the file read-only.
+    """
+
+    name = 'sqlite'
+
+    def __init__(self, path=None, read_only=True):
+        self.path = path or os.getenv('SQLITE_PATH') or DEFAULT_PATH
+        self.read_only = read_only
+        self._local = threading.local()
+
+    def connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            if self.read_only:
+                if not os.path.isfile(self.path):
+                    raise FileNotFoundError(f"Embedded database not found: {self.path} (build it with app/scripts/build_embedded_db.py)")
+                connection = sqlite3.connect(f"{pathlib.Path(self.path).resolve().as_uri()}?mode=ro", uri=True)
+            else:
+                os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+                connection = sqlite3.connect(self.path)
+                connection.executescript(SCHEMA)
+            connection.row_factory = sqlite3.Row
+            self._local.connection = connection
+        return connection
+
+    def close(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is not None:
+            connection.close()
+            self._local.connection = None
+
+    def _all(self, sql, params=()):
+        return [row_to_dict(row) for row in self.connection().execute(sql, params)]
+
+    def _stream(self, sql, params=()):
+        # sqlite3 cursors step through the result, so rows are never all in memory
+        for row in self.connection().execute(sql, params):
+            yield row_to_dict(row)
+
+    def _one(self, sql, params=()):
+        row = self.connection().execute(sql, params).fetchone()
+        return row_to_dict(row) if row else None
+
+    @staticmethod
+    def _date_range(start, end, where, params):
+        if start:
+            where.append('published_date >= ?')
+            params.append(to_date_text(start))
+        if end:
+            where.append('published_date <= ?')
+            params.append(to_date_text(end))
+
+    # Loading (used by the build script)
+    def write_companies(self, companies):
+        rows = [tuple(company.get(column) for column in COMPANY_COLUMNS) for company in companies]
+        with self.connection() as connection:
+            connection.executemany(f"INSERT OR REPLACE INTO companies VALUES ({', '.join('?' * len(COMPANY_COLUMNS))})", rows)
+        return len(rows)
+
+    def write_stocks(self, documents):
+        rows = [
+            tuple(to_date_text(document.get(column)) if column == 'published_date' else document.get(column) for column in STOCK_COLUMNS)
+            for document in documents
+        ]
+        with self.connection() as connection:
+            connection.executemany(f"INSERT OR REPLACE INTO stocks VALUES ({', '.join('?' * len(STOCK_COLUMNS))})", rows)
+        return len(rows)
+
+    def write_indices(self, documents):
+        rows = [
+            tuple(to_date_text(document.get(column)) if column == 'published_date' else document.get(column) for column in INDEX_COLUMNS)
+            for document in documents
+        ]
+        with self.connection() as connection:
+            connection.executemany(f"INSERT OR REPLACE INTO indices VALUES ({', '.join('?' * len(INDEX_COLUMNS))})", rows)
+        return len(rows)
+
+    def write_sectors(self, documents):
+        rows = [
+            tuple(to_date_text(document.get(column)) if column == 'published_date' else document.get(column) for column in SECTOR_COLUMNS)
+            for document in documents
+        ]
+        with self.connection() as connection:
+            connection.executemany(f"INSERT OR REPLACE INTO sectors VALUES ({', '.join('?' * len(SECTOR_COLUMNS))})", rows)
+        return len(rows)
+
+    def write_company_stats(self, documents):
+        rows = [
+            tuple(to_date_text(document.get(column)) if column in ('as_of', 'last_traded') else document.get(column) for column in STATS_COLUMNS)
+            for document in documents
+        ]
+        with self.connection() as connection:
+            connection.executemany(f"INSERT OR REPLACE INTO company_stats VALUES ({', '.join('?' * len(STATS_COLUMNS))})", rows)
+        return len(rows)
+
+    def write_turnover(self, documents):
+        rows = [
+            tuple(to_date_text(document.get(column)) if column == 'published_date' else document.get(column) for column in TURNOVER_COLUMNS)
+            for document in documents
+        ]
+        with self.connection() as connection:
+            connection.executemany(f"INSERT OR REPLACE INTO turnover VALUES ({', '.join('?' * len(TURNOVER_COLUMNS))})", rows)
+        return len(rows)
+
+    def stock_day_totals(self):
+        """Per-date stock turnover, volume and traded count, summed by SQLite (the input of app/turnover.py)"""
+        return self._stream(
+            'SELECT published_date, SUM(COALESCE(traded_amount, close * traded_quantity)) AS stock_turnover, '
+            'SUM(traded_quantity) AS volume, COUNT(*) AS traded FROM stocks GROUP BY published_date ORDER BY published_date'
+        )
+
+    # Companies
+    def count_companies(self):
+        return self.connection().execute('SELECT COUNT(*) FROM companies').fetchone()[0]
+
+    def companies(self, skip=0, limit=0, fields=COMPANY_FIELDS):
+        return self._all(
+            f"SELECT {select_list(fields, COMPANY_COLUMNS)} FROM companies ORDER BY symbol LIMIT ? OFFSET ?", (limit or -1, skip)
+        )
+
+    def get_company(self, company_id=None, symbol=None, fields=COMPANY_FIELDS):
+        columns = select_list(fields, COMPANY_COLUMNS)
+        if company_id is not None:
+            return self._one(f"SELECT {columns} FROM companies WHERE company_id = ?", (company_id,))
+        return self._one(f"SELECT {columns} FROM companies WHERE symbol = ?", (symbol,))
+
+    def search_companies(self, text, limit=10, fields=COMPANY_LIST_FIELDS):
+        # LIKE is case-insensitive for ASCII in SQLite
+        pattern = like_pattern(text)
+        return self._all(
+            f"SELECT {select_list(fields, COMPANY_COLUMNS)} FROM companies WHERE symbol LIKE ? ESCAPE '\\' OR companyname LIKE ? ESCAPE '\\' ORDER BY symbol LIMIT ?",
+            (pattern, pattern, limit)
+        )
+
+    def resolve_companies(self, symbols=(), company_ids=(), fields=COMPANY_FIELDS):
+        symbols, company_ids = list(symbols), list(company_ids)
+        return self._all(
+            f"SELECT {select_list(fields, COMPANY_COLUMNS)} FROM companies "
+            f"WHERE symbol IN ({', '.join('?' * len(symbols)) or 'NULL'}) OR company_id IN ({', '.join('?' * len(company_ids)) or 'NULL'})",
+            symbols + company_ids
+        )
+
+    def company_stats(self, company_id, fields=STATS_FIELDS):
+        return self._one(f"SELECT {select_list(fields, STATS_COLUMNS)} FROM company_stats WHERE company_id = ?", (company_id,))
+
+    # Stock quotes
+    def latest_stock_date(self):
+        value = self.connection().execute('SELECT MAX(published_date) FROM stocks').fetchone()[0]
+        return to_datetime(value)
+
+    def quotes(self, company_id, start=None, end=None, limit=0, newest_first=False, fields=QUOTE_FIELDS):
+        where, params = ['company_id = ?'], [company_id]
+        self._date_range(start, end, where, params)
+        order = 'DESC' if newest_first else 'ASC'
+        return self._all(
+            f"SELECT {select_list(fields, STOCK_COLUMNS)} FROM stocks WHERE {' AND '.join(where)} ORDER BY published_date {order} LIMIT ?",
+            params + [limit or -1]
+        )
+
+    def quotes_for(self, company_ids, start=None, end=None, fields=BATCH_FIELDS):
+        company_ids = list(company_ids)
+        if not company_ids:
+            return []
+        where, params = [f"company_id IN ({', '.join('?' * len(company_ids))})"], company_ids
+        self._date_range(start, end, where, params)
+        return self._all(
+            f"SELECT {select_list(fields, STOCK_COLUMNS)} FROM stocks WHERE {' AND '.join(where)} ORDER BY company_id, published_date",
+            params
+        )
+
+    def stream_quotes(self, company_ids=None, start=None, end=None, fields=QUOTE_FIELDS):
+        where, params = [], []
+        if company_ids is not None:
+            company_ids = list(company_ids)
+            where.append(f"company_id IN ({', '.join('?' * len(company_ids)) or 'NULL'})")
+            params.extend(company_ids)
+        self._date_range(start, end, where, params)
+        order = 'company_id, published_date' if company_ids is not None else 'published_date, company_id'
+        return self._stream(
+            f"SELECT {select_list(fields, STOCK_COLUMNS)} FROM stocks {'WHERE ' + ' AND '.join(where) if where else ''} ORDER BY {order}",
+            params
+        )
+
+    def quotes_on(self, date, company_ids=None, fields=QUOTE_FIELDS):
+        sql = f"SELECT {select_list(fields, STOCK_COLUMNS)} FROM stocks WHERE published_date = ?"
+        params = [to_date_text(date)]
+        if company_ids is not None:
+            company_ids = list(company_ids)
+            if not company_ids:
+                return []
+            sql += f" AND company_id IN ({', '.join('?' * len(company_ids))})"
+            params.extend(company_ids)
+        return self._all(sql, params)
+
+    def market_summary(self, date, top=8, fields=ACTIVE_FIELDS):
+        day = to_date_text(date)
+        most_active = self._all(
+            f"SELECT {select_list(fields, STOCK_COLUMNS)} FROM stocks WHERE published_date = ? ORDER BY traded_amount DESC LIMIT ?",
+            (day, top)
+        )
+        total = self.connection().execute(
+            'SELECT SUM(traded_amount) FROM stocks WHERE published_date = ?', (day,)
+        ).fetchone()[0]
+        return most_active, total or 0
+
+    # Indices
+    def latest_index_date(self):
+        value = self.connection().execute('SELECT MAX(published_date) FROM indices').fetchone()[0]
+        return to_datetime(value)
+
+    def index_names(self, text=None):
+        if text:
+            pattern = like_pattern(text)
+            rows = self.connection().execute(
+                "SELECT DISTINCT index_name FROM indices WHERE index_name LIKE ? ESCAPE '\\' ORDER BY index_name", (pattern,)
+            )
+        else:
+            rows = self.connection().execute('SELECT DISTINCT index_name FROM indices ORDER BY index_name')
+        return [row[0] for row in rows if row[0]]
+
+    def indices_on(self, date, fields=INDEX_ROW_FIELDS):
+        return self._all(
+            f"SELECT {select_list(fields, INDEX_COLUMNS)} FROM indices WHERE published_date = ? ORDER BY index_id", (to_date_text(date),)
+        )
+
+    def index_on(self, index_name, date, fields=INDEX_ROW_FIELDS):
+        return self._one(
+            f"SELECT {select_list(fields, INDEX_COLUMNS)} FROM indices WHERE index_name = ? AND published_date = ?",
+            (index_name, to_date_text(date))
+        )
+
+    def index_history(self, index_name, start=None, end=None, fields=INDEX_ROW_FIELDS):
+        where, params = ['index_name = ?'], [index_name]
+        self._date_range(start, end, where, params)
+        return self._all(f"SELECT {select_list(fields, INDEX_COLUMNS)} FROM indices WHERE {' AND '.join(where)} ORDER BY published_date", params)
+
+    def index_histories(self, index_names, start=None, end=None, fields=INDEX_ROW_FIELDS):
+        index_names = list(index_names)
+        if not index_names:
+            return []
+        where, params = [f"index_name IN ({', '.join('?' * len(index_names))})"], index_names
+        self._date_range(start, end, where, params)
+        return self._all(
+            f"SELECT {select_list(fields, INDEX_COLUMNS)} FROM indices WHERE {' AND '.join(where)} ORDER BY index_name, published_date",
+            params
+        )
+
+    def stream_index_rows(self, index_names=None, start=None, end=None, fields=INDEX_ROW_FIELDS):
+        where, params = [], []
+        if index_names is not None:
+            index_names = list(index_names)
+            where.append(f"index_name IN ({', '.join('?' * len(index_names)) or 'NULL'})")
+            params.extend(index_names)
+        self._date_range(start, end, where, params)
+        order = 'index_name, published_date' if index_names is not None else 'published_date, index_id'
+        return self._stream(
+            f"SELECT {select_list(fields, INDEX_COLUMNS)} FROM indices {'WHERE ' + ' AND '.join(where) if where else ''} ORDER BY {order}",
+            params
+        )
+
+    # Sector series
+    def sector_names(self):
+        return [row[0] for row in self.connection().execute('SELECT DISTINCT sector FROM sectors ORDER BY sector')]
+
+    def sector_history(self, sector, start=None, end=None, fields=SECTOR_ROW_FIELDS):
+        where, params = ['sector = ?'], [sector]
+        self._date_range(start, end, where, params)
+        return self._all(f"SELECT {select_list(fields, SECTOR_COLUMNS)} FROM sectors WHERE {' AND '.join(where)} ORDER BY published_date", params)
+
+    # Market turnover series
+    def turnover_history(self, start=None, end=None, fields=TURNOVER_ROW_FIELDS):
+        where, params = [], []
+        self._date_range(start, end, where, params)
+        return self._all(
+            f"SELECT {select_list(fields, TURNOVER_COLUMNS)} FROM turnover {'WHERE ' + ' AND '.join(where) if where else ''} ORDER BY published_date",
+            params
+        )
@@ -0,0 +1,78 @@
+import os
+from pymongo import UpdateOne
+from app.storage.base import to_datetime
+
+# Collection (and SQLite table) holding one market turnover document per trading day
+TURNOVER_SERIES = os.getenv('TURNOVER_SERIES', 'market-turnover')
+
+# Index whose published turnover is preferred over the sum of stock rows
+TURNOVER_INDEX = os.getenv('TURNOVER_INDEX', 'NEPSE Index')
+
+# Traded amount of a stock row, or close x quantity when the amount is missing
+STOCK_AMOUNT = {'$ifNull': ['$traded_amount', {'$multiply': ['$close', '$traded_quantity']}]}
+
+# Documents written per bulk write
+WRITE_BATCH = 5000
+
+
+def day_totals_pipeline(query):
+    """Per-date stock totals, summed by the database instead of loading every row"""
+    return [
+        {'$match': query},
+        {'$group': {
+            '_id': '$published_date',
+            'stock_turnover': {'$sum': STOCK_AMOUNT},
+            'volume': {'$sum': '$traded_quantity'},
+            'traded': {'$sum': 1},
+        }},
+        {'$sort': {'_id': 1}},
+    ]
+
+
+def compute_turnover_series(day_totals, index_rows):
+    """
+    One document per trading day from per-date stock totals (published_date,
+    stock_turnover, volume, traded) and the TURNOVER_INDEX rows. turnover is
+    the index's published figure when there is one, the stock sum otherwise.
+    """
+    index_turnover = {}
+    for row in index_rows:
+        if row.get('turnover') is not None:
+            index_turnover[to_datetime(row['published_date'])] = row['turnover']
+
+    for day in day_totals:
+        date = to_datetime(day['published_date'])
+        stock_turnover = float(day.get('stock_turnover') or 0)
+        published = index_turnover.get(date)
+        yield {
+            'published_date': date,
+            'turnover': stock_turnover if published is None else published,
+            'stock_turnover': stock_turnover,
+            'volume': float(day.get('volume') or 0),
+            'traded': int(day.get('traded') or 0),
+        }
+
+
+# Recompute turnover from the latest stored day onwards (everything when full=True); documents are
+# upserted, so a day stored while its stock rows were still arriving is corrected
+def update_turnover_series(db, full=False):
+    collection = db[TURNOVER_SERIES]
+    if full:
+        collection.delete_many({})
+    latest = collection.find_one({}, {'published_date': 1, '_id': 0}, sort=[('published_date', -1)])
+    query = {'published_date': {'$gte': latest['published_date']}} if latest else {}
+
+    days = (
+        dict(day, published_date=day['_id'])
+        for day in db[os.getenv('NEPSE_STOCKS', 'nepse-stocks')].aggregate(day_totals_pipeline(query), allowDiskUse=True)
+    )
+    index_rows = db[os.getenv('NEPSE_INDICES', 'nepse-indices')].find(
+        dict(query, index_name=TURNOVER_INDEX), {'published_date': 1, 'turnover': 1, '_id': 0}
+    )
+    documents = list(compute_turnover_series(days, index_rows))
+    for start in range(0, len(documents), WRITE_BATCH):
+        collection.bulk_write([
+            UpdateOne({'published_date': document['published_date']}, {'$set': document}, upsert=True)
+            for document in documents[start:start + WRITE_BATCH]
+        ], ordered=False)
+    return len(documents)
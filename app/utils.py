@@ -1,8 +1,5 @@
 from flask import current_app
 from app import get_db
-from datetime import datetime, timedelta
-import csv
-import io
 import json
 import locale
 
@@ -105,26 +102,9 @@ def get_company_stock_data(company_id, limit=30, start_date=None, end_date=None)
     ).limit(limit if not (start_date or end_date) else 0))
 
 def export_to_csv(data, fields):
-    """Export data to CSV format"""
-    output = io.StringIO()
-    writer = csv.DictWriter(output, fieldnames=fields)
-    writer.writeheader()
-    
-    for row in data:
-        # Convert any non-serializable objects (like ObjectId) to string
-        clean_row = {}
-        for key, value in row.items():
-            if key not in fields:
-                continue
-                
-            if isinstance(value, datetime):
-                clean_row[key] = value.strftime('%Y-%m-%d')
-            else:
-                clean_row[key] = value
-        
-        writer.writerow(clean_row)
-    
-    return output.getvalue()
+    """Export data to CSV format (for large ranges stream app.export.csv_chunks instead)"""
+    from app.export import csv_chunks
+    return ''.join(csv_chunks(data, fields))
 
 def get_autocomplete_suggestions(query, max_results=10):
     """Get autocomplete suggestions for the search bar"""
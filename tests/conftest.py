@@ -0,0 +1,18 @@
+import pytest
+from app.storage.memory import create_memory_database
+from app.storage.mongo import MongoStore
+
+
+@pytest.fixture
+def memory_db(monkeypatch):
+    """A small synthetic in-memory database, built fresh for each test"""
+    monkeypatch.setenv('MEMORY_COMPANIES', '12')
+    monkeypatch.setenv('MEMORY_DAYS', '80')
+    monkeypatch.setenv('MEMORY_SEED', '7')
+    monkeypatch.delenv('MEMORY_SNAPSHOT', raising=False)
+    return create_memory_database()
+
+
+@pytest.fixture
+def storage(memory_db):
+    return MongoStore(memory_db)
@@ -0,0 +1,62 @@
+import datetime
+from app.export import archived_quotes
+from app.storage.archive import HistoryArchive, export_archive
+from app.storage.base import QUOTE_FIELDS
+
+
+def rows(items):
+    return [(row['company_id'], row['published_date'].strftime('%Y-%m-%d'), row['close']) for row in items]
+
+
+def archive_until(memory_db, path, cut, late=1):
+    """Archive the stock rows up to cut, except late rows of cut itself that are stored afterwards"""
+    stocks = memory_db['nepse-stocks']
+    held = list(stocks.find({'published_date': {'$gte': cut}}))
+    held_back = [row for row in held if row['published_date'] == cut][:late]
+    stocks.delete_many({'_id': {'$in': [row['_id'] for row in held if row['published_date'] > cut] + [row['_id'] for row in held_back]}})
+    archive = HistoryArchive(str(path))
+    export_archive(memory_db, archive)
+    stocks.insert_many([row for row in held if row['published_date'] > cut or row in held_back])
+    return HistoryArchive(str(path))
+
+
+def test_reads_add_rows_stored_after_the_archive(memory_db, storage, tmp_path):
+    dates = sorted(storage.stocks.distinct('published_date'))
+    archive = archive_until(memory_db, tmp_path, dates[-5], late=0)
+    assert archive.through('stocks').date() == dates[-5].date()
+
+    company_ids = sorted(storage.stocks.distinct('company_id'))[:3]
+    start = dates[-10]
+    expected = storage.stream_quotes(company_ids, start=start, fields=QUOTE_FIELDS)
+    assert rows(archived_quotes(archive, storage, company_ids, start, None, QUOTE_FIELDS)) == rows(expected)
+
+    # By date then company without ids; within a day the database order is kept
+    merged = rows(archived_quotes(archive, storage, None, start, dates[-2], QUOTE_FIELDS))
+    expected = rows(storage.stream_quotes(None, start=start, end=dates[-2], fields=QUOTE_FIELDS))
+    assert sorted(merged) == sorted(expected)
+    assert [date for _, date, _ in merged] == sorted(date for _, date, _ in merged)
+
+
+def test_companies_missing_from_the_archive_come_from_the_database(memory_db, storage, tmp_path):
+    dates = sorted(storage.stocks.distinct('published_date'))
+    archive = archive_until(memory_db, tmp_path, dates[-5], late=0)
+    storage.stocks.insert_one({'company_id': 999, 'company_symbol': 'NEWCO', 'published_date': dates[-8], 'close': 10.0})
+
+    company_ids = [1, 999]
+    merged = rows(archived_quotes(archive, storage, company_ids, dates[-10], None, QUOTE_FIELDS))
+    assert merged == rows(storage.stream_quotes(company_ids, start=dates[-10], fields=QUOTE_FIELDS))
+
+
+def test_export_copies_late_rows_of_the_last_archived_day(memory_db, storage, tmp_path):
+    dates = sorted(storage.stocks.distinct('published_date'))
+    archive = archive_until(memory_db, tmp_path, dates[-5], late=2)
+    day = archive.cross_section(dates[-5])
+    assert len(day['company_id']) == len(storage.quotes_on(dates[-5])) - 2
+
+    export_archive(memory_db, archive)
+    archive = HistoryArchive(str(tmp_path))
+    assert len(archive.cross_section(dates[-5])['company_id']) == len(storage.quotes_on(dates[-5]))
+    assert archive.through('stocks').date() == dates[-1].date()
+    assert len(archive.company_history(1, start=datetime.date(2000, 1, 1))['published_date']) == len(
+        storage.quotes_for([1], fields=QUOTE_FIELDS)
+    )
@@ -0,0 +1,92 @@
+import datetime
+from app.scripts.checkpoint import CheckpointJournal
+from app.storage.memory import MemoryDatabase
+
+
+def journal(db, deferred=False):
+    return CheckpointJournal(db['ingest_checkpoints'], 'stocks', deferred=deferred)
+
+
+def test_new_run_records_pages():
+    db = MemoryDatabase()
+    run = journal(db)
+    assert run.begin() is False
+    run.save_companies([{'company_id': 1, 'symbol': 'NABIL'}])
+    run.start_company(1, 'NABIL', datetime.datetime(2024, 1, 1))
+    run.record_page(1, next_start=50, total_records=120, oldest_date=datetime.datetime(2024, 3, 1), inserted=50)
+    run.record_page(1, next_start=100, total_records=120, oldest_date=None, inserted=50)
+
+    state = db['ingest_checkpoints'].find_one({'_id': 'stocks:1'})
+    assert state['next_start'] == 100
+    assert state['inserted'] == 100
+    assert state['oldest_date'] == datetime.datetime(2024, 3, 1)
+    assert state['status'] == 'in_progress'
+
+
+def test_resume_picks_up_saved_progress():
+    db = MemoryDatabase()
+    first = journal(db)
+    first.begin()
+    first.save_companies([{'company_id': 1, 'symbol': 'NABIL'}])
+    first.start_company(1, 'NABIL', None)
+    first.record_page(1, next_start=50, total_records=120, oldest_date=None, inserted=50)
+
+    resumed = journal(db)
+    assert resumed.begin(resume=True) is True
+    assert resumed.run_id == first.run_id
+    assert resumed.companies == [{'company_id': 1, 'symbol': 'NABIL'}]
+    assert resumed.get_company(1)['next_start'] == 50
+
+    # start_company keeps the saved offset of a company already in progress
+    resumed.start_company(1, 'NABIL', None)
+    assert resumed.get_company(1)['next_start'] == 50
+
+
+def test_resume_without_unfinished_run_starts_a_new_one():
+    db = MemoryDatabase()
+    first = journal(db)
+    first.begin()
+    first.finish({'companies_updated': 0})
+
+    second = journal(db)
+    assert second.begin(resume=True) is False
+    assert second.run_id != first.run_id
+    assert db['ingest_checkpoints'].find_one({'_id': 'stocks'})['status'] == 'running'
+
+
+def test_new_run_clears_company_progress():
+    db = MemoryDatabase()
+    first = journal(db)
+    first.begin()
+    first.start_company(1, 'NABIL', None)
+
+    second = journal(db)
+    second.begin()
+    assert db['ingest_checkpoints'].count_documents({'kind': 'company'}) == 0
+    assert second.get_company(1) is None
+
+
+def test_deferred_updates_are_written_on_flush():
+    db = MemoryDatabase()
+    run = journal(db, deferred=True)
+    run.begin()
+    run.start_company(1, 'NABIL', None)
+    run.record_page(1, next_start=50, total_records=120, oldest_date=None, inserted=50)
+    assert db['ingest_checkpoints'].find_one({'_id': 'stocks:1'}) is None
+
+    run.flush()
+    assert db['ingest_checkpoints'].find_one({'_id': 'stocks:1'})['next_start'] == 50
+
+
+def test_finish_marks_the_run_complete():
+    db = MemoryDatabase()
+    run = journal(db, deferred=True)
+    run.begin()
+    run.start_company(1, 'NABIL', None)
+    run.finish_company(1, 'done')
+    run.finish({'companies_updated': 1})
+
+    document = db['ingest_checkpoints'].find_one({'_id': 'stocks'})
+    assert document['status'] == 'complete'
+    assert document['summary'] == {'companies_updated': 1}
+    assert db['ingest_checkpoints'].find_one({'_id': 'stocks:1'})['status'] == 'done'
@@ -0,0 +1,52 @@
+import flask
+import pytest
+from werkzeug.exceptions import ServiceUnavailable
+import app
+
+
+@pytest.fixture
+def unreachable_mongo(monkeypatch, memory_db):
+    monkeypatch.setenv('STORAGE_BACKEND', 'mongo')
+    monkeypatch.setenv('MONGODB_URI', 'mongodb://127.0.0.1:1/')
+    monkeypatch.setattr(app, '_db_client', None)
+    monkeypatch.setattr(app, '_mongo_reachable', None)
+    monkeypatch.setattr(app, 'MONGO_PING_TIMEOUT', 0.2)
+    monkeypatch.setattr(app, '_memory_db', memory_db)
+    monkeypatch.setattr(app, 'MEMORY_FALLBACK', True)
+    yield memory_db
+    if app._db_client is not None:
+        app._db_client.close()
+
+
+def test_unreachable_mongo_falls_back_to_memory(unreachable_mongo):
+    with flask.Flask(__name__).app_context():
+        assert app.get_db() is unreachable_mongo
+    assert app._mongo_reachable is False
+
+
+def test_unreachable_mongo_fails_without_the_fallback(unreachable_mongo, monkeypatch):
+    monkeypatch.setattr(app, 'MEMORY_FALLBACK', False)
+    with flask.Flask(__name__).app_context():
+        with pytest.raises(ServiceUnavailable):
+            app.get_db()
+
+
+def test_reachability_is_cached(unreachable_mongo, monkeypatch):
+    assert app.mongo_reachable() is False
+    calls = []
+    client = app.get_mongo_client()
+    monkeypatch.setattr(app, 'get_mongo_client', lambda: calls.append(1) or client)
+    with flask.Flask(__name__).app_context():
+        assert app.get_db() is unreachable_mongo
+    assert calls == []
+
+    # After MONGO_RECHECK_SECONDS the server is pinged again
+    monkeypatch.setattr(app, '_mongo_checked_at', 0.0)
+    assert app.mongo_reachable() is False
+    assert calls == [1]
+
+
+def test_reachable_server_is_rechecked(unreachable_mongo, monkeypatch):
+    monkeypatch.setattr(app, '_mongo_reachable', True)
+    monkeypatch.setattr(app, '_mongo_checked_at', 0.0)
+    assert app.mongo_reachable() is False
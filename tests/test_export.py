@@ -0,0 +1,63 @@
+import csv
+import datetime
+import gzip
+import io
+import json
+import math
+import pytest
+from app import export
+
+FIELDS = ['company_id', 'company_symbol', 'published_date', 'close', 'traded_quantity']
+
+
+def quote(number):
+    return {
+        'company_id': number % 3, 'company_symbol': f"C{number % 3}", 'published_date': datetime.datetime(2024, 1, 1) + datetime.timedelta(days=number),
+        'close': math.nan if number == 4 else 100.5 + number, 'traded_quantity': number * 10, 'ignored': 'x'
+    }
+
+
+def expected(rows):
+    return [
+        {field: '' if value is None else str(value) for field, value in ((field, export.clean(row.get(field))) for field in FIELDS)}
+        for row in rows
+    ]
+
+
+@pytest.fixture(autouse=True)
+def small_chunks(monkeypatch):
+    # Several chunks per export, so the chunk boundaries are exercised
+    monkeypatch.setattr(export, 'EXPORT_CHUNK_ROWS', 3)
+
+
+def test_csv_round_trip():
+    rows = [quote(number) for number in range(10)]
+    chunks = list(export.csv_chunks(iter(rows), FIELDS))
+    assert len(chunks) > 2
+    assert list(csv.DictReader(io.StringIO(''.join(chunks)))) == expected(rows)
+
+
+def test_csv_of_no_rows_is_the_header():
+    assert ''.join(export.csv_chunks(iter([]), FIELDS)).strip() == ','.join(FIELDS)
+
+
+def test_ndjson_round_trip():
+    rows = [quote(number) for number in range(10)]
+    lines = ''.join(export.ndjson_chunks(iter(rows), FIELDS)).splitlines()
+    decoded = [json.loads(line) for line in lines]
+    assert [row['published_date'] for row in decoded] == [row['published_date'].strftime('%Y-%m-%d') for row in rows]
+    assert decoded[4]['close'] is None
+    assert decoded[5] == {'company_id': 2, 'company_symbol': 'C2', 'published_date': '2024-01-06', 'close': 105.5, 'traded_quantity': 50}
+
+
+@pytest.mark.parametrize('export_format', ['csv', 'ndjson'])
+def test_gzip_round_trip(export_format):
+    rows = [quote(number) for number in range(10)]
+    text_chunks = export.csv_chunks if export_format == 'csv' else export.ndjson_chunks
+    plain = ''.join(text_chunks(iter(rows), FIELDS))
+    compressed = list(export.gzip_chunks(text_chunks(iter(rows), FIELDS)))
+    assert len(compressed) > 1
+    text = gzip.decompress(b''.join(compressed)).decode('utf-8')
+    assert text == plain
+    if export_format == 'csv':
+        assert list(csv.DictReader(io.StringIO(text))) == expected(rows)
@@ -0,0 +1,128 @@
+import math
+import numpy as np
+import pytest
+from app import indicators
+
+# Straight ports of the loops in app/static/js/indicators/, one series at a time
+
+
+def js_sma(data, period):
+    return [None if i < period - 1 else sum(data[i - period + 1:i + 1]) / period for i in range(len(data))]
+
+
+def js_standard_deviation(data, period):
+    means = js_sma(data, period)
+    return [
+        None if i < period - 1 else math.sqrt(sum((value - means[i]) ** 2 for value in data[i - period + 1:i + 1]) / period)
+        for i in range(len(data))
+    ]
+
+
+def js_true_range(high, low, close):
+    return [high[0] - low[0]] + [
+        max(high[i] - low[i], abs(high[i] - close[i - 1]), abs(low[i] - close[i - 1])) for i in range(1, len(high))
+    ]
+
+
+def js_linear_regression(data, period):
+    result = []
+    for i in range(len(data)):
+        if i < period - 1 or any(value is None for value in data[i - period + 1:i + 1]):
+            result.append(None)
+            continue
+        y = data[i - period + 1:i + 1]
+        x = range(period)
+        sum_x, sum_y = sum(x), sum(y)
+        sum_xy = sum(a * b for a, b in zip(x, y))
+        sum_xx = sum(a * a for a in x)
+        slope = (period * sum_xy - sum_x * sum_y) / (period * sum_xx - sum_x * sum_x)
+        result.append(slope * (period - 1) + (sum_y - slope * sum_x) / period)
+    return result
+
+
+def js_wma(data, period):
+    result = []
+    for i in range(len(data)):
+        window = data[i - period + 1:i + 1] if i >= period - 1 else []
+        if i < period - 1 or any(value is None for value in window):
+            result.append(None)
+            continue
+        result.append(sum(data[i - j] * (period - j) for j in range(period)) / (period * (period + 1) / 2))
+    return result
+
+
+def js_hma(data, period):
+    half, full = js_wma(data, period // 2), js_wma(data, period)
+    diff = [None if a is None or b is None else 2 * a - b for a, b in zip(half, full)]
+    return js_wma(diff, int(math.sqrt(period)))
+
+
+def assert_matches(vectorized, reference):
+    expected = np.array([np.nan if value is None else value for value in reference])
+    np.testing.assert_allclose(vectorized, expected, rtol=1e-9, atol=1e-9, equal_nan=True)
+
+
+@pytest.fixture
+def prices():
+    """Two random-walk price series, dates x companies"""
+    generator = np.random.default_rng(3)
+    close = 100 * np.cumprod(1 + generator.normal(0, 0.02, (120, 2)), axis=0)
+    high = close * (1 + generator.uniform(0, 0.02, close.shape))
+    low = close * (1 - generator.uniform(0, 0.02, close.shape))
+    return close, high, low
+
+
+def test_moving_averages_match_the_chart_code(prices):
+    close, _, _ = prices
+    for column in range(close.shape[1]):
+        series = close[:, column].tolist()
+        assert_matches(indicators.sma(close, 20)[:, column], js_sma(series, 20))
+        assert_matches(indicators.standard_deviation(close, 20)[:, column], js_standard_deviation(series, 20))
+        assert_matches(indicators.wma(close, 10)[:, column], js_wma(series, 10))
+        assert_matches(indicators.hma(close, 20)[:, column], js_hma(series, 20))
+        assert_matches(indicators.linear_regression(close, 20)[:, column], js_linear_regression(series, 20))
+
+
+def test_squeeze_matches_the_chart_code(prices):
+    close, high, low = prices
+    result = indicators.squeeze(close, high, low)
+    for column in range(close.shape[1]):
+        c, h, l = (values[:, column].tolist() for values in (close, high, low))
+        basis, deviation = js_sma(c, 20), js_standard_deviation(c, 20)
+        true_range = js_sma(js_true_range(h, l, c), 20)
+        highest = [None if i < 19 else max(h[i - 19:i + 1]) for i in range(len(h))]
+        lowest = [None if i < 19 else min(l[i - 19:i + 1]) for i in range(len(l))]
+        source = [None if basis[i] is None else c[i] - ((highest[i] + lowest[i]) / 2 + basis[i]) / 2 for i in range(len(c))]
+        assert_matches(result['momentum'][:, column], js_linear_regression(source, 20))
+
+        for i in range(19, len(c)):
+            upper_bb, lower_bb = basis[i] + 2 * deviation[i], basis[i] - 2 * deviation[i]
+            upper_kc, lower_kc = basis[i] + 1.5 * true_range[i], basis[i] - 1.5 * true_range[i]
+            assert result['on'][i, column] == (lower_bb > lower_kc and upper_bb < upper_kc)
+            assert result['off'][i, column] == (lower_bb < lower_kc and upper_bb > upper_kc)
+
+
+def test_ssl_hybrid_matches_the_chart_code(prices):
+    close, high, low = prices
+    result = indicators.ssl_hybrid(close, high, low)
+    for column in range(close.shape[1]):
+        c = close[:, column].tolist()
+        hma_high, hma_low = js_hma(high[:, column].tolist(), 20), js_hma(low[:, column].tolist(), 20)
+        trend = 0
+        for i in range(len(c)):
+            if hma_high[i] is None:
+                assert result['trend'][i, column] == 0
+                continue
+            trend = 1 if c[i] > hma_high[i] else -1 if c[i] < hma_low[i] else trend
+            baseline = hma_high[i] if trend < 0 else hma_low[i]
+            assert result['trend'][i, column] == trend
+            assert result['baseline'][i, column] == pytest.approx(baseline)
+            assert result['bullish'][i, column] == (c[i] > baseline)
+
+
+def test_missing_days_leave_the_window_empty():
+    values = np.arange(10, dtype=np.float64)[:, None]
+    values[4] = np.nan
+    result = indicators.sma(values, 3)[:, 0]
+    assert np.isnan(result[:2]).all() and np.isnan(result[4:7]).all()
+    assert result[3] == 2.0 and result[7] == 6.0
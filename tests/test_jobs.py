@@ -0,0 +1,107 @@
+import threading
+import time
+import pytest
+from app import jobs
+from app.jobs import CANCELLED, COMPLETE, Job, JobRunner
+
+
+@pytest.fixture
+def runner():
+    runner = JobRunner(max_workers=4)
+    yield runner
+    if runner._executor is not None:
+        runner._executor.shutdown(wait=True)
+
+
+def blocking(job, **params):
+    # Runs until the test cancels it
+    job.wait_for_cancel(5)
+    job.check_cancelled()
+
+
+def test_events_are_numbered_in_order():
+    job = Job('stocks')
+    for number in range(3):
+        job.publish({'type': 'progress', 'done': number})
+    events = job.events_after(0, timeout=0)
+    assert [sequence for sequence, _ in events] == [1, 2, 3]
+    assert job.events_after(2, timeout=0) == [(3, {'type': 'progress', 'done': 2})]
+
+
+def test_ring_buffer_keeps_the_latest_events(monkeypatch):
+    monkeypatch.setattr(jobs, 'EVENT_BUFFER_SIZE', 3)
+    job = Job('stocks')
+    for number in range(5):
+        job.publish({'done': number})
+
+    # A late subscriber gets the buffered events; older ones are skipped
+    assert [sequence for sequence, _ in job.events_after(0, timeout=0)] == [3, 4, 5]
+
+
+def test_waiting_subscriber_is_woken_by_a_new_event():
+    job = Job('stocks')
+    received = []
+    subscriber = threading.Thread(target=lambda: received.extend(job.events_after(0, timeout=5)))
+    subscriber.start()
+    job.publish({'type': 'log'})
+    subscriber.join(5)
+    assert received == [(1, {'type': 'log'})]
+
+
+def test_finishing_publishes_a_final_event():
+    job = Job('stocks')
+    job.set_status(COMPLETE)
+    (_, event), = job.events_after(0, timeout=0)
+    assert event['type'] == 'finished'
+    assert event['status'] == COMPLETE
+
+
+def test_start_attaches_to_the_same_job(runner):
+    first, created = runner.start('test', blocking, script_name='test_script.py')
+    second, created_again = runner.start('test', blocking, script_name='test_script.py')
+    other, created_other = runner.start('test', blocking, script_name='other.py')
+    assert created and not created_again and created_other
+    assert second is first and other is not first
+    first.cancel()
+    other.cancel()
+
+
+def test_one_job_writes_each_data_set(runner):
+    live, _ = runner.start('stocks', blocking, script_name='fetch_new_stock_data.py')
+    resume, created_resume = runner.start('stocks', blocking, resume=True)
+    scheduled, created_scheduled = runner.start('scheduled', blocking, trading_date='2024-03-05')
+    indices, created_indices = runner.start('indices', blocking)
+
+    # Stock jobs with other parameters, and jobs writing stocks too, attach to the running one
+    assert resume is live and not created_resume
+    assert scheduled is live and not created_scheduled
+    assert created_indices and indices is not live
+    live.cancel()
+    indices.cancel()
+
+
+def test_a_new_job_starts_once_the_previous_one_finished(runner):
+    first, _ = runner.start('stocks', blocking, resume=False)
+    first.cancel()
+    for _ in range(50):
+        if first.finished:
+            break
+        time.sleep(0.1)
+    assert first.status == CANCELLED
+
+    second, created = runner.start('stocks', blocking, resume=False)
+    assert created and second is not first
+    second.cancel()
+
+
+def test_admin_updates_run_the_post_ingest_hooks_once(monkeypatch):
+    from app import scheduler
+    calls = []
+    monkeypatch.setattr(scheduler, 'post_ingest_hooks', [calls.append])
+    monkeypatch.setattr(jobs, 'fetch_indices', lambda job, **params: 'indices')
+    monkeypatch.setattr(jobs, 'fetch_stocks', lambda job, **params: 'stocks')
+
+    assert jobs.run_full_update(Job('both'), end_date='2024-01-04') == {'indices': 'indices', 'stocks': 'stocks'}
+    assert calls == ['2024-01-04']
+    jobs.run_stocks_update(Job('stocks'))
+    assert len(calls) == 2
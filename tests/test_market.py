@@ -0,0 +1,82 @@
+import numpy as np
+from app import market
+from app.market import BENCHMARK, MarketMatrix
+
+
+def same(first, second):
+    return np.array_equal(first.dates, second.dates) and all(
+        np.array_equal(first.values[field], second.values[field], equal_nan=True) for field in market.MATRIX_FIELDS
+    ) and np.array_equal(first.market, second.market, equal_nan=True)
+
+
+def hold_back(storage, date, keep=0):
+    """Remove the stock rows of date (all but the first keep) and return them"""
+    rows = list(storage.stocks.find({'published_date': date}))
+    storage.stocks.delete_many({'_id': {'$in': [row['_id'] for row in rows[keep:]]}})
+    return rows[keep:]
+
+
+def test_load_matches_the_stored_rows(storage):
+    matrix = MarketMatrix().load(storage)
+    latest = storage.latest_index_date()
+    assert matrix.last_date == latest.date()
+    for row in storage.quotes_on(latest):
+        column = matrix.column(row['company_symbol'])
+        assert matrix.closes[-1, column] == row['close']
+    benchmark = storage.index_on(BENCHMARK, latest, fields=('current',))
+    assert matrix.market[-1] == benchmark['current']
+
+
+def test_matrix_keeps_matrix_days(storage, monkeypatch):
+    monkeypatch.setattr(market, 'MATRIX_DAYS', 30)
+    matrix = MarketMatrix().load(storage)
+    assert len(matrix.dates) == 30
+    assert matrix.closes.shape == (30, len(matrix.company_ids))
+
+
+def test_refresh_appends_new_days(storage):
+    dates = sorted(storage.stocks.distinct('published_date'))
+    held_stocks = [row for date in dates[-2:] for row in hold_back(storage, date)]
+    held_indices = list(storage.indices.find({'published_date': {'$in': dates[-2:]}}))
+    storage.indices.delete_many({'published_date': {'$in': dates[-2:]}})
+    matrix = MarketMatrix().load(storage)
+    assert matrix.last_date == dates[-3].date()
+
+    storage.stocks.insert_many(held_stocks)
+    storage.indices.insert_many(held_indices)
+    matrix.refresh(storage)
+    assert same(matrix, MarketMatrix().load(storage))
+
+
+def test_refresh_rereads_a_partial_last_day(storage):
+    latest = storage.latest_index_date()
+    held = hold_back(storage, latest, keep=2)
+    matrix = MarketMatrix().load(storage)
+    matrix.window_stats(20)
+    assert np.isnan(matrix.closes[-1]).sum() == len(held)
+
+    storage.stocks.insert_many(held)
+    matrix.refresh(storage)
+    assert matrix._results == {}
+    assert same(matrix, MarketMatrix().load(storage))
+
+
+def test_unchanged_refresh_keeps_results(storage):
+    matrix = MarketMatrix().load(storage)
+    results = matrix.window_stats(20)
+    loaded_at = matrix.loaded_at
+    matrix.refresh(storage)
+    assert matrix.window_stats(20) is results
+    assert matrix.loaded_at == loaded_at
+
+
+def test_new_company_gets_a_column(storage):
+    latest = storage.latest_index_date()
+    matrix = MarketMatrix().load(storage)
+    storage.company_collection.insert_one({'company_id': 999, 'symbol': 'NEWCO', 'companyname': 'New Company', 'sector': 'Others'})
+    storage.stocks.insert_one({'company_id': 999, 'company_symbol': 'NEWCO', 'published_date': latest, 'close': 100.0})
+    matrix.refresh(storage)
+
+    column = matrix.column('NEWCO')
+    assert matrix.closes[-1, column] == 100.0
+    assert np.isnan(matrix.closes[:-1, column]).all()
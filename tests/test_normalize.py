@@ -0,0 +1,57 @@
+import datetime
+from app.scripts.normalize_existing_data import normalize_collection, remove_duplicate_days
+from app.storage.memory import MemoryDatabase
+
+
+def legacy_stock(company_id, close, day='2024-01-02'):
+    return {
+        'company_id': company_id, 'company_symbol': f"C{company_id}", 'published_date': day,
+        'open': '1,000', 'high': '1,010', 'low': '990', 'close': close, 'per_change': '0.5',
+        'traded_quantity': '100', 'traded_amount': '100,000', 'DT_Row_Index': 3
+    }
+
+
+def test_converts_legacy_documents_in_place():
+    db = MemoryDatabase()
+    db['nepse-stocks'].insert_many([legacy_stock(1, '1,005')])
+    assert normalize_collection(db['nepse-stocks'], 'stock', db['ingest_quarantine']) == (1, 0)
+
+    document = db['nepse-stocks'].find_one({'company_id': 1})
+    assert document['published_date'] == datetime.datetime(2024, 1, 2)
+    assert document['close'] == 1005.0
+    assert 'DT_Row_Index' not in document
+
+
+def test_rejected_documents_move_to_quarantine():
+    db = MemoryDatabase()
+    db['nepse-stocks'].insert_many([legacy_stock(1, 'n/a'), legacy_stock(2, ''), legacy_stock(3, '1,005')])
+    assert normalize_collection(db['nepse-stocks'], 'stock', db['ingest_quarantine']) == (1, 2)
+
+    # Only typed documents are left for the read paths
+    assert [document['company_id'] for document in db['nepse-stocks'].find({})] == [3]
+    quarantined = list(db['ingest_quarantine'].find({}))
+    assert sorted(document['source_id'] for document in quarantined) == [1, 2]
+    assert all(document['times_seen'] == 1 for document in quarantined)
+
+
+def test_rejected_index_rows_keep_their_index():
+    db = MemoryDatabase()
+    db['nepse-indices'].insert_many([
+        {'index_id': 58, 'index_name': 'NEPSE Index', 'published_date': '2024-01-02', 'current': ''},
+        {'index_id': 51, 'index_name': 'Banking SubIndex', 'published_date': '2024-01-02', 'current': ''},
+    ])
+    assert normalize_collection(db['nepse-indices'], 'index', db['ingest_quarantine']) == (0, 2)
+    assert db['nepse-indices'].count_documents({}) == 0
+    assert sorted(document['index_name'] for document in db['ingest_quarantine'].find({})) == ['Banking SubIndex', 'NEPSE Index']
+
+
+def test_duplicate_days_keep_the_newest_row():
+    db = MemoryDatabase()
+    day = datetime.datetime(2024, 1, 2)
+    db['nepse-stocks'].insert_many([
+        {'company_id': 1, 'published_date': day, 'close': 100.0},
+        {'company_id': 1, 'published_date': day, 'close': 101.0},
+        {'company_id': 2, 'published_date': day, 'close': 50.0},
+    ])
+    assert remove_duplicate_days(db['nepse-stocks']) == 1
+    assert sorted((document['company_id'], document['close']) for document in db['nepse-stocks'].find({})) == [(1, 101.0), (2, 50.0)]
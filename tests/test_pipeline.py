@@ -0,0 +1,101 @@
+import datetime
+from pymongo import InsertOne
+from pymongo.errors import BulkWriteError
+from app.scripts.checkpoint import CheckpointJournal
+from app.scripts.fetch_new_stock_data import StockIngestRun
+from app.scripts.pipeline import DUPLICATE_KEY, BulkWriter
+from app.storage.memory import MemoryDatabase
+
+
+class FailingCollection:
+    """Collection whose bulk writes fail with the given write errors"""
+
+    def __init__(self, write_errors):
+        self.write_errors = write_errors
+        self.writes = []
+
+    def bulk_write(self, operations, ordered=True):
+        self.writes.append(operations)
+        if self.write_errors:
+            raise BulkWriteError({'writeErrors': self.write_errors})
+
+
+class SyncWriter:
+    """Writes each submitted page at once, failing the pages listed in fail"""
+
+    def __init__(self, fail=()):
+        self.fail = set(fail)
+        self.submitted = []
+
+    def submit(self, operations, callback=None):
+        self.submitted.append(operations)
+        page = len(self.submitted)
+        callback(0 if page in self.fail else len(operations), 'write failed' if page in self.fail else None)
+
+
+def test_writer_reports_each_item():
+    collection = FailingCollection([
+        {'index': 1, 'code': DUPLICATE_KEY, 'errmsg': 'duplicate key'},
+        {'index': 2, 'code': 121, 'errmsg': 'validation failed'},
+    ])
+    results = []
+    writer = BulkWriter(collection, batch_size=100, flush_interval=60)
+    writer.start()
+    writer.submit([InsertOne({'a': 1}), InsertOne({'a': 2})], lambda written, error: results.append((written, error)))
+    writer.submit([InsertOne({'a': 3})], lambda written, error: results.append((written, error)))
+    stats = writer.close()
+
+    assert len(collection.writes) == 1
+    # The duplicate is already stored: not written, but not a failure either
+    assert results == [(1, None), (0, 'validation failed')]
+    assert stats['operations'] == 1
+    assert stats['duplicates'] == 1
+    assert stats['errors'] == 1
+
+
+def test_writer_flushes_full_batches():
+    collection = FailingCollection([])
+    flushes = []
+    writer = BulkWriter(collection, batch_size=2, flush_interval=60, after_flush=lambda: flushes.append(1))
+    writer.start()
+    for value in range(5):
+        writer.submit([InsertOne({'a': value})])
+    stats = writer.close()
+
+    assert [len(operations) for operations in collection.writes] == [2, 2, 1]
+    assert stats['flushes'] == 3
+    assert len(flushes) == 3
+
+
+def page(number, records):
+    return {
+        'type': 'page', 'company_id': 1, 'company_symbol': 'NABIL', 'records': records,
+        'start_date': None, 'resume_before': None, 'end_date': None,
+        'next_start': number * 2, 'total_records': 6, 'status': 'ok'
+    }
+
+
+def record(day):
+    return {'published_date': f"2024-03-{day:02d}", 'close': '100', 'traded_quantity': '10'}
+
+
+def test_pages_after_a_failed_page_are_not_written():
+    journal = CheckpointJournal(MemoryDatabase()['ingest_checkpoints'], 'stocks')
+    journal.begin()
+    journal.start_company(1, 'NABIL', None)
+    writer = SyncWriter(fail={2})
+    run = StockIngestRun(writer, journal)
+
+    run.handle(page(1, [record(10), record(9)]))
+    run.handle(page(2, [record(8), record(7)]))
+    run.handle(page(3, [record(6), record(5)]))
+    run.handle({'type': 'end', 'company_id': 1, 'company_symbol': 'NABIL', 'status': 'ok'})
+
+    # Page 3 is never submitted, and the checkpoint stays after page 1
+    assert len(writer.submitted) == 3
+    assert writer.submitted[-1] == []
+    state = journal.get_company(1)
+    assert state['next_start'] == 2
+    assert state['oldest_date'] == datetime.datetime(2024, 3, 9)
+    assert state['status'] == 'error'
+    assert run.result['companies_with_errors'] == 1
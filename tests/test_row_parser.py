@@ -0,0 +1,84 @@
+import datetime
+import pytest
+from app.scripts.row_parser import (
+    RowValidationError, parse_date, parse_index_row, parse_number, parse_stock_row, quarantine_document
+)
+
+
+@pytest.mark.parametrize('value, expected', [
+    ('1,234.50', 1234.5),
+    (' 12 ', 12.0),
+    (7, 7.0),
+    ('', None),
+    ('-', None),
+    (None, None),
+])
+def test_parse_number(value, expected):
+    assert parse_number(value) == expected
+
+
+@pytest.mark.parametrize('value', ['abc', 'nan', 'inf'])
+def test_parse_number_rejects(value):
+    with pytest.raises(RowValidationError):
+        parse_number(value, 'close')
+
+
+@pytest.mark.parametrize('value', [
+    '2024-03-05', '2024/03/05', '03/05/2024', '05-03-2024', '2024-03-05T00:00:00',
+    datetime.date(2024, 3, 5), datetime.datetime(2024, 3, 5),
+])
+def test_parse_date(value):
+    assert parse_date(value) == datetime.datetime(2024, 3, 5)
+
+
+@pytest.mark.parametrize('value', ['', None, '2024-13-40', 'yesterday'])
+def test_parse_date_rejects(value):
+    with pytest.raises(RowValidationError):
+        parse_date(value)
+
+
+def test_parse_stock_row():
+    record = {
+        'published_date': '2024-03-05', 'open': '1,200', 'high': '1,250.5', 'low': '', 'close': '1,240',
+        'per_change': '-0.8', 'traded_quantity': '3,000', 'traded_amount': '3,720,000', 'DT_Row_Index': 4
+    }
+    document = parse_stock_row(record, 131, 'NABIL')
+    assert document == {
+        'published_date': datetime.datetime(2024, 3, 5), 'company_id': 131, 'company_symbol': 'NABIL',
+        'open': 1200.0, 'high': 1250.5, 'low': None, 'close': 1240.0,
+        'per_change': -0.8, 'traded_quantity': 3000.0, 'traded_amount': 3720000.0
+    }
+
+
+@pytest.mark.parametrize('field, value', [('close', ''), ('close', '-5'), ('traded_quantity', '-1')])
+def test_parse_stock_row_rejects(field, value):
+    record = {'published_date': '2024-03-05', 'close': '100', 'traded_quantity': '10'}
+    record[field] = value
+    with pytest.raises(RowValidationError) as error:
+        parse_stock_row(record, 131, 'NABIL')
+    assert error.value.field == field
+
+
+def test_parse_index_row():
+    record = {'index_id': '58', 'published_date': '2024-03-05', 'current': '2,050.12', 'turnover': '3,000,000'}
+    assert parse_index_row(record, 'NEPSE Index') == {
+        'index_id': 58, 'published_date': datetime.datetime(2024, 3, 5),
+        'current': 2050.12, 'turnover': 3000000.0, 'index_name': 'NEPSE Index'
+    }
+
+
+def test_parse_index_row_needs_a_value():
+    with pytest.raises(RowValidationError) as error:
+        parse_index_row({'index_id': '58', 'published_date': '2024-03-05', 'current': ''})
+    assert error.value.field == 'current'
+
+
+def test_quarantine_document_keeps_the_raw_row():
+    record = {'_id': 'x', 'published_date': '2024-03-05', 'close': 'abc'}
+    try:
+        parse_stock_row(record, 131, 'NABIL')
+    except RowValidationError as error:
+        document = quarantine_document('stock', record, error, company_id=131)
+    assert document['raw'] == {'published_date': '2024-03-05', 'close': 'abc'}
+    assert document['field'] == 'close'
+    assert document['company_id'] == 131
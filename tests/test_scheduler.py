@@ -0,0 +1,65 @@
+import datetime
+import pytest
+from app import scheduler
+from app.scheduler import NPT, check_for_new_data, expected_trading_day, is_trading_day, next_check_time
+
+# 2024-01-04 is a Thursday, the last trading day of its week
+THURSDAY = datetime.date(2024, 1, 4)
+HOLIDAYS = {THURSDAY}
+
+
+def npt(day, hour, minute=0):
+    return datetime.datetime.combine(day, datetime.time(hour, minute), tzinfo=NPT)
+
+
+@pytest.fixture(autouse=True)
+def close_at_three(monkeypatch):
+    # Data is ready at 15:30 NPT whatever the environment sets
+    monkeypatch.setattr(scheduler, 'MARKET_CLOSE', datetime.time(15, 0))
+    monkeypatch.setattr(scheduler, 'SCHEDULER_DELAY_MINUTES', 30)
+
+
+def test_friday_and_saturday_are_not_trading_days():
+    days = [THURSDAY + datetime.timedelta(days=offset) for offset in range(4)]
+    assert [is_trading_day(day) for day in days] == [True, False, False, True]
+    assert not is_trading_day(THURSDAY, HOLIDAYS)
+
+
+def test_expected_day_waits_for_close_plus_delay():
+    assert expected_trading_day(npt(THURSDAY, 15, 29)) == THURSDAY - datetime.timedelta(days=1)
+    assert expected_trading_day(npt(THURSDAY, 15, 30)) == THURSDAY
+    # The same instant in UTC gives the same answer
+    assert expected_trading_day(npt(THURSDAY, 15, 30).astimezone(datetime.timezone.utc)) == THURSDAY
+
+
+def test_expected_day_skips_the_weekend_and_holidays():
+    sunday = THURSDAY + datetime.timedelta(days=3)
+    assert expected_trading_day(npt(sunday, 10)) == THURSDAY
+    assert expected_trading_day(npt(THURSDAY + datetime.timedelta(days=2), 18)) == THURSDAY
+    assert expected_trading_day(npt(THURSDAY, 18), HOLIDAYS) == THURSDAY - datetime.timedelta(days=1)
+
+
+def test_next_check_is_the_next_data_ready_time():
+    sunday = THURSDAY + datetime.timedelta(days=3)
+    assert next_check_time(npt(THURSDAY, 15, 29)) == npt(THURSDAY, 15, 30)
+    assert next_check_time(npt(THURSDAY, 15, 30)) == npt(sunday, 15, 30)
+    assert next_check_time(npt(THURSDAY, 9), HOLIDAYS) == npt(sunday, 15, 30)
+
+
+def test_up_to_date_watermark_makes_no_upstream_request(monkeypatch):
+    monkeypatch.setattr(scheduler, 'latest_stored_date', lambda: THURSDAY)
+    monkeypatch.setattr(scheduler, 'upstream_has_new_data', lambda *args: pytest.fail('upstream was asked'))
+    check = check_for_new_data(npt(THURSDAY, 16), holidays=set())
+    assert check['up_to_date'] and not check['run']
+    assert check['stored'] == check['expected'] == THURSDAY
+
+
+@pytest.mark.parametrize('published', [False, True])
+def test_behind_watermark_asks_upstream_once(monkeypatch, published):
+    stored = THURSDAY - datetime.timedelta(days=1)
+    calls = []
+    monkeypatch.setattr(scheduler, 'latest_stored_date', lambda: stored)
+    monkeypatch.setattr(scheduler, 'upstream_has_new_data', lambda *args: calls.append(args) or published)
+    check = check_for_new_data(npt(THURSDAY, 16), holidays=set())
+    assert calls == [(stored, THURSDAY)]
+    assert check['run'] is published and not check['up_to_date']
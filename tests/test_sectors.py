@@ -0,0 +1,83 @@
+import datetime
+import pytest
+from app.sectors import SECTOR_BASE, SECTOR_SERIES, compute_sector_series, update_sector_series
+
+DAY_1 = datetime.datetime(2024, 3, 4)
+DAY_2 = datetime.datetime(2024, 3, 5)
+
+COMPANIES = [
+    {'company_id': 1, 'sector': 'Hydro Power'},
+    {'company_id': 2, 'sector': 'Hydro Power '},
+    {'company_id': 3, 'sector': 'Commercial Banks'},
+    {'company_id': 4, 'sector': ''},
+]
+
+
+def row(company_id, date, per_change, amount, quantity=10.0):
+    return {'company_id': company_id, 'published_date': date, 'per_change': per_change, 'traded_amount': amount, 'traded_quantity': quantity}
+
+
+def by_key(documents):
+    return {(document['sector'], document['published_date']): document for document in documents}
+
+
+def test_day_aggregates():
+    rows = [row(1, DAY_1, 2.0, 300.0), row(2, DAY_1, -1.0, 100.0), row(3, DAY_1, 0.0, 50.0), row(4, DAY_1, 5.0, 999.0)]
+    documents = by_key(compute_sector_series(COMPANIES, rows))
+    assert set(documents) == {('Hydro Power', DAY_1), ('Commercial Banks', DAY_1)}
+
+    hydro = documents[('Hydro Power', DAY_1)]
+    assert hydro['equal_weight_change'] == 0.5
+    assert hydro['turnover_weight_change'] == 1.25
+    assert hydro['equal_weight'] == pytest.approx(SECTOR_BASE * 1.005)
+    assert hydro['turnover_weight'] == pytest.approx(SECTOR_BASE * 1.0125)
+    assert (hydro['advances'], hydro['declines'], hydro['unchanged'], hydro['constituents']) == (1, 1, 0, 2)
+    assert hydro['turnover'] == 400.0
+    assert hydro['volume'] == 20.0
+    assert documents[('Commercial Banks', DAY_1)]['unchanged'] == 1
+
+
+def test_moves_beyond_the_limit_are_left_out_of_returns():
+    rows = [row(1, DAY_1, 50.0, 300.0), row(2, DAY_1, 1.0, 100.0)]
+    hydro = by_key(compute_sector_series(COMPANIES, rows))[('Hydro Power', DAY_1)]
+    assert hydro['equal_weight_change'] == 1.0
+    assert hydro['constituents'] == 2
+    assert hydro['turnover'] == 400.0
+
+
+def test_levels_chain_from_stored_levels():
+    rows = [row(1, DAY_1, 10.0, 100.0), row(1, DAY_2, -10.0, 100.0)]
+    documents = by_key(compute_sector_series(COMPANIES, rows, levels={'Hydro Power': (2000.0, 500.0)}))
+    assert documents[('Hydro Power', DAY_1)]['equal_weight'] == pytest.approx(2200.0)
+    assert documents[('Hydro Power', DAY_2)]['equal_weight'] == pytest.approx(1980.0)
+    assert documents[('Hydro Power', DAY_2)]['turnover_weight'] == pytest.approx(495.0)
+
+
+def stored(db):
+    return by_key(db[SECTOR_SERIES].find({}, {'_id': 0}))
+
+
+def test_incremental_update_matches_a_full_build(memory_db):
+    stocks = memory_db['nepse-stocks']
+    dates = sorted(stocks.distinct('published_date'))
+    held = list(stocks.find({'published_date': {'$gte': dates[-3]}}))
+    stocks.delete_many({'published_date': {'$gte': dates[-3]}})
+    # The day the series was last built had only part of its rows
+    partial = [document for document in held if document['published_date'] == dates[-3]][:3]
+    stocks.insert_many(partial)
+    update_sector_series(memory_db, full=True)
+
+    stocks.insert_many([document for document in held if document not in partial])
+    update_sector_series(memory_db)
+    incremental = stored(memory_db)
+    update_sector_series(memory_db, full=True)
+    full = stored(memory_db)
+
+    assert incremental == full
+
+
+def test_update_without_new_rows_changes_nothing(memory_db):
+    before = stored(memory_db)
+    update_sector_series(memory_db)
+    assert stored(memory_db) == before
+    assert memory_db[SECTOR_SERIES].count_documents({}) == len(before)
@@ -0,0 +1,87 @@
+import datetime
+import math
+import statistics
+import pytest
+from app import stats
+from app.market import MarketMatrix
+from app.stats import AVERAGE_DAYS, compute_company_stats
+
+
+def history(storage, dates, company_id):
+    """Rows of one company aligned with the matrix dates (None on days without a trade)"""
+    rows = {row['published_date']: row for row in storage.stocks.find({'company_id': company_id})}
+    return [rows.get(date) for date in dates]
+
+
+def forward_filled_closes(rows):
+    closes, last = [], None
+    for row in rows:
+        last = row['close'] if row else last
+        closes.append(last)
+    return closes
+
+
+@pytest.fixture
+def matrix(storage):
+    # One company misses a few recent days, so forward fill and zero-fill averages matter
+    dates = sorted(storage.stocks.distinct('published_date'))
+    company_id = storage.stocks.find_one({})['company_id']
+    storage.stocks.delete_many({'company_id': company_id, 'published_date': {'$in': [dates[-1], dates[-4], dates[-30]]}})
+    return MarketMatrix().load(storage)
+
+
+def test_stats_match_a_per_company_computation(storage, matrix):
+    dates = [datetime.datetime.combine(day.item(), datetime.time()) for day in matrix.dates]
+    documents = compute_company_stats(matrix)
+    assert len(documents) == len(matrix.company_ids)
+
+    approx = lambda value: pytest.approx(value, rel=1e-6, abs=1e-3)
+    for document in documents:
+        rows = history(storage, dates, document['company_id'])
+        closes = forward_filled_closes(rows)
+        traded = [row for row in rows if row]
+
+        assert document['last_close'] == approx(closes[-1])
+        assert document['last_traded'] == traded[-1]['published_date']
+        assert document['high_52w'] == approx(max(row['high'] for row in traded))
+        assert document['low_52w'] == approx(min(row['low'] for row in traded))
+        assert document['pct_from_high_52w'] == approx((1 - closes[-1] / document['high_52w']) * 100)
+
+        for name, days in stats.RETURN_PERIODS.items():
+            if len(dates) > days:
+                assert document[f"return_{name}"] == approx((closes[-1] / closes[-1 - days] - 1) * 100)
+            else:
+                assert document[f"return_{name}"] is None
+
+        returns = [closes[day] / closes[day - 1] - 1 for day in range(1, len(closes)) if closes[day - 1] is not None]
+        assert document['volatility_1y'] == approx(statistics.stdev(returns) * math.sqrt(stats.YEAR_DAYS) * 100)
+
+        peak, drawdown = closes[0], 0.0
+        for close in closes:
+            peak = max(peak, close)
+            drawdown = min(drawdown, (close / peak - 1) * 100)
+        assert document['max_drawdown_1y'] == approx(drawdown)
+
+        # Days without a trade count as zero in the averages
+        recent = rows[-AVERAGE_DAYS:]
+        assert document['avg_turnover_3m'] == approx(sum(row['traded_amount'] for row in recent if row) / len(recent))
+        assert document['avg_volume_3m'] == approx(sum(row['traded_quantity'] for row in recent if row) / len(recent))
+
+
+def test_gaps_are_forward_filled(storage, matrix):
+    company_id = storage.stocks.find_one({})['company_id']
+    document = next(document for document in compute_company_stats(matrix) if document['company_id'] == company_id)
+    # The company did not trade on the last day, so its last close is carried forward
+    assert document['last_traded'] < document['as_of']
+    last_row = storage.stocks.find_one({'company_id': company_id, 'published_date': document['last_traded']})
+    assert document['last_close'] == pytest.approx(last_row['close'], abs=1e-4)
+
+
+def test_short_history_has_no_volatility(storage, monkeypatch):
+    monkeypatch.setattr(stats, 'MIN_VOLATILITY_DAYS', 1000)
+    documents = compute_company_stats(MarketMatrix().load(storage))
+    assert documents and all(document['volatility_1y'] is None for document in documents)
+
+
+def test_empty_matrix_has_no_stats():
+    assert compute_company_stats(MarketMatrix()) == []
@@ -0,0 +1,62 @@
+import datetime
+from app.storage.mongo import MongoStore
+from app.turnover import TURNOVER_INDEX, TURNOVER_SERIES, compute_turnover_series, update_turnover_series
+
+DAY_1 = datetime.datetime(2024, 3, 4)
+DAY_2 = datetime.datetime(2024, 3, 5)
+
+
+def test_published_index_turnover_is_preferred():
+    days = [
+        {'published_date': DAY_1, 'stock_turnover': 1000.0, 'volume': 50, 'traded': 3},
+        {'published_date': DAY_2, 'stock_turnover': 2000.0, 'volume': None, 'traded': 4},
+    ]
+    index_rows = [{'published_date': DAY_1, 'turnover': 1500.0}, {'published_date': DAY_2, 'turnover': None}]
+    assert list(compute_turnover_series(days, index_rows)) == [
+        {'published_date': DAY_1, 'turnover': 1500.0, 'stock_turnover': 1000.0, 'volume': 50.0, 'traded': 3},
+        {'published_date': DAY_2, 'turnover': 2000.0, 'stock_turnover': 2000.0, 'volume': 0.0, 'traded': 4},
+    ]
+
+
+def test_series_matches_the_stock_rows(memory_db):
+    storage = MongoStore(memory_db)
+    series = storage.turnover_history()
+    assert len(series) == len(storage.stocks.distinct('published_date'))
+    for day in series:
+        rows = storage.quotes_on(day['published_date'], fields=('close', 'traded_amount', 'traded_quantity'))
+        index = storage.index_on(TURNOVER_INDEX, day['published_date'], fields=('turnover',))
+        stock_turnover = sum(row['traded_amount'] for row in rows)
+        assert abs(day['stock_turnover'] - stock_turnover) < 1e-6
+        assert day['turnover'] == (index['turnover'] if index and index.get('turnover') is not None else day['stock_turnover'])
+        assert day['volume'] == sum(row['traded_quantity'] for row in rows)
+        assert day['traded'] == len(rows)
+
+
+def test_missing_amount_falls_back_to_close_times_quantity(memory_db):
+    stocks = memory_db['nepse-stocks']
+    latest = max(stocks.distinct('published_date'))
+    row = stocks.find_one({'published_date': latest})
+    before = memory_db[TURNOVER_SERIES].find_one({'published_date': latest})
+    stocks.update_one({'_id': row['_id']}, {'$set': {'traded_amount': None}})
+
+    update_turnover_series(memory_db)
+    after = memory_db[TURNOVER_SERIES].find_one({'published_date': latest})
+    expected = before['stock_turnover'] - row['traded_amount'] + row['close'] * row['traded_quantity']
+    assert abs(after['stock_turnover'] - expected) < 1e-6
+
+
+def test_latest_day_is_recomputed(memory_db):
+    stocks = memory_db['nepse-stocks']
+    dates = sorted(stocks.distinct('published_date'))
+    held = list(stocks.find({'published_date': {'$gte': dates[-2]}}))
+    stocks.delete_many({'published_date': {'$gte': dates[-2]}})
+    # The series was last built while the day's stock rows were still arriving
+    partial = [document for document in held if document['published_date'] == dates[-2]][:3]
+    stocks.insert_many(partial)
+    update_turnover_series(memory_db, full=True)
+
+    stocks.insert_many([document for document in held if document not in partial])
+    update_turnover_series(memory_db)
+    incremental = list(memory_db[TURNOVER_SERIES].find({}, {'_id': 0}).sort('published_date', 1))
+    update_turnover_series(memory_db, full=True)
+    assert incremental == list(memory_db[TURNOVER_SERIES].find({}, {'_id': 0}).sort('published_date', 1))